@@ -0,0 +1,194 @@
+#/BDSP/bids_app/src/admission.py
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import deque
+
+from utils import common, metrics
+
+logger = logging.getLogger(__name__)
+
+MiB = 1024 * 1024
+
+# WORKING_DIR 아래 작업 이력 파일 (과거 trace에서 측정한 확장 비율)
+HISTORY_FILENAME = ".bdsp_admission_history.json"
+
+
+def read_meminfo_available():
+    """/proc/meminfo의 MemAvailable (bytes, 읽을 수 없으면 None)"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def read_trace_footprint(trace_json):
+    """trace.json의 footprint 항목 (upload_bytes, work_bytes) 읽기"""
+    try:
+        with open(trace_json, 'r', encoding='utf-8') as f:
+            footprint = json.load(f).get('footprint') or {}
+        upload_bytes = int(footprint.get('upload_bytes', 0))
+        work_bytes = int(footprint.get('work_bytes', 0))
+    except (OSError, ValueError, TypeError, AttributeError):
+        return None
+    if upload_bytes <= 0 or work_bytes <= 0:
+        return None
+    return upload_bytes, work_bytes
+
+
+class AdmissionController:
+    """작업 시작 전 디스크/메모리 여유 확인 (backpressure)
+
+    - 디스크 예상 사용량 = 업로드 크기 × 확장 비율
+      확장 비율은 최근 작업 trace의 footprint(work_bytes / upload_bytes) 상위 분위수,
+      이력이 부족하면 default_expansion
+    - 메모리 예상 사용량 = memory_base + 업로드 크기 × memory_factor
+    - 실행 중인 작업의 예상 사용량은 끝날 때까지 예약으로 잡아 두고 여유 공간에서 뺀다
+    - 여유가 부족한 작업은 시작하지 않고 대기 (대기 사유가 바뀔 때만 로그/메트릭 기록)
+    - 예약된(실행 중인) 작업이 하나도 없으면 여유가 부족해도 시작 (기다려도 여유가 늘어나지 않으므로
+      예상 사용량이 전체 용량보다 큰 작업이 영원히 대기하지 않도록 함)
+    """
+
+    def __init__(self, volumes, history_path=None, default_expansion=4.0, expansion_quantile=0.9,
+                 history_size=50, disk_reserve=1024 * MiB, memory_base=512 * MiB,
+                 memory_factor=2.0, memory_reserve=512 * MiB):
+        # 작업 데이터가 기록되는 경로 (scratch / WORKING_DIR) - 같은 장치는 한 번만 확인
+        self.volumes = {}
+        for path in volumes:
+            if not path:
+                continue
+            try:
+                self.volumes.setdefault(os.stat(path).st_dev, path)
+            except OSError as e:
+                logger.warning(f"Admission 대상 경로 확인 실패 (제외): {path} ({e})")
+        self.history_path = history_path
+        self.default_expansion = default_expansion
+        self.expansion_quantile = expansion_quantile
+        self.disk_reserve = disk_reserve
+        self.memory_base = memory_base
+        self.memory_factor = memory_factor
+        self.memory_reserve = memory_reserve
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=history_size)    # 확장 비율 (work_bytes / upload_bytes)
+        self._reservations = {}                       # file_name -> {'disk': bytes, 'memory': bytes}
+        self._held = {}                               # file_name -> 대기 사유
+        self._load_history()
+
+    # ===== 확장 비율 이력 =======================================================
+    def _load_history(self):
+        if not self.history_path or not os.path.exists(self.history_path):
+            return
+        try:
+            with open(self.history_path, 'r', encoding='utf-8') as f:
+                ratios = json.load(f).get('expansion', [])
+            self._history.extend(float(r) for r in ratios if float(r) > 0)
+            logger.info(f"Admission 이력 로드: {len(self._history)}건, 확장 비율 {self.expansion_factor():.2f}")
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"Admission 이력 로드 실패 (기본값 사용): {self.history_path} ({e})")
+
+    def _save_history(self):
+        if not self.history_path:
+            return
+        try:
+            common.write_json_atomic(self.history_path, {'expansion': list(self._history)})
+        except OSError as e:
+            logger.warning(f"Admission 이력 저장 실패: {self.history_path} ({e})")
+
+    def expansion_factor(self):
+        """최근 작업들의 확장 비율 상위 분위수 (이력이 5건 미만이면 기본값)"""
+        if len(self._history) < 5:
+            return self.default_expansion
+        ratios = sorted(self._history)
+        index = min(len(ratios) - 1, int(self.expansion_quantile * len(ratios)))
+        return max(ratios[index], 1.0)
+
+    def record_trace(self, trace_json):
+        """완료된 작업 trace의 footprint로 확장 비율 이력 갱신"""
+        footprint = read_trace_footprint(trace_json)
+        if footprint is None:
+            return
+        upload_bytes, work_bytes = footprint
+        with self._lock:
+            self._history.append(work_bytes / upload_bytes)
+            self._save_history()
+        metrics.ADMISSION_EXPANSION.set(self.expansion_factor())
+
+    # ===== 승인 =================================================================
+    def estimate(self, job):
+        """작업의 예상 디스크/메모리 사용량 (bytes)"""
+        return {
+            'disk': int(job.size * self.expansion_factor()),
+            'memory': int(self.memory_base + job.size * self.memory_factor),
+        }
+
+    def _check(self, need):
+        """예약을 제외한 여유로 need를 수용할 수 있는지 확인 (불가하면 사유 문자열)"""
+        reserved_disk = sum(r['disk'] for r in self._reservations.values())
+        for path in self.volumes.values():
+            try:
+                free = shutil.disk_usage(path).free
+            except OSError as e:
+                logger.warning(f"디스크 여유 공간 확인 실패: {path} ({e})")
+                continue
+            available = free - reserved_disk - self.disk_reserve
+            if need['disk'] > available:
+                return (f"disk: {path} 여유 {free // MiB}MiB, 예약 {reserved_disk // MiB}MiB, "
+                        f"필요 {need['disk'] // MiB}MiB")
+
+        mem_available = read_meminfo_available()
+        if mem_available is not None:
+            reserved_memory = sum(r['memory'] for r in self._reservations.values())
+            available = mem_available - reserved_memory - self.memory_reserve
+            if need['memory'] > available:
+                return (f"memory: MemAvailable {mem_available // MiB}MiB, 예약 {reserved_memory // MiB}MiB, "
+                        f"필요 {need['memory'] // MiB}MiB")
+        return None
+
+    def try_admit(self, job):
+        """여유가 있으면 예약 후 True, 없으면 대기로 기록하고 False"""
+        need = self.estimate(job)
+        with self._lock:
+            reason = self._check(need)
+            if reason is not None and not self._reservations:
+                logger.warning(f"Admission 여유 부족하지만 실행 중인 작업이 없어 시작: {job.file_name} - {reason}")
+                reason = None
+            if reason is None:
+                self._reservations[job.file_name] = need
+                if self._held.pop(job.file_name, None) is not None:
+                    logger.info(f"Admission 대기 해제: {job.file_name}")
+                metrics.ADMISSION_HELD.set(len(self._held))
+                return True
+
+            kind = reason.split(':', 1)[0]
+            previous = self._held.get(job.file_name)
+            self._held[job.file_name] = reason
+            metrics.ADMISSION_HELD.set(len(self._held))
+        if previous is None or previous.split(':', 1)[0] != kind:
+            metrics.ADMISSION_DEFERRALS.inc(reason=kind)
+            logger.warning(f"Admission 대기: {job.file_name} (업로드 {job.size // MiB}MiB) - {reason}")
+        return False
+
+    def release(self, file_name):
+        """작업 종료(성공/실패/다른 노드 처리) 시 예약과 대기 기록 해제"""
+        with self._lock:
+            self._reservations.pop(file_name, None)
+            self._held.pop(file_name, None)
+            metrics.ADMISSION_HELD.set(len(self._held))
+
+    def discard(self, file_name):
+        """대기 중에 취소된 작업의 대기 기록 삭제 (예약 없이 시작되어 바로 취소됨)"""
+        with self._lock:
+            if self._held.pop(file_name, None) is not None:
+                logger.info(f"Admission 대기 취소: {file_name}")
+            metrics.ADMISSION_HELD.set(len(self._held))
+
+    def held(self):
+        """대기 중인 작업과 사유"""
+        with self._lock:
+            return dict(self._held)
@@ -0,0 +1,331 @@
+#/BDSP/bids_app/src/api.py
+import asyncio
+import copy
+import json
+import logging
+import os
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+from jobs import FINISHED_STATES
+from process.main import validate_and_initialize_config
+from utils import common
+
+logger = logging.getLogger(__name__)
+
+# 요청 본문 최대 크기 (이벤트 JSON)
+MAX_BODY_BYTES = 1024 * 1024
+# SSE 연결 유지용 주석 전송 주기 (초)
+KEEPALIVE_SECONDS = 15.0
+# SSE 구독자별 미전송 알림 상한 (넘으면 연결을 끊고 클라이언트가 다시 연결해 상태를 조회)
+SUBSCRIBER_QUEUE_SIZE = 256
+
+_REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def event_job_id(event):
+    """이벤트 JSON의 작업 ID (EVENT_DIR 파일명 규칙: <user>_<subjectId>_<uploadTime>)"""
+    return f"{event['user']}_{event['subjectId']}_{event['uploadTime']}"
+
+
+class SubmissionAPI:
+    """EVENT_DIR 폴링과 함께 동작하는 로컬 작업 제출 / 조회 API (asyncio, 전용 스레드)
+
+    - POST /jobs            이벤트 JSON 제출 (validate_and_initialize_config와 같은 규칙으로 검증)
+                            → EVENT_DIR에 기록하고 모니터를 깨워 폴링 대기 없이 바로 수집 (202, job_id)
+    - GET  /jobs            추적 중인 작업 목록 (?state=running 등)
+    - GET  /jobs/<job_id>   작업 상태와 단계별 진행
+    - POST /jobs/<job_id>/cancel  작업 취소 (본문 {"reason": ...} 선택, 202)
+    - GET  /events          상태 변경 알림 스트림 (text/event-stream, ?job=<job_id>로 한 작업만 - 끝나면 종료)
+
+    제출된 작업도 EVENT_DIR를 거치므로 스케줄러 / admission / cluster claim 규칙은 디렉토리로 들어온 작업과 같다.
+    """
+
+    def __init__(self, monitor, host='127.0.0.1', port=0, socket_path=''):
+        self.monitor = monitor
+        self.jobs = monitor.jobs
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.where = f"unix:{socket_path}" if socket_path else f"http://{host}:{port}"
+        self._loop = None
+        self._server = None
+        self._subscribers = {}          # asyncio.Queue -> job_id 필터 (None이면 전체)
+        self._handlers = set()          # 처리 중인 연결 task (종료 시 대기)
+        self._ready = threading.Event()
+        self._submit_lock = threading.Lock()
+        self._thread = None
+
+    # ===== 시작 / 종료 =========================================================
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='api-server', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._server is None:
+            raise RuntimeError(f"Submission API 시작 실패: {self.where}")
+        self.jobs.add_listener(self._on_job_event)
+        logger.info(f"Submission API: {self.where}")
+        return self
+
+    def stop(self):
+        self.jobs.remove_listener(self._on_job_event)
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._serve())
+        except Exception as e:
+            logger.error(f"Submission API 종료: {e}")
+        finally:
+            self._ready.set()
+            self._loop.close()
+
+    async def _serve(self):
+        if self.socket_path:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            os.makedirs(os.path.dirname(self.socket_path) or '.', exist_ok=True)
+            self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host=self.host, port=int(self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            self.where = f"http://{self.host}:{self.port}"
+        self._ready.set()
+        try:
+            await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        # 열린 SSE 연결을 닫고 처리 중인 요청이 끝날 때까지 대기
+        self._server.close()
+        for subscriber in list(self._subscribers):
+            subscriber.put_nowait(None)
+        if self._handlers:
+            _, pending = await asyncio.wait(list(self._handlers), timeout=5)
+            for task in pending:
+                task.cancel()
+        await self._server.wait_closed()
+
+    # ===== 알림 ================================================================
+    def _on_job_event(self, event, job):
+        """JobTracker listener (모니터 / 워커 스레드에서 호출) → 이벤트 루프로 전달"""
+        if self._loop is not None and not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(self._broadcast, event, job)
+            except RuntimeError:
+                pass    # 루프 종료 중
+
+    def _broadcast(self, event, job):
+        for subscriber, job_filter in list(self._subscribers.items()):
+            if job_filter is not None and job_filter != job['job_id']:
+                continue
+            try:
+                subscriber.put_nowait((event, job))
+            except asyncio.QueueFull:
+                # 느린 구독자 - 알림을 잃은 채 계속 보내지 않고 연결을 끊음
+                logger.warning("Submission API: 알림을 받지 못하는 구독자 연결 종료")
+                del self._subscribers[subscriber]
+                while not subscriber.empty():
+                    subscriber.get_nowait()
+                subscriber.put_nowait(None)
+
+    # ===== 요청 처리 ===========================================================
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            method, target, headers = await self._read_head(reader)
+            url = urlsplit(target)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            path = url.path.rstrip('/') or '/'
+
+            if path == '/events':
+                if method != 'GET':
+                    raise HTTPError(405, f"{method} {path}")
+                await self._stream_events(writer, query.get('job'))
+                return
+
+            body = await self._read_body(reader, headers)
+            if path == '/jobs' and method == 'POST':
+                status, payload = await self._submit(body)
+            elif path == '/jobs' and method == 'GET':
+                status, payload = 200, {'jobs': self.jobs.list(query.get('state'))}
+            elif path.startswith('/jobs/') and path.endswith('/cancel') and method == 'POST':
+                status, payload = self._cancel(path[len('/jobs/'):-len('/cancel')], body)
+            elif path.startswith('/jobs/') and method == 'GET':
+                job = self.jobs.get(path[len('/jobs/'):])
+                if job is None:
+                    raise HTTPError(404, f"작업 없음: {path[len('/jobs/'):]}")
+                status, payload = 200, job
+            elif path in ('/jobs', '/events') or path.startswith('/jobs/'):
+                raise HTTPError(405, f"{method} {path}")
+            else:
+                raise HTTPError(404, f"경로 없음: {path}")
+            await self._respond(writer, status, payload)
+        except HTTPError as e:
+            await self._respond(writer, e.status, {'error': str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"Submission API 요청 처리 실패: {e}")
+            await self._respond(writer, 500, {'error': str(e)})
+        finally:
+            writer.close()
+            self._handlers.discard(task)
+
+    async def _read_head(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        try:
+            method, target, _ = request_line.split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, f"잘못된 요청: {request_line!r}")
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if line in ('\r\n', '\n', ''):
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return method.upper(), target, headers
+
+    async def _read_body(self, reader, headers):
+        length = int(headers.get('content-length') or 0)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"요청 본문이 너무 큼: {length} bytes")
+        return await reader.readexactly(length) if length else b''
+
+    async def _respond(self, writer, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n")
+        try:
+            writer.write(head.encode('latin-1') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    # ===== 제출 ================================================================
+    async def _submit(self, body):
+        """이벤트 JSON 검증 후 EVENT_DIR에 기록
+        EVENT_DIR / WORKING_DIR는 NAS이므로 파일 확인과 기록은 executor 스레드에서 수행
+
+        Returns:
+            tuple: (HTTP status, 응답 dict)
+        """
+        try:
+            event = json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            raise HTTPError(400, f"JSON 파싱 실패: {e}")
+        if not isinstance(event, dict):
+            raise HTTPError(400, "이벤트 JSON은 객체여야 합니다")
+        try:
+            # 검증 함수가 기본값을 채워 넣으므로 사본으로 검증하고 원본 이벤트를 그대로 기록
+            validate_and_initialize_config(copy.deepcopy(event))
+        except Exception as e:
+            raise HTTPError(400, str(e))
+
+        job_id = event_job_id(event)
+        file_name = f"{job_id}.json"
+        if os.sep in file_name or file_name.startswith('.'):
+            raise HTTPError(400, f"작업 ID로 쓸 수 없는 값: {job_id}")
+        job = await asyncio.get_running_loop().run_in_executor(None, self._write_event, job_id, file_name, event)
+        self.monitor.wake()
+        logger.info(f"Submission API: 작업 접수 {job_id}")
+        return 202, {'job_id': job_id, 'status': f"/jobs/{job_id}", 'job': job}
+
+    def _write_event(self, job_id, file_name, event):
+        """중복 확인 후 이벤트 JSON을 EVENT_DIR에 기록하고 작업을 대기 상태로 등록"""
+        event_path = os.path.join(self.monitor.event_dir, file_name)
+        # 같은 작업이 동시에 제출되면 확인과 기록 사이에 끼어들지 않도록 직렬화
+        with self._submit_lock:
+            if self.jobs.active(job_id) or os.path.exists(event_path) \
+                    or os.path.exists(os.path.join(self.monitor.working_dir, self.monitor.working_copy_name(file_name))):
+                raise HTTPError(409, f"이미 접수되었거나 처리 중인 작업: {job_id}")
+
+            # 폴링이 쓰다 만 파일을 읽지 않도록 .json이 아닌 임시 이름으로 쓴 뒤 rename
+            common.write_json_atomic(event_path, event, indent=2)
+            return self.jobs.queued(job_id, source="api")
+
+    def _cancel(self, job_id, body):
+        reason = "API 취소 요청"
+        if body:
+            try:
+                reason = json.loads(body.decode('utf-8')).get('reason') or reason
+            except (ValueError, AttributeError):
+                raise HTTPError(400, "본문은 {\"reason\": ...} 형식이어야 합니다")
+        state = self.monitor.cancel_job(job_id, reason)
+        if state is None:
+            job = self.jobs.get(job_id)
+            if job is not None and job['state'] in FINISHED_STATES:
+                raise HTTPError(409, f"이미 끝난 작업: {job_id} ({job['state']})")
+            raise HTTPError(404, f"작업 없음: {job_id}")
+        return 202, {'job_id': job_id, 'cancel': state}
+
+    # ===== 알림 스트림 =========================================================
+    async def _stream_events(self, writer, job_filter):
+        subscriber = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[subscriber] = job_filter
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/event-stream; charset=utf-8\r\n"
+                         b"Cache-Control: no-cache\r\n"
+                         b"Connection: close\r\n\r\n")
+            # 구독 시점의 상태를 먼저 보냄 (연결 전에 끝난 작업을 놓치지 않도록)
+            if job_filter is not None:
+                job = self.jobs.get(job_filter)
+                if job is not None:
+                    writer.write(self._sse(job['state'], job))
+                    if job['state'] in FINISHED_STATES:
+                        await writer.drain()
+                        return
+            await writer.drain()
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscriber.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    writer.write(b": keepalive\n\n")
+                    await writer.drain()
+                    continue
+                if item is None:
+                    return
+                event, job = item
+                writer.write(self._sse(event, job))
+                await writer.drain()
+                if job_filter is not None and event in FINISHED_STATES:
+                    # 한 작업만 구독한 연결은 작업이 끝나면 종료
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            self._subscribers.pop(subscriber, None)
+
+    @staticmethod
+    def _sse(event, job):
+        data = json.dumps(job, ensure_ascii=False, default=str)
+        return f"event: {event}\ndata: {data}\n\n".encode('utf-8')
+
+
+def start_server(monitor, port=0, host='127.0.0.1', socket_path=''):
+    """작업 제출 API를 백그라운드 스레드로 시작
+
+    socket_path가 있으면 Unix 소켓, 아니면 host:port(HTTP). 둘 다 없으면(port=0) 시작하지 않음.
+
+    Returns:
+        SubmissionAPI (시작하지 않으면 None)
+    """
+    if not socket_path and not port:
+        logger.info("Submission API disabled")
+        return None
+    return SubmissionAPI(monitor, host=host, port=port, socket_path=socket_path).start()
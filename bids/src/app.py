@@ -2,15 +2,38 @@
 import os
 import time
 import shutil
+import threading
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import logging
 import process.main  
+from process.components import staging
+from process.components.domain.mri.source import header_index
+from scheduler import FairShareScheduler
+from admission import AdmissionController, HISTORY_FILENAME, MiB
+from autoscale import AutoscalePolicy
+from claims import ClaimManager
+from jobs import JobTracker, ThroughputHistory, StatusFileWriter, ELSEWHERE, THROUGHPUT_HISTORY_FILENAME
+import api
+import globals as settings
+from utils import profiling, metrics, log, progress, stages, cancel
 from globals import (
     EVENT_DIR, WORKING_DIR, UPLOAD_DIR, BACKUP_DIR, ERROR_DIR, 
-    MAX_WORKERS, LOG_FILENAME, MAGNETIC_STRENGTH_FIELD,
+    MAX_WORKERS, LOG_FILENAME, MAGNETIC_STRENGTH_FIELD, SCRATCH_DIR, POLL_INTERVAL,
+    METRICS_PORT, METRICS_HOST, METRICS_SOCKET, API_PORT, API_HOST, API_SOCKET,
+    PROGRESS_STATUS_DIR, PROGRESS_INTERVAL, PROGRESS_STATUS_RETENTION_HOURS,
+    DEADLINE_JOB_SECONDS, DEADLINE_JOB_SECONDS_PER_GB, DEADLINE_STEP_SECONDS, DEADLINE_STEP_SECONDS_PER_GB,
+    DEADLINE_STEP_LIMITS, DEADLINE_PROCESS_SECONDS, DEADLINE_PROCESS_SECONDS_PER_GB,
+    SCHEDULER_USER_MAX_RUNNING, SCHEDULER_PROJECT_MAX_RUNNING, SCHEDULER_AGING_SECONDS,
+    SCHEDULER_DEFAULT_PRIORITY, ADMISSION_ENABLED, ADMISSION_DEFAULT_EXPANSION,
+    ADMISSION_DISK_RESERVE_MB, ADMISSION_MEMORY_BASE_MB, ADMISSION_MEMORY_FACTOR, ADMISSION_MEMORY_RESERVE_MB,
+    CONFIG_PATH, AUTOSCALE_ENABLED, AUTOSCALE_MIN_WORKERS, AUTOSCALE_MAX_WORKERS, AUTOSCALE_INTERVAL,
+    AUTOSCALE_CPU_HIGH, AUTOSCALE_IOWAIT_HIGH,
+    STAGE_IO_WORKERS, STAGE_CPU_WORKERS, STAGE_PROC_WORKERS, STAGE_QUEUE_SIZE,
+    SOURCE_STREAMING, SOURCE_HEADER_WORKERS, SOURCE_HEADER_QUEUE_SIZE,
+    CLUSTER_ENABLED, CLUSTER_NODE_ID, CLUSTER_HEARTBEAT_INTERVAL, CLUSTER_LEASE_SECONDS,
     DICOM_MODALITY, NIFTI_MODALITY, PARREC_MODALITY, SUFFIX_MAP,
-    FLAG_DIR, DEFACING_FLAG, CANONICAL_FLAG, CIVET_FLAG
+    FLAG_DIR, DEFACING_FLAG, CANONICAL_FLAG, CIVET_FLAG, PROFILE_FLAG, CANCEL_FLAG
 )
 
 # 로그 파일 디렉토리 자동 생성
@@ -18,15 +41,8 @@ log_dir = os.path.dirname(LOG_FILENAME)
 if log_dir and not os.path.exists(log_dir):
     os.makedirs(log_dir, exist_ok=True)
 
-# 로깅 설정
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILENAME),
-        logging.StreamHandler()
-    ]
-)
+# 로깅 설정 (워커 스레드는 큐에 넣기만 하고 파일/콘솔 출력은 리스너 스레드에서 처리)
+log.setup_logging(LOG_FILENAME, level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class JSONFileMonitor:
@@ -38,6 +54,8 @@ class JSONFileMonitor:
         self.error_dir = ERROR_DIR
         self.max_workers = MAX_WORKERS
         self.magnetic_strength_field = MAGNETIC_STRENGTH_FIELD
+        self.scratch_dir = SCRATCH_DIR
+        self.poll_interval = POLL_INTERVAL
         # Modality paths
         self.dicom_modality = DICOM_MODALITY
         self.nifti_modality = NIFTI_MODALITY
@@ -48,13 +66,89 @@ class JSONFileMonitor:
         self.defacing_flag = DEFACING_FLAG
         self.canonical_flag = CANONICAL_FLAG
         self.civet_flag = CIVET_FLAG
-        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.profile_flag = PROFILE_FLAG
+        self.cancel_flag = CANCEL_FLAG
+        # 동시 작업 수는 dispatch에서 max_workers로 제한하므로 스레드풀은 조정 상한 크기로 만들어 둠
+        # (스레드는 필요할 때만 생성됨, 상한을 넘게 늘리면 새 스레드풀로 교체)
+        self.pool_size = max(self.max_workers, AUTOSCALE_MAX_WORKERS if AUTOSCALE_ENABLED else 0)
+        self.executor = ThreadPoolExecutor(max_workers=self.pool_size)
+        self._retired_executors = []
+        self.autoscale_interval = AUTOSCALE_INTERVAL
+        self.autoscaler = None
+        if AUTOSCALE_ENABLED:
+            self.autoscaler = AutoscalePolicy(AUTOSCALE_MIN_WORKERS, AUTOSCALE_MAX_WORKERS,
+                                              AUTOSCALE_CPU_HIGH, AUTOSCALE_IOWAIT_HIGH)
+        self._next_autoscale = time.monotonic() + self.autoscale_interval
+        self.config_path = CONFIG_PATH
+        self._config_mtime = self._get_config_mtime()
+        metrics.WORKER_LIMIT.set(self.max_workers)
+        # 작업 내 단계는 종류별(IO/CPU/PROC) 풀에서 실행
+        stages.configure(io_workers=STAGE_IO_WORKERS, cpu_workers=STAGE_CPU_WORKERS,
+                         proc_workers=STAGE_PROC_WORKERS, queue_size=STAGE_QUEUE_SIZE)
+        header_index.configure(enabled=SOURCE_STREAMING, workers=SOURCE_HEADER_WORKERS,
+                               queue_size=SOURCE_HEADER_QUEUE_SIZE)
+        # 작업 / 단계 / 외부 프로세스 제한 시간 (업로드 / 입력 크기에 비례)
+        cancel.configure(cancel.Deadlines(
+            job_seconds=DEADLINE_JOB_SECONDS, job_per_gb=DEADLINE_JOB_SECONDS_PER_GB,
+            step_seconds=DEADLINE_STEP_SECONDS, step_per_gb=DEADLINE_STEP_SECONDS_PER_GB,
+            step_overrides=cancel.parse_step_overrides(DEADLINE_STEP_LIMITS),
+            process_seconds=DEADLINE_PROCESS_SECONDS, process_per_gb=DEADLINE_PROCESS_SECONDS_PER_GB
+        ))
+        self._tokens = {}               # 실행 중인 작업의 취소 토큰 (job_id -> CancelToken)
+        self._cancel_requests = {}      # 아직 시작하지 않은 작업의 취소 요청 (job_id -> 사유)
+        # 이벤트 파일은 스케줄러 대기열에 등록하고 빈 워커가 있을 때만 executor에 제출
+        self.scheduler = FairShareScheduler(
+            self.upload_dir,
+            user_max_running=SCHEDULER_USER_MAX_RUNNING,
+            project_max_running=SCHEDULER_PROJECT_MAX_RUNNING,
+            aging_seconds=SCHEDULER_AGING_SECONDS,
+            default_priority=SCHEDULER_DEFAULT_PRIORITY
+        )
+        # 디스크/메모리 여유가 부족하면 대기열에 둔 채 시작하지 않음
+        self.admission = None
+        if ADMISSION_ENABLED:
+            self.admission = AdmissionController(
+                [self.scratch_dir, self.working_dir],
+                history_path=os.path.join(self.working_dir, HISTORY_FILENAME),
+                default_expansion=ADMISSION_DEFAULT_EXPANSION,
+                disk_reserve=ADMISSION_DISK_RESERVE_MB * MiB,
+                memory_base=ADMISSION_MEMORY_BASE_MB * MiB,
+                memory_factor=ADMISSION_MEMORY_FACTOR,
+                memory_reserve=ADMISSION_MEMORY_RESERVE_MB * MiB
+            )
+        # 여러 노드가 같은 EVENT_DIR를 처리하면 작업 시작 직전에 이벤트를 claim (다른 노드가 가져간 작업은 건너뜀)
+        self.claims = None
+        if CLUSTER_ENABLED:
+            self.claims = ClaimManager(self.event_dir, node_id=CLUSTER_NODE_ID,
+                                       heartbeat_interval=CLUSTER_HEARTBEAT_INTERVAL,
+                                       lease_seconds=CLUSTER_LEASE_SECONDS,
+                                       on_fenced=self.cancel_fenced_jobs)
+        # 작업 상태 / 단계 / 진행 카운터 / ETA (제출 API와 STATUS_DIR 상태 파일로 노출)
+        self.jobs = JobTracker(
+            estimator=ThroughputHistory(os.path.join(self.working_dir, THROUGHPUT_HISTORY_FILENAME)),
+            progress_interval=PROGRESS_INTERVAL
+        )
+        log.add_step_listener(self.jobs.step)
+        progress.add_listener(self.jobs.progress)
+        if PROGRESS_STATUS_DIR:
+            status_files = StatusFileWriter(PROGRESS_STATUS_DIR, retention_seconds=PROGRESS_STATUS_RETENTION_HOURS * 3600)
+            status_files.cleanup()
+            self.jobs.add_listener(status_files)
+        self._dispatch_lock = threading.Lock()
         self.processed_files = set()  # 이미 처리된 파일 추적
+        self._stop_event = threading.Event()  # monitor_loop 종료 요청
+        self._wake_event = threading.Event()  # 폴링 대기 중단 (API 제출 / 종료 요청)
         
         logger.info(f"Monitor initialized - Event Dir: {self.event_dir}, Working Dir: {self.working_dir}, Upload Dir: {self.upload_dir}, "
                    f"Backup Dir: {self.backup_dir}, Error Dir: {self.error_dir}, Max Workers: {self.max_workers}")
         logger.info(f"Modality paths - DICOM: {self.dicom_modality}, NIFTI: {self.nifti_modality}, PARREC: {self.parrec_modality}, SUFFIX_MAP: {self.suffix_map}")
-        logger.info(f"Flag paths - Base: {self.flag_dir}, Defacing: {self.defacing_flag}, Canonical: {self.canonical_flag}, CIVET: {self.civet_flag}")
+        logger.info(f"Flag paths - Base: {self.flag_dir}, Defacing: {self.defacing_flag}, Canonical: {self.canonical_flag}, CIVET: {self.civet_flag}, Profile: {self.profile_flag}, Cancel: {self.cancel_flag}")
+        logger.info(f"Scratch Dir: {self.scratch_dir or '(disabled)'}, Poll Interval: {self.poll_interval}s")
+        
+        # 이전 실행이 남긴 scratch / 게시 준비 디렉토리 정리
+        staging.cleanup_stale(self.working_dir, self.scratch_dir)
+        if self.claims:
+            self.claims.start()
     
     
     def get_json_files(self):
@@ -71,15 +165,31 @@ class JSONFileMonitor:
         except Exception as e:
             logger.error(f"Error scanning event directory: {e}")
         
+        metrics.EVENT_FILES.set(len(json_files))
         return json_files
     
     
+    def working_copy_name(self, file_name):
+        """WORKING_DIR의 작업 파일 이름
+
+        cluster 모드면 노드 ID를 붙여 노드마다 다른 이름을 쓴다. claim을 인수한 노드가 같은 이벤트를 다시 복사해도
+        fenced 노드의 정리와 겹치지 않고, process.main이 이 이름으로 작업 ID를 정하므로 scratch / 게시 준비 디렉토리
+        (.bdsp_publish/<작업 ID>) / 게시 중 표시도 노드별로 분리된다.
+        """
+        if not self.claims:
+            return file_name
+        name, ext = os.path.splitext(file_name)
+        return f"{name}.{self.claims.node_id}{ext}"
+    
     def move_file_to_working(self, json_file_path):
-        """JSON 파일을 WORKING_DIR로 이동"""
+        """JSON 파일을 WORKING_DIR로 이동 (claim한 파일은 작업이 끝날 때까지 claim으로 남기고 복사)"""
         try:
             file_name = os.path.basename(json_file_path)
-            destination = os.path.join(self.working_dir, file_name)
-            shutil.move(json_file_path, destination)
+            destination = os.path.join(self.working_dir, self.working_copy_name(file_name))
+            if self.claims:
+                shutil.copy2(json_file_path, destination)
+            else:
+                shutil.move(json_file_path, destination)
             logger.info(f"Moved file: {file_name} to working directory")
             return destination
         except Exception as e:
@@ -87,10 +197,10 @@ class JSONFileMonitor:
             return None
     
     
-    def move_file_to_error(self, file_path, error_msg):
-        """처리 실패한 파일을 ERROR_DIR로 이동"""
+    def move_file_to_error(self, file_path, error_msg, file_name=None):
+        """처리 실패한 파일을 ERROR_DIR로 이동 (file_name: ERROR_DIR에서 쓸 이름, 기본은 file_path의 파일명)"""
         try:
-            file_name = os.path.basename(file_path)
+            file_name = file_name or os.path.basename(file_path)
             error_destination = os.path.join(self.error_dir, file_name)
             
             # 같은 이름의 파일이 있으면 타임스탬프 추가
@@ -111,21 +221,50 @@ class JSONFileMonitor:
         except Exception as e:
             logger.error(f"Error moving file to error directory {file_path}: {e}")
     
-    def process_json_file(self, json_file_path):
-        """JSON 파일을 처리하는 메인 로직"""
+    def process_json_file(self, json_file_path, upload_bytes=0):
+        """JSON 파일을 처리하는 메인 로직 (작업 ID = 이벤트 파일명을 로그 컨텍스트로 설정)"""
+        job_id = Path(json_file_path).stem
+        # 취소 토큰: 대기 중에 들어온 취소 요청은 시작하자마자 반영
+        token = cancel.CancelToken(job_id, upload_bytes)
+        with self._dispatch_lock:
+            self._tokens[job_id] = token
+            reason = self._cancel_requests.pop(job_id, None)
+        if reason is not None:
+            token.cancel(reason)
+        try:
+            with log.job_context(job_id=job_id), cancel.job_scope(token):
+                return self._process_json_file(json_file_path)
+        finally:
+            with self._dispatch_lock:
+                self._tokens.pop(job_id, None)
+    
+    def _process_json_file(self, json_file_path):
         file_name = os.path.basename(json_file_path)
         logger.info(f"Processing file: {file_name}")
         
+        # 대기열에서 꺼내 실행 시작 (워커 스레드별 실행 중 작업 수)
+        job_id = Path(json_file_path).stem
+        worker = threading.current_thread().name
+        metrics.QUEUE_DEPTH.dec()
+        metrics.JOBS_IN_FLIGHT.inc(worker=worker)
+        self.jobs.started(job_id)
+        started = time.perf_counter()
+        outcome = "error"
+        error_msg = None
+        result = None
+        
         working_file_path = None
         try:
             # 파일을 WORKING_DIR로 이동
             working_file_path = self.move_file_to_working(json_file_path)
             if not working_file_path:
+                error_msg = f"WORKING_DIR로 이동 실패: {file_name}"
                 return
+            # 대기 중에 취소된 작업
+            cancel.check()
             
             # process.main의 함수 직접 호출 (전역변수들과 함께)
-            process.main.main(
-                working_file_path,
+            main_kwargs = dict(
                 upload_dir=self.upload_dir,
                 backup_dir=self.backup_dir,
                 error_dir=self.error_dir,
@@ -135,27 +274,259 @@ class JSONFileMonitor:
                 parrec_modality=self.parrec_modality,
                 suffix_map = self.suffix_map,
                 flag_dir=self.flag_dir,
-                magnetic_strength_field = self.magnetic_strength_field
+                defacing_flag=self.defacing_flag,
+                canonical_flag=self.canonical_flag,
+                civet_flag=self.civet_flag,
+                magnetic_strength_field = self.magnetic_strength_field,
+                scratch_dir=self.scratch_dir
             )
+            
+            # 이벤트 JSON의 profile 필드 또는 PROFILE_FLAG 제어 파일이 있을 때만 프로파일링
+            profile_options = profiling.profile_requested(working_file_path, self.profile_flag)
+            if profile_options:
+                result = profiling.run_profiled(process.main.main, working_file_path, self.error_dir,
+                                                profile_options, **main_kwargs)
+            else:
+                result = process.main.main(working_file_path, **main_kwargs)
+            outcome = "success"
             logger.info(f"Successfully processed: {file_name}")
+            return result
                 
+        except cancel.JobFenced as e:
+            # claim을 인수한 노드가 다시 처리하므로 ERROR_DIR로 옮기지 않고 이 노드의 작업 복사본만 삭제
+            # (복사본 이름에 노드 ID가 있으므로 인수한 노드의 복사본은 건드리지 않음)
+            outcome = e.kind
+            error_msg = str(e)
+            logger.warning(f"Stopped processing {file_name}: {e}")
+            if working_file_path and os.path.exists(working_file_path):
+                os.remove(working_file_path)
+            
+        except cancel.JobCancelled as e:
+            # 취소 / 제한 시간 초과: 워커를 반환하고 사유와 함께 ERROR_DIR로 이동
+            outcome = e.kind
+            error_msg = str(e)
+            logger.error(f"Stopped processing {file_name}: {e}")
+            if working_file_path and os.path.exists(working_file_path):
+                self.move_file_to_error(working_file_path, error_msg, file_name)
+            
         except Exception as e:
-            error_msg = f"Error processing {file_name}: {e}"
-            logger.error(error_msg)
+            error_msg = str(e)
+            logger.error(f"Error processing {file_name}: {e}")
             
             # 에러 발생 시 ERROR_DIR로 이동
             if working_file_path and os.path.exists(working_file_path):
-                self.move_file_to_error(working_file_path, str(e))
+                self.move_file_to_error(working_file_path, str(e), file_name)
             
         finally:
+            metrics.JOBS_IN_FLIGHT.dec(worker=worker)
+            metrics.JOBS.inc(outcome=outcome)
+            metrics.JOB_DURATION.observe(time.perf_counter() - started, outcome=outcome)
+            self.jobs.finished(job_id, outcome, error=error_msg, result=result if isinstance(result, dict) else None)
             # 처리 완료된 파일을 추적 목록에서 제거 (재처리 가능하게)
             self.processed_files.discard(file_name)
     
+    def _run_job(self, json_file_path, upload_bytes=0):
+        """워커 스레드: 작업 실행 후 스케줄러에 종료를 알리고 다음 작업 제출"""
+        file_name = os.path.basename(json_file_path)
+        try:
+            result = self.process_json_file(json_file_path, upload_bytes)
+            if self.admission and isinstance(result, dict) and result.get('trace_json'):
+                self.admission.record_trace(result['trace_json'])
+        finally:
+            if self.claims:
+                self.claims.release(file_name)
+            if self.admission:
+                self.admission.release(file_name)
+            self.scheduler.done(file_name)
+            self.dispatch()
+    
+    def dispatch(self):
+        """빈 워커 수만큼 스케줄러에서 작업을 꺼내 executor에 제출"""
+        with self._dispatch_lock:
+            while not self._stop_event.is_set() and self.scheduler.running < self.max_workers:
+                job = self.scheduler.next_job(admit=self._admit if self.admission else None)
+                if job is None:
+                    break
+                job_path = job.path
+                if self.claims:
+                    job_path = self.claims.claim(job.path)
+                    if job_path is None:
+                        # 다른 노드가 먼저 claim함 - 대기열에서 제거
+                        logger.info(f"다른 노드가 처리 중: {job.file_name}")
+                        self.jobs.finished(Path(job.file_name).stem, ELSEWHERE)
+                        if self.admission:
+                            self.admission.release(job.file_name)
+                        self.scheduler.done(job.file_name)
+                        self.processed_files.discard(job.file_name)
+                        metrics.QUEUE_DEPTH.dec()
+                        continue
+                try:
+                    self.executor.submit(self._run_job, job_path, job.size)
+                except RuntimeError:
+                    # 종료 중 (executor shutdown 이후) - 대기열에 있던 작업은 다음 기동 시 다시 수집됨
+                    if self.claims:
+                        self.claims.requeue(job_path, "종료 중")
+                    if self.admission:
+                        self.admission.release(job.file_name)
+                    self.scheduler.done(job.file_name)
+                    break
+                logger.info(f"Submitted for processing: {job.file_name}")
+    
+    def _admit(self, job):
+        """admission 확인 (dispatch 잠금 안에서 호출) - 취소 요청된 대기 작업은 여유와 관계없이 바로 시작해 취소 처리"""
+        if Path(job.file_name).stem in self._cancel_requests:
+            self.admission.discard(job.file_name)
+            return True
+        return self.admission.try_admit(job)
+    
+    def cancel_job(self, job_id, reason):
+        """작업 취소 요청 (제어 파일 / API, 다른 스레드에서 호출 가능)
+
+        Returns:
+            str: 'cancelling'(실행 중 - 다음 확인 지점에서 중단, 외부 프로세스는 바로 종료),
+                 'pending'(대기 중 - 시작하자마자 중단), 모르는 작업이면 None
+        """
+        with self._dispatch_lock:
+            token = self._tokens.get(job_id)
+            if token is None:
+                if f"{job_id}.json" not in self.processed_files:
+                    return None
+                self._cancel_requests[job_id] = reason
+        if token is not None:
+            token.cancel(reason)
+            return "cancelling"
+        logger.info(f"대기 중인 작업 취소 예약: {job_id} ({reason})")
+        return "pending"
+    
+    def cancel_fenced_jobs(self):
+        """claim 디렉토리가 다른 노드로 인수됨 (heartbeat 스레드에서 호출) - 실행 중인 작업 모두 중단
+
+        인수 시점의 claim은 모두 다른 노드로 넘어갔으므로 실행 중인 작업 전체가 대상이다.
+        """
+        with self._dispatch_lock:
+            tokens = list(self._tokens.values())
+        for token in tokens:
+            token.cancel("claim이 다른 노드로 인수됨", error_class=cancel.JobFenced)
+        if tokens:
+            logger.error(f"claim 인수로 실행 중인 작업 {len(tokens)}개 중단")
+    
+    def check_cancel_requests(self):
+        """CANCEL_FLAG/<job_id> 제어 파일 처리 (처리한 파일은 삭제, 아직 모르는 작업의 파일은 남겨 둠)"""
+        try:
+            names = os.listdir(self.cancel_flag)
+        except FileNotFoundError:
+            return
+        for name in names:
+            control_path = os.path.join(self.cancel_flag, name)
+            job_id = name[:-len('.json')] if name.endswith('.json') else name
+            if name.startswith('.') or not os.path.isfile(control_path):
+                continue
+            try:
+                with open(control_path, 'r', encoding='utf-8', errors='replace') as f:
+                    reason = f.readline().strip() or "제어 파일로 취소 요청"
+            except OSError:
+                continue
+            if self.cancel_job(job_id, reason) is None:
+                continue
+            try:
+                os.unlink(control_path)
+            except FileNotFoundError:
+                pass
+    
+    def watch_deadlines(self):
+        """실행 중인 작업의 제한 시간 확인 (초과 시 외부 프로세스를 바로 종료, 작업은 다음 확인 지점에서 중단)"""
+        with self._dispatch_lock:
+            tokens = list(self._tokens.values())
+        for token in tokens:
+            token.poll()
+    
+    def set_max_workers(self, max_workers, reason):
+        """동시 작업 수 변경 (줄일 때 실행 중인 작업은 중단하지 않고, 끝날 때까지 새 작업 제출만 보류)"""
+        max_workers = max(1, int(max_workers))
+        if max_workers == self.max_workers:
+            return
+        logger.info(f"동시 작업 수 변경: {self.max_workers} -> {max_workers} ({reason})")
+        with self._dispatch_lock:
+            if max_workers > self.pool_size:
+                # 기존 스레드풀은 실행 중인 작업만 마치고 종료 (대기 작업은 스케줄러에 있으므로 남지 않음)
+                self._prune_retired_executors()
+                self._retired_executors.append(self.executor)
+                self.executor.shutdown(wait=False)
+                self.executor = ThreadPoolExecutor(max_workers=max_workers)
+                self.pool_size = max_workers
+            self.max_workers = max_workers
+        metrics.WORKER_LIMIT.set(max_workers)
+        self.dispatch()
+    
+    def _get_config_mtime(self):
+        try:
+            return os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            return None
+    
+    def reload_config_if_changed(self):
+        """config.ini 수정 시각이 바뀌면 실행 중 반영 가능한 설정을 다시 읽음"""
+        mtime = self._get_config_mtime()
+        if mtime is None or mtime == self._config_mtime:
+            return
+        self._config_mtime = mtime
+        try:
+            runtime = settings.read_runtime_settings(self.config_path)
+        except Exception as e:
+            logger.error(f"config.ini 다시 읽기 실패 (기존 설정 유지): {e}")
+            return
+        logger.info(f"config.ini 변경 감지: {self.config_path}")
+        
+        self.poll_interval = runtime['POLL_INTERVAL']
+        self.scheduler.user_max_running = runtime['SCHEDULER_USER_MAX_RUNNING']
+        self.scheduler.project_max_running = runtime['SCHEDULER_PROJECT_MAX_RUNNING']
+        self.autoscale_interval = runtime['AUTOSCALE_INTERVAL']
+        if runtime['AUTOSCALE_ENABLED']:
+            if self.autoscaler is None:
+                self.autoscaler = AutoscalePolicy()
+            self.autoscaler.min_workers = max(1, runtime['AUTOSCALE_MIN_WORKERS'])
+            self.autoscaler.max_workers = max(self.autoscaler.min_workers, runtime['AUTOSCALE_MAX_WORKERS'])
+            self.autoscaler.cpu_high = runtime['AUTOSCALE_CPU_HIGH']
+            self.autoscaler.iowait_high = runtime['AUTOSCALE_IOWAIT_HIGH']
+            target = min(max(runtime['MAX_WORKERS'], self.autoscaler.min_workers), self.autoscaler.max_workers)
+        else:
+            self.autoscaler = None
+            target = runtime['MAX_WORKERS']
+        self.set_max_workers(target, "config.ini")
+    
+    def _prune_retired_executors(self):
+        """교체된 스레드풀 중 실행 중이던 작업을 모두 마치고 스레드가 종료된 것은 목록에서 제거"""
+        self._retired_executors = [executor for executor in self._retired_executors
+                                   if any(thread.is_alive() for thread in executor._threads)]
+
+    def autoscale(self):
+        """AUTOSCALE_INTERVAL마다 autoscale 정책에 따라 동시 작업 수 조정"""
+        if self.autoscaler is None or time.monotonic() < self._next_autoscale:
+            return
+        self._next_autoscale = time.monotonic() + self.autoscale_interval
+        # 직렬화 키 / 사용자·프로젝트 상한에 막힌 작업은 슬롯을 늘려도 시작할 수 없으므로 제외
+        target, reason = self.autoscaler.decide(self.max_workers, self.scheduler.dispatchable(), self.scheduler.running)
+        if reason:
+            self.set_max_workers(target, f"autoscale: {reason}")
+    
+    def stop(self):
+        """monitor_loop 종료 요청 (다른 스레드에서 호출, 진행 중인 작업은 완료 후 종료)"""
+        self._stop_event.set()
+        self._wake_event.set()
+    
+    def wake(self):
+        """poll_interval을 기다리지 않고 EVENT_DIR를 바로 다시 확인 (다른 스레드에서 호출)"""
+        self._wake_event.set()
+    
+    def _wait(self):
+        self._wake_event.wait(self.poll_interval)
+        self._wake_event.clear()
+    
     def monitor_loop(self):
-        """5초마다 EVENT_DIR을 체크하는 메인 루프"""
+        """poll_interval(기본 5초)마다 EVENT_DIR을 체크하는 메인 루프"""
         logger.info("Starting JSON file monitoring...")
         
-        while True:
+        while not self._stop_event.is_set():
             try:
                 json_files = self.get_json_files()
                 
@@ -164,27 +535,45 @@ class JSONFileMonitor:
                     # 중복 처리 방지
                     if file_name not in self.processed_files:
                         self.processed_files.add(file_name)
-                        # 스레드풀에 작업 제출
-                        self.executor.submit(self.process_json_file, json_file)
-                        logger.info(f"Submitted for processing: {file_name}")
+                        # 스케줄러 대기열에 등록 (실행 순서는 스케줄러가 결정)
+                        metrics.QUEUE_DEPTH.inc()
+                        self.jobs.queued(Path(json_file).stem)
+                        self.scheduler.add(json_file)
+                
+                # 취소 제어 파일 / 제한 시간 확인
+                self.check_cancel_requests()
+                self.watch_deadlines()
+                
+                # 동시 작업 수 조정 (config.ini 변경 / autoscale) 후 빈 슬롯만큼 제출
+                self.reload_config_if_changed()
+                self.autoscale()
+                self.dispatch()
                 
-                time.sleep(5)  # 5초 대기
+                self._wait()
                 
             except KeyboardInterrupt:
                 logger.info("Monitor stopped by user")
                 break
             except Exception as e:
                 logger.error(f"Error in monitor loop: {e}")
-                time.sleep(5)
+                self._wait()
         
-        # 종료 시 스레드풀 정리
-        self.executor.shutdown(wait=True)
+        # 종료 시 스레드풀 정리 (교체된 이전 스레드풀의 실행 중 작업 포함)
+        for executor in self._retired_executors + [self.executor]:
+            executor.shutdown(wait=True)
+        stages.shutdown(wait=True)
+        if self.claims:
+            self.claims.stop()
         logger.info("Monitor shutdown complete")
 
 def main():
     """메인 함수"""
     monitor = JSONFileMonitor()
+    metrics.start_server(port=METRICS_PORT, host=METRICS_HOST, socket_path=METRICS_SOCKET)
+    api_server = api.start_server(monitor, port=API_PORT, host=API_HOST, socket_path=API_SOCKET)
     monitor.monitor_loop()
+    if api_server:
+        api_server.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
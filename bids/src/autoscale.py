@@ -0,0 +1,83 @@
+#/BDSP/bids_app/src/autoscale.py
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# /proc/stat cpu 행 필드 순서
+_CPU_FIELDS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal')
+
+
+def read_cpu_times():
+    """/proc/stat 전체 cpu 누적 시간 (jiffies, 읽을 수 없으면 None)"""
+    try:
+        with open('/proc/stat', 'r') as f:
+            fields = f.readline().split()
+    except OSError:
+        return None
+    if not fields or fields[0] != 'cpu':
+        return None
+    values = [int(v) for v in fields[1:len(_CPU_FIELDS) + 1]]
+    return dict(zip(_CPU_FIELDS, values))
+
+
+class CpuSampler:
+    """직전 샘플 이후 CPU 사용률과 I/O wait 비율 (0.0 ~ 1.0)"""
+
+    def __init__(self):
+        self._last = read_cpu_times()
+
+    def sample(self):
+        """
+        Returns:
+            (busy, iowait) 또는 측정 불가 시 None
+        """
+        current = read_cpu_times()
+        last, self._last = self._last, current
+        if current is None or last is None:
+            return None
+        delta = {key: current[key] - last[key] for key in current}
+        total = sum(delta.values())
+        if total <= 0:
+            return None
+        busy = 1.0 - (delta['idle'] + delta['iowait']) / total
+        return busy, delta['iowait'] / total
+
+
+class AutoscalePolicy:
+    """CPU 사용률 / I/O wait / 대기열 길이로 동시 작업 수 조정 (한 번에 1씩)
+
+    - CPU 또는 I/O wait가 상한 이상: 1 감소 (디스크/CPU 포화 상태에서 작업을 더 넣으면 전체 처리량이 떨어짐)
+    - 대기 작업이 있고 모든 슬롯이 사용 중이며 여유가 있으면: 1 증가
+    - 대기 작업이 없고 빈 슬롯이 있으면: 1 감소
+    감소는 새 작업 제출만 막으며 실행 중인 작업은 끝까지 실행된다.
+    """
+
+    def __init__(self, min_workers=1, max_workers=None, cpu_high=0.9, iowait_high=0.3):
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers or os.cpu_count() or 1)
+        self.cpu_high = cpu_high
+        self.iowait_high = iowait_high
+        self.sampler = CpuSampler()
+
+    def decide(self, current, pending, running):
+        """
+        Returns:
+            (새 동시 작업 수, 사유)
+        """
+        usage = self.sampler.sample()
+        if usage is None:
+            return current, None
+        busy, iowait = usage
+        target, reason = current, None
+        if busy >= self.cpu_high or iowait >= self.iowait_high:
+            target = current - 1
+            reason = f"CPU {busy:.0%}, I/O wait {iowait:.0%}"
+        elif pending > 0 and running >= current:
+            target = current + 1
+            reason = f"대기 {pending}건, CPU {busy:.0%}, I/O wait {iowait:.0%}"
+        elif pending == 0 and running < current:
+            target = current - 1
+            reason = f"대기 없음, 실행 {running}건"
+        target = min(max(target, self.min_workers), self.max_workers)
+        return target, (reason if target != current else None)
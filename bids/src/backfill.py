@@ -0,0 +1,563 @@
+#/BDSP/bids_app/src/backfill.py
+"""이벤트 JSON 일괄 재처리 (bids-backfill)
+
+모달리티 매핑 / suffix_map 등 규칙이 바뀐 뒤 과거 업로드를 다시 처리할 때, EVENT_DIR(라이브 모니터)를
+거치지 않고 process.main.main을 N개 워커로 직접 실행한다.
+
+- 입력: 이벤트 JSON 디렉토리 / 파일 / manifest (한 줄에 경로 하나, '#'은 주석). BACKUP_DIR의 *_export.json도
+  그대로 받는다 (export 키는 제거). 같은 작업(<user>_<subjectId>_<uploadTime>)이 여러 번 나오면 가장 최근 파일만 사용
+- 최신 판정: trace.json 생성 시각(trace_created, 예전 trace는 mtime)이 업로드 zip / 모달리티 매핑 / suffix_map보다
+  새로우면 건너뜀 (--force면 모두 재처리). flag 보고 / rederive로 trace가 갱신되어도 판정은 바뀌지 않음
+- 오래된 결과는 다시 처리하기 직전에 trace와 rawdata 결과물(NIfTI / sidecar / thumbnail / 부산물)을
+  MSS state/backfill/superseded/<job_id>_<시각>/으로 옮긴다 (삭제하지 않음). 재처리가 실패하거나 취소되면
+  옮긴 결과를 원래 위치로 되돌리고 run 번호를 다시 할당한다
+- 한 프로세스에서 실행하므로 PAR 헤더 / 규칙 JSON 캐시는 작업 간에 공유되고, dcm2niix 결과는 입력 내용 기준
+  변환 캐시(CONVERSION_CACHE_DIR)로 재사용된다
+- 실행 순서는 모니터와 같은 FairShareScheduler (같은 subject/session 작업은 하나씩)
+- 끝나면 처리량과 실패 목록을 출력하고(--output이면 JSON 보고서도 저장) 실패가 있으면 종료 코드 1.
+  실패한 작업의 이벤트 사본은 WORKING_DIR/.bdsp_backfill/<실행 ID>/에 남으므로 그 디렉토리로 다시 실행할 수 있다
+
+    bids-backfill /BDSP/interfaces/backup --workers 4
+    bids-backfill --manifest events.txt --dry-run
+    bids-backfill events/ --force --output backfill_report.json
+
+라이브 모니터가 같은 작업을 동시에 처리하지 않도록 EVENT_DIR에 없는 과거 작업만 넣어야 한다.
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import process.main
+from process.components import export, flags, mss
+from process.components.domain.mri.raw import conversion_cache, name_builder
+from process.components.domain.mri.raw.modality_mapper import modality_mapping_path
+from process.components.domain.mri.source import header_index
+from scheduler import FairShareScheduler
+from utils import cancel, common, log, metrics, stages
+from globals import (
+    WORKING_DIR, UPLOAD_DIR, BACKUP_DIR, ERROR_DIR, MAGNETIC_STRENGTH_FIELD, SCRATCH_DIR,
+    DICOM_MODALITY, NIFTI_MODALITY, PARREC_MODALITY, SUFFIX_MAP,
+    FLAG_DIR, DEFACING_FLAG, CANONICAL_FLAG, CIVET_FLAG,
+    STAGE_IO_WORKERS, STAGE_CPU_WORKERS, STAGE_PROC_WORKERS, STAGE_QUEUE_SIZE,
+    SOURCE_STREAMING, SOURCE_HEADER_WORKERS, SOURCE_HEADER_QUEUE_SIZE,
+    DEADLINE_JOB_SECONDS, DEADLINE_JOB_SECONDS_PER_GB, DEADLINE_STEP_SECONDS, DEADLINE_STEP_SECONDS_PER_GB,
+    DEADLINE_STEP_LIMITS, DEADLINE_PROCESS_SECONDS, DEADLINE_PROCESS_SECONDS_PER_GB,
+    BACKFILL_WORKERS, BACKFILL_CONVERSION_CACHE_DIR, BACKFILL_CONVERSION_CACHE_MAX_GB, BACKFILL_LOG_FILENAME
+)
+
+logger = logging.getLogger(__name__)
+
+# 재처리용 이벤트 사본 위치 (WORKING_DIR 아래, 실행마다 하위 디렉토리)
+STAGING_DIRNAME = ".bdsp_backfill"
+# 재처리 전에 이전 결과를 옮겨 두는 MSS state 하위 경로
+SUPERSEDED_DIRNAME = os.path.join("backfill", "superseded")
+
+# 작업 판정
+NEW = "new"             # trace 없음 (처리된 적 없음)
+STALE = "stale"         # trace가 입력(업로드 / 규칙)보다 오래됨
+CURRENT = "current"     # 최신 - 건너뜀
+INVALID = "invalid"     # 이벤트 / 업로드 문제로 실행하지 않음
+
+
+class BackfillJob:
+    """재처리 대상 작업 하나"""
+
+    def __init__(self, job_id, source, event):
+        self.job_id = job_id
+        self.source = source
+        self.event = event
+        self.state = NEW
+        self.reason = ""
+        self.mss_path = None
+        self.trace_path = None
+        self.upload_bytes = 0
+        self.staged_path = None
+        self.outcome = None
+        self.error = None
+        self.duration = None
+        self.superseded = None
+        self.retired = []               # 보관한 NIfTI (MSS 기준 상대 경로)
+        self.renamed = []               # 재처리 후 같은 이름으로 다시 만들어지지 않은 NIfTI
+        self.restored = 0               # 재처리 실패로 되돌린 이전 결과 파일 수
+
+
+# ===== 입력 수집 / 판정 ========================================================
+def collect_event_paths(sources, manifest=None, recursive=False):
+    """디렉토리 / 파일 / manifest에서 이벤트 JSON 경로 목록"""
+    paths = []
+    for source in sources:
+        source = Path(source)
+        if source.is_dir():
+            pattern = '**/*.json' if recursive else '*.json'
+            paths.extend(sorted(p for p in source.glob(pattern) if p.is_file() and not p.name.startswith('.')))
+        elif source.is_file():
+            paths.append(source)
+        else:
+            raise FileNotFoundError(f"입력 경로가 없습니다: {source}")
+    if manifest:
+        base = Path(manifest).parent
+        with open(manifest, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    path = Path(line)
+                    paths.append(path if path.is_absolute() else base / path)
+    return [str(p) for p in paths]
+
+
+def load_jobs(paths):
+    """이벤트 JSON 로드 - 같은 작업이 여러 번 나오면 가장 최근 파일만 사용
+
+    Returns:
+        tuple: (jobs, invalid) - invalid는 읽을 수 없는 파일의 BackfillJob (state=INVALID)
+    """
+    jobs = {}
+    invalid = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                event = json.load(f)
+            if not isinstance(event, dict):
+                raise ValueError("JSON 객체가 아님")
+            job_id = f"{event['user']}_{event['subjectId']}_{event['uploadTime']}"
+        except (OSError, ValueError, KeyError) as e:
+            job = BackfillJob(Path(path).stem, path, None)
+            job.state, job.reason = INVALID, f"이벤트 JSON 읽기 실패: {e}"
+            invalid.append(job)
+            continue
+        # BACKUP_DIR의 export.json은 처리 결과(export)를 뺀 원래 이벤트로 사용
+        event.pop('export', None)
+        previous = jobs.get(job_id)
+        if previous is None or os.path.getmtime(path) >= os.path.getmtime(previous.source):
+            jobs[job_id] = BackfillJob(job_id, path, event)
+    return list(jobs.values()), invalid
+
+
+def plan_job(job, global_vars, force=False):
+    """작업 판정: trace 경로, 업로드 크기, NEW / STALE / CURRENT / INVALID"""
+    try:
+        structured_config = process.main.validate_and_initialize_config(copy.deepcopy(job.event))
+    except Exception as e:
+        job.state, job.reason = INVALID, f"이벤트 검증 실패: {e}"
+        return job
+    request = structured_config['request']
+    job.mss_path = mss.mss_path_for(structured_config, global_vars['working_dir'])
+    job.trace_path = export.trace_json_path(job.event, os.path.join(job.mss_path, "state"))
+
+    upload_path = Path(global_vars['upload_dir']) / request['user'] / request['subjectId'] / request['uploadTime']
+    zips = sorted(p for p in upload_path.glob('*') if p.is_file() and p.suffix.lower() == '.zip') \
+        if upload_path.is_dir() else []
+    if not zips:
+        job.state, job.reason = INVALID, f"업로드 zip 없음: {upload_path}"
+        return job
+    job.upload_bytes = sum(p.stat().st_size for p in zips)
+
+    if not os.path.exists(job.trace_path):
+        job.state, job.reason = NEW, "trace 없음"
+        return job
+    if force:
+        job.state, job.reason = STALE, "--force"
+        return job
+
+    # 결과에 영향을 주는 입력 중 가장 최근에 바뀐 파일
+    inputs = [str(p) for p in zips] + [global_vars['suffix_map']]
+    inputs += [modality_mapping_path(global_vars, structured_config, file_format) for file_format in ('dicom', 'parrec')]
+    newest = max(((os.path.getmtime(path), path) for path in inputs if os.path.exists(path)), default=(0, None))
+    # trace 파일 mtime이 아니라 trace에 기록된 생성 시각과 비교 (flag 보고 / rederive 갱신은 처리 시각이 아님)
+    try:
+        processed = flags.trace_created(job.trace_path)
+    except (OSError, ValueError) as e:
+        job.state, job.reason = STALE, f"trace 읽기 실패: {e}"
+        return job
+    if newest[0] > processed:
+        job.state, job.reason = STALE, f"{os.path.basename(newest[1])} 변경"
+    else:
+        job.state, job.reason = CURRENT, "최신"
+    return job
+
+
+# ===== 이전 결과 보관 ==========================================================
+def _trace_outputs(trace):
+    """trace의 rawdata NIfTI 경로 목록 (step5 checklist, 없으면 step4 매핑)"""
+    checklist = trace.get('step5_checklist', {}).get('bids_checklist') or {}
+    if checklist:
+        return list(checklist)
+    raw_map = trace.get('step4_raw', {}).get('raw_path') or {}
+    return list(raw_map.values()) if isinstance(raw_map, dict) else []
+
+
+def retire_outputs(job):
+    """재처리 전에 이전 trace와 rawdata 결과물을 MSS state/backfill/superseded/로 이동
+
+    같은 이름(확장자만 다른) sidecar / thumbnail / 부산물을 함께 옮기고, 옮긴 폴더의 bdsp_file_list.json을 갱신한다.
+    옮긴 NIfTI의 run 번호는 run ledger에 반환하므로 재처리 결과는 같은 run 번호(같은 BIDS 파일명)로 다시 만들어진다.
+
+    Returns:
+        str: 보관 디렉토리 (이전 trace가 없으면 None)
+    """
+    try:
+        with open(job.trace_path, 'r', encoding='utf-8') as f:
+            trace = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logger.warning(f"이전 trace 읽기 실패 (trace만 보관): {job.trace_path} ({e})")
+        trace = {}
+
+    stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    superseded = os.path.join(job.mss_path, "state", SUPERSEDED_DIRNAME, f"{job.job_id}_{stamp}")
+    os.makedirs(superseded, exist_ok=True)
+    # 옮기는 중에 실패해도 restore_outputs가 되돌릴 수 있도록 먼저 기록
+    job.superseded = superseded
+    mss_root = os.path.realpath(job.mss_path)
+    touched = set()
+    moved = 0
+    retired = []
+    for nifti_path in _trace_outputs(trace):
+        directory = os.path.dirname(nifti_path)
+        if not os.path.realpath(directory).startswith(mss_root + os.sep) or not os.path.isdir(directory):
+            continue
+        base = Path(nifti_path).name.split('.', 1)[0]
+        for name in os.listdir(directory):
+            if name.split('.', 1)[0] != base or not os.path.isfile(os.path.join(directory, name)):
+                continue
+            destination = os.path.join(superseded, os.path.relpath(os.path.join(directory, name), job.mss_path))
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.move(os.path.join(directory, name), destination)
+            touched.add(directory)
+            moved += 1
+            if name.endswith('.nii.gz'):
+                retired.append(os.path.join(directory, name))
+    for directory in touched:
+        common.bdsp_walk(directory)
+    if retired:
+        name_builder.release_run_numbers(os.path.join(job.mss_path, "state", name_builder.RUN_LEDGER_NAME), retired)
+    job.retired = sorted(os.path.relpath(path, job.mss_path) for path in retired)
+    shutil.move(job.trace_path, os.path.join(superseded, os.path.basename(job.trace_path)))
+    logger.info(f"이전 결과 보관: {job.job_id} - 파일 {moved}개 → {superseded}")
+    return superseded
+
+
+def restore_outputs(job):
+    """재처리가 실패 / 취소되면 보관한 이전 결과(rawdata 파일, trace)를 원래 위치로 되돌리고 run 번호를 다시 할당
+
+    실패한 재처리가 같은 이름으로 만든 파일은 이전 파일로 덮어쓴다.
+
+    Returns:
+        int: 되돌린 파일 수
+    """
+    superseded = job.superseded
+    if not superseded or not os.path.isdir(superseded):
+        return 0
+    trace_name = os.path.basename(job.trace_path)
+    touched = set()
+    restored = []
+    for root, dirs, files in os.walk(superseded):
+        for name in files:
+            if root == superseded and name == trace_name:
+                continue
+            source = os.path.join(root, name)
+            destination = os.path.join(job.mss_path, os.path.relpath(source, superseded))
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            os.replace(source, destination)
+            touched.add(os.path.dirname(destination))
+            restored.append(destination)
+    for directory in touched:
+        common.bdsp_walk(directory)
+    niftis = [path for path in restored if path.endswith('.nii.gz')]
+    if niftis:
+        name_builder.reserve_run_numbers(os.path.join(job.mss_path, "state", name_builder.RUN_LEDGER_NAME), niftis)
+    trace_backup = os.path.join(superseded, trace_name)
+    if os.path.exists(trace_backup):
+        os.makedirs(os.path.dirname(job.trace_path), exist_ok=True)
+        os.replace(trace_backup, job.trace_path)
+    shutil.rmtree(superseded, ignore_errors=True)
+    job.superseded = None
+    job.retired = []
+    logger.warning(f"재처리 실패로 이전 결과 복원: {job.job_id} - 파일 {len(restored)}개")
+    return len(restored)
+
+
+def check_run_names(job):
+    """재처리 결과가 보관한 NIfTI와 같은 이름(같은 run 번호)으로 만들어졌는지 확인
+
+    Returns:
+        list: 다시 만들어지지 않은 NIfTI (MSS 기준 상대 경로)
+    """
+    if not job.retired:
+        return []
+    try:
+        with open(job.trace_path, 'r', encoding='utf-8') as f:
+            outputs = {os.path.relpath(path, job.mss_path) for path in _trace_outputs(json.load(f))}
+    except (OSError, ValueError) as e:
+        logger.warning(f"재처리 trace 읽기 실패 (파일명 확인 생략): {job.trace_path} ({e})")
+        return []
+    renamed = [path for path in job.retired if path not in outputs]
+    if renamed:
+        logger.warning(f"재처리 결과 파일명이 이전과 다름: {job.job_id} - {len(renamed)}개 ({renamed[:5]})")
+    return renamed
+
+
+# ===== 실행 ===================================================================
+class BackfillRunner:
+    """FairShareScheduler로 순서를 정하고 N개 워커로 process.main.main 실행"""
+
+    def __init__(self, global_vars, workers, staging_dir):
+        self.global_vars = global_vars
+        self.workers = max(1, int(workers))
+        self.staging_dir = staging_dir
+        self.scheduler = FairShareScheduler(global_vars['upload_dir'])
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backfill')
+        self._lock = threading.Lock()
+        self._jobs = {}                 # 이벤트 사본 파일명 -> BackfillJob
+        self._tokens = {}
+        self._remaining = 0
+        self._finished = 0
+        self._all_done = threading.Event()
+        self._stopping = False
+
+    def run(self, jobs):
+        os.makedirs(self.staging_dir, exist_ok=True)
+        for job in jobs:
+            job.staged_path = os.path.join(self.staging_dir, f"{job.job_id}.json")
+            with open(job.staged_path, 'w', encoding='utf-8') as f:
+                json.dump(job.event, f, ensure_ascii=False, indent=2)
+            self._jobs[os.path.basename(job.staged_path)] = job
+            self.scheduler.add(job.staged_path)
+        self._remaining = len(jobs)
+        if not jobs:
+            return
+        self.dispatch()
+        try:
+            while not self._all_done.wait(0.5):
+                pass
+        except KeyboardInterrupt:
+            self.stop("사용자 중단 (Ctrl+C)")
+            self._all_done.wait()
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def stop(self, reason):
+        """새 작업 시작을 멈추고 실행 중인 작업 취소 (외부 프로세스는 바로 종료)"""
+        with self._lock:
+            self._stopping = True
+            tokens = list(self._tokens.values())
+            # 시작하지 않은 작업은 그대로 완료 처리
+            pending = self.scheduler.pending
+        print(f"중단 요청: {reason} - 실행 중 {len(tokens)}개 취소, 대기 {pending}개 생략", file=sys.stderr)
+        for token in tokens:
+            token.cancel(reason)
+        with self._lock:
+            self._remaining -= pending
+            if self._remaining <= 0:
+                self._all_done.set()
+
+    def dispatch(self):
+        with self._lock:
+            while not self._stopping and self.scheduler.running < self.workers:
+                scheduled = self.scheduler.next_job()
+                if scheduled is None:
+                    break
+                self.executor.submit(self._run_job, self._jobs[scheduled.file_name], scheduled.size)
+
+    def _run_job(self, job, upload_bytes):
+        token = cancel.CancelToken(job.job_id, upload_bytes)
+        with self._lock:
+            self._tokens[job.job_id] = token
+        started = time.perf_counter()
+        try:
+            with log.job_context(job_id=job.job_id), cancel.job_scope(token):
+                cancel.check()
+                if job.state == STALE:
+                    retire_outputs(job)
+                process.main.main(job.staged_path, **self.global_vars)
+                job.renamed = check_run_names(job)
+            job.outcome = "success"
+        except cancel.JobCancelled as e:
+            job.outcome, job.error = e.kind, str(e)
+        except Exception as e:
+            job.outcome, job.error = "error", str(e)
+            logger.error(f"Backfill 실패: {job.job_id} ({e})")
+        finally:
+            if job.outcome != "success" and job.superseded:
+                # 실패 / 취소된 재처리가 이전 결과를 지우지 않도록 보관한 결과를 되돌림
+                try:
+                    job.restored = restore_outputs(job)
+                except Exception as e:
+                    logger.error(f"이전 결과 복원 실패 (보관 디렉토리에 남음): {job.job_id} {job.superseded} ({e})")
+            job.duration = time.perf_counter() - started
+            with self._lock:
+                self._tokens.pop(job.job_id, None)
+                self._finished += 1
+                finished = self._finished
+                self._remaining -= 1
+                remaining = self._remaining
+            self.scheduler.done(os.path.basename(job.staged_path))
+            line = f"[{finished}/{len(self._jobs)}] {job.outcome:<9} {job.job_id} ({job.duration:.1f}s)"
+            print(line + (f" - {job.error}" if job.error else ""), file=sys.stderr)
+            if remaining <= 0:
+                self._all_done.set()
+            else:
+                self.dispatch()
+
+
+# ===== 보고 ===================================================================
+def build_report(jobs, elapsed, workers, staging_dir, cache_summary):
+    done = [job for job in jobs if job.outcome is not None]
+    ok = [job for job in done if job.outcome == "success"]
+    failed = [job for job in jobs if job.outcome not in (None, "success") or job.state == INVALID]
+    durations = sorted(job.duration for job in done)
+    processed_bytes = sum(job.upload_bytes for job in ok)
+    latency = {}
+    if durations:
+        latency = {'p50': statistics.median(durations),
+                   'p95': durations[min(len(durations) - 1, int(round(0.95 * (len(durations) - 1))))],
+                   'max': durations[-1]}
+    return {
+        'finished': datetime.now().isoformat(timespec='seconds'),
+        'elapsed_seconds': elapsed,
+        'workers': workers,
+        'jobs': {
+            'total': len(jobs),
+            'skipped_current': sum(1 for job in jobs if job.state == CURRENT),
+            'processed': len(done),
+            'succeeded': len(ok),
+            'failed': len(failed),
+            'not_started': sum(1 for job in jobs if job.state in (NEW, STALE) and job.outcome is None),
+        },
+        'throughput_jobs_per_min': len(ok) / elapsed * 60 if elapsed > 0 else 0.0,
+        'throughput_upload_mb_per_s': processed_bytes / (1024 * 1024) / elapsed if elapsed > 0 else 0.0,
+        'job_seconds': latency,
+        'caches': metrics.cache_snapshot(),
+        'conversion_cache': cache_summary,
+        'staging_dir': staging_dir,
+        'failed': [{'job_id': job.job_id, 'source': job.source, 'state': job.state,
+                    'outcome': job.outcome or INVALID, 'error': job.error or job.reason,
+                    'superseded': job.superseded, 'restored': job.restored} for job in failed],
+        'renamed': [{'job_id': job.job_id, 'source': job.source, 'superseded': job.superseded,
+                     'files': job.renamed} for job in ok if job.renamed],
+    }
+
+
+def print_summary(report):
+    jobs = report['jobs']
+    print(f"\n=== Backfill 결과 ({report['elapsed_seconds']:.1f}s, workers={report['workers']}) ===", file=sys.stderr)
+    print(f"전체 {jobs['total']} / 최신(건너뜀) {jobs['skipped_current']} / 처리 {jobs['processed']} "
+          f"(성공 {jobs['succeeded']}, 실패 {jobs['failed']}, 미실행 {jobs['not_started']})", file=sys.stderr)
+    latency = report['job_seconds']
+    print(f"처리량 {report['throughput_jobs_per_min']:.2f} jobs/min, {report['throughput_upload_mb_per_s']:.2f} MB/s "
+          f"(작업당 p50 {latency.get('p50', 0):.1f}s, p95 {latency.get('p95', 0):.1f}s)", file=sys.stderr)
+    for name, stats in sorted(report['caches'].items()):
+        total = stats['hits'] + stats['misses']
+        if total:
+            print(f"캐시 {name}: {stats['hits']}/{total} 적중 ({stats['hits'] / total:.0%})", file=sys.stderr)
+    for item in report['renamed']:
+        print(f"파일명 변경 {item['job_id']}: 이전 결과 {len(item['files'])}개가 같은 이름으로 다시 만들어지지 않음 "
+              f"({item['superseded']})", file=sys.stderr)
+    for item in report['failed']:
+        restored = f" - 이전 결과 {item['restored']}개 복원" if item['restored'] else ""
+        print(f"실패 {item['job_id']}: {item['error']} ({item['source']}){restored}", file=sys.stderr)
+    if report['failed'] and os.path.isdir(report['staging_dir']):
+        print(f"실패한 작업 다시 실행: bids-backfill {report['staging_dir']}", file=sys.stderr)
+
+
+# ===== 명령 ===================================================================
+def configure(conversion_cache_dir, conversion_cache_max_gb):
+    """모니터(app)와 같은 단계 풀 / 헤더 스캔 / 제한 시간 설정 + 변환 캐시"""
+    stages.configure(io_workers=STAGE_IO_WORKERS, cpu_workers=STAGE_CPU_WORKERS,
+                     proc_workers=STAGE_PROC_WORKERS, queue_size=STAGE_QUEUE_SIZE)
+    header_index.configure(enabled=SOURCE_STREAMING, workers=SOURCE_HEADER_WORKERS,
+                           queue_size=SOURCE_HEADER_QUEUE_SIZE)
+    cancel.configure(cancel.Deadlines(
+        job_seconds=DEADLINE_JOB_SECONDS, job_per_gb=DEADLINE_JOB_SECONDS_PER_GB,
+        step_seconds=DEADLINE_STEP_SECONDS, step_per_gb=DEADLINE_STEP_SECONDS_PER_GB,
+        step_overrides=cancel.parse_step_overrides(DEADLINE_STEP_LIMITS),
+        process_seconds=DEADLINE_PROCESS_SECONDS, process_per_gb=DEADLINE_PROCESS_SECONDS_PER_GB
+    ))
+    conversion_cache.configure(conversion_cache_dir, conversion_cache_max_gb)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="bids-backfill", description="이벤트 JSON 일괄 재처리")
+    parser.add_argument('sources', nargs='*', help="이벤트 JSON 파일 또는 디렉토리 (BACKUP_DIR의 *_export.json 가능)")
+    parser.add_argument('--manifest', help="이벤트 JSON 경로 목록 파일 (한 줄에 하나, '#'은 주석)")
+    parser.add_argument('--recursive', action='store_true', help="디렉토리 하위까지 검색")
+    parser.add_argument('--workers', type=int, default=BACKFILL_WORKERS, help="동시 작업 수")
+    parser.add_argument('--force', action='store_true', help="최신 결과도 재처리")
+    parser.add_argument('--dry-run', action='store_true', help="판정 결과만 출력")
+    parser.add_argument('--conversion-cache', default=BACKFILL_CONVERSION_CACHE_DIR,
+                        help="dcm2niix 변환 캐시 디렉토리")
+    parser.add_argument('--no-conversion-cache', action='store_true', help="변환 캐시 사용 안 함")
+    parser.add_argument('--output', help="JSON 보고서 저장 경로")
+    args = parser.parse_args(argv)
+    if not args.sources and not args.manifest:
+        parser.error("이벤트 JSON 디렉토리 / 파일 또는 --manifest가 필요합니다")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    log_dir = os.path.dirname(BACKFILL_LOG_FILENAME)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    # 파이프라인 로그는 파일로만, 진행 상황과 결과는 stderr로 출력
+    log.setup_logging(BACKFILL_LOG_FILENAME, level=logging.INFO, console=False)
+
+    global_vars = dict(
+        upload_dir=UPLOAD_DIR, backup_dir=BACKUP_DIR, error_dir=ERROR_DIR, working_dir=WORKING_DIR,
+        dicom_modality=DICOM_MODALITY, nifti_modality=NIFTI_MODALITY, parrec_modality=PARREC_MODALITY,
+        suffix_map=SUFFIX_MAP, flag_dir=FLAG_DIR, defacing_flag=DEFACING_FLAG, canonical_flag=CANONICAL_FLAG,
+        civet_flag=CIVET_FLAG, magnetic_strength_field=MAGNETIC_STRENGTH_FIELD, scratch_dir=SCRATCH_DIR
+    )
+
+    jobs, invalid = load_jobs(collect_event_paths(args.sources, args.manifest, args.recursive))
+    for job in jobs:
+        plan_job(job, global_vars, force=args.force)
+    jobs = invalid + sorted(jobs, key=lambda job: job.job_id)
+    runnable = [job for job in jobs if job.state in (NEW, STALE)]
+    counts = {state: sum(1 for job in jobs if job.state == state) for state in (NEW, STALE, CURRENT, INVALID)}
+    print(f"대상 {len(jobs)}개 - 신규 {counts[NEW]}, 재처리 {counts[STALE]}, 최신 {counts[CURRENT]}, "
+          f"제외 {counts[INVALID]}", file=sys.stderr)
+
+    if args.dry_run:
+        for job in jobs:
+            print(f"{job.state:<8} {job.job_id}  {job.reason}  ({job.source})")
+        return 0
+
+    configure(None if args.no_conversion_cache else args.conversion_cache, BACKFILL_CONVERSION_CACHE_MAX_GB)
+    run_id = datetime.now().strftime('%Y%m%d%H%M%S')
+    staging_dir = os.path.join(WORKING_DIR, STAGING_DIRNAME, run_id)
+    runner = BackfillRunner(global_vars, args.workers, staging_dir)
+    started = time.perf_counter()
+    runner.run(runnable)
+    elapsed = time.perf_counter() - started
+
+    cache_summary = conversion_cache.prune() if conversion_cache.enabled() else None
+    # 성공한 작업의 이벤트 사본은 export 단계에서 BACKUP_DIR로 이동됨 - 비었으면 실행 디렉토리 제거
+    try:
+        os.rmdir(staging_dir)
+    except OSError:
+        pass
+
+    report = build_report(jobs, elapsed, runner.workers, staging_dir, cache_summary)
+    print_summary(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"보고서 저장: {args.output}", file=sys.stderr)
+    log.shutdown_logging()
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
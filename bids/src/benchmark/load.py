@@ -0,0 +1,434 @@
+#/BDSP/bids_app/src/benchmark/load.py
+"""JSONFileMonitor 부하 테스트
+
+임시 /BDSP/interfaces 구조를 만들고, 설정한 도착률로 합성 업로드 + 이벤트 JSON을 EVENT_DIR에 넣으면서
+실제 app.JSONFileMonitor가 처리하게 한다. 시나리오(MAX_WORKERS / scratch / poll 주기 조합)마다
+별도 프로세스에서 실행하여 설정(globals.py)과 최대 메모리 측정을 서로 분리한다.
+
+    cd /BDSP/bids_app/src
+    python -m benchmark.load --jobs 200 --duration 600 --workers 1,2,4 --output load.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from benchmark import synthetic
+from benchmark import stub_dcm2niix
+
+logger = logging.getLogger(__name__)
+
+SRC_ROOT = Path(__file__).resolve().parents[1]
+SUFFIX_MAP = SRC_ROOT / 'utils' / 'modality_json' / 'suffix.json'
+
+# 디스크 사용량 샘플링 주기 (초)
+_DISK_SAMPLE_INTERVAL = 1.0
+
+# 설정 파일 템플릿 (globals.py가 읽는 키 전체)
+_CONFIG_TEMPLATE = """[DEFAULT]
+MAX_WORKERS = {max_workers}
+EVENT_DIR = {root}/event
+WORKING_DIR = {root}/working
+UPLOAD_DIR = {root}/upload
+BACKUP_DIR = {root}/backup
+ERROR_DIR = {root}/error
+LOG_FILENAME = {root}/logs/bids_app.log
+MAGNETIC_STRENGTH_FIELD = 3
+SCRATCH_DIR = {scratch_dir}
+POLL_INTERVAL = {poll_interval}
+
+[MODALITY]
+DICOM_MODALITY = {root}/modality/dicom
+NIFTI_MODALITY = {root}/modality/nifti
+PARREC_MODALITY = {root}/modality/parrec
+SUFFIX_MAP = {suffix_map}
+
+[FLAG]
+FLAG_DIR = {root}/flag
+DEFACING_FLAG = {root}/flag/defacing
+CANONICAL_FLAG = {root}/flag/canonical
+CIVET_FLAG = {root}/flag/civet
+"""
+
+
+def percentile(values, pct):
+    """선형 보간 백분위수 (values가 비어 있으면 None)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def _distribution(values):
+    if not values:
+        return None
+    return {
+        'min': min(values),
+        'mean': statistics.fmean(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values),
+    }
+
+
+def _dir_size(*paths):
+    total = 0
+    for path in paths:
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+    return total
+
+
+def arrival_offsets(jobs, duration, pattern, seed=0):
+    """작업 도착 시각(시작 기준 초) 목록
+
+    - uniform: 일정 간격
+    - poisson: 평균 도착률 jobs/duration의 지수 분포 간격
+    - burst: 전부 시작 시점에 도착
+    """
+    if pattern == 'burst' or duration <= 0:
+        return [0.0] * jobs
+    if pattern == 'uniform':
+        return [duration * i / jobs for i in range(jobs)]
+    rng = random.Random(seed)
+    rate = jobs / duration
+    offsets = []
+    t = 0.0
+    for _ in range(jobs):
+        offsets.append(t)
+        t += rng.expovariate(rate)
+    return offsets
+
+
+class JobRecorder:
+    """작업별 도착/제출/시작/종료 시각 기록 (이벤트 파일명 기준)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.jobs = {}
+        self.done = threading.Event()
+        self.expected = 0
+
+    def mark(self, name, field, value=None):
+        with self._lock:
+            job = self.jobs.setdefault(name, {})
+            job[field] = time.monotonic() if value is None else value
+            finished = sum(1 for j in self.jobs.values() if 'end' in j)
+        if field == 'end' and finished >= self.expected:
+            self.done.set()
+
+
+def _instrument(monitor, recorder):
+    """모니터의 제출/실행 경로에 시각 기록 추가 (app.py 수정 없이 인스턴스/모듈 속성만 교체)"""
+    import process.main
+
+    original_submit = monitor.executor.submit
+
+    def submit(fn, json_file, *args, **kwargs):
+        recorder.mark(os.path.basename(json_file), 'submit')
+        return original_submit(fn, json_file, *args, **kwargs)
+
+    monitor.executor.submit = submit
+
+    original_main = process.main.main
+
+    def timed_main(json_file_path, *args, **kwargs):
+        name = os.path.basename(json_file_path)
+        recorder.mark(name, 'start')
+        try:
+            result = original_main(json_file_path, *args, **kwargs)
+            recorder.mark(name, 'ok', True)
+            return result
+        except Exception as e:
+            recorder.mark(name, 'ok', False)
+            recorder.mark(name, 'error', str(e))
+            raise
+        finally:
+            recorder.mark(name, 'end')
+
+    process.main.main = timed_main
+
+    # main 호출 전 단계(이동 실패 등)에서 끝난 작업도 완료로 집계
+    original_process = monitor.process_json_file
+
+    def process_json_file(json_file_path, *args, **kwargs):
+        name = os.path.basename(json_file_path)
+        try:
+            return original_process(json_file_path, *args, **kwargs)
+        finally:
+            if 'end' not in recorder.jobs.get(name, {}):
+                recorder.mark(name, 'ok', False)
+                recorder.mark(name, 'end')
+
+    monitor.process_json_file = process_json_file
+
+
+def run_scenario(settings):
+    """시나리오 1개 실행 (자식 프로세스에서 호출)
+
+    Args:
+        settings: {'root', 'dataset_zip', 'jobs', 'duration', 'pattern', 'subjects', 'timeout', ...}
+
+    Returns:
+        dict: 시나리오 측정 결과
+    """
+    root = Path(settings['root'])
+    os.environ['BDSP_CONFIG'] = str(root / 'config.ini')
+    if str(SRC_ROOT) not in sys.path:
+        sys.path.insert(0, str(SRC_ROOT))
+
+    import app
+
+    # 파이프라인 print 출력은 버리고 로그는 파일로만 기록
+    sys.stdout = open(os.devnull, 'w')
+    for handler in list(logging.getLogger().handlers):
+        if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler):
+            logging.getLogger().removeHandler(handler)
+
+    monitor = app.JSONFileMonitor()
+    recorder = JobRecorder()
+    recorder.expected = settings['jobs']
+    _instrument(monitor, recorder)
+
+    upload_bytes = os.path.getsize(settings['dataset_zip'])
+    watched = [monitor.working_dir] + ([monitor.scratch_dir] if monitor.scratch_dir else [])
+    disk_samples = []
+    sampler_stop = threading.Event()
+
+    def sample_disk():
+        while not sampler_stop.wait(_DISK_SAMPLE_INTERVAL):
+            disk_samples.append(_dir_size(*watched))
+
+    monitor_thread = threading.Thread(target=monitor.monitor_loop, name='monitor', daemon=True)
+    sampler_thread = threading.Thread(target=sample_disk, name='disk-sampler', daemon=True)
+
+    offsets = arrival_offsets(settings['jobs'], settings['duration'], settings['pattern'], settings['seed'])
+    subjects = settings['subjects']
+    start = time.monotonic()
+    monitor_thread.start()
+    sampler_thread.start()
+
+    # 도착 스케줄에 맞춰 업로드 zip → 이벤트 JSON 순서로 배치 (이벤트는 rename으로 원자적으로 생성)
+    for i, offset in enumerate(offsets):
+        delay = start + offset - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        subject_id = f"LOAD{(i % subjects) + 1 if subjects else i + 1:04d}"
+        upload_time = f"20240101{i:06d}"
+        zip_path = synthetic.upload_zip_path(monitor.upload_dir, subject_id, upload_time)
+        zip_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(settings['dataset_zip'], zip_path)
+        except OSError:
+            shutil.copyfile(settings['dataset_zip'], zip_path)
+        staged = synthetic.write_event_json(root / 'event_staging', subject_id, upload_time)
+        event_path = Path(monitor.event_dir) / staged.name
+        os.replace(staged, event_path)
+        recorder.mark(event_path.name, 'arrival')
+
+    finished = recorder.done.wait(settings['timeout'])
+    wall = time.monotonic() - start
+    monitor.stop()
+    monitor_thread.join()
+    sampler_stop.set()
+    sampler_thread.join()
+    final_bytes = _dir_size(*watched)
+
+    jobs = list(recorder.jobs.values())
+    completed = [j for j in jobs if 'end' in j and 'arrival' in j]
+    ok = [j for j in completed if j.get('ok')]
+    detect = [j['submit'] - j['arrival'] for j in completed if 'submit' in j]
+    pool_wait = [j['start'] - j['submit'] for j in completed if 'start' in j and 'submit' in j]
+    queue_delay = [j['start'] - j['arrival'] for j in completed if 'start' in j]
+    service = [j['end'] - j['start'] for j in completed if 'start' in j]
+    latency = [j['end'] - j['arrival'] for j in completed]
+    last_end = max((j['end'] for j in completed), default=start)
+
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'finished': finished,
+        'wall_seconds': wall,
+        'jobs_submitted': len(offsets),
+        'jobs_completed': len(completed),
+        'jobs_ok': len(ok),
+        'jobs_failed': len(completed) - len(ok),
+        'errors': sorted({j['error'] for j in completed if j.get('error')})[:10],
+        'throughput_jobs_per_min': len(ok) / ((last_end - start) / 60.0) if ok and last_end > start else 0.0,
+        'detect_delay': _distribution(detect),
+        'pool_wait': _distribution(pool_wait),
+        'queue_delay': _distribution(queue_delay),
+        'service_time': _distribution(service),
+        'latency': _distribution(latency),
+        # Linux ru_maxrss 단위는 KB
+        'peak_rss_mb': usage_self.ru_maxrss / 1024.0,
+        'peak_child_rss_mb': usage_children.ru_maxrss / 1024.0,
+        'cpu_seconds': usage_self.ru_utime + usage_self.ru_stime,
+        'child_cpu_seconds': usage_children.ru_utime + usage_children.ru_stime,
+        'upload_bytes_per_job': upload_bytes,
+        'peak_work_bytes': max(disk_samples, default=final_bytes),
+        'final_work_bytes': final_bytes,
+        # 디스크 증폭: 업로드 총량 대비 WORKING_DIR(+scratch) 사용량
+        'peak_disk_amplification': max(disk_samples, default=final_bytes) / (upload_bytes * len(offsets)),
+        'final_disk_amplification': final_bytes / (upload_bytes * len(offsets)),
+    }
+
+
+def prepare_root(root, settings):
+    """시나리오용 /BDSP/interfaces 구조 + config.ini 생성"""
+    root = Path(root)
+    for name in ('event', 'event_staging', 'working', 'upload', 'backup', 'error', 'logs',
+                 'flag/defacing', 'flag/canonical', 'flag/civet', 'scratch'):
+        (root / name).mkdir(parents=True, exist_ok=True)
+    synthetic.write_modality_rules(root / 'modality')
+    config = _CONFIG_TEMPLATE.format(
+        root=root,
+        max_workers=settings['max_workers'],
+        scratch_dir=root / 'scratch' if settings['scratch'] else '',
+        poll_interval=settings['poll_interval'],
+        suffix_map=SUFFIX_MAP,
+    )
+    (root / 'config.ini').write_text(config, encoding='utf-8')
+
+
+def _scenario_child(settings_path):
+    """자식 프로세스 진입점: 시나리오 실행 후 결과 JSON을 settings 옆에 저장"""
+    with open(settings_path, 'r', encoding='utf-8') as f:
+        settings = json.load(f)
+    result = run_scenario(settings)
+    with open(Path(settings_path).with_name('result.json'), 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+def _parse_list(value, cast):
+    return [cast(v) for v in str(value).split(',') if v.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="JSONFileMonitor load test")
+    parser.add_argument('--preset', choices=sorted(synthetic.PRESETS), default='small',
+                        help="업로드 1건의 합성 데이터셋 크기")
+    parser.add_argument('--jobs', type=int, default=20, help="시나리오당 업로드 수")
+    parser.add_argument('--duration', type=float, default=60.0, help="업로드가 도착하는 시간 범위(초)")
+    parser.add_argument('--pattern', choices=('uniform', 'poisson', 'burst'), default='poisson')
+    parser.add_argument('--subjects', type=int, default=0,
+                        help="반복 사용할 subject 수 (0이면 업로드마다 새 subject)")
+    parser.add_argument('--workers', default='1', help="MAX_WORKERS 목록 (예: 1,2,4)")
+    parser.add_argument('--scratch', default='on', help="scratch 스테이징 on/off 목록 (예: on,off)")
+    parser.add_argument('--poll', default='1', help="POLL_INTERVAL 목록 (초, 예: 5,1)")
+    parser.add_argument('--stub-delay', type=float, default=0.0, help="dcm2niix 스텁의 시리즈당 대기 시간(초)")
+    parser.add_argument('--timeout', type=float, default=3600.0, help="시나리오당 최대 대기 시간(초)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="작업 디렉토리 (지정하면 삭제하지 않음)")
+    parser.add_argument('--output', help="결과 JSON 경로 (기본: stdout)")
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.scenario:
+        _scenario_child(args.scenario)
+        return 0
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix='bdsp_load_'))
+    workdir.mkdir(parents=True, exist_ok=True)
+    stub_dcm2niix.install(workdir / 'bin')
+
+    print(f"합성 업로드 생성 중 (preset={args.preset}) ...", file=sys.stderr)
+    spec = synthetic.PRESETS[args.preset]
+    dataset_stats = synthetic.build_dataset(workdir / 'dataset', spec)
+    dataset_zip = synthetic.zip_dataset(workdir / 'dataset', workdir / 'dataset.zip')
+
+    env = dict(os.environ)
+    env['PATH'] = f"{workdir / 'bin'}{os.pathsep}{env.get('PATH', '')}"
+    env['BDSP_STUB_DCM2NIIX_DELAY'] = str(args.stub_delay)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(SRC_ROOT), env.get('PYTHONPATH')]))
+
+    scenarios = []
+    matrix = itertools.product(_parse_list(args.workers, int),
+                               [v.strip().lower() in ('on', '1', 'true', 'yes') for v in args.scratch.split(',')],
+                               _parse_list(args.poll, float))
+    for index, (workers, scratch, poll) in enumerate(matrix):
+        root = workdir / f"scenario{index:02d}_w{workers}_{'scratch' if scratch else 'direct'}_p{poll:g}"
+        settings = {
+            'root': str(root),
+            'dataset_zip': str(dataset_zip),
+            'jobs': args.jobs,
+            'duration': args.duration,
+            'pattern': args.pattern,
+            'subjects': args.subjects,
+            'seed': args.seed,
+            'timeout': args.timeout,
+            'max_workers': workers,
+            'scratch': scratch,
+            'poll_interval': poll,
+        }
+        prepare_root(root, settings)
+        settings_path = root / 'settings.json'
+        settings_path.write_text(json.dumps(settings, indent=2), encoding='utf-8')
+
+        print(f"[scenario {index}] MAX_WORKERS={workers} scratch={scratch} poll={poll:g}s "
+              f"jobs={args.jobs} over {args.duration:g}s ({args.pattern})", file=sys.stderr)
+        proc = subprocess.run([sys.executable, '-m', 'benchmark.load', '--scenario', str(settings_path)],
+                              cwd=str(SRC_ROOT), env=env)
+        result_path = root / 'result.json'
+        if proc.returncode != 0 or not result_path.exists():
+            result = {'failed': True, 'returncode': proc.returncode}
+        else:
+            result = json.loads(result_path.read_text(encoding='utf-8'))
+            latency = result['latency'] or {}
+            print(f"  ok={result['jobs_ok']}/{result['jobs_submitted']} "
+                  f"throughput={result['throughput_jobs_per_min']:.2f}/min "
+                  f"latency p50={latency.get('p50') or 0:.2f}s p95={latency.get('p95') or 0:.2f}s "
+                  f"p99={latency.get('p99') or 0:.2f}s peak_rss={result['peak_rss_mb']:.0f}MB "
+                  f"disk_amp={result['peak_disk_amplification']:.2f}x", file=sys.stderr)
+        scenarios.append({'settings': settings, 'result': result})
+
+        if not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        'benchmark': 'bdsp-monitor-load',
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': {'cpu_count': os.cpu_count(), 'python': sys.version.split()[0]},
+        'preset': args.preset,
+        'dataset': dataset_stats,
+        'stub_delay': args.stub_delay,
+        'scenarios': scenarios,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"결과 저장: {args.output}", file=sys.stderr)
+    else:
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0 if all(not s['result'].get('failed') for s in scenarios) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
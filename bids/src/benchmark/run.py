@@ -0,0 +1,370 @@
+#/BDSP/bids_app/src/benchmark/run.py
+"""BIDS 파이프라인 단계별 벤치마크
+
+합성 업로드(zip)를 만들어 process.main.main을 그대로 실행하면서,
+각 단계 함수에 타이머를 씌워 단계별 소요 시간을 JSON으로 기록한다.
+
+    cd /BDSP/bids_app/src
+    python -m benchmark.run --preset small --repeat 3 --output bench_small.json
+    python -m benchmark.run --preset small --baseline bench_small.json   # 회귀 비교 (회귀 시 exit 1)
+"""
+import argparse
+import contextlib
+import functools
+import importlib
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from benchmark import synthetic
+from benchmark import stub_dcm2niix
+
+logger = logging.getLogger(__name__)
+
+SRC_ROOT = Path(__file__).resolve().parents[1]
+SUFFIX_MAP = SRC_ROOT / 'utils' / 'modality_json' / 'suffix.json'
+
+# 측정 대상: (단계 이름, 모듈, 속성 경로)
+#  - 호출 시점에 모듈 속성/클래스 메서드를 찾는 구조이므로 속성 교체만으로 실제 호출 경로가 측정된다
+#  - 중첩 단계(예: create_source_path ⊃ validator.*)는 각각 포함 시간(inclusive)으로 기록
+STAGES = [
+    ('create_mss_structure', 'process.components.mss', 'create_mss_structure'),
+    ('create_origin_path', 'process.components.origin', 'create_origin_path'),
+    ('create_source_path', 'process.components.domain.mri.source.source', 'create_source_path'),
+    ('validator.DICOM', 'process.components.domain.mri.source.validator', 'DicomValidator.run'),
+    ('validator.PARREC', 'process.components.domain.mri.source.validator', 'ParrecValidator.run'),
+    ('validator.NIFTI', 'process.components.domain.mri.source.validator', 'NiftiValidator.run'),
+    ('separator.DICOM', 'process.components.domain.mri.source.separator', 'DicomSeparator.run'),
+    ('separator.PARREC', 'process.components.domain.mri.source.separator', 'ParrecSeparator.run'),
+    ('separator.NIFTI', 'process.components.domain.mri.source.separator', 'NiftiSeparator.run'),
+    ('create_raw_path', 'process.components.domain.mri.raw.raw', 'create_raw_path'),
+    ('mapper.DICOM', 'process.components.domain.mri.raw.modality_mapper', 'DicomMapper.get_path_mapping'),
+    ('mapper.PARREC', 'process.components.domain.mri.raw.modality_mapper', 'ParrecMapper.get_path_mapping'),
+    ('mapper.NIFTI', 'process.components.domain.mri.raw.modality_mapper', 'NiftiMapper.get_path_mapping'),
+    ('create_bids_mapping', 'process.components.domain.mri.raw.name_builder', 'create_bids_mapping'),
+    ('process_bids_conversion', 'process.components.domain.mri.raw.dcm2nii_parser', 'process_bids_conversion'),
+    ('convert.dcm2niix', 'process.components.domain.mri.raw.dcm2nii_parser', 'run_dcm2niix'),
+    ('convert.parrec', 'process.components.domain.mri.raw.dcm2nii_parser', 'convert_parrec'),
+    ('convert.nifti', 'process.components.domain.mri.raw.dcm2nii_parser', 'process_nifti_files'),
+    ('check_modality', 'process.components.domain.mri.post.bids_checker', 'check_modality'),
+    ('check_byproduct', 'process.components.domain.mri.post.byproduct', 'check_byproduct'),
+    ('thumbnail', 'process.components.domain.mri.post.thumbnail', 'thumbnail'),
+    ('publish', 'process.components.staging', 'publish'),
+    ('export', 'process.components.export', 'create_export'),
+]
+
+
+class StageTimer:
+    """단계 함수에 타이머를 씌우고 실행별 누적 시간/호출 수를 기록"""
+
+    def __init__(self, stages=STAGES):
+        self.stages = stages
+        self._lock = threading.Lock()
+        self._originals = []
+        self.records = {}
+
+    def reset(self):
+        with self._lock:
+            self.records = {}
+
+    def _record(self, stage, seconds):
+        with self._lock:
+            record = self.records.setdefault(stage, {'seconds': 0.0, 'calls': 0})
+            record['seconds'] += seconds
+            record['calls'] += 1
+
+    def _wrap(self, stage, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._record(stage, time.perf_counter() - start)
+        return timed
+
+    def install(self):
+        for stage, module_name, attr_path in self.stages:
+            owner = importlib.import_module(module_name)
+            *parents, attr = attr_path.split('.')
+            for parent in parents:
+                owner = getattr(owner, parent)
+            original = owner.__dict__[attr]
+            self._originals.append((owner, attr, original))
+            setattr(owner, attr, self._wrap(stage, original))
+
+    def uninstall(self):
+        while self._originals:
+            owner, attr, original = self._originals.pop()
+            setattr(owner, attr, original)
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.uninstall()
+
+
+def _dir_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def create_layout(root):
+    """/BDSP/interfaces와 같은 구조의 작업 디렉토리 생성
+
+    Returns:
+        dict: process.main.main에 그대로 전달할 경로 인자
+    """
+    root = Path(root)
+    for name in ('upload', 'event', 'working', 'backup', 'error', 'flag', 'scratch'):
+        (root / name).mkdir(parents=True, exist_ok=True)
+    modality_dirs = synthetic.write_modality_rules(root / 'modality')
+    return {
+        'upload_dir': str(root / 'upload'),
+        'backup_dir': str(root / 'backup'),
+        'error_dir': str(root / 'error'),
+        'working_dir': str(root / 'working'),
+        'dicom_modality': modality_dirs['dicom'],
+        'nifti_modality': modality_dirs['nifti'],
+        'parrec_modality': modality_dirs['parrec'],
+        'suffix_map': str(SUFFIX_MAP),
+        'flag_dir': str(root / 'flag'),
+        'magnetic_strength_field': '3',
+        'scratch_dir': str(root / 'scratch'),
+    }
+
+
+def run_once(dataset_zip, workdir, run_index, timer, use_scratch=True, verbose=False):
+    """합성 업로드 1건을 process.main.main으로 처리하고 측정 결과 반환"""
+    from process import main as process_main
+
+    root = Path(tempfile.mkdtemp(prefix=f'run{run_index:03d}_', dir=workdir))
+    try:
+        kwargs = create_layout(root)
+        if not use_scratch:
+            kwargs['scratch_dir'] = None
+
+        subject_id = 'BENCH001'
+        upload_time = f"20240101{run_index:06d}"
+        zip_path = synthetic.upload_zip_path(kwargs['upload_dir'], subject_id, upload_time)
+        zip_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(dataset_zip, zip_path)
+        event_path = synthetic.write_event_json(kwargs['working_dir'], subject_id, upload_time)
+
+        timer.reset()
+        output = io.StringIO()
+        redirect = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(output)
+        error = None
+        start = time.perf_counter()
+        try:
+            with redirect:
+                process_main.main(str(event_path), **kwargs)
+        except Exception as e:
+            error = str(e)
+        total = time.perf_counter() - start
+
+        converted = 0
+        for export_path in Path(kwargs['backup_dir']).glob('*.json'):
+            with open(export_path, 'r', encoding='utf-8') as f:
+                converted += len(json.load(f).get('export', {}).get('data', []))
+
+        stages = {name: dict(record) for name, record in timer.records.items()}
+        stages['total'] = {'seconds': total, 'calls': 1}
+        return {
+            'run': run_index,
+            'error': error,
+            'series_converted': converted,
+            'output_bytes': _dir_size(kwargs['working_dir']),
+            'stages': stages,
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def summarize(runs):
+    """실행별 단계 시간을 단계별 통계로 요약"""
+    samples = {}
+    for run in runs:
+        if run['error']:
+            continue
+        for stage, record in run['stages'].items():
+            samples.setdefault(stage, {'seconds': [], 'calls': []})
+            samples[stage]['seconds'].append(record['seconds'])
+            samples[stage]['calls'].append(record['calls'])
+
+    summary = {}
+    for stage, values in samples.items():
+        seconds = values['seconds']
+        summary[stage] = {
+            'min': min(seconds),
+            'median': statistics.median(seconds),
+            'mean': statistics.fmean(seconds),
+            'max': max(seconds),
+            'stdev': statistics.stdev(seconds) if len(seconds) > 1 else 0.0,
+            'calls': max(values['calls']),
+        }
+    return summary
+
+
+def compare(summary, baseline_summary, threshold, min_delta):
+    """기준 결과 대비 중앙값이 threshold 비율 + min_delta 초 이상 느려진 단계 목록"""
+    regressions = []
+    for stage, current in summary.items():
+        base = baseline_summary.get(stage)
+        if not base:
+            continue
+        delta = current['median'] - base['median']
+        if delta > min_delta and current['median'] > base['median'] * (1.0 + threshold):
+            regressions.append({
+                'stage': stage,
+                'baseline_median': base['median'],
+                'median': current['median'],
+                'ratio': current['median'] / base['median'] if base['median'] else None,
+            })
+    return regressions
+
+
+def _print_summary(summary, regressions):
+    regressed = {r['stage'] for r in regressions}
+    print(f"{'stage':<26}{'calls':>6}{'min':>10}{'median':>10}{'max':>10}", file=sys.stderr)
+    order = [name for name, _, _ in STAGES] + ['total']
+    for stage in order:
+        if stage not in summary:
+            continue
+        s = summary[stage]
+        mark = '  <-- REGRESSION' if stage in regressed else ''
+        print(f"{stage:<26}{s['calls']:>6}{s['min']:>10.3f}{s['median']:>10.3f}{s['max']:>10.3f}{mark}", file=sys.stderr)
+
+
+def _load_spec(args):
+    spec = json.loads(json.dumps(synthetic.PRESETS[args.preset]))
+    if args.spec:
+        with open(args.spec, 'r', encoding='utf-8') as f:
+            spec.update(json.load(f))
+    if args.matrix:
+        spec['matrix'] = args.matrix
+    if args.dicom_slices:
+        spec['dicom_series'] = [(desc, args.dicom_slices) for desc, _ in spec['dicom_series']]
+    return spec
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="BIDS pipeline per-stage benchmark")
+    parser.add_argument('--preset', choices=sorted(synthetic.PRESETS), default='small')
+    parser.add_argument('--spec', help="프리셋을 덮어쓸 데이터셋 spec JSON 파일")
+    parser.add_argument('--matrix', type=int, help="DICOM/PAR 영상 matrix 크기")
+    parser.add_argument('--dicom-slices', type=int, help="모든 DICOM 시리즈의 슬라이스 수")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=1, help="결과에서 제외할 준비 실행 수")
+    parser.add_argument('--workdir', help="작업 디렉토리 (기본: 임시 디렉토리)")
+    parser.add_argument('--no-scratch', action='store_true', help="scratch 스테이징 없이 실행")
+    parser.add_argument('--stub-delay', type=float, default=0.0,
+                        help="dcm2niix 스텁의 시리즈당 대기 시간(초)")
+    parser.add_argument('--output', help="결과 JSON 경로 (기본: stdout)")
+    parser.add_argument('--baseline', help="비교할 이전 결과 JSON")
+    parser.add_argument('--threshold', type=float, default=0.25, help="회귀 판정 비율 (기본 25%%)")
+    parser.add_argument('--min-delta', type=float, default=0.05, help="회귀 판정 최소 차이(초)")
+    parser.add_argument('--verbose', action='store_true', help="파이프라인 출력/로그 표시")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # 파이프라인 모듈은 src 기준 절대 import를 사용
+    if str(SRC_ROOT) not in sys.path:
+        sys.path.insert(0, str(SRC_ROOT))
+
+    spec = _load_spec(args)
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix='bdsp_bench_'))
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    # dcm2niix 스텁을 PATH 맨 앞에 설치
+    stub_dcm2niix.install(workdir / 'bin')
+    os.environ['PATH'] = f"{workdir / 'bin'}{os.pathsep}{os.environ.get('PATH', '')}"
+    os.environ['BDSP_STUB_DCM2NIIX_DELAY'] = str(args.stub_delay)
+
+    print(f"합성 데이터셋 생성 중 (preset={args.preset}) ...", file=sys.stderr)
+    start = time.perf_counter()
+    dataset_stats = synthetic.build_dataset(workdir / 'dataset', spec)
+    dataset_zip = synthetic.zip_dataset(workdir / 'dataset', workdir / 'dataset.zip')
+    dataset_stats['zip_bytes'] = os.path.getsize(dataset_zip)
+    dataset_stats['generate_seconds'] = time.perf_counter() - start
+
+    runs = []
+    with StageTimer() as timer:
+        for i in range(args.warmup + args.repeat):
+            result = run_once(dataset_zip, workdir, i, timer,
+                              use_scratch=not args.no_scratch, verbose=args.verbose)
+            label = 'warmup' if i < args.warmup else 'run'
+            status = f"FAILED: {result['error']}" if result['error'] else 'ok'
+            print(f"[{label} {i}] {result['stages']['total']['seconds']:.3f}s "
+                  f"({result['series_converted']} series) {status}", file=sys.stderr)
+            if i >= args.warmup:
+                runs.append(result)
+
+    summary = summarize(runs)
+    report = {
+        'benchmark': 'bdsp-bids-pipeline',
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'preset': args.preset,
+        'spec': spec,
+        'scratch': not args.no_scratch,
+        'stub_delay': args.stub_delay,
+        'dataset': dataset_stats,
+        'runs': runs,
+        'summary': summary,
+        'regressions': [],
+    }
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['baseline'] = args.baseline
+        report['regressions'] = compare(summary, baseline.get('summary', {}),
+                                        args.threshold, args.min_delta)
+
+    _print_summary(summary, report['regressions'])
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"결과 저장: {args.output}", file=sys.stderr)
+    else:
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failed = any(run['error'] for run in runs)
+    return 1 if failed or report['regressions'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
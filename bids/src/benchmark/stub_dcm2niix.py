@@ -0,0 +1,95 @@
+#/BDSP/bids_app/src/benchmark/stub_dcm2niix.py
+"""dcm2niix 대체 스텁 (벤치마크 / 부하 테스트 전용)
+
+run_dcm2niix와 같은 인자(-f <이름> -z y -o <출력> <입력>)를 받아
+입력 DICOM 슬라이스를 쌓은 .nii.gz와 BidsGuess가 포함된 sidecar JSON을 생성한다.
+BDSP_STUB_DCM2NIIX_DELAY(초)를 지정하면 실제 변환 시간을 흉내내도록 그만큼 대기한다.
+"""
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pydicom
+
+
+def _parse_args(argv):
+    options = {}
+    i = 0
+    while i < len(argv) - 1:
+        if argv[i].startswith('-'):
+            options[argv[i]] = argv[i + 1]
+            i += 2
+        else:
+            i += 1
+    return options, argv[-1]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    options, src_dir = _parse_args(argv)
+    out_dir = options.get('-o', '.')
+    # %-포맷(%s, %p 등)은 고정 값으로 치환
+    name = re.sub(r'%[a-zA-Z]', '1', options.get('-f', 'stub'))
+
+    slices = []
+    for entry in sorted(os.listdir(src_dir)):
+        path = os.path.join(src_dir, entry)
+        if not os.path.isfile(path) or entry.endswith('.json'):
+            continue
+        try:
+            ds = pydicom.dcmread(path)
+            slices.append(ds.pixel_array)
+        except Exception:
+            continue
+
+    if not slices:
+        print(f"No valid DICOM images were found in {src_dir}", file=sys.stderr)
+        return 2
+
+    delay = float(os.environ.get('BDSP_STUB_DCM2NIIX_DELAY', '0') or 0)
+    if delay > 0:
+        time.sleep(delay)
+
+    volume = np.stack(slices, axis=-1)
+    os.makedirs(out_dir, exist_ok=True)
+    suffix = '.nii.gz' if options.get('-z', 'y') == 'y' else '.nii'
+    nib.save(nib.Nifti1Image(volume, np.eye(4)), os.path.join(out_dir, name + suffix))
+
+    with open(os.path.join(out_dir, name + '.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'ConversionSoftware': 'bdsp-stub-dcm2niix',
+            'BidsGuess': [os.path.basename(out_dir), '_' + name.rsplit('_', 1)[-1]],
+        }, f, indent=2)
+
+    print(f"Convert {len(slices)} DICOM as {os.path.join(out_dir, name)} ({volume.shape})")
+    return 0
+
+
+def install(bin_dir):
+    """bin_dir에 실행 가능한 dcm2niix 스텁 생성 (PATH 앞에 bin_dir을 추가해서 사용)
+
+    Returns:
+        str: 생성된 실행 파일 경로
+    """
+    bin_dir = Path(bin_dir)
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    src_root = Path(__file__).resolve().parents[1]
+    exe = bin_dir / 'dcm2niix'
+    exe.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        f"sys.path.insert(0, {str(src_root)!r})\n"
+        "from benchmark.stub_dcm2niix import main\n"
+        "sys.exit(main())\n",
+        encoding='utf-8')
+    exe.chmod(0o755)
+    return str(exe)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
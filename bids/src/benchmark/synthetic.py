@@ -0,0 +1,332 @@
+#/BDSP/bids_app/src/benchmark/synthetic.py
+import json
+import logging
+import os
+import zipfile
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+from pydicom.dataset import FileDataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, MRImageStorage, generate_uid
+
+logger = logging.getLogger(__name__)
+
+# 벤치마크용 가상 요청 정보 (모달리티 규칙 파일명/MSS 경로 생성에 사용)
+DEFAULT_REQUEST = {
+    'user': 'bench',
+    'systemId': 'BENCH',
+    'projectCode': 'perf',
+    'projectSeq': 'bench0000',
+    'orgId': '1_Bench',
+    'trialIndex': 1,
+    'domain': 'MRI',
+    # bold 시리즈의 task 엔티티
+    'task': {'isFunc': True, 'option': 'rest'},
+}
+
+# 데이터셋 구성 프리셋
+#  - dicom_series: [(SeriesDescription, 슬라이스 수), ...]
+#  - parrec: [(ProtocolName, 슬라이스 수, dynamic 수), ...]
+#  - nifti_3d / nifti_4d: [(모달리티, shape), ...]
+PRESETS = {
+    'small': {
+        'matrix': 64,
+        'dicom_series': [('SPGR', 16), ('FLAIR', 16)],
+        'parrec': [('BENCH T2W', 9, 1)],
+        'nifti_3d': [('T1w', (64, 64, 32))],
+        'nifti_4d': [('bold', (32, 32, 16, 10))],
+    },
+    'medium': {
+        'matrix': 128,
+        'dicom_series': [('SPGR', 64), ('FLAIR', 48), ('FSE', 48), ('MRA', 64)],
+        'parrec': [('BENCH T2W', 30, 1), ('BENCH BOLD', 24, 20)],
+        'nifti_3d': [('T1w', (128, 128, 96))],
+        'nifti_4d': [('bold', (64, 64, 32, 60))],
+    },
+    'large': {
+        'matrix': 256,
+        'dicom_series': [('SPGR', 176), ('FLAIR', 160), ('FSE', 120), ('MRA', 160),
+                         ('Accelerated Sagittal MPRAGE', 176), ('3D_SAG_T1', 176)],
+        'parrec': [('BENCH T2W', 60, 1), ('BENCH BOLD', 36, 120)],
+        'nifti_3d': [('T1w', (256, 256, 176)), ('T2w', (256, 256, 120))],
+        'nifti_4d': [('bold', (64, 64, 36, 200))],
+    },
+}
+
+# 생성 데이터가 매핑될 모달리티 (규칙 파일에 그대로 기록)
+_DICOM_RULES = {
+    'T1w': ['SPGR', 'Accelerated Sagittal MPRAGE', '3D_SAG_T1'],
+    'FLAIR': ['FLAIR'],
+    'T2w': ['FSE'],
+    'angio': ['MRA'],
+}
+_PARREC_RULES = {
+    'T2w': ['BENCH T2W'],
+    'bold': ['BENCH BOLD'],
+}
+_NIFTI_RULES = {
+    'T1w': ['SPGR'],
+    'T2w': ['FSE'],
+}
+
+
+def _volume(shape, seed):
+    """썸네일/압축률이 실제 영상과 비슷하도록 부드러운 구조 + 잡음을 가진 uint16 볼륨"""
+    rng = np.random.default_rng(seed)
+    grids = np.meshgrid(*[np.linspace(-1, 1, n, dtype=np.float32) for n in shape[:3]], indexing='ij')
+    radius = np.sqrt(sum(g * g for g in grids))
+    base = np.clip(1.0 - radius, 0, None) * 2000.0
+    if len(shape) > 3:
+        base = base[..., None] * (1.0 + 0.01 * np.arange(shape[3], dtype=np.float32))
+    noise = rng.normal(0, 20, size=shape).astype(np.float32)
+    return np.clip(base + noise, 0, 4095).astype(np.uint16)
+
+
+def write_dicom_series(out_dir, series_description, slices, matrix=64, prefix='IM', seed=0):
+    """단일 시리즈 DICOM 파일 생성 (슬라이스 1장 = 파일 1개)
+
+    Returns:
+        list: 생성된 파일 경로 목록
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    volume = _volume((matrix, matrix, slices), seed)
+
+    study_uid = generate_uid()
+    series_uid = generate_uid()
+    frame_uid = generate_uid()
+    paths = []
+    for i in range(slices):
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = MRImageStorage
+        meta.MediaStorageSOPInstanceUID = generate_uid()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+        ds = FileDataset(None, {}, file_meta=meta, preamble=b'\0' * 128)
+        ds.SOPClassUID = MRImageStorage
+        ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+        ds.StudyInstanceUID = study_uid
+        ds.SeriesInstanceUID = series_uid
+        ds.FrameOfReferenceUID = frame_uid
+        ds.Modality = 'MR'
+        ds.Manufacturer = 'BDSP-BENCH'
+        ds.MagneticFieldStrength = 3
+        ds.PatientID = 'BENCH'
+        ds.SeriesDescription = series_description
+        ds.ProtocolName = series_description
+        ds.SeriesNumber = seed + 1
+        ds.InstanceNumber = i + 1
+        ds.ImagePositionPatient = [0.0, 0.0, float(i)]
+        ds.ImageOrientationPatient = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+        ds.PixelSpacing = [1.0, 1.0]
+        ds.SliceThickness = 1.0
+        ds.Rows = matrix
+        ds.Columns = matrix
+        ds.BitsAllocated = 16
+        ds.BitsStored = 16
+        ds.HighBit = 15
+        ds.PixelRepresentation = 0
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = 'MONOCHROME2'
+        ds.PixelData = np.ascontiguousarray(volume[:, :, i]).tobytes()
+
+        path = out_dir / f"{prefix}{i + 1:05d}.dcm"
+        ds.save_as(str(path), enforce_file_format=True)
+        paths.append(path)
+    return paths
+
+
+# PAR V4.2 일반 정보 (nibabel parrec 파서가 요구하는 필드)
+_PAR_GENERAL = """# === DATA DESCRIPTION FILE ======================================================
+#
+# Dataset name: {name}
+#
+# CLINICAL TRYOUT             Research image export tool     V4.2
+#
+# === GENERAL INFORMATION ========================================================
+#
+.    Patient name                       :   bench
+.    Examination name                   :   bench
+.    Protocol name                      :   {protocol}
+.    Examination date/time              :   2024.01.01 / 09:00:00
+.    Series Type                        :   Image   MRSERIES
+.    Acquisition nr                     :   {acq}
+.    Reconstruction nr                  :   1
+.    Scan Duration [sec]                :   60
+.    Max. number of cardiac phases      :   1
+.    Max. number of echoes              :   1
+.    Max. number of slices/locations    :   {slices}
+.    Max. number of dynamics            :   {dynamics}
+.    Max. number of mixes               :   1
+.    Patient position                   :   Head First Supine
+.    Preparation direction              :   Anterior-Posterior
+.    Technique                          :   {technique}
+.    Scan resolution  (x, y)            :   {matrix}  {matrix}
+.    Scan mode                          :   MS
+.    Repetition time [ms]               :   2000.000
+.    FOV (ap,fh,rl) [mm]                :   {fov:.3f}  {fh:.3f}  {fov:.3f}
+.    Water Fat shift [pixels]           :   11.050
+.    Angulation midslice(ap,fh,rl)[degr]:   0.000  0.000  0.000
+.    Off Centre midslice(ap,fh,rl) [mm] :   0.000  0.000  0.000
+.    Flow compensation <0=no 1=yes> ?   :   0
+.    Presaturation     <0=no 1=yes> ?   :   0
+.    Phase encoding velocity [cm/sec]   :   0.000000  0.000000  0.000000
+.    MTC               <0=no 1=yes> ?   :   0
+.    SPIR              <0=no 1=yes> ?   :   0
+.    EPI factor        <0,1=no EPI>     :   1
+.    Dynamic scan      <0=no 1=yes> ?   :   {is_dynamic}
+.    Diffusion         <0=no 1=yes> ?   :   0
+.    Diffusion echo time [ms]           :   0.0000
+.    Max. number of diffusion values    :   1
+.    Max. number of gradient orients    :   1
+.    Number of label types   <0=no ASL> :   0
+#
+# === IMAGE INFORMATION ==========================================================
+#  sl ec  dyn ph ty    idx pix scan% rec size                (re)scale              window        angulation              offcentre        thick   gap   info      spacing     echo     dtime   ttime    diff  avg  flip    freq   RR-int  turbo delay b grad cont anis         diffusion       L.ty
+
+"""
+
+_PAR_IMAGE_LINE = ("{sl:3d} 1 {dyn:4d} 1 0 2 {idx:6d} 16 100 {matrix:4d} {matrix:4d} "
+                   "0.00000 1.00000 1.00000e+000 1000 2000 0.00 0.00 0.00 0.00 {fh:.2f} 0.00 "
+                   "1.000 0.000 0 1 0 2 1.000 1.000 30.00 {dtime:.2f} 0.00 0.00 1 90.00 "
+                   "0 0 0 0 0.0 1 1 0 0 0.000 0.000 0.000 1\n")
+
+_PAR_END = "\n# === END OF DATA DESCRIPTION FILE ===============================================\n"
+
+
+def write_parrec(out_dir, name, protocol_name, slices, dynamics=1, matrix=64,
+                 technique='T2TSE', acquisition=1, seed=0):
+    """PAR(V4.2)/REC 쌍 생성
+
+    Returns:
+        tuple: (PAR 경로, REC 경로)
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    shape = (matrix, matrix, slices, dynamics) if dynamics > 1 else (matrix, matrix, slices)
+    volume = _volume(shape, seed).reshape(matrix, matrix, slices, dynamics)
+
+    par_path = out_dir / f"{name}.PAR"
+    rec_path = out_dir / f"{name}.REC"
+
+    lines = [_PAR_GENERAL.format(name=name, protocol=protocol_name, acq=acquisition,
+                                 slices=slices, dynamics=dynamics, technique=technique,
+                                 matrix=matrix, fov=float(matrix), fh=float(slices),
+                                 is_dynamic=1 if dynamics > 1 else 0)]
+    # REC는 dynamic 순 → slice 순으로 이미지(2D int16)를 연속 저장
+    with open(rec_path, 'wb') as rec:
+        idx = 0
+        for dyn in range(dynamics):
+            for sl in range(slices):
+                lines.append(_PAR_IMAGE_LINE.format(sl=sl + 1, dyn=dyn + 1, idx=idx, matrix=matrix,
+                                                    fh=float(sl) - slices / 2.0, dtime=dyn * 2.0))
+                rec.write(np.ascontiguousarray(volume[:, :, sl, dyn].T).astype('<i2').tobytes())
+                idx += 1
+    lines.append(_PAR_END)
+    par_path.write_text(''.join(lines), encoding='utf-8')
+    return par_path, rec_path
+
+
+def write_nifti(path, shape, seed=0):
+    """3D/4D NIfTI 생성 (.nii 또는 .nii.gz)"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    image = nib.Nifti1Image(_volume(shape, seed), np.eye(4))
+    image.header.set_xyzt_units('mm', 'sec')
+    nib.save(image, str(path))
+    return path
+
+
+def write_modality_rules(modality_root, request=None):
+    """요청 정보에 맞는 *_modality.json 규칙 파일 생성 (dicom / parrec / nifti)
+
+    Returns:
+        dict: {'dicom': 경로, 'parrec': 경로, 'nifti': 경로} - 각 포맷의 규칙 디렉토리
+    """
+    request = request or DEFAULT_REQUEST
+    prefix = f"{request['systemId']}_{request['projectCode']}_{request['projectSeq']}_{request['orgId']}"
+    rule_sets = {
+        'dicom': {m: [{'SeriesDescription': v}] for m, v in _DICOM_RULES.items()},
+        'parrec': {m: [{'Protocol name': v}] for m, v in _PARREC_RULES.items()},
+        'nifti': {m: [{'series_description': v}] for m, v in _NIFTI_RULES.items()},
+    }
+    dirs = {}
+    for fmt, rules in rule_sets.items():
+        fmt_dir = Path(modality_root) / fmt
+        fmt_dir.mkdir(parents=True, exist_ok=True)
+        with open(fmt_dir / f"{prefix}_{fmt}_modality.json", 'w', encoding='utf-8') as f:
+            json.dump(rules, f, indent=2, ensure_ascii=False)
+        dirs[fmt] = str(fmt_dir)
+    return dirs
+
+
+def build_dataset(out_dir, spec):
+    """프리셋/사용자 spec으로 업로드 대상 원본 파일 생성 (zip 이전 상태)
+
+    Returns:
+        dict: {'files': 파일 수, 'bytes': 총 바이트}
+    """
+    out_dir = Path(out_dir)
+    matrix = spec.get('matrix', 64)
+    seed = 0
+    for i, (description, slices) in enumerate(spec.get('dicom_series', [])):
+        write_dicom_series(out_dir / f"dicom_{i + 1:02d}", description, slices, matrix,
+                           prefix=f"S{i + 1:02d}_", seed=seed)
+        seed += 1
+    for i, (protocol, slices, dynamics) in enumerate(spec.get('parrec', [])):
+        write_parrec(out_dir / 'parrec', f"BENCH_{i + 1:02d}", protocol, slices, dynamics, matrix,
+                     acquisition=i + 1, seed=seed)
+        seed += 1
+    # NiftiSeparator는 업로드 파일명의 마지막 '_' 뒤 토큰을 모달리티로 사용
+    for kind in ('nifti_3d', 'nifti_4d'):
+        for i, (modality, shape) in enumerate(spec.get(kind, [])):
+            write_nifti(out_dir / 'nifti' / f"bench_{kind[-2:]}{i + 1:02d}_{modality}.nii.gz",
+                        tuple(shape), seed=seed)
+            seed += 1
+
+    file_count = 0
+    byte_count = 0
+    for root, dirs, files in os.walk(out_dir):
+        for name in files:
+            file_count += 1
+            byte_count += os.path.getsize(os.path.join(root, name))
+    return {'files': file_count, 'bytes': byte_count}
+
+
+def zip_dataset(src_dir, zip_path):
+    """생성한 원본 파일을 업로드 zip으로 묶기
+
+    Validator는 invalid_data 최상위의 파일명 기준으로 파일을 찾으므로 zip 안에서는 평탄화하여 저장
+    (생성 파일명은 포맷/시리즈별 접두어로 서로 겹치지 않음)
+    """
+    zip_path = Path(zip_path)
+    zip_path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for root, dirs, files in os.walk(src_dir):
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                zf.write(full, name)
+    return zip_path
+
+
+def write_event_json(event_dir, subject_id, upload_time, request=None, **extra):
+    """모니터가 처리하는 이벤트 JSON 생성
+
+    Returns:
+        Path: 생성된 이벤트 JSON 경로
+    """
+    event = dict(request or DEFAULT_REQUEST)
+    event.update({'subjectId': subject_id, 'uploadTime': upload_time})
+    event.update(extra)
+    event_path = Path(event_dir) / f"{event['user']}_{subject_id}_{upload_time}.json"
+    event_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(event_path, 'w', encoding='utf-8') as f:
+        json.dump(event, f, indent=2, ensure_ascii=False)
+    return event_path
+
+
+def upload_zip_path(upload_dir, subject_id, upload_time, request=None):
+    """origin.create_origin_path가 찾는 업로드 zip 위치 (upload/<user>/<subject>/<uploadTime>/)"""
+    request = request or DEFAULT_REQUEST
+    return Path(upload_dir) / request['user'] / subject_id / upload_time / f"{subject_id}_{upload_time}.zip"
@@ -0,0 +1,221 @@
+#/BDSP/bids_app/src/claims.py
+import json
+import logging
+import os
+import secrets
+import shutil
+import socket
+import threading
+import time
+
+from utils import common, metrics
+
+logger = logging.getLogger(__name__)
+
+# EVENT_DIR 아래 노드별 claim 디렉토리 (EVENT_DIR/.claims/<node_id>/)
+CLAIMS_DIRNAME = ".claims"
+HEARTBEAT_FILENAME = ".heartbeat"
+# 인수(takeover) 중인 디렉토리 이름 접두사 (노드 ID로 쓰이지 않도록 '.'으로 시작)
+TAKEOVER_PREFIX = ".takeover-"
+
+
+def default_node_id():
+    """hostname-pid-임의값 (같은 hostname을 쓰는 컨테이너나 재시작한 프로세스가 같은 ID를 쓰지 않도록)
+
+    재시작하면 ID가 바뀌므로 이전 실행의 claim 디렉토리는 다른 노드(또는 자기 자신)가 lease 만료 후 인수한다.
+    """
+    return f"{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(3)}"
+
+
+class ClaimManager:
+    """공유 NAS의 EVENT_DIR를 여러 노드(컨테이너)가 나눠 처리하기 위한 claim / heartbeat / 인수
+
+    - claim: 이벤트 파일을 EVENT_DIR/.claims/<node_id>/로 rename (NFS에서도 rename은 원자적이므로
+      여러 노드가 같은 파일을 동시에 claim해도 한 노드만 성공). 작업이 끝날 때까지 claim 파일을 유지하고
+      WORKING_DIR에는 복사본으로 작업한다.
+    - heartbeat: heartbeat_interval마다 claim 디렉토리의 .heartbeat에 증가하는 seq를 기록
+    - 인수: 다른 노드의 seq가 lease_seconds 동안 바뀌지 않으면(관찰하는 노드의 시계 기준이라 노드 간
+      시계 차이와 무관) 그 노드의 claim 디렉토리를 통째로 rename하여 인수한 뒤 이벤트 파일을 EVENT_DIR로
+      되돌린다. 디렉토리 rename도 원자적이므로 여러 노드가 동시에 인수를 시도해도 한 노드만 성공한다.
+    - 인수당한 노드는 다음 heartbeat에서 자기 디렉토리가 사라진 것을 확인하고(fenced), 다시 만들기 전에
+      on_fenced를 호출해 실행 중인 작업을 중단한다 (인수한 노드가 같은 이벤트를 다시 처리하므로 중복 실행 방지).
+    """
+
+    def __init__(self, event_dir, node_id=None, heartbeat_interval=10.0, lease_seconds=120.0, on_fenced=None):
+        self.event_dir = event_dir
+        self.on_fenced = on_fenced
+        self.node_id = node_id or default_node_id()
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_seconds = max(lease_seconds, heartbeat_interval * 3)
+        self.claims_root = os.path.join(event_dir, CLAIMS_DIRNAME)
+        self.claim_dir = os.path.join(self.claims_root, self.node_id)
+        self._seq = 0
+        self._peers = {}                # node_id -> (마지막으로 본 seq, 바뀐 시각(monotonic))
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    # ===== 시작 / 종료 =========================================================
+    def start(self):
+        """이전 실행이 남긴 자기 claim을 EVENT_DIR로 되돌리고 heartbeat 스레드 시작"""
+        os.makedirs(self.claim_dir, exist_ok=True)
+        for file_name in self._claim_files(self.claim_dir):
+            self.requeue(os.path.join(self.claim_dir, file_name), "이전 실행 미완료")
+        self._beat()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name="claims-heartbeat", daemon=True)
+        self._thread.start()
+        logger.info(f"Cluster claim 시작 - Node: {self.node_id}, Heartbeat: {self.heartbeat_interval}s, "
+                    f"Lease: {self.lease_seconds:g}s, Claim Dir: {self.claim_dir}")
+        return self
+
+    def stop(self):
+        """heartbeat 중지 (실행 중인 작업이 모두 끝난 뒤 호출) - 남은 claim이 없으면 디렉토리 제거"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        remaining = self._claim_files(self.claim_dir)
+        if remaining:
+            logger.warning(f"종료 시 남은 claim {len(remaining)}개 (다른 노드가 lease 만료 후 인수): {remaining}")
+            return
+        shutil.rmtree(self.claim_dir, ignore_errors=True)
+        logger.info(f"Cluster claim 종료: {self.node_id}")
+
+    # ===== claim ===============================================================
+    def claim(self, event_path):
+        """이벤트 파일 claim
+
+        Returns:
+            str: claim 디렉토리로 옮겨진 경로 (다른 노드가 먼저 가져갔으면 None)
+        """
+        claimed_path = os.path.join(self.claim_dir, os.path.basename(event_path))
+        try:
+            os.rename(event_path, claimed_path)
+        except FileNotFoundError:
+            if not os.path.isdir(self.claim_dir):
+                # 인수당한 직후 (heartbeat가 디렉토리를 다시 만들기 전) - 다음 dispatch에서 재시도
+                logger.warning(f"claim 디렉토리 없음 (인수당함?): {self.claim_dir}")
+            return None
+        logger.info(f"Claim: {os.path.basename(event_path)} ({self.node_id})")
+        return claimed_path
+
+    def release(self, file_name):
+        """작업 종료 (성공/실패 무관) 후 claim 파일 제거
+
+        Returns:
+            bool: claim이 유지되어 있었으면 True (False면 lease 만료로 다른 노드가 인수한 작업)
+        """
+        try:
+            os.unlink(os.path.join(self.claim_dir, file_name))
+            return True
+        except FileNotFoundError:
+            logger.error(f"claim이 다른 노드로 인수된 작업이 종료됨 (중복 실행 가능): {file_name}")
+            return False
+
+    # ===== heartbeat / 인수 ====================================================
+    def _heartbeat_loop(self):
+        while not self._stop_event.wait(self.heartbeat_interval):
+            try:
+                self._beat()
+                self.check_peers()
+            except Exception as e:
+                logger.error(f"Cluster heartbeat 실패: {e}")
+
+    def _beat(self):
+        self._seq += 1
+        heartbeat_path = os.path.join(self.claim_dir, HEARTBEAT_FILENAME)
+        data = {'node': self.node_id, 'pid': os.getpid(), 'seq': self._seq, 'time': time.time()}
+        try:
+            common.write_json_atomic(heartbeat_path, data)
+        except FileNotFoundError:
+            if self._seq > 1:
+                # 다른 노드가 lease 만료로 claim 디렉토리를 인수함 - 지금까지 claim한 작업을 중단한 뒤
+                # 새 디렉토리로 계속 (이후 claim만 유효)
+                logger.error(f"claim 디렉토리가 다른 노드에 인수됨 (heartbeat 지연?): {self.claim_dir}")
+                metrics.CLUSTER_FENCED.inc()
+                if self.on_fenced is not None:
+                    self.on_fenced()
+            os.makedirs(self.claim_dir, exist_ok=True)
+            common.write_json_atomic(heartbeat_path, data)
+
+    def _read_seq(self, node_dir):
+        try:
+            with open(os.path.join(node_dir, HEARTBEAT_FILENAME), 'r', encoding='utf-8') as f:
+                return json.load(f).get('seq')
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def check_peers(self):
+        """다른 노드의 heartbeat 확인, lease 만료 노드 인수"""
+        now = time.monotonic()
+        try:
+            names = os.listdir(self.claims_root)
+        except FileNotFoundError:
+            return
+        alive = 0
+        for name in names:
+            node_dir = os.path.join(self.claims_root, name)
+            if name == self.node_id or not os.path.isdir(node_dir):
+                continue
+            if name.startswith(TAKEOVER_PREFIX):
+                # 인수 도중 중단된 디렉토리 - 오래되었으면 이어서 처리
+                if now - self._peer_changed(name, None, now) > self.lease_seconds:
+                    self._drain(node_dir, name)
+                continue
+            seq = self._read_seq(node_dir)
+            if now - self._peer_changed(name, seq, now) > self.lease_seconds:
+                self._take_over(name)
+            else:
+                alive += 1
+        # 정리된 노드의 추적 정보 제거
+        with self._lock:
+            for name in list(self._peers):
+                if name not in names:
+                    del self._peers[name]
+        metrics.CLUSTER_PEERS.set(alive)
+
+    def _peer_changed(self, name, seq, now):
+        """노드 seq가 마지막으로 바뀐 시각 (처음 보면 지금)"""
+        with self._lock:
+            last = self._peers.get(name)
+            if last is None or last[0] != seq:
+                self._peers[name] = (seq, now)
+                return now
+            return last[1]
+
+    def _take_over(self, node_id):
+        node_dir = os.path.join(self.claims_root, node_id)
+        takeover_name = f"{TAKEOVER_PREFIX}{node_id}-{self.node_id}-{int(time.time())}"
+        takeover_dir = os.path.join(self.claims_root, takeover_name)
+        try:
+            os.rename(node_dir, takeover_dir)
+        except (FileNotFoundError, OSError) as e:
+            # 다른 노드가 먼저 인수했거나 노드가 정상 종료하며 제거함
+            logger.debug(f"노드 인수 생략: {node_id} ({e})")
+            return
+        logger.warning(f"노드 heartbeat 만료 ({self.lease_seconds:g}s) - claim 인수: {node_id}")
+        metrics.CLUSTER_TAKEOVERS.inc()
+        self._drain(takeover_dir, node_id)
+
+    def _drain(self, node_dir, node_id):
+        """인수한 디렉토리의 이벤트 파일을 EVENT_DIR로 되돌리고 디렉토리 제거"""
+        for file_name in self._claim_files(node_dir):
+            self.requeue(os.path.join(node_dir, file_name), f"노드 {node_id} 인수")
+        shutil.rmtree(node_dir, ignore_errors=True)
+        with self._lock:
+            self._peers.pop(os.path.basename(node_dir), None)
+
+    def requeue(self, claimed_path, reason):
+        """claim한 이벤트 파일을 EVENT_DIR로 되돌림 (다른 노드가 다시 가져갈 수 있음)"""
+        file_name = os.path.basename(claimed_path)
+        try:
+            os.rename(claimed_path, os.path.join(self.event_dir, file_name))
+            logger.warning(f"이벤트 재등록: {file_name} ({reason})")
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _claim_files(directory):
+        try:
+            return sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+        except FileNotFoundError:
+            return []
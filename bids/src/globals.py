@@ -1,8 +1,22 @@
 #/BDSP/bids_app/src/globals.py
+import os
 import configparser
-# config 파일 읽기
+# config 파일 읽기 (BDSP_CONFIG 환경 변수로 다른 config.ini 지정 가능 - 부하 테스트 등)
+CONFIG_PATH = os.environ.get('BDSP_CONFIG', '/BDSP/bids_app/src/config.ini')
 config = configparser.ConfigParser()
-config.read('/BDSP/bids_app/src/config.ini')
+config.read(CONFIG_PATH)
+
+
+def _section_option(parser, section, option, fallback):
+    """섹션에 직접 적힌 값만 읽기
+
+    configparser는 DEFAULT 섹션의 키를 모든 섹션에 상속하므로, DEFAULT와 같은 이름의 키
+    (MAX_WORKERS, LOG_FILENAME)를 config.get으로 읽으면 fallback 대신 DEFAULT 값이 반환된다.
+    """
+    if parser.has_section(section) and parser.optionxform(option) in parser._sections[section]:
+        return parser.get(section, option)
+    return fallback
+
 
 # DEFAULT 섹션
 MAX_WORKERS = int(config['DEFAULT']['MAX_WORKERS'])
@@ -13,6 +27,8 @@ BACKUP_DIR = config['DEFAULT']['BACKUP_DIR']
 ERROR_DIR = config['DEFAULT']['ERROR_DIR']
 LOG_FILENAME = config['DEFAULT']['LOG_FILENAME']
 MAGNETIC_STRENGTH_FIELD = config['DEFAULT']['MAGNETIC_STRENGTH_FIELD']
+SCRATCH_DIR = config['DEFAULT'].get('SCRATCH_DIR', '')
+POLL_INTERVAL = float(config['DEFAULT'].get('POLL_INTERVAL', '5'))
 
 # MODALITY 섹션
 DICOM_MODALITY = config['MODALITY']['DICOM_MODALITY']
@@ -24,4 +40,103 @@ SUFFIX_MAP = config['MODALITY']['SUFFIX_MAP']
 FLAG_DIR = config['FLAG']['FLAG_DIR']
 DEFACING_FLAG = config['FLAG']['DEFACING_FLAG']
 CANONICAL_FLAG = config['FLAG']['CANONICAL_FLAG']
-CIVET_FLAG = config['FLAG']['CIVET_FLAG']
\ No newline at end of file
+CIVET_FLAG = config['FLAG']['CIVET_FLAG']
+PROFILE_FLAG = config['FLAG'].get('PROFILE_FLAG', os.path.join(FLAG_DIR, 'profile'))
+CANCEL_FLAG = config['FLAG'].get('CANCEL_FLAG', os.path.join(FLAG_DIR, 'cancel'))
+
+# METRICS 섹션 (Prometheus text format 노출, 포트 0이고 소켓이 비어 있으면 비활성화)
+METRICS_PORT = int(config.get('METRICS', 'METRICS_PORT', fallback='0'))
+METRICS_HOST = config.get('METRICS', 'METRICS_HOST', fallback='127.0.0.1')
+METRICS_SOCKET = config.get('METRICS', 'METRICS_SOCKET', fallback='')
+
+# API 섹션 (작업 제출 / 상태 조회 / 완료 알림, 포트 0이고 소켓이 비어 있으면 비활성화)
+API_PORT = int(config.get('API', 'API_PORT', fallback='0'))
+API_HOST = config.get('API', 'API_HOST', fallback='127.0.0.1')
+API_SOCKET = config.get('API', 'API_SOCKET', fallback='')
+
+# DEADLINE 섹션 (기본 시간 + 입력 GB당 추가 시간, 기본 시간이 0이면 제한 없음)
+DEADLINE_JOB_SECONDS = float(config.get('DEADLINE', 'JOB_SECONDS', fallback='0'))
+DEADLINE_JOB_SECONDS_PER_GB = float(config.get('DEADLINE', 'JOB_SECONDS_PER_GB', fallback='0'))
+DEADLINE_STEP_SECONDS = float(config.get('DEADLINE', 'STEP_SECONDS', fallback='0'))
+DEADLINE_STEP_SECONDS_PER_GB = float(config.get('DEADLINE', 'STEP_SECONDS_PER_GB', fallback='0'))
+DEADLINE_STEP_LIMITS = config.get('DEADLINE', 'STEP_LIMITS', fallback='')
+DEADLINE_PROCESS_SECONDS = float(config.get('DEADLINE', 'PROCESS_SECONDS', fallback='0'))
+DEADLINE_PROCESS_SECONDS_PER_GB = float(config.get('DEADLINE', 'PROCESS_SECONDS_PER_GB', fallback='0'))
+
+# PROGRESS 섹션 (작업별 진행 상황 파일, STATUS_DIR를 비우면 기록하지 않음)
+PROGRESS_STATUS_DIR = config.get('PROGRESS', 'STATUS_DIR', fallback=os.path.join(WORKING_DIR, '.bdsp_status'))
+PROGRESS_INTERVAL = float(config.get('PROGRESS', 'INTERVAL', fallback='1'))
+PROGRESS_STATUS_RETENTION_HOURS = float(config.get('PROGRESS', 'STATUS_RETENTION_HOURS', fallback='24'))
+
+# SCHEDULER 섹션 (사용자/프로젝트 공정 분배, 동시 실행 상한 0은 제한 없음)
+SCHEDULER_USER_MAX_RUNNING = int(config.get('SCHEDULER', 'USER_MAX_RUNNING', fallback='0'))
+SCHEDULER_PROJECT_MAX_RUNNING = int(config.get('SCHEDULER', 'PROJECT_MAX_RUNNING', fallback='0'))
+SCHEDULER_AGING_SECONDS = float(config.get('SCHEDULER', 'AGING_SECONDS', fallback='600'))
+SCHEDULER_DEFAULT_PRIORITY = int(config.get('SCHEDULER', 'DEFAULT_PRIORITY', fallback='0'))
+
+# ADMISSION 섹션 (디스크/메모리 여유가 부족한 작업은 시작하지 않고 대기)
+ADMISSION_ENABLED = config.getboolean('ADMISSION', 'ENABLED', fallback=True)
+ADMISSION_DEFAULT_EXPANSION = float(config.get('ADMISSION', 'DEFAULT_EXPANSION', fallback='4'))
+ADMISSION_DISK_RESERVE_MB = int(config.get('ADMISSION', 'DISK_RESERVE_MB', fallback='1024'))
+ADMISSION_MEMORY_BASE_MB = int(config.get('ADMISSION', 'MEMORY_BASE_MB', fallback='512'))
+ADMISSION_MEMORY_FACTOR = float(config.get('ADMISSION', 'MEMORY_FACTOR', fallback='2'))
+ADMISSION_MEMORY_RESERVE_MB = int(config.get('ADMISSION', 'MEMORY_RESERVE_MB', fallback='512'))
+
+# AUTOSCALE 섹션 (CPU 사용률 / I/O wait / 대기열 길이로 동시 작업 수를 MIN~MAX_WORKERS 범위에서 조정)
+AUTOSCALE_ENABLED = config.getboolean('AUTOSCALE', 'ENABLED', fallback=False)
+AUTOSCALE_MIN_WORKERS = int(config.get('AUTOSCALE', 'MIN_WORKERS', fallback='1'))
+AUTOSCALE_MAX_WORKERS = int(_section_option(config, 'AUTOSCALE', 'MAX_WORKERS', str(os.cpu_count() or 1)))
+AUTOSCALE_INTERVAL = float(config.get('AUTOSCALE', 'INTERVAL', fallback='30'))
+AUTOSCALE_CPU_HIGH = float(config.get('AUTOSCALE', 'CPU_HIGH', fallback='0.9'))
+AUTOSCALE_IOWAIT_HIGH = float(config.get('AUTOSCALE', 'IOWAIT_HIGH', fallback='0.3'))
+
+# STAGES 섹션 (단계 종류별 풀 크기, 0이면 기본값: IO 4 / CPU·PROC CPU 수)
+STAGE_IO_WORKERS = int(config.get('STAGES', 'IO_WORKERS', fallback='0'))
+STAGE_CPU_WORKERS = int(config.get('STAGES', 'CPU_WORKERS', fallback='0'))
+STAGE_PROC_WORKERS = int(config.get('STAGES', 'PROC_WORKERS', fallback='0'))
+STAGE_QUEUE_SIZE = int(config.get('STAGES', 'QUEUE_SIZE', fallback='8'))
+
+# SOURCE 섹션 (스트리밍 모드: 압축 해제와 DICOM 헤더 스캔을 겹쳐 실행, 워커 0이면 기본값 min(4, CPU 수))
+SOURCE_STREAMING = config.getboolean('SOURCE', 'STREAMING', fallback=False)
+SOURCE_HEADER_WORKERS = int(config.get('SOURCE', 'HEADER_WORKERS', fallback='0'))
+SOURCE_HEADER_QUEUE_SIZE = int(config.get('SOURCE', 'HEADER_QUEUE_SIZE', fallback='64'))
+
+# CLUSTER 섹션 (여러 노드가 같은 EVENT_DIR를 처리: EVENT_DIR/.claims/<NODE_ID>로 claim, heartbeat 만료 시 인수)
+CLUSTER_ENABLED = config.getboolean('CLUSTER', 'ENABLED', fallback=False)
+CLUSTER_NODE_ID = config.get('CLUSTER', 'NODE_ID', fallback='') or os.environ.get('BDSP_NODE_ID', '')
+CLUSTER_HEARTBEAT_INTERVAL = float(config.get('CLUSTER', 'HEARTBEAT_INTERVAL', fallback='10'))
+CLUSTER_LEASE_SECONDS = float(config.get('CLUSTER', 'LEASE_SECONDS', fallback='120'))
+
+# BACKFILL 섹션 (bids-backfill 기본값, 변환 캐시 디렉토리를 비우면 캐시 사용 안 함)
+BACKFILL_WORKERS = int(config.get('BACKFILL', 'WORKERS', fallback='0')) or MAX_WORKERS
+BACKFILL_CONVERSION_CACHE_DIR = config.get('BACKFILL', 'CONVERSION_CACHE_DIR',
+                                           fallback=os.path.join(SCRATCH_DIR or WORKING_DIR, '.bdsp_conversion_cache'))
+BACKFILL_CONVERSION_CACHE_MAX_GB = float(config.get('BACKFILL', 'CONVERSION_CACHE_MAX_GB', fallback='0'))
+BACKFILL_LOG_FILENAME = _section_option(config, 'BACKFILL', 'LOG_FILENAME',
+                                        os.path.join(os.path.dirname(LOG_FILENAME), 'bids_backfill.log'))
+
+# REDERIVE 섹션 (bids-rederive 기본값)
+REDERIVE_WORKERS = int(config.get('REDERIVE', 'WORKERS', fallback='0')) or STAGE_CPU_WORKERS or (os.cpu_count() or 1)
+REDERIVE_LOG_FILENAME = _section_option(config, 'REDERIVE', 'LOG_FILENAME',
+                                        os.path.join(os.path.dirname(LOG_FILENAME), 'bids_rederive.log'))
+
+
+def read_runtime_settings(path=CONFIG_PATH):
+    """실행 중 다시 읽어 반영하는 설정 (monitor가 config.ini 수정 시각이 바뀌면 호출)
+
+    나머지 설정(경로 등)은 재시작해야 반영된다.
+    """
+    parser = configparser.ConfigParser()
+    parser.read(path)
+    return {
+        'MAX_WORKERS': int(parser['DEFAULT']['MAX_WORKERS']),
+        'POLL_INTERVAL': float(parser['DEFAULT'].get('POLL_INTERVAL', '5')),
+        'SCHEDULER_USER_MAX_RUNNING': int(parser.get('SCHEDULER', 'USER_MAX_RUNNING', fallback='0')),
+        'SCHEDULER_PROJECT_MAX_RUNNING': int(parser.get('SCHEDULER', 'PROJECT_MAX_RUNNING', fallback='0')),
+        'AUTOSCALE_ENABLED': parser.getboolean('AUTOSCALE', 'ENABLED', fallback=False),
+        'AUTOSCALE_MIN_WORKERS': int(parser.get('AUTOSCALE', 'MIN_WORKERS', fallback='1')),
+        'AUTOSCALE_MAX_WORKERS': int(_section_option(parser, 'AUTOSCALE', 'MAX_WORKERS', str(os.cpu_count() or 1))),
+        'AUTOSCALE_INTERVAL': float(parser.get('AUTOSCALE', 'INTERVAL', fallback='30')),
+        'AUTOSCALE_CPU_HIGH': float(parser.get('AUTOSCALE', 'CPU_HIGH', fallback='0.9')),
+        'AUTOSCALE_IOWAIT_HIGH': float(parser.get('AUTOSCALE', 'IOWAIT_HIGH', fallback='0.3')),
+    }
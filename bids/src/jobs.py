@@ -0,0 +1,339 @@
+#/BDSP/bids_app/src/jobs.py
+import itertools
+import json
+import logging
+import math
+import os
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+
+from utils import common
+
+logger = logging.getLogger(__name__)
+
+# 작업 상태
+QUEUED = "queued"          # 접수됨 (EVENT_DIR에 있거나 스케줄러 대기열)
+RUNNING = "running"
+SUCCESS = "success"
+ERROR = "error"
+CANCELLED = "cancelled"    # 제어 파일 / API로 취소
+TIMEOUT = "timeout"        # 작업 / 단계 / 외부 프로세스 제한 시간 초과
+ELSEWHERE = "elsewhere"    # 다른 노드가 claim하여 처리 중 (cluster 모드)
+FINISHED_STATES = (SUCCESS, ERROR, CANCELLED, TIMEOUT, ELSEWHERE)
+
+# 끝난 작업 상태를 메모리에 유지하는 개수 (오래된 것부터 제거)
+DEFAULT_HISTORY = 1000
+# 진행 카운터 변경 알림 최소 간격 (초) - 상태 변경 / 단계 알림은 바로 보냄
+PROGRESS_INTERVAL = 1.0
+
+# 단계별 진행률 계산에 쓰는 진행 카운터 (완료 수, 전체 수)
+STEP_COUNTERS = {
+    'origin': ('files_extracted', 'files_total'),
+    'raw': ('series_converted', 'series_total'),
+    'post': ('series_processed', 'series_total'),
+}
+
+# WORKING_DIR 아래 단계별 처리량 이력 파일 (ETA 추정)
+THROUGHPUT_HISTORY_FILENAME = ".bdsp_throughput_history.json"
+
+
+class ThroughputHistory:
+    """완료된 작업의 업로드 크기와 단계별 소요 시간 이력 (ETA 추정)
+
+    업로드 크기가 비슷한(로그 스케일로 가까운) 작업 neighbors건의 단계별 처리 시간(초/byte) 중앙값에
+    현재 작업의 업로드 크기를 곱해 단계별 예상 시간을 구한다. 이력이 min_samples건 미만이면 추정하지 않는다.
+    """
+
+    def __init__(self, path=None, size=200, neighbors=10, min_samples=3):
+        self.path = path
+        self.neighbors = neighbors
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=size)     # {'upload_bytes', 'steps': {step: seconds}}
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                records = json.load(f).get('jobs', [])
+            self._records.extend(r for r in records if r.get('upload_bytes', 0) > 0 and r.get('steps'))
+            logger.info(f"처리량 이력 로드: {len(self._records)}건")
+        except Exception as e:
+            logger.warning(f"처리량 이력 로드 실패 (ETA 추정 생략): {self.path} ({e})")
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            common.write_json_atomic(self.path, {'jobs': list(self._records)})
+        except OSError as e:
+            logger.warning(f"처리량 이력 저장 실패: {self.path} ({e})")
+
+    def record(self, upload_bytes, step_seconds):
+        """성공한 작업 하나의 단계별 소요 시간 기록"""
+        if not upload_bytes or not step_seconds:
+            return
+        with self._lock:
+            self._records.append({'upload_bytes': int(upload_bytes),
+                                  'steps': {step: round(seconds, 3) for step, seconds in step_seconds.items()}})
+            self._save()
+
+    def step_estimates(self, upload_bytes):
+        """업로드 크기에 대한 단계별 예상 시간 (초, 이력 부족 시 None)"""
+        with self._lock:
+            records = list(self._records)
+        if len(records) < self.min_samples or not upload_bytes:
+            return None
+        records.sort(key=lambda r: abs(math.log(r['upload_bytes'] / upload_bytes)))
+        nearest = records[:self.neighbors]
+        estimates = {}
+        for step in {step for r in nearest for step in r['steps']}:
+            rates = [r['steps'][step] / r['upload_bytes'] for r in nearest if step in r['steps']]
+            estimates[step] = statistics.median(rates) * upload_bytes
+        return estimates
+
+
+class StatusFileWriter:
+    """작업 상태를 directory/<job_id>.json으로 기록하는 JobTracker listener (API 없이 진행 상황 확인)
+
+    진행 카운터 변경은 JobTracker가 progress_interval 간격으로만 알리므로 그 간격으로 갱신된다.
+    다른 노드가 처리하는 작업(elsewhere)은 그 노드가 기록하므로 덮어쓰지 않는다.
+    """
+
+    def __init__(self, directory, retention_seconds=24 * 3600):
+        self.directory = directory
+        self.retention_seconds = retention_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, event, job):
+        if event == ELSEWHERE:
+            return
+        status_path = os.path.join(self.directory, f"{job['job_id']}.json")
+        # 다른 노드가 이미 기록 중인 작업의 접수 알림은 무시
+        if event == QUEUED and os.path.exists(status_path):
+            return
+        try:
+            common.write_json_atomic(status_path, job, indent=2, default=str)
+        except OSError as e:
+            logger.warning(f"작업 상태 파일 기록 실패: {status_path} ({e})")
+
+    def cleanup(self):
+        """보관 기간이 지난 상태 파일 삭제 (모니터 시작 시)"""
+        cutoff = time.time() - self.retention_seconds
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            logger.info(f"오래된 작업 상태 파일 {removed}개 삭제: {self.directory}")
+
+
+class JobTracker:
+    """모니터가 처리하는 작업의 상태 / 단계 진행 추적 (작업 ID = 이벤트 파일명 stem)
+
+    EVENT_DIR로 들어온 작업과 제출 API로 들어온 작업을 같은 방식으로 추적한다.
+    상태가 바뀔 때마다 등록된 listener(event, job)를 호출한다
+    (event: 'queued' / 'running' / 'step' / 'progress' / 'success' / 'error' / 'cancelled' / 'timeout' / 'elsewhere').
+    listener는 상태를 바꾼 스레드(모니터 / 워커)에서 호출되므로 오래 걸리면 안 된다.
+    진행 카운터(utils.progress.report)는 job['progress']에 모으고, estimator가 있으면 실행 중인 작업의
+    남은 시간(eta_seconds)을 추정한다.
+    """
+
+    def __init__(self, history=DEFAULT_HISTORY, estimator=None, progress_interval=PROGRESS_INTERVAL):
+        self.history = history
+        self.estimator = estimator
+        self.progress_interval = progress_interval
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()      # job_id -> 상태 dict (접수 순서)
+        self._step_order = itertools.count()
+        self._progress_sent = {}        # job_id -> 마지막 진행 알림 시각 (monotonic)
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        try:
+            self._listeners.remove(listener)
+        except ValueError:
+            pass
+
+    # ===== 상태 변경 ===========================================================
+    def queued(self, job_id, source="event"):
+        """작업 접수 (이미 접수된 작업이면 유지, 끝난 작업이면 재처리로 보고 새로 시작)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job['state'] not in FINISHED_STATES:
+                return self._copy(job)
+            snapshot = self._copy(self._new_job(job_id, source))
+        self._emit(QUEUED, snapshot)
+        return snapshot
+
+    def started(self, job_id):
+        with self._lock:
+            # 접수 기록이 없으면(history에서 제거된 재처리 등) 여기서 등록
+            job = self._jobs.get(job_id) or self._new_job(job_id, "event")
+            job['state'] = RUNNING
+            job['started'] = time.time()
+            snapshot = self._copy(job)
+        self._emit(RUNNING, snapshot)
+
+    def step(self, job_id, name, event):
+        """단계 시작/종료 (log.add_step_listener로 등록)
+
+        시리즈별 후처리처럼 같은 단계가 여러 스레드에서 겹쳐 실행될 수 있으므로 단계별 실행 수를 센다.
+        현재 단계는 실행 중인 단계 중 가장 마지막에 시작한 단계.
+        """
+        now = time.time()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['state'] != RUNNING:
+                return
+            info = job['steps'].get(name)
+            if event == 'start':
+                if info is None:
+                    info = job['steps'][name] = {'started': now, 'finished': None, 'active': 0, 'order': 0}
+                info['active'] += 1
+                info['order'] = next(self._step_order)
+            elif info is not None:
+                info['active'] = max(0, info['active'] - 1)
+                info['finished'] = now
+            active = [(step['order'], step_name) for step_name, step in job['steps'].items() if step['active']]
+            current = max(active)[1] if active else None
+            # 단계 사이(현재 단계 없음)는 알리지 않음
+            changed = event == 'start' or (current is not None and current != job['step'])
+            job['step'] = current
+            snapshot = self._copy(job) if changed else None
+        if snapshot is not None:
+            self._emit('step', snapshot)
+
+    def progress(self, job_id, counters):
+        """진행 카운터 갱신 (utils.progress.add_listener로 등록) - 알림은 progress_interval 간격으로만"""
+        now = time.monotonic()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['state'] != RUNNING:
+                return
+            job['progress'].update(counters)
+            if now - self._progress_sent.get(job_id, 0) < self.progress_interval:
+                return
+            self._progress_sent[job_id] = now
+            snapshot = self._copy(job)
+        self._emit('progress', snapshot)
+
+    def finished(self, job_id, state, error=None, result=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            now = time.time()
+            for info in job['steps'].values():
+                if info['active']:
+                    info['active'] = 0
+                    info['finished'] = now
+            job['state'] = state
+            job['step'] = None
+            job['finished'] = now
+            job['error'] = error
+            job['result'] = result
+            self._progress_sent.pop(job_id, None)
+            snapshot = self._copy(job)
+        if state == SUCCESS and self.estimator is not None:
+            self.estimator.record(snapshot['progress'].get('upload_bytes'),
+                                  {step: info['seconds'] for step, info in snapshot['steps'].items()})
+        self._emit(state, snapshot)
+        return snapshot
+
+    # ===== 조회 ================================================================
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._copy(job) if job is not None else None
+
+    def active(self, job_id):
+        """접수되었고 아직 끝나지 않은 작업인지"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job is not None and job['state'] not in FINISHED_STATES
+
+    def list(self, state=None):
+        with self._lock:
+            return [self._copy(job) for job in self._jobs.values() if state is None or job['state'] == state]
+
+    # ===== 내부 ================================================================
+    def _new_job(self, job_id, source):
+        job = self._jobs[job_id] = {
+            'job_id': job_id,
+            'source': source,
+            'state': QUEUED,
+            'step': None,
+            'steps': {},
+            'progress': {},
+            'submitted': time.time(),
+            'started': None,
+            'finished': None,
+            'error': None,
+            'result': None,
+        }
+        self._jobs.move_to_end(job_id)
+        self._trim()
+        return job
+
+    def _trim(self):
+        """끝난 작업이 history를 넘으면 오래된 것부터 제거 (진행 중인 작업은 유지)"""
+        excess = len(self._jobs) - self.history
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job['state'] in FINISHED_STATES][:excess]:
+            del self._jobs[job_id]
+
+    def _copy(self, job):
+        snapshot = dict(job)
+        snapshot['progress'] = dict(job['progress'])
+        snapshot['steps'] = {}
+        for name, info in job['steps'].items():
+            finished = None if info['active'] else info['finished']
+            snapshot['steps'][name] = {'started': info['started'], 'finished': finished,
+                                       'seconds': round((finished or time.time()) - info['started'], 3)}
+        snapshot['eta_seconds'] = self._eta(job) if job['state'] == RUNNING else None
+        return snapshot
+
+    def _eta(self, job):
+        """남은 예상 시간 (초) = 시작 안 한 단계의 예상 시간 + 실행 중인 단계의 남은 부분
+
+        실행 중인 단계는 진행 카운터가 있으면 진행률로, 없으면 경과 시간으로 남은 부분을 계산한다.
+        """
+        upload_bytes = job['progress'].get('upload_bytes')
+        if self.estimator is None or not upload_bytes:
+            return None
+        estimates = self.estimator.step_estimates(upload_bytes)
+        if not estimates:
+            return None
+        now = time.time()
+        remaining = 0.0
+        for step, expected in estimates.items():
+            info = job['steps'].get(step)
+            if info is None:
+                remaining += expected
+            elif info['active']:
+                done, total = (job['progress'].get(name) for name in STEP_COUNTERS.get(step, (None, None)))
+                if total:
+                    remaining += expected * max(0.0, 1.0 - (done or 0) / total)
+                else:
+                    remaining += max(0.0, expected - (now - info['started']))
+        return round(remaining, 1)
+
+    def _emit(self, event, snapshot):
+        for listener in list(self._listeners):
+            try:
+                listener(event, snapshot)
+            except Exception as e:
+                logger.error(f"작업 상태 알림 실패 ({event}, {snapshot['job_id']}): {e}")
@@ -0,0 +1,132 @@
+#/BDSP/bids_app/src/process/components/domain/mri/parrec_header.py
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from nibabel import parrec
+from utils.common import remove_all_whitespace, remove_special_chars
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# IMAGE INFORMATION 섹션 시작 라인
+_IMAGE_SECTION_MARKER = "#  sl ec  dyn"
+
+# 이미지 라인의 최소 필수 컬럼 수
+_MIN_IMAGE_COLUMNS = 10
+
+# 헤더 캐시 (inode 기준이므로 Separator의 rename 이후에도 적중)
+_CACHE_SIZE = 256
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+cache_stats = {'hits': 0, 'misses': 0}
+metrics.register_cache('par_header', cache_stats)
+
+
+class ParHeader:
+    """PAR 파일을 한 번 파싱한 결과 (Validator / Mapper / Converter 공용)
+
+    Attributes:
+        par_path: 파싱한 PAR 파일 경로
+        metadata: {정규화된 키: 값} - ':'가 있는 모든 라인 (Mapper 모달리티 판단용)
+        has_image_section: IMAGE INFORMATION 섹션 존재 여부
+        image_count: 이미지 정의 라인 수
+        general_info: nibabel 일반 정보 dict (파싱 실패 시 None)
+        image_defs: nibabel 이미지 정의 structured array (파싱 실패 시 None)
+        parse_error: nibabel 파싱 실패 사유
+    """
+
+    def __init__(self, par_path, metadata, has_image_section, image_count,
+                 general_info=None, image_defs=None, parse_error=None):
+        self.par_path = str(par_path)
+        self.metadata = metadata
+        self.has_image_section = has_image_section
+        self.image_count = image_count
+        self.general_info = general_info
+        self.image_defs = image_defs
+        self.parse_error = parse_error
+
+    def to_parrec_header(self, permit_truncated=False, strict_sort=True):
+        """변환용 nibabel PARRECHeader 생성 (재파싱 없음)"""
+        if self.general_info is None or self.image_defs is None:
+            raise ValueError(f"PAR 헤더 구조 파싱 실패: {self.par_path} ({self.parse_error})")
+        return parrec.PARRECHeader(self.general_info, self.image_defs,
+                                   permit_truncated=permit_truncated, strict_sort=strict_sort)
+
+
+def find_rec_path(par_path):
+    """PAR 파일과 짝이 되는 REC 파일 경로 (.rec / .REC), 없으면 None"""
+    par_path = Path(par_path)
+    for suffix in ('.rec', '.REC', '.Rec'):
+        rec_path = par_path.with_suffix(suffix)
+        if rec_path.exists():
+            return rec_path
+    return None
+
+
+def _parse_par_text(par_path, text):
+    """PAR 텍스트를 한 번 순회하여 ParHeader 생성"""
+    metadata = {}
+    has_image_section = False
+    image_count = 0
+
+    for line in text.split('\n'):
+        line = line.strip()
+
+        # IMAGE INFORMATION 섹션 시작 확인
+        if line.startswith(_IMAGE_SECTION_MARKER):
+            has_image_section = True
+            continue
+
+        # 데이터 라인 카운트
+        if has_image_section and line and not line.startswith("#"):
+            if len(line.split()) >= _MIN_IMAGE_COLUMNS:
+                image_count += 1
+            continue
+
+        if ':' in line:
+            # 키 정규화: 공백 제거 → 특수문자 제거 → 소문자 변환
+            key, value = line.split(':', 1)
+            key = remove_special_chars(remove_all_whitespace(key.strip())).lower()
+            metadata[key] = value.strip()
+
+    general_info = image_defs = parse_error = None
+    try:
+        general_info, image_defs = parrec.parse_PAR_header(io.StringIO(text))
+    except Exception as e:
+        parse_error = str(e)
+        logger.warning(f"PAR 헤더 구조 파싱 실패: {par_path} ({e})")
+
+    return ParHeader(par_path, metadata, has_image_section, image_count,
+                     general_info, image_defs, parse_error)
+
+
+def read_par_header(par_path) -> ParHeader:
+    """PAR 헤더 로드 (캐시 사용)
+
+    같은 파일(inode/크기/mtime 동일)은 Validator → Separator(rename) → Mapper → Converter
+    전 과정에서 한 번만 파싱한다.
+    """
+    st = os.stat(par_path)
+    key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    with _cache_lock:
+        header = _cache.get(key)
+        if header is not None:
+            _cache.move_to_end(key)
+            cache_stats['hits'] += 1
+            return header
+        cache_stats['misses'] += 1
+
+    with open(par_path, 'r', encoding='utf-8', errors='ignore') as f:
+        header = _parse_par_text(par_path, f.read())
+
+    with _cache_lock:
+        _cache[key] = header
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return header
@@ -2,15 +2,21 @@ import os
 import json
 import logging
 from pathlib import Path
+from utils import stages
 
 logger = logging.getLogger(__name__)
 
-def check_modality(raw_path):
+# 검증 로직(check_modality)을 바꾸면 올린다 - bids-rederive가 이전 버전의 검증 결과만 다시 계산
+CHECKER_VERSION = 1
+
+@stages.stage(stages.CPU)
+def check_modality(raw_path, summary=True):
     """
     BIDS 규격에 따른 모달리티 검증을 수행합니다.
     
     Args:
         raw_path (dict): {source_path: nifti_file_path} 형태의 딕셔너리
+        summary (bool): 검증 결과 요약 로그 출력 여부 (시리즈 단위 호출은 마지막에 한 번만 출력)
         
     Returns:
         dict: 검증 결과를 담은 딕셔너리
@@ -92,7 +98,8 @@ def check_modality(raw_path):
         
         validation_results[nifti_path] = file_result
     
-    _log_validation_summary(validation_results)
+    if summary:
+        _log_validation_summary(validation_results)
     return validation_results
 
 
@@ -1,12 +1,16 @@
 import os
 from pathlib import Path
+from utils import stages
 
-def check_byproduct(raw_path):
+@stages.stage(stages.IO)
+def check_byproduct(raw_path, produced=None):
     """
     BIDS rawdata에서 .nii.gz와 .json 외의 부산물 파일들을 찾아 정리합니다.
     
     Args:
         raw_path (dict): {source_path: nifti_file_path} 형태의 딕셔너리
+        produced (dict): {nifti_file_path: [파일 경로, ...]} 변환 단계에서 해당 시리즈가 만든 파일
+                         (있으면 폴더 전체 대신 이 파일들만 확인 - 다른 시리즈가 같은 폴더에 변환 중일 수 있음)
         
     Returns:
         dict: {nifti_file_path: {확장자: 파일경로}} 형태의 딕셔너리
@@ -30,27 +34,34 @@ def check_byproduct(raw_path):
         # 같은 디렉토리에서 같은 base_filename을 가진 파일들 찾기
         byproduct_files = {}
         
-        if os.path.exists(base_dir):
-            for file in os.listdir(base_dir):
-                file_path = os.path.join(base_dir, file)
+        series_files = (produced or {}).get(nifti_path)
+        if series_files is not None:
+            candidates = [os.path.basename(file_path) for file_path in series_files
+                          if os.path.dirname(file_path) == str(base_dir)]
+        elif os.path.exists(base_dir):
+            candidates = os.listdir(base_dir)
+        else:
+            candidates = []
+        for file in candidates:
+            file_path = os.path.join(base_dir, file)
+            
+            # 디렉토리는 제외
+            if os.path.isdir(file_path):
+                continue
+            
+            # 현재 파일이 같은 base_filename으로 시작하는지 확인
+            if file.startswith(base_filename):
+                file_pathobj = Path(file_path)
                 
-                # 디렉토리는 제외
-                if os.path.isdir(file_path):
+                # .nii.gz와 .json 파일은 제외
+                if file.endswith('.nii.gz') or file.endswith('.json'):
                     continue
                 
-                # 현재 파일이 같은 base_filename으로 시작하는지 확인
-                if file.startswith(base_filename):
-                    file_pathobj = Path(file_path)
-                    
-                    # .nii.gz와 .json 파일은 제외
-                    if file.endswith('.nii.gz') or file.endswith('.json'):
-                        continue
-                    
-                    # 확장자 추출 (점 제거)
-                    suffix = file_pathobj.suffix.lstrip('.')
-                    
-                    if suffix:  # 확장자가 있는 경우만
-                        byproduct_files[suffix] = file_path
+                # 확장자 추출 (점 제거)
+                suffix = file_pathobj.suffix.lstrip('.')
+                
+                if suffix:  # 확장자가 있는 경우만
+                    byproduct_files[suffix] = file_path
         
         # 결과 저장 (부산물이 있는 경우만)
         if byproduct_files:
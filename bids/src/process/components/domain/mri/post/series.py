@@ -0,0 +1,91 @@
+#/BDSP/bids_app/src/process/components/domain/mri/post/series.py
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import cancel, common, log, metrics, progress
+from . import bids_checker, byproduct, thumbnail
+
+logger = logging.getLogger(__name__)
+
+# 시리즈별 후처리 동시 실행 수 (실제 작업은 단계 풀(CPU/IO)에서 실행되므로 제출용 스레드 수)
+_SERIES_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+
+class SeriesPostProcessor:
+    """시리즈 변환 완료 이벤트를 받아 후처리를 시리즈 단위로 바로 실행
+
+    raw 단계가 시리즈 하나를 변환할 때마다 submit()을 호출하면, 다른 시리즈가 변환되는 동안
+    해당 시리즈의 checker / byproduct / thumbnail을 실행하고 on_ready(nifti_path, entry)로
+    완료된 checklist 항목을 넘긴다 (flag 인계 등).
+    finish()는 남은 시리즈를 기다린 뒤 전체 결과를 raw 매핑 순서대로 모아 반환한다.
+    """
+
+    def __init__(self, on_ready=None, workers=_SERIES_WORKERS):
+        self.on_ready = on_ready
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="series-post")
+        self._futures = {}      # source_path -> Future
+        self._done = 0
+        self._done_lock = threading.Lock()
+
+    def submit(self, source_path, nifti_path, produced=None):
+        """시리즈 하나의 변환 완료 (raw 단계의 on_series 콜백, produced: 이 시리즈가 만든 파일 목록)"""
+        logger.debug(f"시리즈 후처리 제출: {nifti_path}")
+        self._futures[source_path] = log.submit(self._executor, self._process, source_path, nifti_path, produced)
+
+    def _process(self, source_path, nifti_path, produced=None):
+        cancel.check()
+        single = {source_path: nifti_path}
+        with metrics.step_timer("series_post"), log.step("post"):
+            checklist = bids_checker.check_modality(single, summary=False)
+            # 부산물은 이 시리즈가 만든 파일에서만 찾음 (같은 폴더에 다른 시리즈가 변환 중)
+            byproducts = byproduct.check_byproduct(single, {nifti_path: produced} if produced is not None else None)
+            thumbnails = thumbnail.thumbnail(single)
+
+            entry = checklist[nifti_path]
+            if nifti_path in byproducts:
+                entry['byproduct'] = byproducts[nifti_path]
+            if nifti_path in thumbnails:
+                entry['thumbnail'] = thumbnails[nifti_path]
+            entry['source'] = source_path
+
+            if self.on_ready is not None:
+                self.on_ready(nifti_path, entry)
+        with self._done_lock:
+            self._done += 1
+            done = self._done
+        progress.report(series_processed=done)
+        return entry
+
+    def finish(self, raw_path):
+        """남은 시리즈 후처리를 기다린 뒤 결과 병합
+
+        Args:
+            raw_path: raw 단계 결과 {source_path: nifti_path}
+
+        Returns:
+            dict: {nifti_path: checklist 항목 (byproduct / thumbnail / source 포함)}
+        """
+        try:
+            bids_checklist = {}
+            for source_path, nifti_path in raw_path.items():
+                future = self._futures.get(source_path)
+                if future is None:
+                    # 콜백 없이 변환된 시리즈 (하위 호환) - 여기서 바로 처리
+                    bids_checklist[nifti_path] = self._process(source_path, nifti_path)
+                else:
+                    bids_checklist[nifti_path] = future.result()
+        finally:
+            self._executor.shutdown(wait=True)
+
+        # 변환과 썸네일 생성이 같은 폴더 목록을 동시에 갱신했으므로 마지막에 한 번 다시 기록
+        for folder in sorted({os.path.dirname(nifti_path) for nifti_path in raw_path.values()}):
+            common.bdsp_walk(folder)
+
+        bids_checker._log_validation_summary(bids_checklist)
+        return bids_checklist
+
+    def close(self):
+        """raw 단계 실패 시 아직 시작하지 않은 시리즈 후처리 취소"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
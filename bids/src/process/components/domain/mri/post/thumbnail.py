@@ -3,8 +3,15 @@ import nibabel as nib
 import sys
 import numpy as np
 import os
+import logging
 from pathlib import Path
 from utils.common import bdsp_walk
+from utils import stages
+
+logger = logging.getLogger(__name__)
+
+# 썸네일 렌더링(create_thumbnail)을 바꾸면 올린다 - bids-rederive가 이전 버전으로 만든 썸네일만 다시 생성
+THUMBNAIL_VERSION = 1
 
 
 def create_thumbnail(nii_path, output_path):
@@ -39,9 +46,10 @@ def create_thumbnail(nii_path, output_path):
         
         return True
     except Exception as e:
-        print(f"Error creating thumbnail for {nii_path}: {e}")
+        logger.error(f"Error creating thumbnail for {nii_path}: {e}")
         return False
 
+@stages.stage(stages.CPU)
 def thumbnail(raw_path):
     """
     raw_path 딕셔너리를 받아서 각 nii.gz 파일의 썸네일을 생성
@@ -68,13 +76,14 @@ def thumbnail(raw_path):
             if create_thumbnail(nii_file_path, thumb_path):
                 thumbnail_path[nii_file_path] = thumb_path
                 bdsp_walk(thumbnail_dir)
-                print(f"썸네일 생성 완료: {thumb_path}")
+                logger.debug(f"썸네일 생성 완료: {thumb_path}")
             else:
-                print(f"썸네일 생성 실패: {nii_file_path}")
+                logger.warning(f"썸네일 생성 실패: {nii_file_path}")
                 
         except Exception as e:
-            print(f"Error processing {nii_file_path}: {e}")
+            logger.error(f"Error processing {nii_file_path}: {e}")
     
+    logger.info(f"썸네일 생성 완료: {len(thumbnail_path)}/{len(raw_path)}개")
     return thumbnail_path
 
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+#/BDSP/bids_app/src/process/components/domain/mri/raw/conversion_cache.py
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+from utils import metrics
+from utils.common import clone_or_copy_file
+
+logger = logging.getLogger(__name__)
+
+ENTRY_FILENAME = "entry.json"
+# 변환 중인 임시 디렉토리 접두사 (prune 대상에서 제외하고 오래된 것만 정리)
+_TMP_PREFIX = ".tmp-"
+_CHUNK_SIZE = 4 * 1024 * 1024
+
+# dcm2niix 파일명(-f)의 리터럴 부분을 대신하는 표식 - 캐시 항목은 파일명과 무관하게 입력 내용으로만 찾고,
+# 꺼낼 때 표식을 이번 작업의 리터럴(sub/ses/run/suffix)로 바꾼다. %-포맷과 dcm2niix가 붙이는 접미사(_e2 등)는 그대로 유지
+_MARKER = "BDSPL{}Z"
+_MARKER_RE = re.compile(r"BDSPL(\d+)Z")
+
+# 캐시 설정 (backfill에서 configure로 활성화, 디렉토리가 없으면 비활성화)
+_settings = {'cache_dir': None, 'max_bytes': 0}
+cache_stats = {'hits': 0, 'misses': 0}
+metrics.register_cache('conversion', cache_stats)
+_stats_lock = threading.Lock()
+_tool_lock = threading.Lock()
+_tool_ids = {}
+
+
+def configure(cache_dir=None, max_gb=0):
+    """입력 내용(sha256) 기준 변환 결과 캐시 설정 (cache_dir가 비어 있으면 비활성화)"""
+    _settings['cache_dir'] = cache_dir or None
+    _settings['max_bytes'] = int(float(max_gb or 0) * 1024 ** 3)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    logger.info(f"Conversion cache - Dir: {_settings['cache_dir']}, Max: {float(max_gb or 0):g} GB")
+
+
+def enabled():
+    return _settings['cache_dir'] is not None
+
+
+def _tool_id(tool):
+    """변환 도구 식별값 (경로 + 크기 + mtime - 도구가 바뀌면 캐시 키도 바뀜)"""
+    with _tool_lock:
+        if tool not in _tool_ids:
+            path = shutil.which(tool) or tool
+            try:
+                st = os.stat(path)
+                _tool_ids[tool] = f"{path}:{st.st_size}:{st.st_mtime_ns}"
+            except OSError:
+                _tool_ids[tool] = path
+        return _tool_ids[tool]
+
+
+def input_key(src_path, tool, options):
+    """시리즈 폴더 내용 기준 캐시 키 (파일 이름 + 내용, bdsp_file_list.json / 숨김 파일 제외)"""
+    hasher = hashlib.sha256()
+    hasher.update(f"{_tool_id(tool)}\0{' '.join(options)}\0".encode('utf-8'))
+    for root, dirs, files in os.walk(src_path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.startswith('.') or (name.lower().startswith('bdsp') and name.lower().endswith('.json')):
+                continue
+            path = os.path.join(root, name)
+            hasher.update(f"{os.path.relpath(path, src_path)}\0{os.path.getsize(path)}\0".encode('utf-8'))
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def split_template(filename_without_ext):
+    """'sub-01_acq-%u_run-01_T1w' → ('BDSPL0Z%uBDSPL1Z', ['sub-01_acq-', '_run-01_T1w'])"""
+    parts = re.split(r'(%[^_]*)', filename_without_ext)
+    literals = parts[0::2]
+    template = ''.join(_MARKER.format(i // 2) if i % 2 == 0 else part for i, part in enumerate(parts))
+    return template, literals
+
+
+def _entry_dir(key):
+    return os.path.join(_settings['cache_dir'], key[:2], key)
+
+
+def _read_entry(entry_dir):
+    try:
+        with open(os.path.join(entry_dir, ENTRY_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _materialize(entry_dir, entry, raw_path, literals):
+    """캐시 항목 파일을 이번 작업의 파일명으로 raw_path에 배치 (hardlink 금지 - 후처리의 수정이 캐시에 반영되지 않도록)"""
+    os.makedirs(raw_path, exist_ok=True)
+    placed = []
+    for name in entry['files']:
+        target = _MARKER_RE.sub(lambda m: literals[int(m.group(1))], name)
+        clone_or_copy_file(os.path.join(entry_dir, name), os.path.join(raw_path, target), allow_hardlink=False)
+        placed.append(target)
+    # LRU 정리 기준 시각
+    try:
+        os.utime(os.path.join(entry_dir, ENTRY_FILENAME))
+    except OSError:
+        pass
+    return placed
+
+
+def convert(src_path, raw_path, filename_without_ext, tool, options, run):
+    """
+    캐시를 거쳐 변환 (같은 입력이면 이전 변환 결과를 복사)
+
+    Args:
+        src_path (str): 시리즈 폴더
+        raw_path (str): 결과 폴더
+        filename_without_ext (str): 결과 파일명 (%-포맷 포함 가능)
+        tool (str), options (list): 캐시 키에 포함할 도구 이름과 옵션
+        run (callable): run(out_dir, filename_template) - out_dir에 filename_template으로 변환
+
+    Returns:
+        list: raw_path에 배치된 파일 이름
+    """
+    key = input_key(src_path, tool, options)
+    template, literals = split_template(filename_without_ext)
+    entry_dir = _entry_dir(key)
+
+    entry = _read_entry(entry_dir)
+    with _stats_lock:
+        cache_stats['hits' if entry is not None else 'misses'] += 1
+    if entry is not None:
+        logger.info(f"변환 캐시 적중: {os.path.basename(src_path)} ({key[:12]})")
+        return _materialize(entry_dir, entry, raw_path, literals)
+
+    tmp_dir = os.path.join(_settings['cache_dir'], f"{_TMP_PREFIX}{uuid.uuid4().hex}")
+    os.makedirs(tmp_dir)
+    try:
+        run(tmp_dir, template)
+        files = sorted(name for name in os.listdir(tmp_dir) if not name.startswith('.'))
+        with open(os.path.join(tmp_dir, ENTRY_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump({'files': files, 'source': src_path, 'created': time.time()}, f, ensure_ascii=False)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # 같은 입력을 다른 작업이 먼저 등록함 - 등록된 항목 사용
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    entry = _read_entry(entry_dir)
+    if entry is None:
+        raise FileNotFoundError(f"변환 캐시 항목 없음: {entry_dir}")
+    return _materialize(entry_dir, entry, raw_path, literals)
+
+
+def prune():
+    """최근 사용 순으로 max_bytes까지 남기고 삭제, 중단된 임시 디렉토리 정리
+
+    Returns:
+        dict: {'entries', 'bytes', 'removed'}
+    """
+    cache_dir = _settings['cache_dir']
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return {'entries': 0, 'bytes': 0, 'removed': 0}
+    now = time.time()
+    entries = []
+    removed = 0
+    for prefix in os.listdir(cache_dir):
+        prefix_dir = os.path.join(cache_dir, prefix)
+        if prefix.startswith(_TMP_PREFIX):
+            if now - os.path.getmtime(prefix_dir) > 24 * 3600:
+                shutil.rmtree(prefix_dir, ignore_errors=True)
+            continue
+        if not os.path.isdir(prefix_dir):
+            continue
+        for key in os.listdir(prefix_dir):
+            entry_dir = os.path.join(prefix_dir, key)
+            try:
+                used = os.path.getmtime(os.path.join(entry_dir, ENTRY_FILENAME))
+                size = sum(entry.stat().st_size for entry in os.scandir(entry_dir) if entry.is_file())
+            except OSError:
+                continue
+            entries.append((used, size, entry_dir))
+    total = sum(size for _, size, _ in entries)
+    if _settings['max_bytes'] > 0:
+        for used, size, entry_dir in sorted(entries):
+            if total <= _settings['max_bytes']:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            removed += 1
+    return {'entries': len(entries) - removed, 'bytes': total, 'removed': removed}
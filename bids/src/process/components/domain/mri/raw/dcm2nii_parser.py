@@ -5,8 +5,12 @@ import json
 import logging
 import re
 import subprocess
+import time
 from pathlib import Path
-from utils.common import bdsp_walk, compress_nii_gz
+from utils.common import bdsp_walk, clone_or_copy_file, dir_file_size, stream_compress_file
+from utils import cancel, metrics, progress, stages
+from .parrec_converter import convert_parrec
+from . import conversion_cache
 
 logger = logging.getLogger(__name__)
 
@@ -73,6 +77,7 @@ def _resolve_actual_output(raw_dir: str, filename_without_ext: str) -> Path:
 
 # === UPDATED: NIfTI processing ==============================================
 
+@stages.stage(stages.IO)
 def process_nifti_files(src_path: str, raw_path: str, raw_file_option: str) -> str:
     """
     NIFTI 파일 처리
@@ -114,19 +119,21 @@ def process_nifti_files(src_path: str, raw_path: str, raw_file_option: str) -> s
 
         os.makedirs(raw_path, exist_ok=True)
 
+        # 타깃은 항상 .nii.gz
+        if not target_file_path.endswith('.nii.gz'):
+            target_file_path = re.sub(r'\.nii$', '', target_file_path) + '.nii.gz'
+
         if data_file.endswith('.nii.gz'):
-            shutil.copy2(src_file_path, target_file_path)
-            logger.info("Copied .nii.gz: %s -> %s", src_file_path, target_file_path)
-            final_path = target_file_path
+            # 이미 압축된 입력: 같은 장치면 reflink/hardlink, 아니면 1회 읽기 복사
+            method, checksum = clone_or_copy_file(src_file_path, target_file_path)
+            logger.info("Placed .nii.gz (%s): %s -> %s", method, src_file_path, target_file_path)
         else:
-            # .nii → .nii.gz 압축
-            temp_nii_path = target_file_path
-            if temp_nii_path.endswith('.nii.gz'):
-                temp_nii_path = temp_nii_path[:-3]  # '.gz' 제거 -> '.nii'
-            shutil.copy2(src_file_path, temp_nii_path)
-            compressed_path = compress_nii_gz(temp_nii_path)
-            logger.info("Copied+compressed .nii: %s -> %s", src_file_path, compressed_path)
-            final_path = compressed_path
+            # .nii → .nii.gz: 원본을 한 번 읽으며 바로 압축 기록 (임시 .nii 없음)
+            checksum = stages.run(stages.CPU, stream_compress_file, src_file_path, target_file_path)
+            logger.info("Streamed+compressed .nii: %s -> %s", src_file_path, target_file_path)
+        if checksum:
+            logger.info("Source sha256: %s (%s)", checksum, data_file)
+        final_path = target_file_path
 
         # 사이드카 동반 복사(json/bval/bvec) - 있으면 동일 basename으로 맞춰줌
         base_src = re.sub(r'\.nii(\.gz)?$', '', data_file)
@@ -145,8 +152,31 @@ def process_nifti_files(src_path: str, raw_path: str, raw_file_option: str) -> s
         raise
 
 
+# === NEW: native PAR/REC conversion =========================================
+
+def process_parrec_files(src_path: str, raw_path: str, raw_file_option: str) -> str:
+    """
+    PAR/REC를 프로세스 내부 변환기로 NIfTI 변환 (실패 시 dcm2niix로 대체)
+
+    Args:
+        src_path (str): 소스 경로
+        raw_path (str): 타겟 경로
+        raw_file_option (str): 타겟 파일명(요구 포맷)
+
+    Returns:
+        str: 최종 결과 NIfTI(.nii.gz) 파일의 풀 경로
+    """
+    try:
+        # %-포맷은 dcm2niix만 해석하므로 내부 변환에서는 NIfTI 처리와 같이 제거
+        return stages.run(stages.CPU, convert_parrec, src_path, raw_path, clean_filename(raw_file_option))
+    except Exception as e:
+        logger.warning("Native PAR/REC conversion failed, falling back to dcm2niix: %s", e)
+        return run_dcm2niix(src_path, raw_path, raw_file_option)
+
+
 # === UPDATED: dcm2niix runner ===============================================
 
+@stages.stage(stages.PROC)
 def run_dcm2niix(src_path: str, raw_path: str, raw_file_option: str) -> str:
     """
     dcm2niix를 사용하여 DICOM/PARREC 파일을 NIFTI로 변환하고,
@@ -166,27 +196,41 @@ def run_dcm2niix(src_path: str, raw_path: str, raw_file_option: str) -> str:
         filename_base = raw_file_option
         filename_without_ext = re.sub(r'\.nii(\.gz)?$', '', filename_base)
 
-        # dcm2niix 명령어 구성
-        cmd = [
-            'dcm2niix',
-            '-f', filename_without_ext,
-            '-z', 'y',            # gzip 압축
-            '-o', raw_path,
-            src_path
-        ]
-
-        logger.info("Running dcm2niix: %s", ' '.join(cmd))
-
-        # 실행
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, check=True
-        )
-        logger.info("dcm2niix completed successfully")
-        if result.stdout:
-            logger.debug("dcm2niix stdout: %s", result.stdout)
-        if result.stderr:
-            # dcm2niix는 stderr로도 유용 로그를 찍는 경우가 있음
-            logger.warning("dcm2niix stderr: %s", result.stderr)
+        def convert(out_dir, output_name):
+            # dcm2niix 명령어 구성
+            cmd = [
+                'dcm2niix',
+                '-f', output_name,
+                '-z', 'y',            # gzip 압축
+                '-o', out_dir,
+                src_path
+            ]
+
+            logger.info("Running dcm2niix: %s", ' '.join(cmd))
+
+            # 실행 (별도 프로세스 그룹 - 제한 시간 초과 / 작업 취소 시 그룹째 종료 후 회수)
+            started = time.perf_counter()
+            try:
+                result = cancel.run_process(cmd, input_bytes=dir_file_size(src_path))
+            except subprocess.CalledProcessError:
+                metrics.DCM2NIIX_DURATION.observe(time.perf_counter() - started, outcome="error")
+                raise
+            except cancel.JobCancelled as e:
+                metrics.DCM2NIIX_DURATION.observe(time.perf_counter() - started, outcome=e.kind)
+                raise
+            metrics.DCM2NIIX_DURATION.observe(time.perf_counter() - started, outcome="success")
+            logger.info("dcm2niix completed successfully")
+            if result.stdout:
+                logger.debug("dcm2niix stdout: %s", result.stdout)
+            if result.stderr:
+                # dcm2niix는 stderr로도 유용 로그를 찍는 경우가 있음
+                logger.warning("dcm2niix stderr: %s", result.stderr)
+
+        if conversion_cache.enabled():
+            # 입력 내용이 같은 시리즈는 이전 변환 결과를 이번 파일명으로 복사 (backfill 재처리)
+            conversion_cache.convert(src_path, raw_path, filename_without_ext, 'dcm2niix', ['-z', 'y'], convert)
+        else:
+            convert(raw_path, filename_without_ext)
 
         # 실제 생성된 결과 파일(.nii.gz) 경로 해석
         actual_path = _resolve_actual_output(raw_path, filename_without_ext)
@@ -206,21 +250,47 @@ def run_dcm2niix(src_path: str, raw_path: str, raw_file_option: str) -> str:
 
 # === UPDATED: main conversion orchestrator ==================================
 
-def process_bids_conversion(bids_mapping: dict) -> dict:
+def _snapshot(raw_dir: str) -> dict:
+    """폴더의 파일별 (inode, mtime, 크기) - 목록 파일과 숨김 파일 제외"""
+    files = {}
+    try:
+        for entry in os.scandir(raw_dir):
+            if entry.name.startswith('.') or entry.name == 'bdsp_file_list.json' or not entry.is_file():
+                continue
+            stat = entry.stat()
+            files[entry.name] = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        pass
+    return files
+
+
+def _produced(raw_dir: str, before: dict, actual_path: str) -> list:
+    """변환 전후 폴더 상태를 비교해 이번 시리즈가 새로 만들거나 덮어쓴 파일 경로 목록"""
+    after = _snapshot(raw_dir)
+    produced = {os.path.join(raw_dir, name) for name, stat in after.items() if before.get(name) != stat}
+    produced.add(str(actual_path))
+    return sorted(produced)
+
+
+def process_bids_conversion(bids_mapping: dict, on_series=None) -> dict:
     """
     BIDS 매핑을 처리하여 변환 준비
 
     Args:
         bids_mapping (dict): {src_path: raw_full_path} 매핑 딕셔너리
                              raw_full_path는 '원하는' 경로(파일명 옵션 포함)
+        on_series (callable): 시리즈 하나가 변환될 때마다 (src_path, 실제 NIfTI 경로, 이 시리즈가 만든 파일 목록)으로 호출
 
     Returns:
         dict: {src_path: 실제 생성/복사된 NIfTI 파일의 풀 경로}
     """
     logger.info("Processing %d BIDS mappings", len(bids_mapping))
     src2raw_mapping = {}
+    failed = 0
+    progress.report(series_total=len(bids_mapping), series_converted=0, series_failed=0)
 
     for src_path, raw_full_path in bids_mapping.items():
+        cancel.check()
         try:
             # 1) 타겟 디렉토리
             raw_path = os.path.dirname(raw_full_path)
@@ -246,29 +316,40 @@ def process_bids_conversion(bids_mapping: dict) -> dict:
             )
 
             os.makedirs(raw_path, exist_ok=True)
+            # 변환 전 폴더 상태 (이 시리즈가 만든 파일을 구분 - 같은 폴더에 다른 시리즈 결과가 함께 있음)
+            before = _snapshot(raw_path)
 
             # 4) 포맷별 처리
             if file_format.upper() == 'NIFTI':
                 actual_path = process_nifti_files(src_path, raw_path, raw_file_option)
+            elif file_format.upper() == 'PARREC':
+                actual_path = process_parrec_files(src_path, raw_path, raw_file_option)
             else:
-                # DICOM, PARREC 등 -> dcm2niix 변환
+                # DICOM 등 -> dcm2niix 변환
                 logger.info("Converting %s using dcm2niix", file_format)
                 actual_path = run_dcm2niix(src_path, raw_path, raw_file_option)
 
             # 5) bdsp_file_list.json 생성/갱신
             logger.info("Generating bdsp_file_list.json for %s", raw_path)
-            bdsp_walk(raw_path)
+            stages.run(stages.IO, bdsp_walk, raw_path)
             logger.info("Successfully generated bdsp_file_list.json in %s", raw_path)
 
             # 6) src2raw_mapping에 '실제 결과 경로'로 기록
             if actual_path:
                 src2raw_mapping[src_path] = actual_path
                 logger.info("Mapped %s -> %s", src_path, actual_path)
+                progress.report(series_converted=len(src2raw_mapping))
+                if on_series is not None:
+                    on_series(src_path, actual_path, _produced(raw_path, before, actual_path))
             else:
                 logger.warning("No actual output path resolved for %s", src_path)
+                failed += 1
+                progress.report(series_failed=failed)
 
         except Exception as e:
             logger.error("Failed to process mapping for %s: %s", src_path, e)
+            failed += 1
+            progress.report(series_failed=failed)
             continue
 
     logger.info("Successfully processed %d mappings", len(src2raw_mapping))
@@ -4,10 +4,21 @@ import logging
 import os
 import pydicom
 from pathlib import Path
-from utils.common import remove_all_whitespace, remove_special_chars
+from process.components.domain.mri.parrec_header import read_par_header
+from utils.common import load_json_cached, remove_all_whitespace, remove_special_chars
 
 logger = logging.getLogger(__name__)
 
+# 포맷별 모달리티 매핑 파일이 있는 global_vars 키 (NIFTI는 파일명에서 모달리티를 읽으므로 매핑 파일 없음)
+_MAPPING_DIR_KEYS = {'dicom': 'dicom_modality', 'parrec': 'parrec_modality'}
+
+def modality_mapping_path(global_vars, structured_config, file_format):
+    """프로젝트의 모달리티 매핑 JSON 경로 (<systemId>_<projectCode>_<projectSeq>_<orgId>_<format>_modality.json)"""
+    request = structured_config['request']
+    file_format = file_format.lower()
+    filename = f"{request['systemId']}_{request['projectCode']}_{request['projectSeq']}_{request['orgId']}_{file_format}_modality.json"
+    return os.path.join(global_vars[_MAPPING_DIR_KEYS[file_format]], filename)
+
 class DicomMapper:
     def __init__(self, global_vars, structured_config, separated_paths):
         self.global_vars = global_vars
@@ -17,13 +28,11 @@ class DicomMapper:
     
     def _load_modality_mapping(self):
         """DICOM 모달리티 매핑 JSON 파일 로드"""
-        request = self.structured_config['request']
-        filename = f"{request['systemId']}_{request['projectCode']}_{request['projectSeq']}_{request['orgId']}_dicom_modality.json"
-        mapping_path = os.path.join(self.global_vars['dicom_modality'], filename)
+        mapping_path = modality_mapping_path(self.global_vars, self.structured_config, 'dicom')
         
         try:
-            with open(mapping_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            # 같은 프로젝트 작업끼리 파싱 결과 공유 (파일이 바뀌면 다시 로드)
+            return load_json_cached(mapping_path)
         except FileNotFoundError:
             logger.error(f"DICOM modality mapping file not found: {mapping_path}")
             return {}
@@ -113,13 +122,11 @@ class ParrecMapper:
     
     def _load_modality_mapping(self):
         """PARREC 모달리티 매핑 JSON 파일 로드"""
-        request = self.structured_config['request']
-        filename = f"{request['systemId']}_{request['projectCode']}_{request['projectSeq']}_{request['orgId']}_parrec_modality.json"
-        mapping_path = os.path.join(self.global_vars['parrec_modality'], filename)
+        mapping_path = modality_mapping_path(self.global_vars, self.structured_config, 'parrec')
         
         try:
-            with open(mapping_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            # 같은 프로젝트 작업끼리 파싱 결과 공유 (파일이 바뀌면 다시 로드)
+            return load_json_cached(mapping_path)
         except FileNotFoundError:
             logger.error(f"PARREC modality mapping file not found: {mapping_path}")
             return {}
@@ -128,26 +135,9 @@ class ParrecMapper:
             return {}
     
     def _get_par_metadata(self, par_path):
-        """PAR 파일에서 메타데이터 추출"""
+        """PAR 파일에서 메타데이터 추출 (Validator와 공유하는 헤더 캐시 사용)"""
         try:
-            metadata = {}
-            
-            with open(par_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-                # PAR 파일의 각 라인을 파싱
-                for line in content.split('\n'):
-                    line = line.strip()
-                    if ':' in line:
-                        # 콜론으로 분리하여 키-값 추출
-                        parts = line.split(':', 1)
-                        if len(parts) == 2:
-                            # 키 정규화: 공백 제거 → 특수문자 제거 → 소문자 변환
-                            key = remove_special_chars(remove_all_whitespace(parts[0].strip())).lower()
-                            value = parts[1].strip()
-                            metadata[key] = value
-            
-            return metadata
+            return read_par_header(par_path).metadata
         except Exception as e:
             logger.error(f"Error reading PAR file {par_path}: {e}")
             return {}
@@ -3,11 +3,18 @@ import os
 import glob
 import logging
 import pydicom
-from utils.common import zero_fill
+from utils import common
+from utils.common import load_json_cached, zero_fill
 
 logger = logging.getLogger(__name__)
 
-def create_bids_mapping(path_mapping, structured_config, global_vars, raw_path):
+# MSS state 폴더의 run 번호 할당 기록 (sub/ses/data_type/modality → 마지막으로 할당한 run)
+RUN_LEDGER_NAME = "bdsp_run_ledger.json"
+# 재처리(backfill)로 결과를 옮기면서 반환된 run 번호 (ledger 안의 키 → [run, ...]) - 다음 할당에서 먼저 사용
+RELEASED_KEY = "_released"
+
+
+def create_bids_mapping(path_mapping, structured_config, global_vars, raw_path, run_lookup_path=None):
     """
     소스 데이터 경로를 BIDS 형식 경로로 매핑하는 함수
     
@@ -16,6 +23,7 @@ def create_bids_mapping(path_mapping, structured_config, global_vars, raw_path):
         structured_config (dict): 프로젝트 설정 정보
         global_vars (dict): 전역 변수 (suffix_map 경로 포함)
         raw_path (str): BIDS rawdata 기본 경로
+        run_lookup_path (str): 기존 run 번호를 확인할 rawdata 경로 (기본값: raw_path)
     
     Returns:
         dict: 소스 폴더 경로와 BIDS 형식 파일 경로 매핑
@@ -23,8 +31,7 @@ def create_bids_mapping(path_mapping, structured_config, global_vars, raw_path):
     
     # 1. suffix_map JSON 파일 로드
     try:
-        with open(global_vars['suffix_map'], 'r') as f:
-            suffix_rules = json.load(f)
+        suffix_rules = load_json_cached(global_vars['suffix_map'])
     except (FileNotFoundError, json.JSONDecodeError) as e:
         logger.error(f"Failed to load suffix_map: {e}")
         raise
@@ -39,34 +46,35 @@ def create_bids_mapping(path_mapping, structured_config, global_vars, raw_path):
     # 3. 결과 매핑 딕셔너리
     bids_mapping = {}
     
-    # 4. 모달리티별 run 카운터 초기화 (중복 방지용)
-    modality_run_counter = {}
-    
-    # 5. 각 소스 폴더에 대해 BIDS 파일명 생성
+    # 4. 모달리티별 필요한 run 수 집계 후 시작 run 번호를 한 번에 할당
+    #    (같은 subject/session 작업이 동시에 실행되어도 같은 run 번호를 받지 않도록 ledger 잠금 하에서 할당)
+    data_types = {}
+    run_counts = {}
     for source_folder, modality in path_mapping.items():
         # 모달리티에 해당하는 데이터 타입 찾기
         data_type = find_data_type(modality, suffix_rules)
         if not data_type:
             logger.error(f"Unknown modality: {modality}")
             raise ValueError(f"Unknown modality: {modality}")
+        data_types[source_folder] = data_type
+        run_key = (data_type, modality)
+        run_counts[run_key] = run_counts.get(run_key, 0) + 1
+    
+    mss_path = global_vars.get('mss_path')
+    ledger_path = os.path.join(mss_path, "state", RUN_LEDGER_NAME) if mss_path else None
+    modality_run_counter = allocate_run_numbers(
+        ledger_path, run_counts, subject_id, trial_index, run_lookup_path or raw_path
+    )
+    
+    # 5. 각 소스 폴더에 대해 BIDS 파일명 생성
+    for source_folder, modality in path_mapping.items():
+        data_type = data_types[source_folder]
         
         # BIDS 엔티티 규칙 가져오기
         entity_rules = suffix_rules[data_type][modality]
         
-        # 모달리티별 키 생성 (같은 subject, session, data_type, modality 조합)
-        modality_key = f"{subject_id}_{trial_index}_{data_type}_{modality}"
-        
-        # 기존 run 번호 확인 (해당 모달리티 키가 처음 등장할 때만)
-        if modality_key not in modality_run_counter:
-            base_run = get_base_run_number(
-                modality, 
-                subject_id, 
-                trial_index, 
-                raw_path, 
-                data_type
-            )
-            modality_run_counter[modality_key] = base_run
-            logger.info(f"Initialized run counter for {modality_key}: starting from {base_run}")
+        # 모달리티별 키 (같은 subject, session 안에서 data_type, modality 조합)
+        modality_key = (data_type, modality)
         
         # 현재 run 번호 사용
         current_run = modality_run_counter[modality_key]
@@ -110,6 +118,185 @@ def find_data_type(modality, suffix_rules):
     return None
 
 
+def allocate_run_numbers(ledger_path, run_counts, subject_id, trial_index, raw_path):
+    """
+    (data_type, modality)별로 필요한 run 수만큼 연속된 run 번호를 원자적으로 할당
+    
+    시작 번호는 max(기존 파일의 run + 1, ledger에 기록된 마지막 run + 1).
+    할당 결과는 ledger에 바로 기록되므로, 아직 게시되지 않은(scratch 작업 중) 다른 작업의 run 번호와도 겹치지 않는다.
+    실패한 작업이 할당받은 번호는 재사용하지 않는다 (run 번호 공백 허용).
+    재처리 전에 release_run_numbers로 반환된 번호가 있으면 그 번호를 먼저 사용한다.
+    
+    Args:
+        ledger_path (str): MSS state 폴더의 ledger 경로 (None이면 기존 파일만 확인)
+        run_counts (dict): {(data_type, modality): 필요한 run 수}
+        raw_path (str): 기존 run 번호를 확인할 rawdata 경로
+    
+    Returns:
+        dict: {(data_type, modality): 시작 run 번호}
+    """
+    def base_runs():
+        return {
+            (data_type, modality): get_base_run_number(modality, subject_id, trial_index, raw_path, data_type)
+            for data_type, modality in run_counts
+        }
+    
+    if not ledger_path:
+        return base_runs()
+    
+    def allocate(ledger):
+        released = ledger.get(RELEASED_KEY, {})
+        start_runs = {}
+        for (data_type, modality), base_run in base_runs().items():
+            ledger_key = f"sub-{subject_id}/ses-{trial_index}/{data_type}/{modality}"
+            count = run_counts[(data_type, modality)]
+            # 같은 작업을 재처리하면 반환된 번호를 그대로 다시 받음 (BIDS 파일명 유지)
+            start_run = _take_released(released, ledger_key, count)
+            if start_run is None:
+                start_run = max(base_run, ledger.get(ledger_key, 0) + 1)
+                ledger[ledger_key] = start_run + count - 1
+            start_runs[(data_type, modality)] = start_run
+            logger.info(f"Run 번호 할당: {ledger_key} run-{zero_fill(start_run)} ~ run-{zero_fill(start_run + count - 1)}")
+        if RELEASED_KEY in ledger and not released:
+            del ledger[RELEASED_KEY]
+        return start_runs
+    
+    return _update_ledger(ledger_path, allocate)
+
+
+def _take_released(released, ledger_key, count):
+    """반환된 번호 중 count개가 연속인 가장 작은 구간을 꺼냄 (없으면 None)"""
+    runs = released.get(ledger_key)
+    if not runs:
+        return None
+    available = set(runs)
+    for start_run in sorted(available):
+        block = set(range(start_run, start_run + count))
+        if block <= available:
+            remaining = sorted(available - block)
+            if remaining:
+                released[ledger_key] = remaining
+            else:
+                del released[ledger_key]
+            return start_run
+    return None
+
+
+def _update_ledger(ledger_path, update):
+    """ledger를 잠금 하에 읽고 update(ledger)로 수정한 뒤 교체
+
+    Returns:
+        update의 반환값
+    """
+    with common.locked_file(ledger_path):
+        try:
+            with open(ledger_path, 'r', encoding='utf-8') as f:
+                ledger = json.load(f)
+        except FileNotFoundError:
+            ledger = {}
+        
+        result = update(ledger)
+        
+        common.write_json_atomic(ledger_path, ledger, indent=2, sort_keys=True)
+        return result
+
+
+def _runs_by_key(nifti_paths):
+    """rawdata NIfTI 경로 → {ledger 키(sub/ses/data_type/modality): {run, ...}}"""
+    runs_by_key = {}
+    for nifti_path in nifti_paths:
+        parts = nifti_path.split(os.sep)
+        if len(parts) < 4:
+            continue
+        stem = parts[-1].split('.', 1)[0]
+        tokens = stem.split('_')
+        run = next((token[4:] for token in tokens if token.startswith('run-')), None)
+        if not run or not run.isdigit():
+            continue
+        ledger_key = f"{parts[-4]}/{parts[-3]}/{parts[-2]}/{tokens[-1]}"
+        runs_by_key.setdefault(ledger_key, set()).add(int(run))
+    return runs_by_key
+
+
+def release_run_numbers(ledger_path, nifti_paths):
+    """
+    재처리 전에 옮긴 결과 파일의 run 번호를 ledger에 반환
+    
+    반환된 번호가 마지막으로 할당한 번호까지 이어지면 ledger 값을 내리고, 중간 번호면 반환 목록에 둔다.
+    어느 쪽이든 같은 작업을 다시 처리하면 같은 run 번호(같은 BIDS 파일명)를 받는다.
+    
+    Args:
+        ledger_path (str): MSS state 폴더의 ledger 경로
+        nifti_paths (list): 옮긴 rawdata NIfTI 경로 (.../sub-*/ses-*/<data_type>/..._run-XX_<modality>.nii.gz)
+    
+    Returns:
+        dict: {ledger 키: [반환한 run, ...]}
+    """
+    runs_by_key = _runs_by_key(nifti_paths)
+    if not runs_by_key:
+        return {}
+    
+    def release(ledger):
+        released = ledger.setdefault(RELEASED_KEY, {})
+        for ledger_key, runs in runs_by_key.items():
+            if ledger_key not in ledger:
+                continue
+            pool = sorted(set(released.get(ledger_key, [])) | runs)
+            last_run = ledger[ledger_key]
+            while pool and pool[-1] == last_run:
+                pool.pop()
+                last_run -= 1
+            ledger[ledger_key] = last_run
+            if pool:
+                released[ledger_key] = pool
+            else:
+                released.pop(ledger_key, None)
+            logger.info(f"Run 번호 반환: {ledger_key} {sorted(runs)} (마지막 할당 run-{zero_fill(last_run)})")
+        if not released:
+            del ledger[RELEASED_KEY]
+        return {key: sorted(runs) for key, runs in runs_by_key.items()}
+    
+    return _update_ledger(ledger_path, release)
+
+
+def reserve_run_numbers(ledger_path, nifti_paths):
+    """
+    release_run_numbers로 반환한 run 번호를 다시 할당된 상태로 되돌림 (재처리 실패 후 이전 결과를 복원할 때)
+    
+    반환 목록에 있으면 목록에서 빼고, 마지막 할당 번호보다 크면 ledger 값을 올린다 (사이의 번호는 반환 목록에 둠).
+    재처리가 이미 다시 할당한 번호는 그대로 둔다.
+    
+    Returns:
+        dict: {ledger 키: [다시 할당한 run, ...]}
+    """
+    runs_by_key = _runs_by_key(nifti_paths)
+    if not runs_by_key:
+        return {}
+    
+    def reserve(ledger):
+        released = ledger.setdefault(RELEASED_KEY, {})
+        for ledger_key, runs in runs_by_key.items():
+            pool = set(released.get(ledger_key, []))
+            last_run = ledger.get(ledger_key, 0)
+            for run in sorted(runs):
+                if run > last_run:
+                    pool.update(range(last_run + 1, run))
+                    last_run = run
+                else:
+                    pool.discard(run)
+            ledger[ledger_key] = last_run
+            if pool:
+                released[ledger_key] = sorted(pool)
+            else:
+                released.pop(ledger_key, None)
+            logger.info(f"Run 번호 재할당: {ledger_key} {sorted(runs)} (마지막 할당 run-{zero_fill(last_run)})")
+        if not released:
+            del ledger[RELEASED_KEY]
+        return {key: sorted(runs) for key, runs in runs_by_key.items()}
+    
+    return _update_ledger(ledger_path, reserve)
+
+
 def get_base_run_number(modality, subject_id, trial_index, raw_path, data_type):
     """
     기존 파일들을 확인하여 시작 run 번호를 결정
@@ -0,0 +1,122 @@
+#/BDSP/bids_app/src/process/components/domain/mri/raw/parrec_converter.py
+import json
+import logging
+import os
+import re
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+from nibabel import parrec
+from process.components.domain.mri.parrec_header import read_par_header, find_rec_path
+from utils.common import ParallelGzipWriter
+
+logger = logging.getLogger(__name__)
+
+# 변환 소프트웨어 표기 (sidecar JSON)
+CONVERSION_SOFTWARE = "bdsp-parrec"
+
+
+def _find_par_file(src_path: str) -> Path:
+    """separated 경로에서 변환 대상 PAR 파일 1개 찾기"""
+    par_files = sorted(p for p in Path(src_path).iterdir()
+                       if p.is_file() and p.suffix.lower() == '.par')
+    if len(par_files) != 1:
+        raise ValueError(f"Expected 1 PAR file, found {len(par_files)} in {src_path}")
+    return par_files[0]
+
+
+def _load_scaled_data(header, rec_path):
+    """REC를 memory-map으로 읽고 스케일링 적용
+
+    모든 슬라이스의 scale이 같으면 정수 원본 + NIfTI scl_slope/scl_inter로 저장(무손실, 소용량),
+    슬라이스별 scale이 다르면 nibabel의 벡터화된 스케일링으로 float32 변환
+
+    Returns:
+        tuple: (data, slope, inter) - slope/inter가 None이면 data에 이미 스케일 적용됨
+    """
+    proxy = parrec.PARRECArrayProxy(str(rec_path), header, mmap=True, scaling='dv')
+    slopes, inters = header.get_data_scaling('dv')
+    if np.unique(slopes).size == 1 and np.unique(inters).size == 1:
+        return proxy.get_unscaled(), float(slopes.flat[0]), float(inters.flat[0])
+    return np.asarray(proxy, dtype=np.float32), None, None
+
+
+def _build_sidecar(par_header, header, target_path: Path) -> dict:
+    """PAR 헤더 정보로 BIDS sidecar JSON 구성"""
+    general = par_header.general_info
+    image_defs = par_header.image_defs
+
+    sidecar = {
+        "Manufacturer": "Philips",
+        "SeriesDescription": general.get('protocol_name', ''),
+        "ProtocolName": general.get('protocol_name', ''),
+        "ScanningSequence": general.get('tech', ''),
+        "RepetitionTime": float(np.asarray(general['repetition_time']).flat[0]) / 1000.0,
+        "EchoTime": float(image_defs['echo_time'][0]) / 1000.0,
+        "FlipAngle": float(image_defs['image_flip_angle'][0]),
+        "ConversionSoftware": CONVERSION_SOFTWARE,
+        "ConversionSoftwareVersion": nib.__version__,
+    }
+
+    # dcm2niix sidecar와 같은 형식: [data_type, "_<suffix>"] (매핑 규칙으로 정해진 위치 기준)
+    stem = re.sub(r'\.nii(\.gz)?$', '', target_path.name)
+    sidecar["BidsGuess"] = [target_path.parent.name, "_" + stem.rsplit('_', 1)[-1]]
+
+    shape = header.get_data_shape()
+    if len(shape) > 3:
+        sidecar["NumberOfVolumes"] = int(shape[3])
+
+    return sidecar
+
+
+def convert_parrec(src_path: str, raw_path: str, filename: str) -> str:
+    """
+    PAR/REC를 프로세스 내부에서 NIfTI(.nii.gz)로 변환 (dcm2niix 미사용)
+
+    Args:
+        src_path (str): PAR/REC가 있는 separated 경로
+        raw_path (str): 타겟 디렉토리
+        filename (str): 타겟 파일명 (%-포맷이 제거된 .nii.gz 파일명)
+
+    Returns:
+        str: 생성된 NIfTI(.nii.gz) 파일의 풀 경로
+    """
+    par_path = _find_par_file(src_path)
+    rec_path = find_rec_path(par_path)
+    if rec_path is None:
+        raise FileNotFoundError(f"REC 파일이 존재하지 않음: {par_path}")
+
+    # Validator/Mapper와 공유하는 헤더 캐시 사용 (재파싱 없음)
+    par_header = read_par_header(par_path)
+    header = par_header.to_parrec_header(strict_sort=True)
+
+    data, slope, inter = _load_scaled_data(header, rec_path)
+
+    nifti = nib.Nifti1Image(data, header.get_affine(origin='scanner'))
+    nifti.header.set_zooms(header.get_zooms()[:data.ndim])
+    nifti.header.set_xyzt_units('mm', 'sec')
+    if slope is not None:
+        nifti.header.set_slope_inter(slope, inter)
+
+    target_path = Path(raw_path) / filename
+    if not target_path.name.endswith('.nii.gz'):
+        target_path = target_path.with_name(re.sub(r'\.nii$', '', target_path.name) + '.nii.gz')
+    os.makedirs(raw_path, exist_ok=True)
+
+    with ParallelGzipWriter(str(target_path)) as writer:
+        nifti.to_stream(writer)
+
+    # sidecar JSON (+ 확산 영상이면 bval/bvec)
+    base_path = str(target_path)[:-len('.nii.gz')]
+    with open(base_path + '.json', 'w', encoding='utf-8') as f:
+        json.dump(_build_sidecar(par_header, header, target_path), f, indent=2, ensure_ascii=False)
+
+    bvals, bvecs = header.get_bvals_bvecs()
+    if bvals is not None and bvecs is not None:
+        np.savetxt(base_path + '.bval', bvals[None, :], fmt='%g')
+        np.savetxt(base_path + '.bvec', bvecs.T, fmt='%.6f')
+
+    logger.info("PAR/REC converted in-process: %s -> %s (shape %s, sha256 %s)",
+                par_path.name, target_path, data.shape, writer.checksum)
+    return str(target_path)
@@ -1,52 +1,72 @@
 import json
 import logging
 import os
+from utils import stages
 from . import modality_mapper as mapper
 from . import name_builder as builder
 from . import dcm2nii_parser as parser
 
 logger = logging.getLogger(__name__)
 
-def create_raw_path(structured_config, source_path, global_vars):
-    """Raw 데이터 경로 생성 및 모달리티 분석"""
+# ===== 포맷 → Mapper 클래스 매핑 ==============================================
+_MAPPER_CLASS = {
+    "DICOM": mapper.DicomMapper,
+    "PARREC": mapper.ParrecMapper,
+    "NIFTI": mapper.NiftiMapper,
+}
+
+def create_raw_path(structured_config, source_path, global_vars, on_series=None):
+    """Raw 데이터 경로 생성 및 모달리티 분석
+
+    오케스트레이션은 작업 스레드에서 실행하고 (변환을 기다리는 동안 단계 풀 슬롯을 잡지 않음),
+    헤더 분석(CPU) / run 번호 할당(IO) / 변환(시리즈별 IO·CPU·PROC)만 단계 풀에서 실행한다.
+
+    on_series: 시리즈 하나의 변환이 끝날 때마다 (source_path, nifti_path, 만든 파일 목록)으로 호출 (시리즈 단위 후처리)
+    """
     
     # 1. Raw 경로 생성 (sourcedata -> rawdata)
     raw_path = source_path['source_path'].replace('/sourcedata', '/rawdata')
     
-    # 2. 포맷 확인 (format_path에서 마지막 폴더명)
-    format_name = os.path.basename(source_path['format_path'])
+    # scratch에서 작업 중이면 기존 run 번호는 NAS(게시 대상) rawdata 기준으로 확인
+    run_lookup_path = raw_path
+    if global_vars.get('work_mss_path') and global_vars.get('mss_path'):
+        run_lookup_path = raw_path.replace(global_vars['work_mss_path'], global_vars['mss_path'], 1)
     
-    # 3. 포맷에 따라 적절한 Mapper 사용하여 매핑 딕셔너리 생성
+    # 2. 포맷 확인 (멀티 포맷이면 formats, 아니면 format_path의 마지막 폴더명)
+    formats = source_path.get('formats') or {
+        os.path.basename(source_path['format_path']): {'separated_paths': source_path['separated_paths']}
+    }
+    
+    # 3. 포맷별 Mapper로 매핑 딕셔너리를 만든 뒤 하나로 병합
     path_mapping = {}
     
-    if format_name.upper() == 'DICOM':
-        dicom_mapper = mapper.DicomMapper(global_vars, structured_config, source_path['separated_paths'])
-        path_mapping = dicom_mapper.get_path_mapping()
-    elif format_name.upper() == 'PARREC':
-        parrec_mapper = mapper.ParrecMapper(global_vars, structured_config, source_path['separated_paths'])
-        path_mapping = parrec_mapper.get_path_mapping()
-    elif format_name.upper() == 'NIFTI':
-        nifti_mapper = mapper.NiftiMapper(global_vars, structured_config, source_path['separated_paths'])
-        path_mapping = nifti_mapper.get_path_mapping()
-    else:
-        logger.error(f"Unsupported format: {format_name}")
-        raise ValueError(f"Unsupported format: {format_name}")
+    for format_name, format_info in formats.items():
+        mapper_class = _MAPPER_CLASS.get(format_name.upper())
+        if mapper_class is None:
+            logger.error(f"Unsupported format: {format_name}")
+            raise ValueError(f"Unsupported format: {format_name}")
+        
+        format_mapper = mapper_class(global_vars, structured_config, format_info['separated_paths'])
+        path_mapping.update(stages.run(stages.CPU, format_mapper.get_path_mapping))
 
-    print("Path mapping:", path_mapping)
+    logger.debug(f"Path mapping: {path_mapping}")
     
     # 4. BIDS 형식 파일명 매핑 생성
     try:
-        bids_mapping = builder.create_bids_mapping(
+        bids_mapping = stages.run(
+            stages.IO,
+            builder.create_bids_mapping,
             path_mapping, 
             structured_config, 
             global_vars, 
-            raw_path
+            raw_path,
+            run_lookup_path=run_lookup_path
         )
-        print("BIDS mapping:", bids_mapping)
+        logger.debug(f"BIDS mapping: {bids_mapping}")
         
         # 5. BIDS 변환 처리
         try:
-            src2raw_map = parser.process_bids_conversion(bids_mapping)
+            src2raw_map = parser.process_bids_conversion(bids_mapping, on_series=on_series)
             logger.info("BIDS conversion completed successfully")
         except Exception as e:
             logger.error(f"Failed to process BIDS conversion: {e}")
@@ -0,0 +1,155 @@
+#/BDSP/bids_app/src/process/components/domain/mri/source/header_index.py
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+import pydicom
+
+from utils import metrics, progress
+from .source import _detect_file_format
+
+logger = logging.getLogger(__name__)
+
+# 스트리밍 모드 설정 (app에서 configure로 변경)
+_DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_QUEUE_SIZE = 64
+_settings = {'enabled': False, 'workers': _DEFAULT_WORKERS, 'queue_size': DEFAULT_QUEUE_SIZE}
+
+# Study/Series 그룹핑에 필요한 태그만 읽음
+_GROUP_TAGS = ['StudyInstanceUID', 'SeriesInstanceUID']
+
+# 입력 종료 표시
+_DONE = object()
+
+
+def configure(enabled=False, workers=None, queue_size=None):
+    """스트리밍 헤더 인덱스 설정 (workers가 0 또는 None이면 기본값)"""
+    _settings['enabled'] = bool(enabled)
+    _settings['workers'] = int(workers) if workers else _DEFAULT_WORKERS
+    if queue_size:
+        _settings['queue_size'] = int(queue_size)
+    logger.info(f"Source streaming - Enabled: {_settings['enabled']}, Workers: {_settings['workers']}, "
+                f"Queue: {_settings['queue_size']}")
+
+
+def enabled():
+    return _settings['enabled']
+
+
+def scan_header(file_path):
+    """파일 하나의 포맷과 (DICOM이면) Study/Series UID
+
+    Returns:
+        dict: {'format', 'study_uid', 'series_uid'}
+    """
+    file_path = Path(file_path)
+    entry = {'format': _detect_file_format(file_path), 'study_uid': None, 'series_uid': None}
+    if entry['format'] != "DICOM":
+        return entry
+    try:
+        ds = pydicom.dcmread(str(file_path), stop_before_pixels=True, force=True, specific_tags=_GROUP_TAGS)
+    except Exception as e:
+        logger.debug(f"DICOM 헤더 읽기 실패: {file_path.name} ({e})")
+        return entry
+    entry['study_uid'] = str(getattr(ds, 'StudyInstanceUID', '') or '') or None
+    entry['series_uid'] = str(getattr(ds, 'SeriesInstanceUID', '') or '') or None
+    return entry
+
+
+class HeaderIndex:
+    """압축 해제와 헤더 스캔을 겹쳐 실행하는 producer–consumer 인덱스
+
+    origin이 zip 멤버를 하나 풀 때마다 put()으로 넘기면 소비자 스레드가 바로 포맷 판별과
+    DICOM Study/Series UID 읽기를 수행하고 (Study, Series) 그룹을 점진적으로 키운다.
+    close() 후의 entries는 source 단계에서 포맷 분류와 DicomValidator 그룹핑에 재사용되어
+    같은 파일의 헤더를 다시 읽지 않는다.
+    대기열이 가득 차면 put()이 대기하므로 압축 해제가 헤더 스캔보다 크게 앞서 나가지 않는다.
+    """
+
+    def __init__(self, workers=None, queue_size=None):
+        self.workers = max(1, int(workers or _settings['workers']))
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size or _settings['queue_size'])))
+        self._lock = threading.Lock()
+        self._entries = {}      # 파일 경로 -> {'format', 'study_uid', 'series_uid'}
+        self._groups = {}       # (StudyUID, SeriesUID) -> [파일 경로, ...]
+        self._started = None
+        self._first_series = None
+        self._threads = []
+
+    def start(self):
+        self._started = time.monotonic()
+        for i in range(self.workers):
+            # 로그 컨텍스트(job/subject/step)를 소비자 스레드로 전달
+            context = contextvars.copy_context()
+            thread = threading.Thread(target=context.run, args=(self._consume,),
+                                      name=f"header-index-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def put(self, file_path):
+        """압축 해제된 파일 하나를 스캔 대기열에 추가 (producer 콜백)"""
+        self._queue.put(str(file_path))
+
+    def _consume(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            try:
+                self._add(item, scan_header(item))
+            except Exception as e:
+                logger.warning(f"헤더 스캔 실패: {item} ({e})")
+
+    def _add(self, file_path, entry):
+        key = (entry['study_uid'], entry['series_uid'])
+        first = False
+        with self._lock:
+            self._entries[file_path] = entry
+            if entry['format'] == "DICOM" and all(key):
+                new_series = key not in self._groups
+                self._groups.setdefault(key, []).append(file_path)
+                first = new_series and self._first_series is None
+                if first:
+                    self._first_series = time.monotonic() - self._started
+            scanned, series = len(self._entries), len(self._groups)
+        progress.report(headers_scanned=scanned, series_found=series)
+        if first:
+            metrics.SOURCE_FIRST_SERIES.observe(self._first_series)
+            logger.info(f"첫 DICOM 시리즈 확인: 압축 해제 시작 후 {self._first_series:.2f}s")
+
+    def close(self, root=None):
+        """입력 종료 후 소비자 스레드가 끝날 때까지 대기
+
+        Args:
+            root: 지정하면 결과 키를 root 기준 상대 경로로 변환 (압축 해제 폴더)
+
+        Returns:
+            dict: 파일 경로 -> {'format', 'study_uid', 'series_uid'}
+        """
+        for _ in self._threads:
+            self._queue.put(_DONE)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        logger.info(f"헤더 인덱스 완료: 파일 {len(self._entries)}개, DICOM 시리즈 {len(self._groups)}개 "
+                    f"({time.monotonic() - self._started:.2f}s)")
+        entries = self.entries
+        if root is None:
+            return entries
+        return {os.path.relpath(path, root): entry for path, entry in entries.items()}
+
+    @property
+    def entries(self):
+        with self._lock:
+            return dict(self._entries)
+
+    @property
+    def series(self):
+        """(StudyUID, SeriesUID) -> 파일 경로 목록 (스캔 중에도 조회 가능)"""
+        with self._lock:
+            return {key: list(paths) for key, paths in self._groups.items()}
@@ -1,10 +1,11 @@
 # /BDSP/bids_app/src/process/components/domain/mri/separation.py
-import json
 import logging
 from pathlib import Path
 import gzip
 import shutil
 
+from utils.file_index import FileIndex
+
 logger = logging.getLogger(__name__)
 
 
@@ -14,16 +15,20 @@ class PreWork:
     def __init__(self, validated_dir: str, set_id: str = None):
         self.validated_dir = Path(validated_dir)
         self.set_id = set_id
+        # run() 이후 분리 결과 파일 목록 (FileIndex, index 순)
+        self.separated_entries = FileIndex()
 
     def _load_json_index(self, json_path: Path):
-        """bdsp_file_list.json에서 파일 목록(index 순서대로) 로드"""
+        """bdsp_file_list.json에서 파일 목록(index 순서대로) 로드
+
+        Returns:
+            FileIndex: (index, file_path) 목록 (로드 실패 시 빈 목록)
+        """
         try:
-            with open(json_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return sorted(data.get("path", []), key=lambda x: x.get("index", 0))
+            return FileIndex.load(json_path).sort()
         except Exception as e:
             logger.error(f"JSON index 로드 실패: {json_path} ({e})")
-            return []
+            return FileIndex()
 
 
 class DicomSeparator(PreWork):
@@ -54,25 +59,34 @@ class DicomSeparator(PreWork):
         if not file_list:
             raise RuntimeError("JSON index에서 파일을 불러오지 못했습니다.")
 
-        # 파일 이동 및 이름 변경 (같은 디렉토리 내에서)
-        for item in file_list:
-            src_path = work_dir / Path(item.get("file_path")).name  # 파일명만 사용
+        # 1) 재명명 계획 수립 (같은 디렉토리 내에서)
+        plan = []
+        missing = 0
+        for index, file_path in file_list:
+            src_path = work_dir / Path(file_path).name  # 파일명만 사용
             if not src_path.exists():
-                logger.warning(f"원본 파일 없음: {src_path}")
+                logger.debug(f"원본 파일 없음: {src_path}")
+                missing += 1
                 continue
 
-            index = item.get("index")
             ext = src_path.suffix  # 원래 확장자 유지
             new_name = f"item_{work_set_id}_{index:04d}{ext}"  # 0-padding 추가
-            dst_path = work_dir / new_name
+            plan.append((index, src_path, work_dir / new_name))
 
+        # 2) 계획 실행: 성공한 파일만 분리 결과 목록에 기록
+        entries = FileIndex()
+        failed = 0
+        for index, src_path, dst_path in plan:
             try:
                 src_path.rename(dst_path)
-                logger.info(f"[DICOM 분리] {src_path} → {dst_path}")
             except Exception as e:
                 logger.error(f"파일 이동 실패: {src_path} → {dst_path} ({e})")
+                failed += 1
+                continue
+            entries.add(str(dst_path), index)
 
-        logger.info(f"DICOM 분리 완료: {work_dir}")
+        self.separated_entries = entries
+        logger.info(f"DICOM 분리 완료: {work_dir} (재명명 {len(entries)}개, 누락 {missing}개, 실패 {failed}개)")
         return str(work_dir)
 
 
@@ -105,12 +119,14 @@ class ParrecSeparator(PreWork):
 
         # PAR/REC 파일들을 그룹핑하여 처리
         parrec_pairs = {}  # 기본 파일명 -> [par_path, rec_path]
+        missing = 0
         
         # 먼저 PAR/REC 쌍을 찾기
-        for item in file_list:
-            src_path = work_dir / Path(item.get("file_path")).name
+        for index, file_path in file_list:
+            src_path = work_dir / Path(file_path).name
             if not src_path.exists():
-                logger.warning(f"원본 파일 없음: {src_path}")
+                logger.debug(f"원본 파일 없음: {src_path}")
+                missing += 1
                 continue
                 
             ext = src_path.suffix.lower()
@@ -119,7 +135,7 @@ class ParrecSeparator(PreWork):
                 base_name = src_path.stem
                 
                 if base_name not in parrec_pairs:
-                    parrec_pairs[base_name] = {'par': None, 'rec': None, 'index': item.get("index", 0)}
+                    parrec_pairs[base_name] = {'par': None, 'rec': None, 'index': index}
                 
                 if ext == '.par':
                     parrec_pairs[base_name]['par'] = src_path
@@ -128,6 +144,7 @@ class ParrecSeparator(PreWork):
 
         # PAR/REC 쌍별로 파일명 변경 (둘 다 0001 사용)
         renamed_count = 0
+        entries = FileIndex()
         for base_name, pair_info in parrec_pairs.items():
             par_path = pair_info['par']
             rec_path = pair_info['rec']
@@ -140,7 +157,8 @@ class ParrecSeparator(PreWork):
                 
                 try:
                     par_path.rename(dst_par_path)
-                    logger.info(f"[PAR/REC 분리] {par_path} → {dst_par_path}")
+                    logger.debug(f"[PAR/REC 분리] {par_path} → {dst_par_path}")
+                    entries.add(str(dst_par_path), 1)
                     renamed_count += 1
                 except Exception as e:
                     logger.error(f"PAR 파일 이동 실패: {par_path} → {dst_par_path} ({e})")
@@ -152,12 +170,14 @@ class ParrecSeparator(PreWork):
                 
                 try:
                     rec_path.rename(dst_rec_path)
-                    logger.info(f"[PAR/REC 분리] {rec_path} → {dst_rec_path}")
+                    logger.debug(f"[PAR/REC 분리] {rec_path} → {dst_rec_path}")
+                    entries.add(str(dst_rec_path), 1)
                     renamed_count += 1
                 except Exception as e:
                     logger.error(f"REC 파일 이동 실패: {rec_path} → {dst_rec_path} ({e})")
         
-        logger.info(f"PAR/REC 분리 완료: {work_dir} ({renamed_count}개 파일 처리)")
+        self.separated_entries = entries
+        logger.info(f"PAR/REC 분리 완료: {work_dir} ({renamed_count}개 파일 처리, 누락 {missing}개)")
         return str(work_dir)
 
 
@@ -200,14 +220,13 @@ class NiftiSeparator(PreWork):
             raise RuntimeError("처리할 NIfTI 파일이 없습니다.")
 
         # 단일 파일 처리
-        item = file_list[0]
-        index = item.get("index", 0)
+        index, file_path = file_list[0]
         
         # index가 2 이상이면 문제상황
         if index >= 2:
             raise RuntimeError(f"NIfTI 파일의 index는 1이어야 합니다. 현재 {index}입니다. zip데이터에 문제가 있을 수 있습니다.")
         
-        src_path = work_dir / Path(item.get("file_path")).name
+        src_path = work_dir / Path(file_path).name
         if not src_path.exists():
             raise FileNotFoundError(f"원본 파일 없음: {src_path}")
 
@@ -229,10 +248,12 @@ class NiftiSeparator(PreWork):
 
         try:
             src_path.rename(dst_path)
-            logger.info(f"[NIfTI 분리] {src_path} → {dst_path}")
+            logger.debug(f"[NIfTI 분리] {src_path} → {dst_path}")
         except Exception as e:
             logger.error(f"파일 이동 실패: {src_path} → {dst_path} ({e})")
             raise
 
-        logger.info(f"NIfTI 분리 완료: {work_dir}")
+        self.separated_entries = FileIndex()
+        self.separated_entries.add(str(dst_path), 1)
+        logger.info(f"NIfTI 분리 완료: {work_dir} ({dst_path.name})")
         return str(work_dir)
\ No newline at end of file
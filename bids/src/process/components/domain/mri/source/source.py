@@ -1,10 +1,12 @@
 #/BDSP/bids_app/src/process/components/domain/mri/source/source.py
 import os
-import json
+import gzip
 import shutil
+import struct
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from utils import common
+from utils import common, file_index, log, stages
 from . import validator
 from . import separator
 
@@ -23,6 +25,16 @@ _SEPARATOR_CLASS = {
     "NIFTI": "NiftiSeparator",
 }
 
+# 포맷 처리 순서 (단일 포맷 하위 호환 키는 첫 번째 포맷 기준)
+_FORMAT_ORDER = ("DICOM", "PARREC", "NIFTI")
+
+# 포맷 판별 시 읽는 파일 앞부분 크기 (DICOM preamble 132 / NIfTI-2 헤더 540 포함)
+_SNIFF_BYTES = 4096
+_NIFTI2_HEADER_SIZE = 540
+
+# 세트(시리즈)별 분리 동시 실행 수 (rename/stat 위주의 I/O 작업)
+_SET_WORKERS = min(16, (os.cpu_count() or 1) * 4)
+
 def _as_set_list(vr):
     """
     Validator.run() 반환값을 리스트로 정규화
@@ -55,8 +67,12 @@ def _get_pipeline_classes(file_format: str):
     
     return Validator, Separator
 
-def copy_files_to_invalid(origin_unzip_path, invalid_data_path):
-    """origin_unzip_path의 모든 파일을 invalid_data_path로 복사"""
+@stages.stage(stages.IO)
+def copy_files_to_invalid(origin_unzip_path, invalid_data_path, files=None):
+    """origin_unzip_path의 파일을 invalid_data_path로 복사
+
+    files가 주어지면 해당 파일만 origin_unzip_path 기준 상대 경로를 유지하여 복사
+    """
     try:
         origin_path = Path(origin_unzip_path)
         invalid_path = Path(invalid_data_path)
@@ -65,11 +81,17 @@ def copy_files_to_invalid(origin_unzip_path, invalid_data_path):
             logger.error(f"원본 경로가 존재하지 않음: {origin_path}")
             return
         
-        for item in origin_path.iterdir():
-            if item.is_file():
-                shutil.copy2(item, invalid_path)
-            elif item.is_dir():
-                shutil.copytree(item, invalid_path / item.name, dirs_exist_ok=True)
+        if files is None:
+            for item in origin_path.iterdir():
+                if item.is_file():
+                    shutil.copy2(item, invalid_path)
+                elif item.is_dir():
+                    shutil.copytree(item, invalid_path / item.name, dirs_exist_ok=True)
+        else:
+            for item in files:
+                dst = invalid_path / Path(item).relative_to(origin_path)
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(item, dst)
         
         logger.info(f"파일 복사 완료: {origin_unzip_path} → {invalid_data_path}")
     except Exception as e:
@@ -96,42 +118,199 @@ def make_participants_file(subject_path):
         logger.error(f"Participants 파일 생성 실패: {e}")
         raise
 
-def get_file_format(origin_unzip_path):
-    """bdsp_file_list.json에서 index 1인 파일의 확장자를 읽어 파일 포맷 판단 (보강 없음)"""
+
+def _detect_file_format(file_path: Path) -> str:
+    """파일 내용(매직 바이트)으로 포맷 판별
+
+    - DICOM : 128바이트 preamble 뒤 'DICM' (preamble 없는 구형 파일은 확장자로 보조 판단)
+    - PARREC: PAR 헤더의 'DATA DESCRIPTION FILE' 문구
+    - NIFTI : sizeof_hdr(348/540) + magic('n+1', 'ni1', 'n+2'), .nii.gz는 압축 해제 후 확인
+    REC/사이드카처럼 자체 매직이 없는 파일은 "UNKNOWN"을 반환하고 호출부에서 짝을 찾아 배정
+    """
     try:
-        json_file_path = os.path.join(origin_unzip_path, "bdsp_file_list.json")
-        if not os.path.exists(json_file_path):
-            logger.error(f"bdsp_file_list.json 파일이 존재하지 않음: {json_file_path}")
-            return "UNKNOWN"
-        
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # index가 1인 파일 찾기
-        for item in data.get("path", []):
-            if item.get("index") == 1:
-                file_path = item.get("file_path", "")
-                
-                # 확장자 추출 및 분류 (단순 suffix.lower()만 사용)
-                file_ext = Path(file_path).suffix.lower()
-                if file_ext in ['.dcm', '.dicom', '.ima']:
-                    return "DICOM"
-                elif file_ext in ['.par', '.rec', ]:  
-                    return "PARREC"
-                elif file_ext in ['.nii', '.gz', '.nifti', '.nii.gz']:
-                    return "NIFTI"
-                else:
-                    logger.warning(f"알 수 없는 파일 확장자: {file_ext}")
-                    return "UNKNOWN"
-        
-        logger.error("index가 1인 파일을 찾을 수 없음")
-        return "UNKNOWN"
-    except Exception as e:
-        logger.error(f"파일 포맷 판단 실패: {e}")
+        with open(file_path, 'rb') as f:
+            head = f.read(_SNIFF_BYTES)
+    except OSError as e:
+        logger.warning(f"파일 읽기 실패: {file_path} ({e})")
         return "UNKNOWN"
 
-def create_source_path(structured_config, mss_path, origin_unzip_path):
-    """Source 경로를 생성하고 반환"""
+    if len(head) >= 132 and head[128:132] == b'DICM':
+        return "DICOM"
+
+    if b'DATA DESCRIPTION FILE' in head:
+        return "PARREC"
+
+    if head[:2] == b'\x1f\x8b':
+        # gzip → .nii.gz 여부 확인 (헤더 크기만큼만 압축 해제)
+        try:
+            with gzip.open(file_path, 'rb') as gz:
+                head = gz.read(_NIFTI2_HEADER_SIZE)
+        except (OSError, EOFError):
+            return "UNKNOWN"
+
+    if _is_nifti_header(head):
+        return "NIFTI"
+
+    if file_path.suffix.lower() in ('.dcm', '.dicom', '.ima'):
+        return "DICOM"
+
+    return "UNKNOWN"
+
+
+def _is_nifti_header(head: bytes) -> bool:
+    """NIfTI-1/NIfTI-2 헤더 여부 (엔디안 무관)"""
+    if len(head) >= 348:
+        for order in ('<', '>'):
+            if struct.unpack(f'{order}i', head[:4])[0] == 348 and head[344:348] in (b'n+1\x00', b'ni1\x00'):
+                return True
+    if len(head) >= 12:
+        for order in ('<', '>'):
+            if struct.unpack(f'{order}i', head[:4])[0] == 540 and head[4:8] in (b'n+2\x00', b'ni2\x00'):
+                return True
+    return False
+
+
+def _nifti_base_name(name: str) -> str:
+    """NIfTI/사이드카 파일명에서 확장자를 제거한 basename"""
+    low = name.lower()
+    for ext in ('.nii.gz', '.nii', '.json', '.bval', '.bvec'):
+        if low.endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+
+def partition_files_by_format(origin_unzip_path, headers=None):
+    """origin_unzip_path의 모든 파일을 내용 기준으로 DICOM/PARREC/NIFTI로 분류
+
+    Args:
+        headers: 스트리밍 헤더 인덱스 (origin_unzip_path 기준 상대 경로 -> {'format', ...}).
+                 인덱스에 있는 파일은 다시 읽지 않고 기록된 포맷을 사용
+
+    Returns:
+        dict: {file_format: [Path, ...]} (파일이 있는 포맷만 포함, _FORMAT_ORDER 순서)
+    """
+    json_file_path = os.path.join(origin_unzip_path, "bdsp_file_list.json")
+    if not os.path.exists(json_file_path):
+        raise FileNotFoundError(f"bdsp_file_list.json 파일이 존재하지 않음: {json_file_path}")
+
+    files = [Path(file_path) for _, file_path in file_index.iter_file(json_file_path)]
+    files = [p for p in files if p.is_file()]
+
+    # 1차: 매직 바이트로 분류
+    partitions = {fmt: [] for fmt in _FORMAT_ORDER}
+    unresolved = []
+    headers = headers or {}
+    for p in files:
+        entry = headers.get(os.path.relpath(p, origin_unzip_path))
+        file_format = entry['format'] if entry else _detect_file_format(p)
+        if file_format == "UNKNOWN":
+            unresolved.append(p)
+        else:
+            partitions[file_format].append(p)
+
+    # 2차: 자체 매직이 없는 파일은 짝이 되는 파일의 포맷을 따름 (REC → PAR, 사이드카 → NIfTI)
+    par_stems = {(p.parent, p.stem) for p in partitions["PARREC"]}
+    nifti_bases = {(p.parent, _nifti_base_name(p.name)) for p in partitions["NIFTI"]}
+    for p in unresolved:
+        if p.suffix.lower() == '.rec' and (p.parent, p.stem) in par_stems:
+            partitions["PARREC"].append(p)
+        elif p.suffix.lower() in ('.json', '.bval', '.bvec') and (p.parent, _nifti_base_name(p.name)) in nifti_bases:
+            partitions["NIFTI"].append(p)
+        else:
+            logger.warning(f"포맷을 판별할 수 없는 파일 제외: {p}")
+
+    result = {fmt: partitions[fmt] for fmt in _FORMAT_ORDER if partitions[fmt]}
+    logger.info("포맷 분류 결과: " + ", ".join(f"{fmt}={len(fs)}" for fmt, fs in result.items()))
+    return result
+
+
+@stages.stage(stages.IO)
+def _separate_set(Separator, validated_dir, set_id):
+    """validated 세트 하나를 분리하고 분리 결과 목록(bdsp_file_list.json)을 기록 (파일 재명명/복사 - IO)
+
+    Returns:
+        tuple: ({'validated_set_dir', 'set_id'}, separated_path)
+    """
+    # validated_dir 쪽 JSON 생성 (Separator 입력)
+    common.bdsp_walk(validated_dir, os.path.join(validated_dir, "bdsp_file_list.json"))
+
+    # 분리(Separation)
+    sep = Separator(validated_dir, set_id)
+    sr = sep.run(validated_dir, set_id)
+    separated_path = sr[0] if isinstance(sr, tuple) else sr
+
+    if not separated_path or not Path(separated_path).exists():
+        raise RuntimeError(f"분리 결과(separated_path) 미생성: set_id={set_id}")
+
+    # JSON 업데이트: 재스캔 없이 Separator의 재명명 계획 결과로 기록
+    separated_json = Path(separated_path) / "bdsp_file_list.json"
+    common.write_file_list(sep.separated_entries, str(separated_json))
+    logger.info(f"[{set_id}] bdsp_file_list.json 생성 (separated, {len(sep.separated_entries)}개): {separated_json}")
+
+    return {'validated_set_dir': str(validated_dir), 'set_id': str(set_id)}, str(separated_path)
+
+
+@stages.stage(stages.CPU)
+def _validate_format(Validator, file_format, invalid_data_path, valid_data_path, headers=None):
+    """포맷 하나의 유효성 검사 (헤더 파싱 / 세트 그룹핑 - CPU)"""
+    if file_format == "DICOM" and headers:
+        validator = Validator(invalid_data_path, valid_data_path, headers=headers)
+    else:
+        validator = Validator(invalid_data_path, valid_data_path)
+    return validator.run()
+
+
+def _run_format_pipeline(file_format, format_path, headers=None):
+    """포맷 하나에 대한 Validator → Separator 파이프라인 실행
+
+    유효성 검사는 CPU 풀, 세트별 분리(파일 재명명/복사)는 IO 풀에서 실행한다.
+    headers(스트리밍 헤더 인덱스)가 있으면 DICOM Study/Series 그룹핑에 재사용
+
+    Returns:
+        tuple: (validated_sets, separated_paths)
+    """
+    invalid_data_path = format_path / "invalid_data"
+    valid_data_path = format_path / "valid_data"
+
+    Validator, Separator = _get_pipeline_classes(file_format)
+
+    # 유효성 검사 (여러 세트 가능)
+    vr = _validate_format(Validator, file_format, invalid_data_path, valid_data_path, headers)
+    if vr is None:
+        raise Exception(f"[{file_format}] 유효성 검사 실패 또는 유효 파일 없음")
+
+    # 단일/다중 세트 모두 리스트로 정규화
+    vr_list = _as_set_list(vr)
+    if not vr_list:
+        raise Exception(f"[{file_format}] 유효성 검사 결과가 비어 있습니다.")
+
+    # invalid 쪽 JSON 최신화 1회
+    common.bdsp_walk(str(invalid_data_path), str(invalid_data_path / "bdsp_file_list.json"))
+
+    # 세트별 분리를 동시에 수행 (결과는 vr_list 순서 유지)
+    for validated_dir, _ in vr_list:
+        if not validated_dir or not Path(validated_dir).exists():
+            raise Exception(f"[{file_format}] 유효성 검사 디렉토리 없음: {validated_dir}")
+
+    with ThreadPoolExecutor(max_workers=min(_SET_WORKERS, len(vr_list))) as executor:
+        # 로그 컨텍스트(job/subject/step)를 풀 스레드로 전달
+        futures = [log.submit(executor, _separate_set, Separator, *vr_item) for vr_item in vr_list]
+        set_results = [future.result() for future in futures]
+
+    validated_sets = [validated_set for validated_set, _ in set_results]
+    separated_paths = [separated_path for _, separated_path in set_results]
+
+    logger.info(f"[{file_format}] 유효성 검사/분리 완료: {invalid_data_path} / {valid_data_path}")
+    return validated_sets, separated_paths
+
+
+def create_source_path(structured_config, mss_path, origin_unzip_path, headers=None):
+    """Source 경로를 생성하고 반환
+
+    업로드 파일을 내용 기준으로 포맷별(DICOM/PARREC/NIFTI)로 나누고,
+    포맷별 Validator/Separator 파이프라인을 동시에 실행한 뒤 결과를 합친다.
+    headers: 압축 해제 중 만든 헤더 인덱스 (HeaderIndex.close(origin_unzip_path) 결과, 스트리밍 모드)
+    """
     logger.info("Step 3: Source 경로 생성 시작")
     
     try:
@@ -143,104 +322,97 @@ def create_source_path(structured_config, mss_path, origin_unzip_path):
         org_id = request['orgId']
         subject_id = request['subjectId']
         
-        # 2) source 경로 및 alias/session/format
+        # 2) source 경로 및 alias/session
         source_path = Path(mss_path) / 'sourcedata'
         alias_id = f"{public}{project_code}{project_seq}{org_id}{subject_id}"
         session_num = common.zero_fill(request['trialIndex'])
         
-        # bdsp_file_list.json은 origin_unzip_path 기준으로 먼저 판단
-        file_format = get_file_format(origin_unzip_path)
-        if file_format == "UNKNOWN":
+        # bdsp_file_list.json(origin_unzip_path 기준)의 파일들을 내용으로 포맷 분류
+        partitions = partition_files_by_format(origin_unzip_path, headers)
+        if not partitions:
             raise ValueError("포맷을 판별할 수 없어 파이프라인을 진행할 수 없습니다.")
         
-        logger.info(f"Entity 정리 완료 - Alias ID: {alias_id}, Session: {session_num}, Format: {file_format}")
-        print(f"Source 구조 생성: sub-{alias_id}/ses-{session_num}/{file_format}")
+        logger.info(f"Entity 정리 완료 - Alias ID: {alias_id}, Session: {session_num}, Formats: {list(partitions)}")
         
         # 3) 디렉토리 생성
         subject_path = source_path / f"sub-{alias_id}"
         session_path = subject_path / f"ses-{session_num}"
-        format_path = session_path / file_format
-        invalid_data_path = format_path / "invalid_data"
-        valid_data_path = format_path / "valid_data"
-        
-        invalid_data_path.mkdir(parents=True, exist_ok=True)
-        valid_data_path.mkdir(parents=True, exist_ok=True)
+        session_path.mkdir(parents=True, exist_ok=True)
         
         # 4) participants 파일 생성
         make_participants_file(subject_path)
         
-        # 5) 원본 압축해제 경로의 모든 파일을 invalid로 복사
-        copy_files_to_invalid(origin_unzip_path, invalid_data_path)
+        # 5) 포맷별 format_path 생성 및 해당 파일만 invalid로 복사
+        format_paths = {}
+        for file_format, files in partitions.items():
+            format_path = session_path / file_format
+            invalid_data_path = format_path / "invalid_data"
+            valid_data_path = format_path / "valid_data"
+            invalid_data_path.mkdir(parents=True, exist_ok=True)
+            valid_data_path.mkdir(parents=True, exist_ok=True)
+            logger.info(f"Source 구조 생성: sub-{alias_id}/ses-{session_num}/{file_format} ({len(files)}개 파일)")
+            
+            copy_files_to_invalid(origin_unzip_path, invalid_data_path, files)
+            
+            # 6) invalid 경로에 bdsp_file_list.json 생성 (스캔)
+            common.bdsp_walk(str(invalid_data_path), str(invalid_data_path / "bdsp_file_list.json"))
+            format_paths[file_format] = format_path
         
-        # 6) invalid 경로에 bdsp_file_list.json 생성 (스캔)
-        common.bdsp_walk(str(invalid_data_path), str(invalid_data_path / "bdsp_file_list.json"))
-   
+        # ===== 7~9) 포맷별 Validator/Separator 파이프라인 동시 실행 ==========
+        format_results = {}
+        errors = []
+        with ThreadPoolExecutor(max_workers=len(format_paths)) as executor:
+            futures = {
+                log.submit(executor, _run_format_pipeline, file_format, format_path, headers): file_format
+                for file_format, format_path in format_paths.items()
+            }
+            for future in as_completed(futures):
+                file_format = futures[future]
+                try:
+                    format_results[file_format] = future.result()
+                except Exception as e:
+                    logger.error(f"[{file_format}] 파이프라인 실패: {e}")
+                    errors.append(f"{file_format}: {e}")
         
-        # ===== 7) 포맷별 Validator/Separator 분기(클래스 기반) ==============
-        Validator, Separator = _get_pipeline_classes(file_format)
-
-        # 7-1) 유효성 검사 (여러 세트 가능)
-        validator = Validator(invalid_data_path, valid_data_path)
-        vr = validator.run()
-        if vr is None:
-            error_msg = "유효성 검사 실패 또는 유효 파일 없음"
-            logger.error(error_msg)
-            raise Exception(error_msg)
-
-        # 단일/다중 세트 모두 리스트로 정규화
-        vr_list = _as_set_list(vr)
-        if not vr_list:
-            raise Exception("유효성 검사 결과가 비어 있습니다.")
-
-        # 8) invalid/validated 쪽 JSON 생성
-        #    - invalid은 최신화 1회
-        common.bdsp_walk(str(invalid_data_path), str(invalid_data_path / "bdsp_file_list.json"))
-
-        # 세트별로 분리 수행
+        if errors:
+            raise Exception(f"포맷별 source 처리 실패 - {'; '.join(errors)}")
+        
+        # 10) 포맷별 결과를 raw 단계용으로 병합 (_FORMAT_ORDER 순서 유지)
+        formats = {}
         validated_sets = []
         separated_paths = []
-
-        for (validated_dir, set_id) in vr_list:
-            if not validated_dir or not Path(validated_dir).exists():
-                error_msg = f"유효성 검사 디렉토리 없음: {validated_dir}"
-                logger.error(error_msg)
-                raise Exception(error_msg)
-
-            # validated_dir 쪽 JSON 생성
-            common.bdsp_walk(validated_dir, os.path.join(validated_dir, "bdsp_file_list.json"))
-
-            # 9) 분리(Separation): 세트별 실행
-            sep = Separator(validated_dir, set_id)
-            sr = sep.run(validated_dir, set_id)
-            separated_path = sr[0] if isinstance(sr, tuple) else sr
-
-            if not separated_path or not Path(separated_path).exists():
-                raise RuntimeError(f"분리 결과(separated_path) 미생성: set_id={set_id}")
-
-            # ✨ JSON 업데이트: 분리 결과 경로 기준으로 스캔
-            common.separated_walk(str(separated_path), str(Path(separated_path) / "bdsp_file_list.json"))
-            logger.info(f"[{set_id}] bdsp_file_list.json 생성 (separated): {Path(separated_path) / 'bdsp_file_list.json'}")
-
-            validated_sets.append({'validated_set_dir': str(validated_dir), 'set_id': str(set_id)})
-            separated_paths.append(str(separated_path))
-
-        logger.info(f"Source 디렉토리 구조 생성 및 유효성 검사/분리 완료: {invalid_data_path} / {valid_data_path}")
-
-        # 10) 생성된 경로 반환 (하위 호환 + 멀티 세트 지원)
+        for file_format in format_paths:
+            format_path = format_paths[file_format]
+            fmt_validated_sets, fmt_separated_paths = format_results[file_format]
+            formats[file_format] = {
+                'format_path': str(format_path),
+                'invalid_data_path': str(format_path / "invalid_data"),
+                'valid_data_path': str(format_path / "valid_data"),
+                'validated_sets': fmt_validated_sets,
+                'separated_paths': fmt_separated_paths,
+            }
+            validated_sets.extend(fmt_validated_sets)
+            separated_paths.extend(fmt_separated_paths)
+        
+        logger.info(f"Source 디렉토리 구조 생성 및 유효성 검사/분리 완료: {session_path} ({', '.join(formats)})")
+        
+        # 생성된 경로 반환 (하위 호환: 단일 포맷 키는 첫 번째 포맷 기준)
+        primary = formats[next(iter(formats))]
         source = {
             'source_path': str(source_path),
             'subject_path': str(subject_path),
             'session_path': str(session_path),
-            'format_path': str(format_path),
-            'invalid_data_path': str(invalid_data_path),
-            'valid_data_path': str(valid_data_path),
+            'format_path': primary['format_path'],
+            'invalid_data_path': primary['invalid_data_path'],
+            'valid_data_path': primary['valid_data_path'],
 
-            # 멀티 세트 대비
-            'validated_sets': validated_sets,          
-            'separated_paths': separated_paths,        
+            # 멀티 세트 / 멀티 포맷
+            'validated_sets': validated_sets,
+            'separated_paths': separated_paths,
+            'formats': formats,
         }
         return source
     
     except Exception as e:
         logger.error(f"Source 경로 생성 실패: {e}")
-        raise
\ No newline at end of file
+        raise
@@ -1,4 +1,3 @@
-import json
 import hashlib
 import logging
 from pathlib import Path
@@ -11,6 +10,8 @@ from collections import defaultdict
 import nibabel as nib
 import numpy as np
 from typing import List, Tuple
+from utils.file_index import FileIndex
+from process.components.domain.mri.parrec_header import read_par_header, find_rec_path
 
 logger = logging.getLogger(__name__)
 
@@ -29,45 +30,27 @@ def validate_parrec_files(par_path):
     Returns:
         bool: 유효성 여부 (True/False)
     """
-    # REC 파일 경로 생성
-    rec_path = par_path.replace('.par', '.rec')
-    
     try:
-        # 1. 파일 존재 확인
+        # 1. 파일 존재 확인 (REC는 .rec/.REC 모두 허용)
         if not os.path.exists(par_path):
             return False
-            
-        if not os.path.exists(rec_path):
+        
+        rec_path = find_rec_path(par_path)
+        if rec_path is None:
             return False
         
         # 2. REC 파일 크기 확인 (비어있지 않은지만)
         if os.path.getsize(rec_path) == 0:
             return False
         
-        # 3. PAR 파일 기본 파싱 가능 확인
-        has_image_section = False
-        image_count = 0
+        # 3. PAR 헤더 파싱 (Mapper/Converter와 공유하는 캐시에 적재)
+        header = read_par_header(par_path)
         
-        with open(par_path, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                line = line.strip()
-                
-                # IMAGE INFORMATION 섹션 시작 확인
-                if line.startswith("#  sl ec  dyn"):
-                    has_image_section = True
-                    continue
-                
-                # 데이터 라인 카운트 (최소 1개 이상)
-                if has_image_section and line and not line.startswith("#"):
-                    parts = line.split()
-                    if len(parts) >= 10:  # 최소 필수 컬럼 수
-                        image_count += 1
-        
-        # 4. 최소 요구사항 확인
-        if not has_image_section:
+        # 4. 최소 요구사항 확인: IMAGE INFORMATION 섹션 + 이미지 라인 1개 이상
+        if not header.has_image_section:
             return False
         
-        if image_count == 0:
+        if header.image_count == 0:
             return False
         
         # 모든 필수 검증 통과
@@ -204,9 +187,23 @@ def validate_nifti_file(nifti_path):
         return results
 
 class DicomValidator:
-    def __init__(self, invalid_data_path: str | Path, valid_data_path: str | Path):
+    def __init__(self, invalid_data_path: str | Path, valid_data_path: str | Path, headers: dict | None = None):
         self.invalid_data_path = Path(invalid_data_path)
         self.valid_data_path = Path(valid_data_path)
+        # 스트리밍 헤더 인덱스 (invalid_data 기준 상대 경로 -> {'format', 'study_uid', 'series_uid'})
+        self.headers = headers or {}
+
+    def _group_key(self, cur: Path):
+        """(StudyUID, SeriesUID) - 헤더 인덱스에 있으면 재사용, 없으면 헤더를 읽음"""
+        entry = self.headers.get(str(cur.relative_to(self.invalid_data_path)))
+        if entry and entry.get('study_uid') and entry.get('series_uid'):
+            return entry['study_uid'], entry['series_uid']
+        try:
+            ds = pydicom.dcmread(str(cur), stop_before_pixels=True, force=True)
+        except (InvalidDicomError, Exception):
+            logger.info(f"Skipping non-DICOM file: {cur.name}")
+            return None
+        return getattr(ds, "StudyInstanceUID", None), getattr(ds, "SeriesInstanceUID", None)
 
     def run(self) -> List[Tuple[str, str]] | None:
         jpath = self.invalid_data_path / "bdsp_file_list.json"
@@ -214,7 +211,7 @@ class DicomValidator:
             logger.error(f"{jpath} not found")
             return None
         try:
-            data = json.loads(jpath.read_text(encoding="utf-8"))
+            file_list = FileIndex.load(jpath)
         except Exception as e:
             logger.error(f"Failed to read {jpath}: {e}")
             return None
@@ -222,20 +219,16 @@ class DicomValidator:
         # (StudyUID, SeriesUID) -> [Path...]
         groups: dict[tuple[str, str], list[Path]] = {}
 
-        for item in data.get("path", []):
-            p = Path(item.get("file_path", ""))
-            cur = self.invalid_data_path / p.name
+        for p in file_list.paths():
+            cur = self.invalid_data_path / Path(p).name
             if not cur.exists():
                 logger.error(f"File not found: {cur}")
                 continue
-            try:
-                ds = pydicom.dcmread(str(cur), stop_before_pixels=True, force=True)
-            except (InvalidDicomError, Exception):
-                logger.info(f"Skipping non-DICOM file: {cur.name}")
+            key = self._group_key(cur)
+            if key is None:
                 continue
 
-            study_uid = getattr(ds, "StudyInstanceUID", None)
-            series_uid = getattr(ds, "SeriesInstanceUID", None)
+            study_uid, series_uid = key
             if not study_uid or not series_uid:
                 logger.warning(f"Missing StudyUID or SeriesUID in {cur}")
                 continue
@@ -276,7 +269,7 @@ class ParrecValidator:
             logger.error(f"{jpath} not found")
             return None
         try:
-            data = json.loads(jpath.read_text(encoding="utf-8"))
+            file_list = FileIndex.load(jpath)
         except Exception as e:
             logger.error(f"Failed to read {jpath}: {e}")
             return None
@@ -284,9 +277,8 @@ class ParrecValidator:
         # stem -> {'par': Path|None, 'rec': Path|None}
         pairs: dict[str, dict[str, Path | None]] = {}
 
-        for item in data.get("path", []):
-            p = Path(item.get("file_path", ""))
-            cur = self.invalid_data_path / p.name
+        for p in file_list.paths():
+            cur = self.invalid_data_path / Path(p).name
             if not cur.exists():
                 logger.error(f"File not found: {cur}")
                 continue
@@ -344,7 +336,7 @@ class NiftiValidator:
             logger.error(f"{jpath} not found")
             return None
         try:
-            data = json.loads(jpath.read_text(encoding="utf-8"))
+            file_list = FileIndex.load(jpath)
         except Exception as e:
             logger.error(f"Failed to read {jpath}: {e}")
             return None
@@ -352,9 +344,8 @@ class NiftiValidator:
         # stem -> [Path...(.nii / .nii.gz)]
         groups: dict[str, list[Path]] = {}
 
-        for item in data.get("path", []):
-            p = Path(item.get("file_path", ""))
-            cur = self.invalid_data_path / p.name
+        for p in file_list.paths():
+            cur = self.invalid_data_path / Path(p).name
             if not cur.exists():
                 logger.error(f"File not found: {cur}")
                 continue
@@ -5,45 +5,60 @@ import os
 import shutil
 import logging
 from datetime import datetime
+from utils import stages
+from process.components import flags
 logger = logging.getLogger(__name__)
 
 
+def trace_json_path(config, mss_state_path):
+    """작업의 trace.json 경로 (mss_state_path/trace/<user>_<subjectId>_<uploadTime>_trace.json)"""
+    trace_filename = f"{config['user']}_{config['subjectId']}_{config['uploadTime']}_trace.json"
+    return os.path.join(mss_state_path, 'trace', trace_filename)
+
+
 def create_trace_json(config, paths):
     """trace.json 파일 생성"""
     
     # 1. mss_state_path에서 trace 폴더 경로 설정
     mss_state_path = paths['step1_mss']['mss_state_path']
-    trace_folder = os.path.join(mss_state_path, 'trace')
+    trace_filepath = trace_json_path(config, mss_state_path)
+    trace_folder = os.path.dirname(trace_filepath)
     
-    # 2. trace 폴더가 없으면 생성
+    # 2. trace 폴더가 없으면 생성 (동시에 실행 중인 다른 작업이 먼저 만들 수 있음)
     if not os.path.exists(trace_folder):
-        os.makedirs(trace_folder)
+        os.makedirs(trace_folder, exist_ok=True)
         logger.info(f"trace 폴더 생성: {trace_folder}")
     else:
         logger.info(f"trace 폴더 이미 존재: {trace_folder}")
     
     # 3. trace.json 파일명 생성
-    user = config['user']
-    subject_id = config['subjectId']
-    upload_time = config['uploadTime']
-    trace_filename = f"{user}_{subject_id}_{upload_time}_trace.json"
-    trace_filepath = os.path.join(trace_folder, trace_filename)
+    trace_filename = os.path.basename(trace_filepath)
     
-    # 4. 파일이 이미 존재하면 ValueError
-    if os.path.exists(trace_filepath):
-        error_msg = f"trace 파일이 이미 존재함: {trace_filepath}"
-        logger.error(error_msg)
-        raise ValueError(error_msg)
+    # 4~5. paths 딕셔너리를 JSON으로 저장 (파일이 이미 존재하면 ValueError - 존재 확인과 생성을 원자적으로)
+    # flag 티켓이 있으면 소비자가 같은 trace에 상태를 보고하므로 잠금 안에서 현재 티켓 상태를 반영하여 생성
+    def write_trace():
+        with open(trace_filepath, 'x', encoding='utf-8') as f:
+            json.dump(paths, f, ensure_ascii=False, indent=2)
+    
+    # 생성 시각 기록 (이후 소비자 보고 / rederive로 파일이 갱신되어도 backfill은 이 시각으로 최신 여부를 판정)
+    paths[flags.TRACE_CREATED] = datetime.now().isoformat()
     
-    # 5. paths 딕셔너리를 JSON으로 저장
     try:
-        with open(trace_filepath, 'w', encoding='utf-8') as f:
-            json.dump(paths, f, ensure_ascii=False, indent=2)
+        if paths.get('step7_flags', {}).get('tickets'):
+            with flags.trace_lock(trace_filepath):
+                flags.merge_ticket_states(paths['step7_flags'])
+                write_trace()
+        else:
+            write_trace()
         logger.info(f"trace.json 파일 생성 완료: {trace_filepath}")
-        print(f"trace.json 생성됨: {trace_filename}")
+        logger.debug(f"trace.json 생성됨: {trace_filename}")
         
         return trace_filepath
         
+    except FileExistsError:
+        error_msg = f"trace 파일이 이미 존재함: {trace_filepath}"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
     except Exception as e:
         logger.error(f"trace.json 파일 생성 실패: {e}")
         raise
@@ -115,7 +130,7 @@ def create_export_json(config, global_vars, paths):
         with open(export_filepath, 'w', encoding='utf-8') as f:
             json.dump(export_data, f, ensure_ascii=False, indent=2)
         logger.info(f"export.json 파일 생성 완료: {export_filepath}")
-        print(f"export.json 생성됨: {new_filename}")
+        logger.debug(f"export.json 생성됨: {new_filename}")
         
         return export_filepath
         
@@ -140,7 +155,7 @@ def move_export_to_backup(export_filepath, backup_dir):
         # 파일 이동
         shutil.move(export_filepath, backup_filepath)
         logger.info(f"export.json 파일 이동: {export_filepath} -> {backup_filepath}")
-        print(f"export.json을 backup 디렉토리로 이동: {backup_filepath}")
+        logger.debug(f"export.json을 backup 디렉토리로 이동: {backup_filepath}")
         
         return backup_filepath
         
@@ -149,6 +164,7 @@ def move_export_to_backup(export_filepath, backup_dir):
         raise
 
 
+@stages.stage(stages.IO)
 def create_export(config, global_vars, paths):
     """export 메인 함수"""
     logger.info("Step 6: Export 시작")
@@ -164,12 +180,7 @@ def create_export(config, global_vars, paths):
         backup_dir = global_vars['backup_dir']
         final_export_filepath = move_export_to_backup(export_filepath, backup_dir)
         
-        logger.info("Export 완료")
-        print("="*50)
-        print("Export 작업 완료")
-        print(f"  - trace.json: {trace_filepath}")
-        print(f"  - export.json: {final_export_filepath}")
-        print("="*50)
+        logger.info(f"Export 완료 - trace.json: {trace_filepath}, export.json: {final_export_filepath}")
         
         return {
             'trace_json': trace_filepath,
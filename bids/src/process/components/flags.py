@@ -0,0 +1,544 @@
+#/BDSP/bids_app/src/process/components/flags.py
+import argparse
+import hashlib
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from utils import common
+
+logger = logging.getLogger(__name__)
+
+# flag process 이름 (이벤트 JSON flag[].process) → 후처리 서비스
+FLAG_PROCESSES = ("defacing", "canonical", "civet")
+
+# 인계 디렉토리(FLAG_DIR/<process>) 아래 티켓 상태별 폴더
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+STATES = (PENDING, CLAIMED, DONE, FAILED)
+
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 3
+# 다른 스레드가 상태 변경 중인 티켓을 기다리는 최대 시간
+_ACQUIRE_WAIT_SECONDS = 5
+
+# trace 생성(작업 처리 완료) 시각 - 이후 소비자 보고 / 재생성(rederive)으로 파일이 갱신되어도 유지 (backfill 최신 판정 기준)
+TRACE_CREATED = "trace_created"
+
+
+def flag_dirs(flag_dir, defacing_flag=None, canonical_flag=None, civet_flag=None):
+    """process 이름 → 인계 디렉토리 (지정하지 않으면 FLAG_DIR/<process>)"""
+    configured = {'defacing': defacing_flag, 'canonical': canonical_flag, 'civet': civet_flag}
+    if not flag_dir and not any(configured.values()):
+        return {}
+    return {process: configured[process] or os.path.join(flag_dir, process) for process in FLAG_PROCESSES}
+
+
+def enabled_flags(structured_config):
+    """활성화된 flag 목록 [(process, options), ...]"""
+    return [(item.get('process', ''), item.get('options', ''))
+            for item in structured_config['flag']['processes'] if item.get('enabled', False)]
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+# ===== trace 보고 ===========================================================
+def trace_lock(trace_path):
+    """trace.json 갱신 잠금 (작업의 trace 생성과 소비자의 상태 보고를 직렬화)"""
+    return common.locked_file(trace_path)
+
+
+def trace_created(trace_path, trace=None):
+    """trace 생성 시각 (timestamp) - 기록이 없는 예전 trace는 파일 mtime"""
+    if trace is None:
+        trace = _read_json(trace_path)
+    created = trace.get(TRACE_CREATED)
+    if created:
+        try:
+            return datetime.fromisoformat(created).timestamp()
+        except ValueError:
+            pass
+    return os.path.getmtime(trace_path)
+
+
+def modify_trace(trace_path, update):
+    """기존 trace.json 갱신 (update(trace)가 True를 반환하면 저장)
+
+    trace가 아직 없으면(작업 진행 중) 아무것도 하지 않고 False 반환.
+    생성 시각 기록이 없는 예전 trace는 갱신 전 mtime을 생성 시각으로 남긴다 (갱신해도 최신 판정이 바뀌지 않도록).
+    """
+    with trace_lock(trace_path):
+        try:
+            trace = _read_json(trace_path)
+        except FileNotFoundError:
+            return False
+        if not update(trace):
+            return False
+        if not trace.get(TRACE_CREATED):
+            trace[TRACE_CREATED] = datetime.fromtimestamp(os.path.getmtime(trace_path)).isoformat()
+        common.write_json_atomic(trace_path, trace, indent=2)
+        return True
+
+
+def update_trace(trace_path, ticket_id, record):
+    """trace.json의 step7_flags.tickets[ticket_id]에 record 반영
+
+    trace가 아직 없으면(작업 진행 중) 아무것도 하지 않고 False 반환 - 작업이 trace를 만들 때
+    티켓 폴더의 현재 상태를 읽어 반영한다 (merge_ticket_states).
+    """
+    def apply(trace):
+        tickets = trace.setdefault('step7_flags', {}).setdefault('tickets', {})
+        tickets.setdefault(ticket_id, {}).update(record)
+        return True
+
+    return modify_trace(trace_path, apply)
+
+
+def ticket_state(ticket):
+    """티켓의 현재 상태 폴더와 완료 기록 (완료/실패 티켓은 결과 포함)"""
+    directory = ticket['queue']
+    file_name = f"{ticket['ticket_id']}.json"
+    for state in (DONE, FAILED, CLAIMED, PENDING):
+        path = os.path.join(directory, state, file_name)
+        try:
+            data = _read_json(path)
+        except (FileNotFoundError, ValueError):
+            continue
+        record = {'status': state}
+        for key in ('consumer', 'finished', 'result', 'error', 'attempts'):
+            if key in data:
+                record[key] = data[key]
+        return record
+    if os.path.exists(os.path.join(directory, CLAIMED, f".{file_name}.lock")):
+        # 소비자가 상태를 바꾸는 중 (잠금 이름으로 잠시 옮겨 둠)
+        return {'status': CLAIMED}
+    return {'status': 'missing'}
+
+
+def merge_ticket_states(flags_info):
+    """trace 생성 직전 step7_flags 티켓 상태를 티켓 폴더 기준으로 갱신 (trace_lock 안에서 호출)"""
+    for ticket_id, info in (flags_info or {}).get('tickets', {}).items():
+        if info.get('queue'):
+            info.update(ticket_state({'ticket_id': ticket_id, 'queue': info['queue']}))
+    return flags_info
+
+
+# ===== 티켓 대기열 ==========================================================
+class TicketQueue:
+    """후처리 서비스 하나의 인계 디렉토리 (pending → claimed → done / failed)
+
+    - 상태 이동은 같은 파일 시스템 안의 rename이므로 원자적이며, 여러 소비자가 같은 티켓을
+      동시에 claim해도 한 쪽만 성공한다.
+    - claim한 소비자는 lease 만료 전에 renew해야 한다. 만료된 claimed 티켓은 다음 claim 시
+      pending으로 되돌아가 다른 소비자가 가져간다 (max_attempts 초과 시 failed).
+    - 완료/실패는 티켓의 trace(작업 trace.json)에 보고된다.
+    """
+
+    def __init__(self, directory, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.directory = directory
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        for state in STATES:
+            os.makedirs(os.path.join(directory, state), exist_ok=True)
+
+    def _path(self, state, ticket_id):
+        return os.path.join(self.directory, state, f"{ticket_id}.json")
+
+    # ----- 생산자 (bids_app) ------------------------------------------------
+    def put(self, ticket):
+        """pending에 티켓 기록 (ticket_id가 같은 티켓은 덮어씀)"""
+        ticket = dict(ticket, queue=self.directory, attempts=ticket.get('attempts', 0))
+        common.write_json_atomic(self._path(PENDING, ticket['ticket_id']), ticket, indent=2)
+        return ticket
+
+    # ----- 소비자 (defacing / canonical / CIVET) ----------------------------
+    def _lock_path(self, ticket_id):
+        """상태를 바꾸는 동안 claimed 티켓을 옮겨 두는 이름 (.json이 아니므로 claim / 만료 처리 대상이 아님)"""
+        return os.path.join(self.directory, CLAIMED, f".{ticket_id}.json.lock")
+
+    def _acquire(self, ticket_id):
+        """claimed 티켓을 잠금 이름으로 rename (다른 소비자와 동시에 시도해도 한 쪽만 성공)
+
+        같은 티켓을 다른 스레드가 잠시 잡고 있으면(예: renew와 complete) 풀릴 때까지 잠깐 기다린다.
+
+        Returns:
+            tuple: (잠금 경로, 티켓) - claimed 상태가 아니면 (None, None)
+        """
+        lock_path = self._lock_path(ticket_id)
+        deadline = time.monotonic() + _ACQUIRE_WAIT_SECONDS
+        while True:
+            try:
+                os.rename(self._path(CLAIMED, ticket_id), lock_path)
+                break
+            except FileNotFoundError:
+                if not os.path.exists(lock_path) or time.monotonic() >= deadline:
+                    return None, None
+                time.sleep(0.02)
+        # 잠금 시각 기록 (중단된 잠금 복구 기준)
+        os.utime(lock_path)
+        try:
+            return lock_path, _read_json(lock_path)
+        except ValueError:
+            os.rename(lock_path, self._path(CLAIMED, ticket_id))
+            raise
+
+    def _release(self, lock_path, ticket_id, state=CLAIMED, data=None):
+        """잠금을 풀며 티켓을 state 폴더로 이동 (data가 있으면 기록 후 이동)"""
+        if data is not None:
+            common.write_json_atomic(lock_path, data, indent=2)
+        os.rename(lock_path, self._path(state, ticket_id))
+
+    @staticmethod
+    def _owns(current, ticket):
+        """티켓의 lease가 요청한 소비자(와 claim ID)의 것인지"""
+        lease = current.get('lease') or {}
+        mine = ticket.get('lease') or {}
+        if not mine.get('consumer') or lease.get('consumer') != mine['consumer']:
+            return False
+        return mine.get('claim_id') is None or lease.get('claim_id') == mine['claim_id']
+
+    def _recover_locks(self, now):
+        """잠금 중에 종료된 소비자가 남긴 잠금 파일을 claimed로 되돌림 (lease 시간이 지난 잠금)"""
+        claimed_dir = os.path.join(self.directory, CLAIMED)
+        for name in os.listdir(claimed_dir):
+            if not (name.startswith('.') and name.endswith('.json.lock')):
+                continue
+            lock_path = os.path.join(claimed_dir, name)
+            try:
+                if os.path.getmtime(lock_path) + self.lease_seconds > now:
+                    continue
+                os.rename(lock_path, os.path.join(claimed_dir, name[1:-len('.lock')]))
+            except FileNotFoundError:
+                continue
+            logger.warning(f"Flag 티켓 잠금 복구: {name}")
+
+    def requeue_expired(self):
+        """lease가 만료된 claimed 티켓을 pending(또는 시도 횟수 초과 시 failed)으로 되돌림 (lease 기록은 삭제)"""
+        claimed_dir = os.path.join(self.directory, CLAIMED)
+        now = time.time()
+        self._recover_locks(now)
+        requeued = 0
+        for name in os.listdir(claimed_dir):
+            if not name.endswith('.json') or name.startswith('.'):
+                continue
+            path = os.path.join(claimed_dir, name)
+            try:
+                ticket = _read_json(path)
+                expires = ticket.get('lease', {}).get('expires', os.path.getmtime(path) + self.lease_seconds)
+            except (FileNotFoundError, ValueError):
+                continue
+            if expires > now:
+                continue
+            ticket_id = name[:-len('.json')]
+            try:
+                lock_path, ticket = self._acquire(ticket_id)
+            except ValueError:
+                continue
+            if lock_path is None:
+                continue
+            lease = ticket.get('lease') or {}
+            # 확인과 잠금 사이에 renew되었으면 그대로 둠
+            if lease.get('expires', 0) > now:
+                self._release(lock_path, ticket_id)
+                continue
+            ticket.pop('lease', None)
+            ticket['last_consumer'] = lease.get('consumer')
+            state = PENDING if ticket.get('attempts', 0) < self.max_attempts else FAILED
+            if state == FAILED:
+                ticket.update(error="lease 만료 (시도 횟수 초과)", finished=_now())
+            self._release(lock_path, ticket_id, state, ticket)
+            logger.warning(f"Flag 티켓 lease 만료 → {state}: {ticket_id} (consumer {lease.get('consumer')})")
+            if state == FAILED:
+                self._report(ticket, FAILED)
+            requeued += 1
+        return requeued
+
+    def claim(self, consumer=None):
+        """가장 오래된 pending 티켓을 claim (없으면 None)
+
+        Returns:
+            dict: 티켓 (lease 포함 - renew / complete / fail에 그대로 전달, lease.claim_id로 claim 구분)
+        """
+        consumer = consumer or f"{socket.gethostname()}:{os.getpid()}"
+        self.requeue_expired()
+        pending_dir = os.path.join(self.directory, PENDING)
+        entries = []
+        for entry in os.scandir(pending_dir):
+            if entry.name.endswith('.json'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.name))
+                except FileNotFoundError:
+                    continue
+        for _, name in sorted(entries):
+            ticket_id = name[:-len('.json')]
+            lock_path = self._lock_path(ticket_id)
+            try:
+                # pending에서 바로 잠금 이름으로 가져와 lease를 기록한 뒤 claimed에 내놓음
+                os.rename(os.path.join(pending_dir, name), lock_path)
+            except FileNotFoundError:
+                # 다른 소비자가 먼저 가져감
+                continue
+            os.utime(lock_path)
+            ticket = _read_json(lock_path)
+            ticket['attempts'] = ticket.get('attempts', 0) + 1
+            ticket['lease'] = {'consumer': consumer, 'claim_id': uuid.uuid4().hex, 'claimed': _now(),
+                               'expires': time.time() + self.lease_seconds}
+            self._release(lock_path, ticket_id, CLAIMED, ticket)
+            logger.info(f"Flag 티켓 claim: {ticket_id} ({consumer}, 시도 {ticket['attempts']})")
+            self._report(ticket, CLAIMED)
+            return ticket
+        return None
+
+    def renew(self, ticket):
+        """lease 연장 (이미 만료되어 다른 소비자(claim)에게 넘어갔으면 False)"""
+        ticket_id = ticket['ticket_id']
+        lock_path, current = self._acquire(ticket_id)
+        if lock_path is None:
+            return False
+        if not self._owns(current, ticket):
+            self._release(lock_path, ticket_id)
+            return False
+        current['lease']['expires'] = time.time() + self.lease_seconds
+        self._release(lock_path, ticket_id, CLAIMED, current)
+        ticket['lease'] = current['lease']
+        return True
+
+    def complete(self, ticket, result=None):
+        """처리 완료 → done, trace에 보고 (lease 소유자가 아니면 False)"""
+        return self._finish(ticket, DONE, result=result)
+
+    def fail(self, ticket, error, retry=True):
+        """처리 실패 → 재시도 가능하면 pending, 아니면 failed (lease 소유자가 아니면 False)"""
+        return self._finish(ticket, PENDING if retry else FAILED, error=str(error))
+
+    def _finish(self, ticket, state, result=None, error=None):
+        ticket_id = ticket['ticket_id']
+        lock_path, data = self._acquire(ticket_id)
+        if lock_path is None:
+            logger.warning(f"Flag 티켓이 claimed 상태가 아님 (lease 만료?): {ticket_id}")
+            return False
+        if not self._owns(data, ticket):
+            self._release(lock_path, ticket_id)
+            logger.warning(f"Flag 티켓 lease 소유자 아님: {ticket_id} "
+                           f"(요청 {(ticket.get('lease') or {}).get('consumer')}, "
+                           f"현재 {(data.get('lease') or {}).get('consumer')})")
+            return False
+        # 재시도 여부는 현재 티켓의 시도 횟수로 판단
+        if state == PENDING and data.get('attempts', 0) >= self.max_attempts:
+            state = FAILED
+        consumer = data.pop('lease', {}).get('consumer')
+        data.update(consumer=consumer, finished=_now())
+        if result is not None:
+            data['result'] = result
+        if error is not None:
+            data['error'] = error
+        self._release(lock_path, ticket_id, state, data)
+        logger.info(f"Flag 티켓 {state}: {ticket_id} ({consumer})")
+        self._report(data, state)
+        return True
+
+    # ----- 생산자 회수 (bids_app) -------------------------------------------
+    def withdraw(self, ticket_id, error):
+        """작업 실패로 티켓이 가리키는 파일을 삭제할 때 티켓 회수 → failed
+
+        pending이면 바로, claimed이면 lease를 지우고 failed로 옮긴다 (처리 중인 소비자의 renew / complete / fail은
+        claimed 상태가 아니므로 거부됨).
+
+        Returns:
+            bool: 회수 여부 (이미 done / failed이거나 티켓이 없으면 False)
+        """
+        lock_path = self._lock_path(ticket_id)
+        try:
+            os.rename(self._path(PENDING, ticket_id), lock_path)
+            os.utime(lock_path)
+            ticket = _read_json(lock_path)
+        except FileNotFoundError:
+            lock_path, ticket = self._acquire(ticket_id)
+            if lock_path is None:
+                return False
+        lease = ticket.pop('lease', None)
+        if lease:
+            ticket['last_consumer'] = lease.get('consumer')
+        ticket.update(error=error, finished=_now())
+        self._release(lock_path, ticket_id, FAILED, ticket)
+        logger.warning(f"Flag 티켓 회수 → {FAILED}: {ticket_id} ({error})")
+        self._report(ticket, FAILED)
+        return True
+
+    def _report(self, ticket, state):
+        """작업 trace에 티켓 상태 보고 (trace가 아직 없으면 작업이 trace 생성 시 반영)"""
+        trace_path = ticket.get('trace')
+        if not trace_path:
+            return
+        record = {'status': state}
+        for key in ('consumer', 'finished', 'result', 'error', 'attempts'):
+            if key in ticket:
+                record[key] = ticket[key]
+        try:
+            update_trace(trace_path, ticket['ticket_id'], record)
+        except OSError as e:
+            logger.warning(f"trace 보고 실패: {trace_path} ({e})")
+
+
+# ===== 작업 쪽 인계 =========================================================
+class FlagDispatcher:
+    """활성화된 flag마다 시리즈 단위 티켓을 후처리 서비스 대기열에 기록
+
+    scratch 작업이면 티켓이 NAS 경로를 가리켜야 하므로
+    - publish가 있으면 시리즈마다 publish(nifti_path, entry)로 그 시리즈 파일을 NAS에 먼저 게시하고 바로 기록
+    - defer=True이고 publish가 없으면 NAS 게시 전까지 기록을 미루고 flush()에서 NAS 경로로 기록한다.
+    """
+
+    def __init__(self, dirs, enabled, job_id, trace_path, defer=False, publish=None):
+        self.job_id = job_id
+        self.trace_path = trace_path
+        self.defer = defer
+        self.publish = publish
+        self.enabled = []
+        for process, options in enabled:
+            if process in dirs:
+                self.enabled.append((process, options))
+            else:
+                logger.warning(f"알 수 없는 flag process (인계 생략): {process}")
+        self._queues = {process: TicketQueue(dirs[process]) for process, _ in self.enabled}
+        self._lock = threading.Lock()
+        self._deferred = []
+        self.tickets = {}       # ticket_id -> trace 기록 (step7_flags.tickets)
+
+    def series_ready(self, nifti_path, entry):
+        """시리즈 하나의 후처리 완료 (SeriesPostProcessor on_ready 콜백)"""
+        if not self.enabled:
+            return
+        if self.defer and self.publish is not None:
+            nifti_path, entry = self.publish(nifti_path, entry)
+        elif self.defer:
+            with self._lock:
+                self._deferred.append((nifti_path, entry))
+            return
+        self._dispatch(nifti_path, entry)
+
+    def _ticket_id(self, process, nifti_path):
+        series_id = hashlib.sha1(nifti_path.encode('utf-8')).hexdigest()[:12]
+        return f"{self.job_id}_{process}_{series_id}"
+
+    def ticket_refs(self, nifti_path):
+        """시리즈(NIfTI 경로)에 기록될 티켓 [(인계 디렉토리, ticket_id), ...] (작업 실패 시 withdraw_tickets로 회수)"""
+        return [(self._queues[process].directory, self._ticket_id(process, nifti_path))
+                for process, _ in self.enabled]
+
+    def _dispatch(self, nifti_path, entry):
+        for process, options in self.enabled:
+            ticket = self._queues[process].put({
+                'ticket_id': self._ticket_id(process, nifti_path),
+                'job_id': self.job_id,
+                'trace': self.trace_path,
+                'process': process,
+                'options': options,
+                'nifti': [nifti_path],
+                'sidecar': entry.get('sidecar_json'),
+                'byproduct': entry.get('byproduct', {}),
+                'source': entry.get('source', ''),
+                'created': _now(),
+            })
+            with self._lock:
+                self.tickets[ticket['ticket_id']] = {
+                    'process': process, 'nifti': nifti_path, 'queue': ticket['queue'], 'status': PENDING,
+                }
+            logger.info(f"Flag 티켓 등록: {process} ← {os.path.basename(nifti_path)} ({ticket['ticket_id']})")
+
+    def flush(self, rebase=None):
+        """미뤄 둔 티켓 기록 (rebase: 경로 변환 함수, scratch → NAS)"""
+        with self._lock:
+            deferred, self._deferred = self._deferred, []
+        for nifti_path, entry in deferred:
+            if rebase is not None:
+                nifti_path, entry = rebase(nifti_path), rebase(entry)
+            self._dispatch(nifti_path, entry)
+        self.defer = False
+
+    def summary(self):
+        """trace의 step7_flags 항목"""
+        with self._lock:
+            return {
+                'processes': [process for process, _ in self.enabled],
+                'tickets': {ticket_id: dict(info) for ticket_id, info in self.tickets.items()},
+            }
+
+
+def withdraw_tickets(refs, error):
+    """[(인계 디렉토리, ticket_id), ...] 티켓 회수 (하나가 실패해도 나머지는 계속)
+
+    Returns:
+        int: 회수한 티켓 수
+    """
+    withdrawn = 0
+    for directory, ticket_id in refs:
+        try:
+            withdrawn += TicketQueue(directory).withdraw(ticket_id, error)
+        except (OSError, ValueError) as e:
+            logger.error(f"Flag 티켓 회수 실패: {ticket_id} ({e})")
+    return withdrawn
+
+
+# ===== 소비자 CLI ===========================================================
+def _cli(argv=None):
+    """후처리 컨테이너용 티켓 처리 명령
+
+    python -m process.components.flags claim    <dir> [--consumer ID] [--lease SEC]
+    python -m process.components.flags renew    <dir> <ticket_id> --consumer ID [--claim-id ID] [--lease SEC]
+    python -m process.components.flags complete <dir> <ticket_id> --consumer ID [--claim-id ID] [--result JSON]
+    python -m process.components.flags fail     <dir> <ticket_id> --consumer ID [--claim-id ID] --error MSG [--no-retry]
+    claim은 티켓 JSON(lease.consumer / lease.claim_id 포함)을 출력하고, 티켓이 없으면 종료 코드 3
+    renew / complete / fail은 lease가 --consumer(와 --claim-id)의 것이 아니면 종료 코드 1
+    """
+    parser = argparse.ArgumentParser(prog="python -m process.components.flags")
+    parser.add_argument('command', choices=('claim', 'renew', 'complete', 'fail'))
+    parser.add_argument('directory')
+    parser.add_argument('ticket_id', nargs='?')
+    parser.add_argument('--consumer', help="소비자 ID (renew / complete / fail은 필수 - claim한 소비자만 처리 가능)")
+    parser.add_argument('--claim-id', help="claim 결과의 lease.claim_id (지정하면 같은 claim인지도 확인)")
+    parser.add_argument('--lease', type=int, default=DEFAULT_LEASE_SECONDS)
+    parser.add_argument('--result', help="완료 결과 (JSON)")
+    parser.add_argument('--error')
+    parser.add_argument('--no-retry', action='store_true')
+    args = parser.parse_args(argv)
+
+    queue = TicketQueue(args.directory, lease_seconds=args.lease)
+    if args.command == 'claim':
+        ticket = queue.claim(args.consumer)
+        if ticket is None:
+            return 3
+        print(json.dumps(ticket, ensure_ascii=False))
+        return 0
+    if not args.ticket_id:
+        parser.error("ticket_id가 필요합니다")
+    if not args.consumer:
+        parser.error(f"{args.command}에는 --consumer가 필요합니다")
+    ticket = {'ticket_id': args.ticket_id, 'lease': {'consumer': args.consumer, 'claim_id': args.claim_id}}
+    if args.command == 'renew':
+        ok = queue.renew(ticket)
+    elif args.command == 'complete':
+        ok = queue.complete(ticket, json.loads(args.result) if args.result else None)
+    else:
+        ok = queue.fail(ticket, args.error or "failed", retry=not args.no_retry)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(_cli())
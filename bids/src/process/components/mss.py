@@ -4,6 +4,7 @@ import json
 import logging
 from pathlib import Path
 from utils.common import bdsp_path_maker
+from utils import stages
 
 logger = logging.getLogger(__name__)
 
@@ -163,35 +164,28 @@ def _count_directories(structure):
                 count += 1 + _count_directories(value)
     return count
 
+def mss_path_for(structured_config, working_dir):
+    """MSS 경로: working_dir/system_id/project_code/project_seq/org_id/category/body_part/domain"""
+    request = structured_config['request']
+    return os.path.join(
+        working_dir,
+        request['systemId'],
+        request['projectCode'],
+        request['projectSeq'],
+        request['orgId'],
+        request['category'],
+        request['bodyPart'],
+        request['domain']
+    )
+
+@stages.stage(stages.IO)
 def create_mss_structure(structured_config, global_vars):
     """Step 1: Medical Information System Structure 생성"""
     logger.info("Step1: MSS 구조 생성 시작")
     
     try:
-        # request 딕셔너리에서 필요한 entity들 추출
-        request = structured_config['request']
-        working_dir = global_vars['working_dir']
-        
-        # Entity 변수들 선언
-        system_id = request['systemId']
-        project_code = request['projectCode']
-        project_seq = request['projectSeq']
-        org_id = request['orgId']
-        category = request['category']
-        body_part = request['bodyPart']  
-        domain = request['domain']
-        
         # MSS 경로 구성: working_dir/system_id/project_code/project_seq/org_id/category/body_part/domain
-        mss_path = os.path.join(
-            working_dir,
-            system_id,
-            project_code,
-            project_seq,
-            org_id,
-            category,
-            body_part,
-            domain
-        )
+        mss_path = mss_path_for(structured_config, global_vars['working_dir'])
         
         # MSS 경로가 이미 존재하는지 확인
         mss_exists = os.path.exists(mss_path)
@@ -1,12 +1,30 @@
 import os
 import shutil
+import fnmatch
 import logging
 import zipfile
 from pathlib import Path
-from utils import common
+from utils import cancel, common, metrics, progress, stages
 
 logger = logging.getLogger(__name__)
 
+# 시스템에서 자동으로 생성되는 불필요한 파일/폴더 패턴
+UNWANTED_PATTERNS = [
+    '.DS_Store',      # macOS 폴더 설정
+    '._*',            # macOS 리소스 포크 파일
+    '__MACOSX',       # macOS zip 메타데이터 폴더
+    '.localized',     # macOS 현지화 파일
+    'Thumbs.db',      # Windows 썸네일 캐시
+    'desktop.ini',    # Windows 폴더 설정
+    '~$*',            # Office 임시 잠금 파일
+    '*.tmp'           # 임시 파일
+]
+
+def is_system_member(member_name):
+    """zip 멤버 경로의 어느 구성 요소라도 불필요한 시스템 파일/폴더 패턴에 해당하는지 확인"""
+    parts = [part for part in member_name.replace('\\', '/').split('/') if part]
+    return any(fnmatch.fnmatch(part, pattern) for part in parts for pattern in UNWANTED_PATTERNS)
+
 def clean_system_files(directory):
     """
     시스템에서 자동으로 생성되는 불필요한 파일들 제거
@@ -14,32 +32,21 @@ def clean_system_files(directory):
     Args:
         directory: 정리할 디렉토리 경로
     """
-    unwanted_patterns = [
-        '.DS_Store',      # macOS 폴더 설정
-        '._*',            # macOS 리소스 포크 파일
-        '__MACOSX',       # macOS zip 메타데이터 폴더
-        '.localized',     # macOS 현지화 파일
-        'Thumbs.db',      # Windows 썸네일 캐시
-        'desktop.ini',    # Windows 폴더 설정
-        '~$*',            # Office 임시 잠금 파일
-        '*.tmp'           # 임시 파일
-    ]
-    
     removed_count = 0
     directory_path = Path(directory)
     
-    for pattern in unwanted_patterns:
+    for pattern in UNWANTED_PATTERNS:
         try:
             # glob으로 패턴에 맞는 파일/폴더 찾기
             for item in directory_path.rglob(pattern):
                 try:
                     if item.is_file():
                         item.unlink()
-                        print(f"  불필요한 파일 제거: {item.relative_to(directory_path)}")
+                        logger.debug(f"불필요한 파일 제거: {item.relative_to(directory_path)}")
                         removed_count += 1
                     elif item.is_dir():
                         shutil.rmtree(item)
-                        print(f"  불필요한 폴더 제거: {item.relative_to(directory_path)}")
+                        logger.debug(f"불필요한 폴더 제거: {item.relative_to(directory_path)}")
                         removed_count += 1
                 except Exception as e:
                     logger.warning(f"파일 제거 실패: {item} - {e}")
@@ -47,11 +54,41 @@ def clean_system_files(directory):
             logger.warning(f"패턴 '{pattern}' 검색 실패: {e}")
     
     if removed_count > 0:
-        print(f"총 {removed_count}개의 불필요한 파일/폴더가 제거되었습니다.")
+        logger.info(f"총 {removed_count}개의 불필요한 파일/폴더가 제거되었습니다.")
     else:
-        print("제거할 불필요한 파일이 없습니다.")
+        logger.debug("제거할 불필요한 파일이 없습니다.")
+
+def count_members(zip_files):
+    """압축 해제할 파일 수 (시스템 파일 제외, 읽을 수 없는 zip은 0 - 진행률 표시용)"""
+    total = 0
+    for zip_file in zip_files:
+        try:
+            with zipfile.ZipFile(str(zip_file), 'r') as zip_ref:
+                total += sum(1 for info in zip_ref.infolist()
+                             if not info.is_dir() and not is_system_member(info.filename))
+        except (zipfile.BadZipFile, OSError):
+            continue
+    return total
+
+def extract_members(zip_ref, unzip_folder, on_member):
+    """zip 멤버를 하나씩 풀고 풀린 파일 경로를 on_member로 바로 전달 (스트리밍 모드)
 
-def create_origin_path(structured_config, global_vars, mss_path):
+    시스템 파일은 풀지 않으므로 on_member에 전달되지 않는다.
+
+    Returns:
+        int: 풀린 파일 수
+    """
+    count = 0
+    for info in zip_ref.infolist():
+        if info.is_dir() or is_system_member(info.filename):
+            continue
+        cancel.check()
+        on_member(zip_ref.extract(info, str(unzip_folder)))
+        count += 1
+    return count
+
+@stages.stage(stages.IO)
+def create_origin_path(structured_config, global_vars, mss_path, on_member=None):
     """
     Origin 경로 생성 및 zip 파일 처리
     
@@ -59,6 +96,7 @@ def create_origin_path(structured_config, global_vars, mss_path):
         structured_config: 구조화된 설정 정보
         global_vars: 전역 변수 딕셔너리
         mss_path: MSS 기본 경로
+        on_member: 압축 해제된 파일 경로를 받는 콜백 (지정하면 멤버 단위로 풀면서 바로 전달)
     
     Returns:
         str: 생성된 origin 경로
@@ -76,7 +114,7 @@ def create_origin_path(structured_config, global_vars, mss_path):
         if not user or not upload_time:
             raise ValueError("User 또는 UploadTime 정보가 없습니다")
         
-        print(f"User: {user}, UploadTime: {upload_time}")
+        logger.debug(f"User: {user}, UploadTime: {upload_time}")
         
         # 2. upload_dir/user/upload_time 하위의 모든 파일 찾기 및 zip 파일 체크
         src_dir = Path(upload_dir) / user / subject_id / upload_time
@@ -98,16 +136,28 @@ def create_origin_path(structured_config, global_vars, mss_path):
             logger.error(f"빈 폴더입니다: {src_dir}")
             raise FileNotFoundError(f"빈 폴더입니다: {src_dir}")
         
-        print(f"{len(zip_files)}개의 zip 파일 발견:")
+        logger.info(f"{len(zip_files)}개의 zip 파일 발견")
         for zip_file in zip_files:
-            print(f"  - {zip_file.name}")
+            logger.debug(f"zip 파일: {zip_file.name}")
+        
+        # 진행률 기준값 (업로드 크기는 ETA 추정에도 사용)
+        files_total = count_members(zip_files)
+        extracted = 0
+        progress.report(upload_bytes=sum(zip_file.stat().st_size for zip_file in zip_files),
+                        files_total=files_total, files_extracted=0)
+        
+        def _on_member(path):
+            nonlocal extracted
+            extracted += 1
+            progress.report(files_extracted=extracted)
+            on_member(path)
         
         # 4. originpath 생성: mss_path/origin/user/upload_time
         origin_path = Path(mss_path) / "origin" / user / upload_time
         
         # 디렉토리 생성
         origin_path.mkdir(parents=True, exist_ok=True)
-        print(f"Origin 경로 생성: {origin_path}")
+        logger.info(f"Origin 경로 생성: {origin_path}")
         
         # 5. zip 폴더와 unzip 폴더 생성
         zip_folder = origin_path / "zip"
@@ -116,25 +166,34 @@ def create_origin_path(structured_config, global_vars, mss_path):
         zip_folder.mkdir(exist_ok=True)
         unzip_folder.mkdir(exist_ok=True)
         
-        print(f"  - zip 폴더: {zip_folder}")
-        print(f"  - unzip 폴더: {unzip_folder}")
+        logger.debug(f"zip 폴더: {zip_folder}")
+        logger.debug(f"unzip 폴더: {unzip_folder}")
         
         # 6. zip 파일들을 zip 폴더로 복사 및 압축 해제
         for zip_file in zip_files:
+            cancel.check()
             destination = zip_folder / zip_file.name
             
             try:
                 # zip 파일을 zip 폴더로 복사 (원본 유지)
                 shutil.copy2(str(zip_file), str(destination))
-                print(f"파일 복사: {zip_file.name} -> {zip_folder}")
+                metrics.BYTES_INGESTED.inc(destination.stat().st_size)
+                logger.debug(f"파일 복사: {zip_file.name} -> {zip_folder}")
                 
                 # zip 파일을 unzip 폴더로 압축 해제
                 with zipfile.ZipFile(str(destination), 'r') as zip_ref:
-                    zip_ref.extractall(str(unzip_folder))
-                    print(f"압축 해제: {zip_file.name} -> {unzip_folder}")
+                    if on_member is None:
+                        zip_ref.extractall(str(unzip_folder))
+                        extracted += sum(1 for info in zip_ref.infolist()
+                                         if not info.is_dir() and not is_system_member(info.filename))
+                        progress.report(files_extracted=extracted)
+                        logger.debug(f"압축 해제: {zip_file.name} -> {unzip_folder}")
+                    else:
+                        count = extract_members(zip_ref, unzip_folder, _on_member)
+                        logger.debug(f"압축 해제 (스트리밍, {count}개): {zip_file.name} -> {unzip_folder}")
                 
                 # 압축 해제 직후 불필요한 시스템 파일들 제거
-                print(f"시스템 파일 정리 중...")
+                logger.debug("시스템 파일 정리 중...")
                 clean_system_files(str(unzip_folder))
                 
             except zipfile.BadZipFile as e:
@@ -149,18 +208,18 @@ def create_origin_path(structured_config, global_vars, mss_path):
             # zip 폴더 스캔 (zip 폴더 하위에 bdsp_file_list.json 생성)
             zip_list_file = zip_folder / "bdsp_file_list.json"
             common.bdsp_walk(str(zip_folder), str(zip_list_file))
-            print(f"zip 폴더 파일 리스트 생성: {zip_list_file}")
+            logger.info(f"zip 폴더 파일 리스트 생성: {zip_list_file}")
             
             # unzip 폴더 스캔 (unzip 폴더 하위에 bdsp_file_list.json 생성)
             unzip_list_file = unzip_folder / "bdsp_file_list.json"
             common.bdsp_walk(str(unzip_folder), str(unzip_list_file))
-            print(f"unzip 폴더 파일 리스트 생성: {unzip_list_file}")
+            logger.info(f"unzip 폴더 파일 리스트 생성: {unzip_list_file}")
             
         except Exception as e:
             logger.error(f"파일 리스트 생성 실패: {e}")
             raise Exception(f"파일 리스트 생성 실패: {e}")
         
-        print(f"Origin 경로 생성 완료: zip 파일 처리 및 파일 리스트 생성됨")
+        logger.info(f"Origin 경로 생성 완료: zip 파일 처리 및 파일 리스트 생성됨")
         logger.info("Step 2 origin path making 완료")
         
         return str(origin_path)
@@ -0,0 +1,418 @@
+#/BDSP/bids_app/src/process/components/staging.py
+import os
+import json
+import shutil
+import socket
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from process.components import flags
+from utils.common import atomic_write, bdsp_walk, write_json_atomic
+from utils.file_index import FILE_LIST_NAME
+from utils import stages
+
+logger = logging.getLogger(__name__)
+
+# NAS(WORKING_DIR) 쪽 게시 준비 디렉토리 (최종 경로와 같은 파일시스템이어야 rename이 원자적)
+PUBLISH_DIRNAME = ".bdsp_publish"
+
+# scratch에서 작업 후 NAS로 게시하는 MSS 하위 트리
+PUBLISH_SUBTREES = ("origin", "sourcedata", "rawdata")
+
+# 게시 시 경로 문자열을 재작성하는 파일 (내용에 절대 경로 포함)
+_REWRITE_FILENAMES = ("bdsp_file_list.json",)
+
+# 작업 디렉토리(scratch/<job_id>, .bdsp_publish/<job_id>)를 만든 프로세스 기록
+# cleanup_stale은 이 표시가 있고 만든 프로세스가 종료된 디렉토리만 정리 (변환 캐시 등 다른 디렉토리는 건드리지 않음)
+OWNER_FILENAME = ".bdsp_owner"
+
+# 게시(rename) 중인 작업 표시: MSS state/publishing/<job_id>.json (rawdata를 읽는 도구는 게시가 끝날 때까지 건너뜀)
+PUBLISHING_DIRNAME = "publishing"
+
+
+def _process_identity(pid):
+    """pid 재사용과 구분하기 위한 프로세스 식별자 (부팅 ID + 프로세스 시작 시각, 알 수 없으면 None)"""
+    try:
+        with open('/proc/sys/kernel/random/boot_id', 'r') as f:
+            boot_id = f.read().strip()
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            # comm(2번째 필드)에 공백이 있을 수 있으므로 마지막 ')' 뒤에서 필드 분리 (starttime은 22번째 필드)
+            fields = f.read().rsplit(')', 1)[1].split()
+        return f"{boot_id}:{fields[19]}"
+    except (OSError, IndexError):
+        return None
+
+
+def _write_owner(job_root, **extra):
+    """작업 디렉토리에 소유 프로세스 표시 기록 (임시 파일 후 교체)"""
+    owner = {
+        'host': socket.gethostname(),
+        'pid': os.getpid(),
+        'identity': _process_identity(os.getpid()),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        **extra
+    }
+    write_json_atomic(Path(job_root) / OWNER_FILENAME, owner)
+
+
+def _read_owner(job_root):
+    try:
+        with open(Path(job_root) / OWNER_FILENAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _owner_alive(owner):
+    """표시를 남긴 프로세스가 아직 실행 중인지 (다른 호스트의 프로세스는 확인할 수 없으므로 실행 중으로 간주)"""
+    if owner.get('host') != socket.gethostname():
+        return True
+    pid = owner.get('pid')
+    if not isinstance(pid, int):
+        return True
+    identity = _process_identity(pid)
+    if identity is None:
+        return False
+    return owner.get('identity') is None or identity == owner.get('identity')
+
+
+def create_scratch_mss(scratch_dir, working_dir, mss_path, job_id):
+    """
+    로컬 scratch에 MSS와 같은 상대 구조의 작업 경로 생성
+
+    Args:
+        scratch_dir: 로컬 디스크 scratch 루트
+        working_dir: NAS WORKING_DIR
+        mss_path: NAS MSS 경로
+        job_id: 작업 ID (scratch 하위 디렉토리명)
+
+    Returns:
+        str: scratch 쪽 MSS 경로
+    """
+    job_root = Path(scratch_dir) / job_id
+    if job_root.exists():
+        # 이전 실행이 비정상 종료되어 남은 scratch 정리
+        logger.warning(f"이전 scratch 작업 디렉토리 정리: {job_root}")
+        shutil.rmtree(job_root, ignore_errors=True)
+
+    scratch_mss = job_root / os.path.relpath(mss_path, working_dir)
+    scratch_mss.mkdir(parents=True, exist_ok=True)
+    _write_owner(job_root, job_id=job_id)
+    logger.info(f"Scratch 작업 경로 생성: {scratch_mss}")
+    return str(scratch_mss)
+
+
+def remove_scratch(scratch_dir, job_id):
+    """작업이 끝난(성공/실패) scratch 디렉토리 삭제"""
+    job_root = Path(scratch_dir) / job_id
+    if job_root.exists():
+        shutil.rmtree(job_root, ignore_errors=True)
+        logger.info(f"Scratch 작업 디렉토리 삭제: {job_root}")
+
+
+def cleanup_stale(working_dir, scratch_dir=None):
+    """이전 프로세스가 남긴 게시 준비 디렉토리/scratch 정리 (모니터 시작 시 1회)
+
+    소유 표시(.bdsp_owner)가 있고, 표시를 남긴 이 호스트의 프로세스가 종료된 작업 디렉토리만 정리한다.
+    - 표시가 없는 디렉토리(변환 캐시 등)와 실행 중인 다른 프로세스(backfill, 다른 노드)의 디렉토리는 그대로 둔다
+    - rename 단계 중에 중단된 게시 준비 디렉토리는 삭제하지 않고 남은 rename을 마저 수행한다
+    """
+    roots = [Path(working_dir) / PUBLISH_DIRNAME, Path(scratch_dir) if scratch_dir else None]
+    for root in roots:
+        if root is None or not root.is_dir():
+            continue
+        for item in root.iterdir():
+            if item.is_symlink() or not item.is_dir():
+                continue
+            owner = _read_owner(item)
+            if owner is None or _owner_alive(owner):
+                continue
+            if owner.get('marker_mss') and not owner.get('mss_path'):
+                # 시리즈별 게시만 하고 전체 게시 전에 중단됨 - 먼저 게시한 시리즈 파일 삭제 / 티켓 회수
+                logger.warning(f"중단된 작업의 시리즈별 게시 취소: {item}")
+                _rollback_series(owner['marker_mss'], owner.get('job_id') or item.name, "작업 중단 (cleanup_stale)")
+            if owner.get('mss_path'):
+                logger.warning(f"중단된 게시 마무리: {item} -> {owner['mss_path']}")
+                try:
+                    _rename_phase(item, owner['mss_path'], owner.get('job_id') or item.name)
+                except OSError as e:
+                    # 남은 파일은 그대로 두고 다음 시작 때 다시 시도
+                    logger.error(f"중단된 게시 마무리 실패: {item} ({e})")
+                    continue
+            logger.warning(f"미완료 작업 잔여물 정리: {item}")
+            shutil.rmtree(item, ignore_errors=True)
+
+
+def _publishing_marker(mss_path, job_id):
+    return Path(mss_path) / "state" / PUBLISHING_DIRNAME / f"{job_id}.json"
+
+
+def _read_publishing_marker(mss_path, job_id):
+    try:
+        with open(_publishing_marker(mss_path, job_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        return {}
+
+
+def _write_publishing_marker(mss_path, job_id, staging_root, files=(), tickets=()):
+    """게시 중 표시 기록 (files: 시리즈별로 먼저 게시한 NAS 파일, tickets: 그 시리즈의 flag 티켓 [(인계 디렉토리, ticket_id)])"""
+    marker = _publishing_marker(mss_path, job_id)
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    data = _read_publishing_marker(mss_path, job_id) or {
+        'job_id': job_id, 'staging': str(staging_root), 'started': datetime.now().isoformat(timespec='seconds'),
+        'files': [], 'tickets': []}
+    data.setdefault('files', []).extend(files)
+    data.setdefault('tickets', []).extend([list(ref) for ref in tickets])
+    write_json_atomic(marker, data)
+
+
+def clear_publishing(mss_path, job_id):
+    """게시 중 표시 삭제 (작업 실패 / 중단된 작업 정리)"""
+    _publishing_marker(mss_path, job_id).unlink(missing_ok=True)
+
+
+def _remove_published(mss_path, files):
+    """먼저 게시한 시리즈 파일 삭제 - 비게 된 rawdata 하위 폴더는 삭제하고 남은 폴더는 파일 목록 재생성"""
+    rawdata = os.path.join(mss_path, "rawdata")
+    directories = set()
+    for path in files:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        directories.add(os.path.dirname(path))
+    for directory in sorted(directories, key=len, reverse=True):
+        while directory.startswith(rawdata + os.sep) and os.path.isdir(directory):
+            if any(name != FILE_LIST_NAME for name in os.listdir(directory)):
+                bdsp_walk(directory)
+                break
+            shutil.rmtree(directory, ignore_errors=True)
+            directory = os.path.dirname(directory)
+
+
+def _rollback_series(mss_path, job_id, reason):
+    """시리즈별 게시 취소: 게시 중 표시에 기록된 NAS 파일 삭제, flag 티켓 회수(failed), 표시 삭제"""
+    marker = _read_publishing_marker(mss_path, job_id)
+    if marker is None:
+        return
+    withdrawn = flags.withdraw_tickets(marker.get('tickets', []), f"작업 실패로 시리즈 게시 취소: {reason}")
+    _remove_published(mss_path, marker.get('files', []))
+    clear_publishing(mss_path, job_id)
+    logger.warning(f"시리즈별 게시 취소: 파일 {len(marker.get('files', []))}개 삭제, 티켓 {withdrawn}개 회수 ({mss_path})")
+
+
+def abandon_series(mss_path, working_dir, job_id, reason="작업 실패"):
+    """작업이 전체 게시 전에 실패한 경우 시리즈별로 먼저 게시한 파일 / 티켓을 취소하고 준비 디렉토리 정리
+
+    게시 중 표시가 없으면(시리즈별 게시 없음 / 전체 게시 완료) 아무것도 하지 않고, 전체 게시의 rename 단계가
+    시작된 경우(소유 표시에 mss_path 기록)는 cleanup_stale이 마저 게시하므로 그대로 둔다.
+    """
+    if _read_publishing_marker(mss_path, job_id) is None:
+        return
+    staging_root = Path(working_dir) / PUBLISH_DIRNAME / job_id
+    if (_read_owner(staging_root) or {}).get('mss_path'):
+        return
+    _rollback_series(mss_path, job_id, reason)
+    shutil.rmtree(staging_root, ignore_errors=True)
+
+
+def publishing_jobs(mss_path):
+    """MSS에 게시(rename) 중인 작업 ID 목록 (비어 있으면 rawdata가 완결된 상태)"""
+    marker_dir = Path(mss_path) / "state" / PUBLISHING_DIRNAME
+    try:
+        return sorted(entry.name[:-len(".json")] for entry in os.scandir(marker_dir) if entry.name.endswith(".json"))
+    except FileNotFoundError:
+        return []
+
+
+def rebase_paths(obj, old_prefix, new_prefix):
+    """dict/list 안의 모든 문자열(키 포함)에 들어있는 old_prefix 경로를 new_prefix로 교체
+       (경고 메시지처럼 문자열 중간에 포함된 경로도 교체)"""
+    if isinstance(obj, dict):
+        return {rebase_paths(k, old_prefix, new_prefix): rebase_paths(v, old_prefix, new_prefix)
+                for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [rebase_paths(item, old_prefix, new_prefix) for item in obj]
+    if isinstance(obj, str):
+        return obj.replace(old_prefix, new_prefix)
+    return obj
+
+
+def _copy_tree(src_dir, dst_dir, old_prefix, new_prefix):
+    """scratch 트리를 NAS 게시 준비 디렉토리로 복사 (파일 단위 순차 대용량 복사)
+
+    Returns:
+        tuple: (파일 수, 바이트 수)
+    """
+    file_count = 0
+    byte_count = 0
+    for root, dirs, files in os.walk(src_dir):
+        target_root = os.path.join(dst_dir, os.path.relpath(root, src_dir))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            src = os.path.join(root, name)
+            dst = os.path.join(target_root, name)
+            if name in _REWRITE_FILENAMES:
+                with open(src, 'r', encoding='utf-8') as f:
+                    content = f.read().replace(old_prefix, new_prefix)
+                with open(dst, 'w', encoding='utf-8') as f:
+                    f.write(content)
+            else:
+                # copyfile은 Linux에서 sendfile로 커널 내 순차 복사
+                shutil.copyfile(src, dst)
+            shutil.copystat(src, dst)
+            file_count += 1
+            byte_count += os.path.getsize(dst)
+    return file_count, byte_count
+
+
+def _merge_rename(src_dir, dst_dir):
+    """게시 준비 트리를 최종 경로로 rename
+
+    최종 경로에 없는 디렉토리는 통째로 한 번에 rename(원자적)하고,
+    이미 있는 디렉토리(예: 기존 subject/session)만 내려가며 파일 단위로 교체한다.
+    """
+    dst_dir.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.rename(src_dir, dst_dir)
+        return
+    except OSError:
+        if not dst_dir.is_dir():
+            raise
+
+    for entry in os.scandir(src_dir):
+        target = dst_dir / entry.name
+        if entry.is_dir(follow_symlinks=False):
+            _merge_rename(Path(entry.path), target)
+        else:
+            os.replace(entry.path, target)
+
+    # 기존 디렉토리에 합쳐진 경우 파일 목록은 기존 파일까지 포함하도록 다시 생성
+    if (dst_dir / "bdsp_file_list.json").exists():
+        bdsp_walk(str(dst_dir))
+
+
+def _rename_phase(staging_root, mss_path, job_id):
+    """게시 준비 트리를 MSS로 rename하고 게시 중 표시 삭제
+
+    준비 디렉토리의 소유 표시에 mss_path가 기록된 뒤에만 호출되므로, 중간에 중단되어도
+    cleanup_stale이 같은 함수로 남은 rename을 마저 수행한다 (이미 옮긴 항목은 준비 트리에 없음).
+    """
+    for subtree in PUBLISH_SUBTREES:
+        src = Path(staging_root) / subtree
+        if src.exists():
+            _merge_rename(src, Path(mss_path) / subtree)
+    clear_publishing(mss_path, job_id)
+
+
+@stages.stage(stages.IO)
+def publish(scratch_mss, mss_path, working_dir, job_id):
+    """
+    scratch의 origin/sourcedata/rawdata를 NAS MSS로 게시
+
+    1) 복사 단계: NAS의 게시 준비 디렉토리(.bdsp_publish/<job_id>)로 대용량 순차 복사
+       - 실패 시 준비 디렉토리만 삭제하므로 MSS에는 아무것도 남지 않음
+    2) rename 단계: 같은 파일시스템 안에서 최종 경로로 rename (메타데이터 연산만 수행)
+       - 시작 전에 준비 디렉토리 소유 표시에 mss_path를, MSS state/publishing/에 게시 중 표시를 기록
+       - 기존 디렉토리에 합칠 때는 파일 단위 rename이므로, 중단되면 모니터 재시작 시 cleanup_stale이 마저 게시
+
+    Args:
+        scratch_mss: scratch 쪽 MSS 경로
+        mss_path: NAS MSS 경로
+        working_dir: NAS WORKING_DIR
+        job_id: 작업 ID
+
+    Returns:
+        dict: {'files': 게시한 파일 수, 'bytes': 게시한 바이트 수} (publish_series로 먼저 게시한 파일 제외)
+    """
+    logger.info(f"Publish 시작: {scratch_mss} -> {mss_path}")
+    staging_root = Path(working_dir) / PUBLISH_DIRNAME / job_id
+    if staging_root.exists():
+        shutil.rmtree(staging_root)
+    staging_root.mkdir(parents=True)
+    # 시리즈별로 먼저 게시한 작업이면 중단 시 게시 중 표시를 지우도록 기록
+    early = {'marker_mss': mss_path} if _publishing_marker(mss_path, job_id).exists() else {}
+    _write_owner(staging_root, job_id=job_id, **early)
+
+    try:
+        total_files = 0
+        total_bytes = 0
+        for subtree in PUBLISH_SUBTREES:
+            src = Path(scratch_mss) / subtree
+            if not src.exists():
+                continue
+            files, size = _copy_tree(str(src), str(staging_root / subtree), scratch_mss, mss_path)
+            total_files += files
+            total_bytes += size
+        logger.info(f"Publish 복사 완료: {total_files}개 파일, {total_bytes} bytes -> {staging_root}")
+    except Exception as e:
+        logger.error(f"Publish 복사 실패, 준비 디렉토리 삭제: {e}")
+        shutil.rmtree(staging_root, ignore_errors=True)
+        raise
+
+    # 소유 표시를 먼저 갱신해야 게시 중 표시만 남고 마무리되지 않는 경우가 없음
+    _write_owner(staging_root, job_id=job_id, mss_path=mss_path)
+    _write_publishing_marker(mss_path, job_id, staging_root)
+    _rename_phase(staging_root, mss_path, job_id)
+
+    shutil.rmtree(staging_root, ignore_errors=True)
+    logger.info(f"Publish 완료: {mss_path}")
+    return {'files': total_files, 'bytes': total_bytes}
+
+
+# 시리즈별 게시의 준비 디렉토리 / 게시 중 표시 생성 직렬화 (시리즈 후처리 스레드에서 동시에 호출)
+_series_lock = threading.Lock()
+
+
+@stages.stage(stages.IO)
+def publish_series(scratch_mss, mss_path, working_dir, job_id, files, tickets=()):
+    """
+    시리즈 하나의 결과 파일(NIfTI / sidecar / 부산물 / 썸네일)을 전체 게시 전에 NAS MSS로 먼저 게시 (flag 인계용)
+
+    - 파일마다 같은 폴더의 임시 이름으로 복사한 뒤 rename하므로 후처리 서비스가 쓰는 중인 파일을 읽지 않음
+    - 게시한 파일은 scratch에서 삭제하여 전체 게시(publish)에서 다시 복사하지 않음
+    - 첫 호출에서 MSS state/publishing/ 표시를 남기므로 전체 게시가 끝날 때까지 rawdata를 읽는 도구는 건너뜀
+    - 복사 전에 게시할 NAS 파일과 티켓을 표시에 기록하므로, 전체 게시 전에 작업이 실패하거나 중단되면
+      abandon_series / cleanup_stale이 게시한 파일을 삭제하고 티켓을 회수한다
+
+    Args:
+        scratch_mss: scratch 쪽 MSS 경로
+        mss_path: NAS MSS 경로
+        working_dir: NAS WORKING_DIR
+        job_id: 작업 ID
+        files: scratch 쪽 파일 경로 목록
+        tickets: 이 시리즈의 flag 티켓 [(인계 디렉토리, ticket_id)] (게시 후 기록됨)
+
+    Returns:
+        dict: {'files': 게시한 파일 수, 'bytes': 게시한 바이트 수}
+    """
+    files = [src for src in files if src.startswith(scratch_mss + os.sep) and os.path.isfile(src)]
+    with _series_lock:
+        staging_root = Path(working_dir) / PUBLISH_DIRNAME / job_id
+        if not _publishing_marker(mss_path, job_id).exists():
+            staging_root.mkdir(parents=True, exist_ok=True)
+            _write_owner(staging_root, job_id=job_id, marker_mss=mss_path)
+        _write_publishing_marker(mss_path, job_id, staging_root,
+                                 files=[mss_path + src[len(scratch_mss):] for src in files], tickets=tickets)
+
+    file_count = 0
+    byte_count = 0
+    for src in files:
+        dst = mss_path + src[len(scratch_mss):]
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        with open(src, 'rb') as f_in, atomic_write(dst, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+            f_out.flush()
+            shutil.copystat(src, f_out.name)
+        file_count += 1
+        byte_count += os.path.getsize(dst)
+        os.remove(src)
+    for directory in sorted({os.path.dirname(mss_path + src[len(scratch_mss):]) for src in files}):
+        if os.path.isdir(directory):
+            bdsp_walk(directory)
+    logger.info(f"시리즈 게시: {file_count}개 파일, {byte_count} bytes -> {mss_path}")
+    return {'files': file_count, 'bytes': byte_count}
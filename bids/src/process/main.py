@@ -3,14 +3,12 @@ import json
 import logging
 import os
 from pathlib import Path
-from process.components import mss, origin, export
-from utils import common
+from process.components import mss, origin, export, staging, flags
+from process.components.domain.mri.source import header_index
+from utils import cancel, common, metrics, log
 
 logger = logging.getLogger(__name__)
 
-# 전역 변수를 저장할 딕셔너리
-global_vars = {}
-
 def __init__():
     """초기화 함수"""
     logger.info("Process module initialized")
@@ -57,28 +55,28 @@ def validate_and_initialize_config(config):
         # 선택적 필드 초기화
         if 'domain' not in config or not config['domain']:
             config['domain'] = "DATA"
-            print("Domain 필드를 기본값으로 초기화")
+            logger.debug("Domain 필드를 기본값으로 초기화")
         
         # bodyPart 필드 초기화 (기본값: BRAIN)
         if 'bodyPart' not in config or not config['bodyPart']:
             config['bodyPart'] = "BRAIN"
-            print("BodyPart 필드를 기본값으로 초기화: BRAIN")
+            logger.debug("BodyPart 필드를 기본값으로 초기화: BRAIN")
         else:
-            print(f"Body Part: {config['bodyPart']}")
+            logger.debug(f"Body Part: {config['bodyPart']}")
         
         # category 필드 초기화 (기본값: IMAGE)
         if 'category' not in config or not config['category']:
             config['category'] = "IMAGE"
-            print("Category 필드를 기본값으로 초기화: IMAGE")
+            logger.debug("Category 필드를 기본값으로 초기화: IMAGE")
         else:
-            print(f"Category: {config['category']}")
+            logger.debug(f"Category: {config['category']}")
         
         # public 필드 초기화 (기본값: False)
         if 'public' not in config or config['public'] is None:
             config['public'] = False
-            print("Public 필드를 기본값으로 초기화: False")
+            logger.debug("Public 필드를 기본값으로 초기화: False")
         else:
-            print(f"Public: {config['public']}")
+            logger.debug(f"Public: {config['public']}")
         
         # task 필드 초기화 (기본값: isFunc: False, option: "")
         if 'task' not in config:
@@ -86,7 +84,7 @@ def validate_and_initialize_config(config):
                 "isFunc": False,
                 "option": ""
             }
-            print("Task 설정을 기본값으로 초기화")
+            logger.debug("Task 설정을 기본값으로 초기화")
         else:
             # task 필드 검증
             task = config['task']
@@ -94,14 +92,14 @@ def validate_and_initialize_config(config):
                 task['isFunc'] = False
             if 'option' not in task:
                 task['option'] = ""
-            print(f"Task 설정 검증 완료 - isFunc: {task['isFunc']}")
+            logger.debug(f"Task 설정 검증 완료 - isFunc: {task['isFunc']}")
         
         if 'flag' not in config:
             config['flag'] = []
-            print("Flag 배열을 빈 배열로 초기화")
+            logger.debug("Flag 배열을 빈 배열로 초기화")
         else:
             # flag 배열 검증 및 초기화
-            print(f"{len(config['flag'])}개의 flag 항목 발견")
+            logger.debug(f"{len(config['flag'])}개의 flag 항목 발견")
             for i, flag_item in enumerate(config['flag']):
                 if 'process' not in flag_item:
                     flag_item['process'] = ""
@@ -109,7 +107,7 @@ def validate_and_initialize_config(config):
                     flag_item['enabled'] = False
                 if 'options' not in flag_item:
                     flag_item['options'] = ""
-                print(f"Flag {i+1}: {flag_item['process']} (활성화: {flag_item['enabled']})")
+                logger.debug(f"Flag {i+1}: {flag_item['process']} (활성화: {flag_item['enabled']})")
         
         # 프로젝트 시퀀스를 문자열로 변환 (경로 생성시 일관성 위해)
         config['projectSeq'] = str(config['projectSeq'])
@@ -142,7 +140,7 @@ def validate_and_initialize_config(config):
         structured_config = remove_whitespace_from_dict(structured_config)
         
         logger.info("설정 검증 및 초기화가 성공적으로 완료됨")
-        print("모든 설정 변수가 검증 및 초기화됨 (공백 제거 완료)")
+        logger.debug("모든 설정 변수가 검증 및 초기화됨 (공백 제거 완료)")
         
         return structured_config
         
@@ -158,56 +156,81 @@ def update_paths_after_step(paths, step_name, **step_paths):
     paths[step_name].update(step_paths)
     
     logger.info(f"{step_name} 경로 정보 업데이트 완료")
-    for key, value in step_paths.items():
-        print(f"  {key}: {value}")
+    logger.debug(f"{step_name} 경로: {step_paths}")
     
     return paths
 
-def process_flags(structured_config, paths):
-    """Step 7: process flag 처리 (조건부 실행)"""
+def measure_work_bytes(paths):
+    """scratch 없이 MSS에서 바로 작업한 경우 이 작업이 만든 파일 크기 합
+
+    origin(업로드별) + source 세트 디렉토리 + rawdata 결과(NIfTI와 같은 이름의 sidecar / 썸네일 / 부산물).
+    게시하지 않으므로 scratch 경로의 publish 바이트 수 대신 사용 (admission 확장 비율 추정용).
+    """
+    total = common.tree_file_size(paths.get('step2_origin', {}).get('origin_path', ''))
+    source = paths.get('step3_source', {}).get('source_path') or {}
+    set_dirs = {item.get('validated_set_dir') for item in source.get('validated_sets', [])}
+    set_dirs.update(source.get('separated_paths', []))
+    total += sum(common.tree_file_size(path) for path in set_dirs if path)
+    raw_outputs = paths.get('step4_raw', {}).get('raw_path') or {}
+    bases = {}
+    for nifti_path in raw_outputs.values():
+        if isinstance(nifti_path, str):
+            bases.setdefault(os.path.dirname(nifti_path), set()).add(os.path.basename(nifti_path).split('.', 1)[0])
+    for directory, names in bases.items():
+        try:
+            total += sum(entry.stat().st_size for entry in os.scandir(directory)
+                         if entry.is_file() and entry.name.split('.', 1)[0] in names)
+        except OSError:
+            pass
+    return total
+
+
+def series_files(nifti_path, entry, prefix):
+    """시리즈 하나의 결과 파일 (NIfTI와 checklist 항목의 sidecar / 부산물 / 썸네일 중 prefix 아래 파일)"""
+    files = [nifti_path]
+    values = [entry.get('sidecar_json'), entry.get('thumbnail')]
+    values.extend((entry.get('byproduct') or {}).values())
+    for value in values:
+        if isinstance(value, str) and value.startswith(prefix + os.sep) and value not in files:
+            files.append(value)
+    return files
+
+
+def process_flags(structured_config, paths, dispatcher, rebase=None):
+    """Step 7: process flag 처리 (조건부 실행)
+
+    시리즈별 티켓은 후처리가 끝나는 대로 dispatcher가 각 flag 인계 디렉토리(pending)에 기록하며,
+    여기서는 미뤄 둔 티켓(scratch 작업)을 기록하고 티켓 목록을 trace(step7_flags)에 남긴다.
+    후처리 서비스(defacing/canonical/CIVET)는 티켓을 claim하여 처리하고 결과를 trace에 보고한다.
+    """
     logger.info("Step 7: Flag 처리")
     
     flag = structured_config['flag']
     
     if flag['enabled_count'] == 0:
         logger.info("처리할 활성화된 flag가 없음")
-        return
+        return paths
     
     try:
-        print(f"{flag['enabled_count']}개의 활성화된 프로세스 처리: {', '.join(flag['enabled_processes'])}")
-        
-        for flag_item in flag['processes']:
-            if flag_item.get('enabled', False):
-                process_name = flag_item.get('process', '')
-                options = flag_item.get('options', '')
-                
-                logger.info(f"Flag 처리: {process_name}, 옵션: {options}")
-                print(f"{process_name} 프로세스 실행 중, 옵션: {options}")
-                
-                # 각 프로세스별 처리 로직
-                if process_name == 'defacing':
-                    print("defacing 알고리즘 실행 중...")
-                elif process_name == 'canonical':
-                    print("canonical orientation 프로세스 실행 중...")
-                elif process_name == 'normalization':
-                    print("normalization 프로세스 실행 중...")
-                else:
-                    print(f"알 수 없는 프로세스: {process_name}")
-        
-        logger.info("Flag 처리 완료")
+        logger.info(f"{flag['enabled_count']}개의 활성화된 프로세스 처리: {', '.join(flag['enabled_processes'])}")
+        dispatcher.flush(rebase)
+        flags_info = dispatcher.summary()
+        paths = update_paths_after_step(paths, "step7_flags", **flags_info)
+        logger.info(f"Flag 처리 완료: 티켓 {len(flags_info['tickets'])}개 ({', '.join(flags_info['processes']) or '-'})")
+        return paths
     except Exception as e:
         logger.error(f"Step 7 - Flag 처리 실패: {e}")
         raise
 
 def main(json_file_path, upload_dir=None, backup_dir=None, error_dir=None, working_dir=None,
          dicom_modality=None, nifti_modality=None, parrec_modality=None, suffix_map=None,
-         flag_dir=None, magnetic_strength_field = None):
+         flag_dir=None, magnetic_strength_field = None, scratch_dir=None,
+         defacing_flag=None, canonical_flag=None, civet_flag=None):
     """JSON 파일을 처리하는 메인 함수"""
-    global global_vars
-    
     __init__()
     
-    # app.py에서 전달받은 모든 변수들을 global_vars 딕셔너리에 저장
+    # app.py에서 전달받은 모든 변수들을 작업별 global_vars 딕셔너리에 저장
+    # (모듈 전역으로 두면 동시에 실행되는 작업끼리 덮어씀)
     global_vars = {
         'json_file_path': json_file_path,
         'upload_dir': upload_dir,
@@ -219,45 +242,94 @@ def main(json_file_path, upload_dir=None, backup_dir=None, error_dir=None, worki
         'parrec_modality': parrec_modality,
         'suffix_map': suffix_map,
         'flag_dir': flag_dir,
-        'magnetic_strength_field': magnetic_strength_field 
+        'defacing_flag': defacing_flag,
+        'canonical_flag': canonical_flag,
+        'civet_flag': civet_flag,
+        'magnetic_strength_field': magnetic_strength_field,
+        'scratch_dir': scratch_dir
     }
     
+    # 작업 ID: 이벤트 JSON 파일명 (scratch 작업 디렉토리 / 게시 준비 디렉토리 이름)
+    job_id = Path(json_file_path).stem
+    
     logger.info(f"JSON 파일 처리 시작: {json_file_path}")
     logger.info(f"전역 변수 저장 완료: {len(global_vars)}개 변수")
-    print(f"전역 변수들이 global_vars 딕셔너리에 저장됨:")
-    for key, value in global_vars.items():
-        if value is not None:
-            print(f"  {key}: {value}")
+    logger.debug(f"global_vars: { {key: value for key, value in global_vars.items() if value is not None} }")
     
+    # 시리즈별로 먼저 게시한 결과 ({'files', 'bytes'}) / 작업 완료 여부
+    series_published = []
+    completed = False
+    mss_path = None
     try:
         # 모든 경로 정보를 저장할 딕셔너리 초기화
         paths = {}
         
         # JSON 설정 로드
         config = load_json_config(json_file_path)
+        log.bind(subject=config.get('subjectId'))
         
         # Step 0: 변수 정리 및 초기화
         structured_config = validate_and_initialize_config(config)
         
         # Step 1: MSS 구조 생성
-        mss_path = mss.create_mss_structure(structured_config, global_vars)
+        with metrics.step_timer("mss"), log.step("mss"), cancel.step("mss"):
+            mss_path = mss.create_mss_structure(structured_config, global_vars)
         mss_state_path = os.path.join(mss_path, "state")
         paths = update_paths_after_step(paths, "step1_mss", 
                                       mss_path=mss_path,
                                       mss_state_path=mss_state_path)
         
+        # Step 2~5 작업 경로: scratch가 설정되면 로컬 디스크에서 작업 후 Step 6 전에 NAS로 게시
+        work_mss_path = mss_path
+        if scratch_dir:
+            work_mss_path = staging.create_scratch_mss(scratch_dir, working_dir, mss_path, job_id)
+        global_vars['mss_path'] = mss_path
+        global_vars['work_mss_path'] = work_mss_path
+        
+        # 시리즈별 flag 티켓: 활성화된 flag마다 후처리 서비스 인계 디렉토리에 시리즈 단위로 기록
+        # (scratch에서 작업 중이면 그 시리즈 파일을 NAS에 먼저 게시한 뒤 NAS 경로로 기록)
+        # (작업이 전체 게시 전에 실패하면 finally에서 먼저 게시한 파일을 삭제하고 티켓을 회수)
+        def publish_series(nifti_path, entry):
+            files = series_files(nifti_path, entry, work_mss_path)
+            nas_nifti_path = staging.rebase_paths(nifti_path, work_mss_path, mss_path)
+            series_published.append(staging.publish_series(work_mss_path, mss_path, working_dir, job_id, files,
+                                                           tickets=dispatcher.ticket_refs(nas_nifti_path)))
+            return nas_nifti_path, staging.rebase_paths(entry, work_mss_path, mss_path)
+        
+        handoff_dirs = flags.flag_dirs(flag_dir, defacing_flag, canonical_flag, civet_flag)
+        dispatcher = flags.FlagDispatcher(
+            handoff_dirs,
+            flags.enabled_flags(structured_config) if handoff_dirs else [],
+            job_id,
+            export.trace_json_path(config, mss_state_path),
+            defer=work_mss_path != mss_path,
+            publish=publish_series if work_mss_path != mss_path else None
+        )
         
         # Step 2: origin 경로 생성 (origin.py에서 처리)
-        origin_path = origin.create_origin_path(structured_config, global_vars, mss_path)
+        # 스트리밍 모드: MRI 계열 도메인은 압축 해제된 파일을 바로 헤더 스캔 스레드로 넘겨 겹쳐 실행
+        domain = structured_config['request']['domain'].upper()
+        header_scan = None
+        if domain in ("MRI", "DATA", "CT") and header_index.enabled():
+            header_scan = header_index.HeaderIndex().start()
+        try:
+            with metrics.step_timer("origin"), log.step("origin"), cancel.step("origin"):
+                origin_path = origin.create_origin_path(structured_config, global_vars, work_mss_path,
+                                                        on_member=header_scan.put if header_scan else None)
+        except BaseException:
+            # 실패 / 취소 모두 헤더 스캔 스레드 정리
+            if header_scan is not None:
+                header_scan.close()
+            raise
         origin_zip_path = os.path.join(origin_path,"zip")
         origin_unzip_path = os.path.join(origin_path,"unzip")
+        headers = header_scan.close(origin_unzip_path) if header_scan is not None else None
         paths = update_paths_after_step(paths, "step2_origin",
                                       origin_path=origin_path,
                                       origin_zip_path=origin_zip_path,
                                       origin_unzip_path=origin_unzip_path)
         
         # Step 3,4,5: domain에 따른 source/raw/thumbnail 생성 (domain별 모듈에서 처리)
-        domain = structured_config['request']['domain'].upper()
         logger.info(f"Step 3: Domain '{domain}'에 따른 source 처리")
         
         try:
@@ -265,61 +337,45 @@ def main(json_file_path, upload_dir=None, backup_dir=None, error_dir=None, worki
                 # MRI 또는 DATA 도메인인 경우 MRI 모듈 사용
                 from process.components.domain.mri.source import source as mri_source
                 from process.components.domain.mri.raw import raw as mri_raw
-                from process.components.domain.mri.post import bids_checker as mri_checker
-                from process.components.domain.mri.post import byproduct as mri_byproduct
-                from process.components.domain.mri.post import thumbnail as mri_thumbnail
+                from process.components.domain.mri.post import series as mri_series
                 # source_path로 받아서 개별 변수로 저장
-                source_path = mri_source.create_source_path(structured_config, mss_path, origin_unzip_path)
+                with metrics.step_timer("source"), log.step("source"), cancel.step("source"):
+                    source_path = mri_source.create_source_path(structured_config, work_mss_path, origin_unzip_path,
+                                                                 headers=headers)
                 paths = update_paths_after_step(paths, "step3_source",
                             source_path=source_path)
                 
+                # Step 4~5: 시리즈 하나가 변환되면 다른 시리즈 변환과 동시에 해당 시리즈의
+                # checker / byproduct / thumbnail을 실행하고 flag 인계를 기록
+                series_post = mri_series.SeriesPostProcessor(on_ready=dispatcher.series_ready)
                 logger.info(f"Step 4: Domain '{domain}'에 따른 raw 처리")
-                raw_path = mri_raw.create_raw_path(structured_config,source_path,global_vars)
+                try:
+                    with metrics.step_timer("raw"), log.step("raw"), cancel.step("raw"):
+                        raw_path = mri_raw.create_raw_path(structured_config, source_path, global_vars,
+                                                           on_series=series_post.submit)
+                except BaseException:
+                    # 실패 / 취소 모두 남은 시리즈 후처리 취소
+                    series_post.close()
+                    raise
                 paths = update_paths_after_step(paths,"step4_raw",
                             raw_path=raw_path)
                 
-                logger.info(f"Step 5-1: Domain '{domain}' 후처리: BIDS modality Checker")
-                bids_checklist = mri_checker.check_modality(raw_path)
-                paths = update_paths_after_step(paths,"step5_checklist",
-                            bids_checklist=bids_checklist)
-                
-                logger.info(f"Step 5-2: Domain '{domain}' 후처리: BIDS mdality Byproduct Checker")
-                byproduct_path = mri_byproduct.check_byproduct(raw_path)
-                
-                
-                logger.info(f"Step 5-3: Domain '{domain}' 후처리: Thumbnail 생성")
-                thumbnail_path = mri_thumbnail.thumbnail(raw_path)
-                
-                raw_to_source = {}
-                for source_key, raw_key in raw_path.items():
-                    raw_to_source[raw_key] = source_key
-
-                
-                for nifti_key in bids_checklist.keys():
-                    # byproduct 추가
-                    if nifti_key in byproduct_path:
-                        bids_checklist[nifti_key]['byproduct'] = byproduct_path[nifti_key]
-                    
-                    # thumbnail 추가
-                    if nifti_key in thumbnail_path:
-                        bids_checklist[nifti_key]['thumbnail'] = thumbnail_path[nifti_key]
-                    
-                    # source 추가
-                    if nifti_key in raw_to_source:
-                        bids_checklist[nifti_key]['source'] = raw_to_source[nifti_key]
+                logger.info(f"Step 5: Domain '{domain}' 후처리: 시리즈별 BIDS Checker / Byproduct / Thumbnail 결과 병합")
+                with metrics.step_timer("post"), log.step("post"), cancel.step("post"):
+                    bids_checklist = series_post.finish(raw_path)
 
                 # 통합된 checklist만 paths에 업데이트
                 paths = update_paths_after_step(paths, "step5_checklist",
                             bids_checklist=bids_checklist)
 
-                print(f"MRI 도메인 source 처리 완료 (Domain: {domain})")
+                logger.info(f"MRI 도메인 source 처리 완료 (Domain: {domain})")
                 
             elif domain == "PET":
                 # CT 도메인인 경우 CT 모듈 사용
                 from process.components.domain.pet import source as pet_source
                 from process.components.domain.pet import raw as pet_raw
                 from process.components.domain.pet import thumbnail as pet_thumbnail
-                print(f"PET 도메인 source 처리 완료")
+                logger.info(f"PET 도메인 source 처리 완료")
                 
             else:
                 # 지원되지 않는 도메인인 경우 에러 처리
@@ -335,11 +391,43 @@ def main(json_file_path, upload_dir=None, backup_dir=None, error_dir=None, worki
             raise
         
        
+        # scratch 작업 결과를 NAS MSS로 게시하고 경로 정보를 NAS 기준으로 변경
+        if work_mss_path != mss_path:
+            with metrics.step_timer("publish"), log.step("publish"), cancel.step("publish"):
+                published = staging.publish(work_mss_path, mss_path, working_dir, job_id)
+            paths = staging.rebase_paths(paths, work_mss_path, mss_path)
+            # 업로드 크기 대비 작업 결과 크기 (admission control의 확장 비율 추정에 사용)
+            paths['footprint'] = {
+                'upload_bytes': common.dir_file_size(origin_zip_path),
+                'work_bytes': published['bytes'] + sum(item['bytes'] for item in series_published)
+            }
+        else:
+            paths['footprint'] = {
+                'upload_bytes': common.dir_file_size(origin_zip_path),
+                'work_bytes': measure_work_bytes(paths)
+            }
+        
+        # Step 7: flag 티켓 정리 (미뤄 둔 티켓 기록 및 trace에 티켓 목록 기록, export 전에 수행)
+        with metrics.step_timer("flags"), log.step("flags"), cancel.step("flags"):
+            paths = process_flags(structured_config, paths, dispatcher,
+                                  rebase=lambda obj: staging.rebase_paths(obj, work_mss_path, mss_path))
+        
         # Step 6: Export JSON 생성 (export.py에서 처리)
-        export.create_export(config,global_vars, paths)
+        with metrics.step_timer("export"), log.step("export"), cancel.step("export"):
+            export_result = export.create_export(config,global_vars, paths)
 
         logger.info("BIDS Converting has done")
+        completed = True
+        return export_result
         
     except Exception as e:
         logger.error(f"Fail: {e}")
-        raise
\ No newline at end of file
+        raise
+    
+    finally:
+        # 성공/실패와 관계없이 scratch 작업 디렉토리 정리
+        if scratch_dir:
+            staging.remove_scratch(scratch_dir, job_id)
+            # 시리즈별 게시 후 전체 게시 전에 실패 / 취소 - NAS에 먼저 게시한 시리즈 파일 삭제, 티켓 회수
+            if not completed and mss_path is not None:
+                staging.abandon_series(mss_path, working_dir, job_id)
\ No newline at end of file
@@ -0,0 +1,419 @@
+#/BDSP/bids_app/src/rederive.py
+"""기존 rawdata의 후처리 결과 재생성 (bids-rederive)
+
+썸네일 렌더링이나 BIDS 검증(bids_checker) 로직을 바꾼 뒤, 업로드를 다시 처리하지 않고 MSS의 rawdata에 있는
+NIfTI에서 썸네일(.png)과 검증 결과만 다시 만든다.
+
+- 대상: MSS 디렉토리 / rawdata 하위 디렉토리 / 그 위의 프로젝트 디렉토리 (하위의 rawdata를 찾음).
+  경로가 없으면 WORKING_DIR 기준 상대 경로로 본다 (예: CNA/lab/cna0000)
+- MSS마다 state/bdsp_derive_ledger.json에 파일별로 마지막 재생성 당시의 NIfTI(크기, mtime)와 로직 버전
+  (thumbnail.THUMBNAIL_VERSION, bids_checker.CHECKER_VERSION)을 기록하고, 입력과 버전이 같으면 건너뛴다
+  (검증 결과는 sidecar JSON도 입력에 포함)
+- ledger는 처리 중에도 주기적으로 저장되므로 중단(Ctrl+C)한 뒤 다시 실행하면 남은 파일부터 이어서 처리한다
+- 재생성 결과는 MSS state/trace의 trace.json(step5_checklist.bids_checklist)과 BACKUP_DIR의 최신 export.json
+  (export.data의 modality / sidecar / thumbnail)에 반영한 뒤 ledger에 기록한다. backfill은 trace에 기록된
+  생성 시각(trace_created)으로 최신 여부를 판정하므로 trace를 갱신해도 판정은 바뀌지 않는다
+
+    bids-rederive CNA/lab/cna0000 --workers 8
+    bids-rederive /BDSP/interfaces/working/CNA/lab/cna0000/1_Hanyang/IMAGE/BRAIN/MRI --only thumbnail
+    bids-rederive CNA/lab --dry-run
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+from process.components import flags, staging
+from process.components.domain.mri.post import bids_checker, thumbnail
+from utils import common, log, stages
+from globals import (
+    WORKING_DIR, BACKUP_DIR, STAGE_IO_WORKERS, STAGE_CPU_WORKERS, STAGE_PROC_WORKERS, STAGE_QUEUE_SIZE,
+    REDERIVE_WORKERS, REDERIVE_LOG_FILENAME
+)
+
+logger = logging.getLogger(__name__)
+
+# MSS state 폴더의 재생성 기록 (MSS 기준 NIfTI 상대 경로 → 산출물별 입력 / 버전 / 결과)
+LEDGER_NAME = "bdsp_derive_ledger.json"
+# ledger 중간 저장 주기 (처리 파일 수 / 초)
+SAVE_EVERY = 50
+SAVE_SECONDS = 30
+
+THUMBNAIL = "thumbnail"
+CHECKLIST = "checklist"
+ARTIFACTS = (THUMBNAIL, CHECKLIST)
+
+
+def _stamp(path):
+    """파일 변경 판정값 [크기, mtime_ns] (없으면 None)"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _sidecar_path(nifti_path):
+    return nifti_path.replace('.nii.gz', '.json')
+
+
+class DeriveLedger:
+    """MSS 하나의 재생성 기록
+
+    처리 결과는 메모리에 모아 두었다가 save()에서 파일 잠금 하에 다시 읽어 병합한 뒤 교체한다
+    (같은 MSS를 다른 프로세스가 동시에 처리해도 서로의 기록을 지우지 않음).
+    """
+
+    def __init__(self, mss_path):
+        self.mss_path = mss_path
+        self.path = os.path.join(mss_path, "state", LEDGER_NAME)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.traces_updated = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except ValueError as e:
+            logger.warning(f"재생성 기록 읽기 실패 (처음부터 처리): {self.path} ({e})")
+            self.entries = {}
+
+    def key(self, nifti_path):
+        return os.path.relpath(nifti_path, self.mss_path)
+
+    def needed(self, nifti_path, artifacts, force=False):
+        """다시 만들어야 하는 산출물 목록 (입력 / 버전이 같고 결과가 남아 있으면 제외)"""
+        if force:
+            return list(artifacts)
+        entry = self.entries.get(self.key(nifti_path), {})
+        nifti = _stamp(nifti_path)
+        needed = []
+        if THUMBNAIL in artifacts:
+            record = entry.get(THUMBNAIL) or {}
+            if (record.get('version') != thumbnail.THUMBNAIL_VERSION or record.get('nifti') != nifti
+                    or not os.path.exists(record.get('path') or '')):
+                needed.append(THUMBNAIL)
+        if CHECKLIST in artifacts:
+            record = entry.get(CHECKLIST) or {}
+            if (record.get('version') != bids_checker.CHECKER_VERSION or record.get('nifti') != nifti
+                    or record.get('sidecar') != _stamp(_sidecar_path(nifti_path))):
+                needed.append(CHECKLIST)
+        return needed
+
+    def record(self, nifti_path, records):
+        with self._lock:
+            self._pending.setdefault(self.key(nifti_path), {}).update(records)
+
+    def save(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        # trace / export에 먼저 반영 - 실패하면 ledger에 남기지 않으므로 다시 실행할 때 재생성됨
+        try:
+            self.traces_updated += update_outputs(self.mss_path, pending)
+        except OSError as e:
+            logger.error(f"trace / export 갱신 실패 (ledger 기록 생략): {self.mss_path} ({e})")
+            return
+        with common.locked_file(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (FileNotFoundError, ValueError):
+                entries = {}
+            for key, records in pending.items():
+                entries.setdefault(key, {}).update(records)
+            common.write_json_atomic(self.path, entries, indent=2, sort_keys=True)
+            self.entries = entries
+
+
+# ===== trace / export 반영 ======================================================
+def _apply_records(entry, records):
+    """checklist 항목에 재생성 결과 반영 (byproduct / source는 유지)"""
+    if CHECKLIST in records:
+        entry.update(records[CHECKLIST]['result'])
+    if THUMBNAIL in records:
+        entry['thumbnail'] = records[THUMBNAIL]['path']
+
+
+def _update_export(trace_path, updated):
+    """작업의 최신 export.json(BACKUP_DIR)에 갱신된 checklist 항목 반영
+
+    updated: {raw 경로(trace 기록 그대로): checklist 항목}
+    """
+    prefix = os.path.basename(trace_path)[:-len("_trace.json")]
+    candidates = sorted(glob.glob(os.path.join(glob.escape(BACKUP_DIR), f"{glob.escape(prefix)}_{'[0-9]' * 14}_export.json")))
+    if not candidates:
+        return
+    export_path = candidates[-1]
+    with open(export_path, 'r', encoding='utf-8') as f:
+        export_data = json.load(f)
+    changed = False
+    for item in export_data.get('export', {}).get('data', []):
+        entry = updated.get(item.get('raw'))
+        if entry is None:
+            continue
+        item['modality'] = entry.get('modality', '')
+        item['sidecar'] = entry.get('sidecar_json', '')
+        item['thumbnail'] = entry.get('thumbnail', '')
+        changed = True
+    if changed:
+        common.write_json_atomic(export_path, export_data, indent=2)
+
+
+def update_outputs(mss_path, pending):
+    """MSS의 trace.json과 해당 export.json에 재생성 결과 반영
+
+    pending: {MSS 기준 NIfTI 상대 경로: {산출물: ledger 기록}}
+
+    Returns:
+        int: 갱신한 trace 수
+    """
+    real_mss = os.path.realpath(mss_path)
+    derived = datetime.now().isoformat(timespec='seconds')
+    count = 0
+    for trace_path in sorted(glob.glob(os.path.join(glob.escape(mss_path), "state", "trace", "*_trace.json"))):
+        updated = {}
+
+        def apply(trace):
+            step5 = trace.get('step5_checklist') or {}
+            for raw_path, entry in (step5.get('bids_checklist') or {}).items():
+                records = pending.get(os.path.relpath(os.path.realpath(raw_path), real_mss))
+                if records:
+                    _apply_records(entry, records)
+                    updated[raw_path] = entry
+            if updated:
+                step5['rederived'] = derived
+            return bool(updated)
+
+        try:
+            if not flags.modify_trace(trace_path, apply):
+                continue
+        except ValueError as e:
+            logger.warning(f"trace 읽기 실패 (갱신 생략): {trace_path} ({e})")
+            continue
+        count += 1
+        try:
+            _update_export(trace_path, updated)
+        except ValueError as e:
+            logger.warning(f"export.json 읽기 실패 (갱신 생략): {trace_path} ({e})")
+    return count
+
+
+# ===== 대상 탐색 ===============================================================
+def find_rawdata(target):
+    """대상 경로에서 (MSS 경로, 탐색할 rawdata 경로) 목록"""
+    path = Path(target)
+    if not path.exists() and not path.is_absolute():
+        path = Path(WORKING_DIR) / target
+    if not path.is_dir():
+        raise FileNotFoundError(f"대상 경로가 없습니다: {target}")
+    path = path.resolve()
+    if 'rawdata' in path.parts:
+        index = len(path.parts) - 1 - path.parts[::-1].index('rawdata')
+        return [(str(Path(*path.parts[:index])), str(path))]
+    found = []
+    for root, dirs, _ in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        if 'rawdata' in dirs:
+            found.append((root, os.path.join(root, 'rawdata')))
+            # MSS 하위(state, source 등)는 더 내려가지 않음
+            dirs[:] = []
+    return found
+
+
+def iter_niftis(rawdata_path):
+    for root, dirs, files in os.walk(rawdata_path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.endswith('.nii.gz') and not name.startswith('.'):
+                yield os.path.join(root, name)
+
+
+# ===== 재생성 =================================================================
+def derive(nifti_path, artifacts):
+    """NIfTI 하나의 산출물 재생성
+
+    Returns:
+        dict: {산출물: ledger 기록}
+    """
+    single = {nifti_path: nifti_path}
+    nifti = _stamp(nifti_path)
+    derived = datetime.now().isoformat(timespec='seconds')
+    records = {}
+    if THUMBNAIL in artifacts:
+        thumbnails = thumbnail.thumbnail(single)
+        if nifti_path not in thumbnails:
+            raise RuntimeError("썸네일 생성 실패")
+        records[THUMBNAIL] = {'version': thumbnail.THUMBNAIL_VERSION, 'nifti': nifti,
+                              'path': thumbnails[nifti_path], 'derived': derived}
+    if CHECKLIST in artifacts:
+        result = bids_checker.check_modality(single, summary=False)[nifti_path]
+        records[CHECKLIST] = {'version': bids_checker.CHECKER_VERSION, 'nifti': nifti,
+                              'sidecar': _stamp(_sidecar_path(nifti_path)), 'result': result, 'derived': derived}
+    return records
+
+
+def run(tasks, ledgers, workers):
+    """tasks: [(ledger, nifti_path, artifacts)] - 동시에 workers개씩 처리 (대기열은 workers * 2로 제한)
+
+    Returns:
+        tuple: (결과 목록 [(nifti_path, records 또는 None, error)], 중단 여부)
+    """
+    results = []
+    interrupted = False
+    last_save = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rederive')
+    running = {}
+    queue = iter(tasks)
+    total = len(tasks)
+
+    def collect(futures):
+        nonlocal last_save
+        for future in futures:
+            ledger, nifti_path, artifacts = running.pop(future)
+            try:
+                records = future.result()
+                ledger.record(nifti_path, records)
+                results.append((nifti_path, records, None))
+            except Exception as e:
+                logger.error(f"재생성 실패: {nifti_path} ({e})")
+                results.append((nifti_path, None, str(e)))
+                print(f"[{len(results)}/{total}] 실패 {nifti_path} - {e}", file=sys.stderr)
+        if len(results) % SAVE_EVERY < len(futures) or time.monotonic() - last_save > SAVE_SECONDS:
+            for ledger in ledgers:
+                ledger.save()
+            last_save = time.monotonic()
+            print(f"[{len(results)}/{total}] 진행 중", file=sys.stderr)
+
+    try:
+        for task in queue:
+            while len(running) >= workers * 2:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                collect(done)
+            running[executor.submit(derive, task[1], task[2])] = task
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            collect(done)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("중단 요청 - 대기 중인 파일은 취소하고 실행 중인 파일을 마친 뒤 기록 저장", file=sys.stderr)
+        for future in running:
+            future.cancel()
+        done, _ = wait(running)
+        collect([future for future in done if not future.cancelled()])
+    finally:
+        executor.shutdown(wait=True)
+        for ledger in ledgers:
+            ledger.save()
+    return results, interrupted
+
+
+# ===== 명령 ===================================================================
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="bids-rederive", description="rawdata 썸네일 / BIDS 검증 결과 재생성")
+    parser.add_argument('targets', nargs='+', help="MSS / rawdata / 프로젝트 디렉토리 (WORKING_DIR 기준 상대 경로 가능)")
+    parser.add_argument('--only', action='append', choices=ARTIFACTS, help="재생성할 산출물 (여러 번 지정 가능, 기본: 모두)")
+    parser.add_argument('--workers', type=int, default=REDERIVE_WORKERS, help="동시 처리 파일 수")
+    parser.add_argument('--force', action='store_true', help="입력 / 버전이 같아도 재생성")
+    parser.add_argument('--dry-run', action='store_true', help="대상 파일 수만 출력")
+    parser.add_argument('--output', help="JSON 보고서 저장 경로")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    artifacts = tuple(args.only or ARTIFACTS)
+    log_dir = os.path.dirname(REDERIVE_LOG_FILENAME)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    log.setup_logging(REDERIVE_LOG_FILENAME, level=logging.INFO, console=False)
+
+    ledgers = []
+    tasks = []
+    scanned = 0
+    for target in args.targets:
+        for mss_path, rawdata_path in find_rawdata(target):
+            publishing = staging.publishing_jobs(mss_path)
+            if publishing:
+                # 게시(rename) 중이거나 중단된 게시가 마무리되지 않은 MSS는 rawdata가 완결되지 않았으므로 건너뜀
+                print(f"{rawdata_path}: 게시 중인 작업이 있어 건너뜀 ({', '.join(publishing)})", file=sys.stderr)
+                continue
+            ledger = DeriveLedger(mss_path)
+            ledgers.append(ledger)
+            count = 0
+            for nifti_path in iter_niftis(rawdata_path):
+                count += 1
+                needed = ledger.needed(nifti_path, artifacts, force=args.force)
+                if needed:
+                    tasks.append((ledger, nifti_path, needed))
+            scanned += count
+            print(f"{rawdata_path}: NIfTI {count}개", file=sys.stderr)
+    print(f"대상 {scanned}개 - 재생성 {len(tasks)}, 최신(건너뜀) {scanned - len(tasks)} ({', '.join(artifacts)})",
+          file=sys.stderr)
+
+    if args.dry_run:
+        for _, nifti_path, needed in tasks:
+            print(f"{','.join(needed):<20} {nifti_path}")
+        return 0
+
+    stages.configure(io_workers=STAGE_IO_WORKERS, cpu_workers=STAGE_CPU_WORKERS,
+                     proc_workers=STAGE_PROC_WORKERS, queue_size=STAGE_QUEUE_SIZE)
+    workers = max(1, args.workers)
+    started = time.perf_counter()
+    results, interrupted = run(tasks, ledgers, workers)
+    elapsed = time.perf_counter() - started
+
+    failed = [(nifti_path, error) for nifti_path, records, error in results if error]
+    derived = [records for _, records, error in results if not error]
+    report = {
+        'finished': datetime.now().isoformat(timespec='seconds'),
+        'elapsed_seconds': elapsed,
+        'workers': workers,
+        'artifacts': list(artifacts),
+        'files': {
+            'total': scanned,
+            'skipped_current': scanned - len(tasks),
+            'derived': len(derived),
+            'failed': len(failed),
+            'not_started': len(tasks) - len(results),
+        },
+        'thumbnails': sum(1 for records in derived if THUMBNAIL in records),
+        'checklists': sum(1 for records in derived if CHECKLIST in records),
+        'traces_updated': sum(ledger.traces_updated for ledger in ledgers),
+        'checklist_warnings': sum(1 for records in derived if records.get(CHECKLIST, {}).get('result', {}).get('warnings')),
+        'files_per_second': len(results) / elapsed if elapsed > 0 else 0.0,
+        'interrupted': interrupted,
+        'ledgers': [ledger.path for ledger in ledgers],
+        'failed': [{'nifti': nifti_path, 'error': error} for nifti_path, error in failed],
+    }
+
+    files = report['files']
+    print(f"\n=== Rederive 결과 ({elapsed:.1f}s, workers={workers}) ===", file=sys.stderr)
+    print(f"전체 {files['total']} / 최신(건너뜀) {files['skipped_current']} / 재생성 {files['derived']} "
+          f"(썸네일 {report['thumbnails']}, 검증 {report['checklists']}, 경고 {report['checklist_warnings']}) / "
+          f"실패 {files['failed']} / 미실행 {files['not_started']}", file=sys.stderr)
+    print(f"trace 갱신 {report['traces_updated']}개", file=sys.stderr)
+    print(f"처리량 {report['files_per_second']:.2f} files/s", file=sys.stderr)
+    for item in report['failed']:
+        print(f"실패 {item['nifti']}: {item['error']}", file=sys.stderr)
+    if interrupted or files['not_started']:
+        print("중단됨 - 같은 명령을 다시 실행하면 완료된 파일은 건너뛰고 이어서 처리합니다", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"보고서 저장: {args.output}", file=sys.stderr)
+    log.shutdown_logging()
+    return 1 if failed or interrupted else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,246 @@
+#/BDSP/bids_app/src/scheduler.py
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from utils import common
+
+logger = logging.getLogger(__name__)
+
+
+def _load_event(json_file_path):
+    try:
+        with open(json_file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"이벤트 JSON 읽기 실패 (기본 우선순위로 대기): {json_file_path} ({e})")
+        return {}
+
+
+def upload_size(upload_dir, event):
+    """이벤트가 가리키는 업로드 디렉토리(upload/<user>/<subjectId>/<uploadTime>)의 zip 크기 합 (bytes)"""
+    try:
+        upload_path = Path(upload_dir) / str(event['user']) / str(event['subjectId']) / str(event['uploadTime'])
+        return sum(entry.stat().st_size for entry in os.scandir(upload_path)
+                   if entry.is_file() and entry.name.lower().endswith('.zip'))
+    except (KeyError, OSError):
+        return 0
+
+
+class Job:
+    """스케줄러 대기열의 작업 하나 (이벤트 JSON 파일)"""
+
+    __slots__ = ('path', 'file_name', 'user', 'project', 'key', 'priority', 'size', 'arrival', 'started')
+
+    def __init__(self, path, user, project, priority, size, key=None, arrival=None):
+        self.path = path
+        self.file_name = os.path.basename(path)
+        self.user = user
+        self.project = project
+        # 직렬화 키 (project, subject, session): 같은 키의 작업은 도착 순서대로 하나씩 실행
+        self.key = key if key is not None else (project, self.file_name)
+        self.priority = priority
+        self.size = size
+        self.arrival = arrival if arrival is not None else time.monotonic()
+        self.started = None
+
+    def __repr__(self):
+        return (f"Job({self.file_name}, user={self.user}, project={self.project}, "
+                f"priority={self.priority}, size={self.size})")
+
+
+class FairShareScheduler:
+    """이벤트 파일 수집과 워커 실행 사이의 스케줄러
+
+    - 프로젝트(systemId/projectCode/projectSeq) → 사용자 2단계 공정 분배:
+      실행 중인 작업 수가 적은 프로젝트, 그 안에서 실행 중인 작업 수가 적은 사용자를 먼저 선택
+      (같으면 가장 오래전에 실행 기회를 받은 쪽)
+    - 이벤트 JSON의 priority 필드 (클수록 먼저, 기본 default_priority): 공정 분배보다 우선
+    - 같은 사용자 안에서는 업로드 크기가 작은 작업 먼저. 대기 시간에 따라 유효 크기가 줄어들어(aging)
+      큰 작업도 결국 실행됨
+    - 사용자/프로젝트별 동시 실행 상한 (0이면 제한 없음)
+    - 같은 (project, subject, session) 작업은 도착 순서대로 하나씩 실행 (run 번호 / trace 충돌 방지),
+      다른 subject/session 작업은 병렬 실행
+    """
+
+    def __init__(self, upload_dir, user_max_running=0, project_max_running=0,
+                 aging_seconds=600.0, default_priority=0):
+        self.upload_dir = upload_dir
+        self.user_max_running = user_max_running
+        self.project_max_running = project_max_running
+        self.aging_seconds = aging_seconds
+        self.default_priority = default_priority
+        self._lock = threading.Lock()
+        # project -> user -> deque[Job]
+        self._queues = {}
+        self._running = {}              # file_name -> Job
+        self._running_users = {}        # user -> 실행 중 작업 수
+        self._running_projects = {}     # project -> 실행 중 작업 수
+        self._last_served = {}          # ('project', p) / ('user', p, u) -> 마지막 실행 시각
+        self._key_order = {}            # 직렬화 키 -> deque[Job] (대기 중, 도착 순)
+        self._running_keys = set()
+        self._pending = 0
+
+    # ===== 대기열 등록 =========================================================
+    def make_job(self, json_file_path):
+        """이벤트 JSON에서 사용자/프로젝트/우선순위/업로드 크기를 읽어 Job 생성"""
+        event = _load_event(json_file_path)
+        user = str(event.get('user', ''))
+        project = '/'.join(str(event.get(key, '')) for key in ('systemId', 'projectCode', 'projectSeq'))
+        # rawdata의 sub-<subjectId>/ses-<trialIndex>는 기관(orgId)별 MSS 아래에 생성됨
+        key = (project, str(event.get('orgId', '')), str(event.get('subjectId', '')),
+               common.zero_fill(event.get('trialIndex', '')))
+        try:
+            priority = int(event.get('priority', self.default_priority))
+        except (TypeError, ValueError):
+            logger.warning(f"priority 값이 정수가 아님 (기본값 사용): {json_file_path}")
+            priority = self.default_priority
+        return Job(json_file_path, user, project, priority, upload_size(self.upload_dir, event), key=key)
+
+    def add(self, json_file_path):
+        """작업 등록
+
+        Returns:
+            Job
+        """
+        job = self.make_job(json_file_path)
+        with self._lock:
+            self._queues.setdefault(job.project, {}).setdefault(job.user, deque()).append(job)
+            self._key_order.setdefault(job.key, deque()).append(job)
+            self._pending += 1
+        logger.info(f"대기열 등록: {job}")
+        return job
+
+    # ===== 선택 ================================================================
+    def _effective_size(self, job, now):
+        """대기 시간만큼 줄어든 유효 크기 (aging_seconds마다 절반)"""
+        if self.aging_seconds <= 0:
+            return job.size
+        return job.size / (2 ** ((now - job.arrival) / self.aging_seconds))
+
+    def _ready(self, job):
+        """같은 직렬화 키의 작업이 실행 중이 아니고, 대기 중인 같은 키 작업 중 가장 먼저 도착한 작업"""
+        return job.key not in self._running_keys and self._key_order[job.key][0] is job
+
+    def _user_head(self, queue, now):
+        """사용자 대기열에서 다음 작업 (priority 높은 순 → 유효 크기 작은 순 → 도착 순)"""
+        ready = [job for job in queue if self._ready(job)]
+        if not ready:
+            return None
+        return min(ready, key=lambda job: (-job.priority, self._effective_size(job, now), job.arrival))
+
+    def _eligible(self, project, user):
+        if self.project_max_running and self._running_projects.get(project, 0) >= self.project_max_running:
+            return False
+        if self.user_max_running and self._running_users.get(user, 0) >= self.user_max_running:
+            return False
+        return True
+
+    def _candidates(self, now):
+        for project, users in self._queues.items():
+            for user, queue in users.items():
+                if queue and self._eligible(project, user):
+                    job = self._user_head(queue, now)
+                    if job is not None:
+                        yield job
+
+    def _order_key(self, job):
+        return (
+            -job.priority,
+            self._running_projects.get(job.project, 0),
+            self._last_served.get(('project', job.project), 0.0),
+            self._running_users.get(job.user, 0),
+            self._last_served.get(('user', job.project, job.user), 0.0),
+            job.arrival,
+        )
+
+    def next_job(self, admit=None):
+        """실행할 다음 작업을 꺼내 실행 중으로 표시 (실행 가능한 작업이 없으면 None)
+
+        Args:
+            admit: 선택 순서대로 후보 작업을 받아 시작 가능 여부를 반환하는 콜백 (디스크/메모리 admission).
+                   거절된 작업은 대기열에 그대로 남고 다음 후보를 확인한다.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = sorted(self._candidates(now), key=self._order_key)
+            job = next((candidate for candidate in candidates if admit is None or admit(candidate)), None)
+            if job is None:
+                return None
+
+            users = self._queues[job.project]
+            users[job.user].remove(job)
+            if not users[job.user]:
+                del users[job.user]
+            if not users:
+                del self._queues[job.project]
+            self._pending -= 1
+            key_queue = self._key_order[job.key]
+            key_queue.popleft()
+            if not key_queue:
+                del self._key_order[job.key]
+
+            job.started = now
+            self._running_keys.add(job.key)
+            self._running[job.file_name] = job
+            self._running_users[job.user] = self._running_users.get(job.user, 0) + 1
+            self._running_projects[job.project] = self._running_projects.get(job.project, 0) + 1
+            self._last_served[('project', job.project)] = now
+            self._last_served[('user', job.project, job.user)] = now
+
+        logger.info(f"실행 선택: {job} (대기 {now - job.arrival:.1f}s)")
+        return job
+
+    def done(self, file_name):
+        """작업 종료 (성공/실패 무관) - 사용자/프로젝트 실행 수 반환"""
+        with self._lock:
+            job = self._running.pop(file_name, None)
+            if job is None:
+                return
+            self._running_keys.discard(job.key)
+            for counts, key in ((self._running_users, job.user), (self._running_projects, job.project)):
+                counts[key] -= 1
+                if counts[key] <= 0:
+                    del counts[key]
+
+    # ===== 상태 ================================================================
+    @property
+    def pending(self):
+        return self._pending
+
+    @property
+    def running(self):
+        return len(self._running)
+
+    def dispatchable(self):
+        """지금 시작할 수 있는 대기 작업 수 (admission 제외)
+
+        같은 직렬화 키의 작업이 실행 중이거나 앞에 대기 중인 작업, 사용자/프로젝트 동시 실행 상한에
+        걸린 작업은 슬롯을 늘려도 시작할 수 없으므로 세지 않는다 (autoscale 판단용).
+        """
+        with self._lock:
+            total = 0
+            for project, users in self._queues.items():
+                project_room = (self.project_max_running - self._running_projects.get(project, 0)
+                                if self.project_max_running else None)
+                count = 0
+                for user, queue in users.items():
+                    ready = sum(1 for job in queue if self._ready(job))
+                    if self.user_max_running:
+                        ready = min(ready, max(0, self.user_max_running - self._running_users.get(user, 0)))
+                    count += ready
+                total += count if project_room is None else min(count, max(0, project_room))
+            return total
+
+    def snapshot(self):
+        """프로젝트/사용자별 대기·실행 작업 수"""
+        with self._lock:
+            return {
+                'pending': {project: {user: len(queue) for user, queue in users.items()}
+                            for project, users in self._queues.items()},
+                'running_users': dict(self._running_users),
+                'running_projects': dict(self._running_projects),
+            }
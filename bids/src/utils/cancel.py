@@ -0,0 +1,325 @@
+#/BDSP/bids_app/src/utils/cancel.py
+import contextvars
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+GiB = 1024 * 1024 * 1024
+
+# 제한 시간이 지난 외부 프로세스 그룹에 SIGTERM 후 SIGKILL까지 기다리는 시간 (초)
+KILL_GRACE_SECONDS = 5.0
+# 외부 프로세스 실행 중 취소 / 제한 시간 확인 주기 (초)
+POLL_SECONDS = 0.5
+
+# 현재 작업의 취소 토큰 (작업 스레드 → 단계 풀 / 시리즈 후처리 스레드로 컨텍스트와 함께 전달)
+token_var = contextvars.ContextVar('cancel_token', default=None)
+
+
+class JobCancelled(BaseException):
+    """작업 취소 (제어 파일 / API)
+
+    asyncio.CancelledError처럼 BaseException을 상속하므로 단계 코드의 `except Exception` 래핑이나
+    시리즈별 오류 무시 루프에 잡히지 않고 작업 밖(app)까지 그대로 전달된다. finally 정리는 그대로 실행된다.
+    """
+
+    kind = "cancelled"
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+    def __str__(self):
+        return f"{self.kind}: {self.reason}"
+
+
+class JobTimeout(JobCancelled):
+    """작업 / 단계 / 외부 프로세스 제한 시간 초과"""
+
+    kind = "timeout"
+
+
+class JobFenced(JobCancelled):
+    """클러스터에서 claim이 다른 노드로 인수됨 (인수한 노드가 다시 처리하므로 실패로 보지 않음)"""
+
+    kind = "fenced"
+
+
+class Deadlines:
+    """제한 시간 설정 - 기본 시간 + 입력 크기(GB)당 추가 시간 (기본 시간이 0이면 제한 없음)
+
+    - 작업: 업로드 크기 기준
+    - 단계: 업로드 크기 기준 (step_overrides로 단계별 기본 시간 지정)
+    - 외부 프로세스(dcm2niix 등): 해당 프로세스 입력(시리즈 폴더) 크기 기준
+    """
+
+    def __init__(self, job_seconds=0, job_per_gb=0, step_seconds=0, step_per_gb=0, step_overrides=None,
+                 process_seconds=0, process_per_gb=0):
+        self.job_seconds = job_seconds
+        self.job_per_gb = job_per_gb
+        self.step_seconds = step_seconds
+        self.step_per_gb = step_per_gb
+        self.step_overrides = dict(step_overrides or {})
+        self.process_seconds = process_seconds
+        self.process_per_gb = process_per_gb
+
+    @staticmethod
+    def _scaled(base, per_gb, size_bytes):
+        if not base or base <= 0:
+            return None
+        return base + per_gb * (size_bytes or 0) / GiB
+
+    def job(self, size_bytes):
+        return self._scaled(self.job_seconds, self.job_per_gb, size_bytes)
+
+    def step(self, name, size_bytes):
+        return self._scaled(self.step_overrides.get(name, self.step_seconds), self.step_per_gb, size_bytes)
+
+    def process(self, size_bytes):
+        return self._scaled(self.process_seconds, self.process_per_gb, size_bytes)
+
+
+_deadlines = Deadlines()
+
+
+def parse_step_overrides(text):
+    """'raw=7200, origin=1800' → {'raw': 7200.0, 'origin': 1800.0}"""
+    overrides = {}
+    for item in (text or '').split(','):
+        name, sep, value = item.partition('=')
+        if sep and name.strip():
+            overrides[name.strip()] = float(value)
+    return overrides
+
+
+def configure(deadlines):
+    global _deadlines
+    _deadlines = deadlines
+    logger.info(f"Deadlines - Job: {deadlines.job_seconds}s + {deadlines.job_per_gb}s/GB, "
+                f"Step: {deadlines.step_seconds}s + {deadlines.step_per_gb}s/GB {deadlines.step_overrides or ''}, "
+                f"Process: {deadlines.process_seconds}s + {deadlines.process_per_gb}s/GB")
+
+
+class CancelToken:
+    """작업 하나의 취소 상태와 제한 시간
+
+    취소 / 제한 시간 초과는 확인 지점(check - 단계 시작, 시리즈 / zip 멤버 단위 루프)과 외부 프로세스
+    대기(run_process)에서 예외로 드러난다. 외부 프로세스는 취소되는 즉시 프로세스 그룹째 종료된다.
+    """
+
+    def __init__(self, job_id, upload_bytes=0, deadlines=None):
+        self.job_id = job_id
+        self.upload_bytes = upload_bytes
+        self.deadlines = deadlines or _deadlines
+        self.started = time.monotonic()
+        limit = self.deadlines.job(upload_bytes)
+        self._job_deadline = (self.started + limit, limit) if limit else None
+        self._steps = {}                # 단계 이름 -> [마감 시각, 제한 시간, 실행 수]
+        self._processes = set()
+        self._lock = threading.Lock()
+        self._error = None
+
+    # ===== 취소 ================================================================
+    def cancel(self, reason, error_class=JobCancelled):
+        """취소 요청 (다른 스레드에서 호출) - 실행 중인 외부 프로세스는 바로 종료"""
+        with self._lock:
+            if self._error is not None:
+                return False
+            self._error = error_class(reason)
+            processes = list(self._processes)
+        logger.warning(f"작업 중단 요청: {self.job_id} ({self._error})")
+        for process in processes:
+            kill_process_group(process)
+        return True
+
+    @property
+    def cancelled(self):
+        return self._error is not None
+
+    def poll(self):
+        """제한 시간이 지났으면 취소 상태로 전환 (확인 지점 / 모니터 감시에서 호출)
+
+        Returns:
+            JobCancelled: 취소 / 제한 시간 초과 예외 (아니면 None)
+        """
+        if self._error is None:
+            now = time.monotonic()
+            expired = None
+            with self._lock:
+                if self._job_deadline and now > self._job_deadline[0]:
+                    expired = f"작업 제한 시간 {self._job_deadline[1]:.0f}s 초과 (업로드 {self._size_text()})"
+                else:
+                    for name, (deadline, limit, _) in self._steps.items():
+                        if now > deadline:
+                            expired = f"단계 '{name}' 제한 시간 {limit:.0f}s 초과 (업로드 {self._size_text()})"
+                            break
+            if expired:
+                self.cancel(expired, JobTimeout)
+        return self._error
+
+    def check(self):
+        """취소되었거나 제한 시간이 지났으면 예외 발생 (스레드마다 새 예외 객체)"""
+        error = self.poll()
+        if error is not None:
+            raise type(error)(error.reason)
+
+    def remaining(self):
+        """가장 가까운 마감까지 남은 시간 (초, 제한이 없으면 None)"""
+        with self._lock:
+            deadlines = [deadline for deadline, _, _ in self._steps.values()]
+            if self._job_deadline:
+                deadlines.append(self._job_deadline[0])
+        return min(deadlines) - time.monotonic() if deadlines else None
+
+    def _size_text(self):
+        return f"{self.upload_bytes / (1024 * 1024):.0f} MB"
+
+    # ===== 단계 ================================================================
+    @contextmanager
+    def step(self, name):
+        """단계 제한 시간 (같은 단계가 여러 스레드에서 겹치면 처음 시작한 시각 기준)"""
+        self.check()
+        limit = self.deadlines.step(name, self.upload_bytes)
+        if limit:
+            with self._lock:
+                entry = self._steps.get(name)
+                if entry is None:
+                    entry = self._steps[name] = [time.monotonic() + limit, limit, 0]
+                entry[2] += 1
+        try:
+            yield
+        finally:
+            if limit:
+                with self._lock:
+                    entry = self._steps.get(name)
+                    if entry is not None:
+                        entry[2] -= 1
+                        if entry[2] <= 0:
+                            del self._steps[name]
+
+    # ===== 외부 프로세스 =======================================================
+    def _register(self, process):
+        with self._lock:
+            self._processes.add(process)
+            cancelled = self._error is not None
+        if cancelled:
+            kill_process_group(process)
+
+    def _unregister(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+
+@contextmanager
+def job_scope(token):
+    """작업 하나의 취소 토큰 컨텍스트"""
+    reset = token_var.set(token)
+    try:
+        yield token
+    finally:
+        token_var.reset(reset)
+
+
+def current():
+    return token_var.get()
+
+
+def check():
+    """현재 작업이 취소되었거나 제한 시간이 지났으면 예외 발생 (작업 밖이면 아무것도 하지 않음)"""
+    token = token_var.get()
+    if token is not None:
+        token.check()
+
+
+@contextmanager
+def step(name):
+    """현재 작업의 단계 제한 시간 컨텍스트 (작업 밖이면 아무것도 하지 않음)"""
+    token = token_var.get()
+    if token is None:
+        yield
+        return
+    with token.step(name):
+        yield
+
+
+def _signal_group(process, sig):
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def kill_process_group(process):
+    """프로세스 그룹에 SIGTERM (유예 후 SIGKILL과 회수는 run_process에서)"""
+    _signal_group(process, signal.SIGTERM)
+
+
+def _reap(process):
+    """SIGTERM 후 유예 시간 안에 끝나지 않으면 SIGKILL, 좀비가 남지 않도록 회수"""
+    kill_process_group(process)
+    try:
+        return process.communicate(timeout=KILL_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        _signal_group(process, signal.SIGKILL)
+        return process.communicate()
+
+
+def run_process(cmd, input_bytes=0, check=True):
+    """외부 프로세스 실행 (subprocess.run(capture_output=True, text=True) 대체)
+
+    - 별도 세션(프로세스 그룹)으로 실행하여 취소 / 제한 시간 초과 시 자식 프로세스까지 종료하고 회수
+    - 제한 시간 = 현재 작업의 프로세스 제한(input_bytes 기준)과 작업 / 단계 마감 중 가까운 것
+
+    Returns:
+        subprocess.CompletedProcess
+
+    Raises:
+        subprocess.CalledProcessError: check=True이고 종료 코드가 0이 아님
+        JobTimeout / JobCancelled: 제한 시간 초과 / 작업 취소
+    """
+    token = token_var.get()
+    limit = (token.deadlines if token is not None else _deadlines).process(input_bytes)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                               start_new_session=True)
+    started = time.monotonic()
+    if token is not None:
+        token._register(process)
+    try:
+        while True:
+            error = token.poll() if token is not None else None
+            if error is None and limit and time.monotonic() - started > limit:
+                error = JobTimeout(f"{os.path.basename(cmd[0])} 제한 시간 {limit:.0f}s 초과 "
+                                   f"(입력 {input_bytes / (1024 * 1024):.0f} MB)")
+            if error is not None:
+                logger.error(f"외부 프로세스 종료 (pid {process.pid}): {error}")
+                _reap(process)
+                raise type(error)(error.reason)
+            wait = POLL_SECONDS
+            remaining = token.remaining() if token is not None else None
+            if remaining is not None:
+                wait = max(0.01, min(wait, remaining))
+            try:
+                stdout, stderr = process.communicate(timeout=wait)
+                break
+            except subprocess.TimeoutExpired:
+                continue
+    except BaseException:
+        if process.poll() is None:
+            _reap(process)
+        raise
+    finally:
+        if token is not None:
+            token._unregister(process)
+    # 대기 중 다른 스레드에서 취소되어 SIGTERM으로 끝난 경우 - 남은 자식 프로세스 정리 후 취소로 처리
+    error = token.poll() if token is not None else None
+    if error is not None:
+        _signal_group(process, signal.SIGKILL)
+        raise type(error)(error.reason)
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
@@ -2,10 +2,34 @@
 import os
 import json
 import re
+import io
+import fcntl
 import shutil
 import gzip
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
+from utils import metrics
+from utils.file_index import FILE_LIST_NAME, FileIndex
+
+logger = logging.getLogger(__name__)
+
+# 스트리밍 복사/압축 시 읽기 단위
+_COPY_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Linux FICLONE ioctl (reflink)
+_FICLONE = 0x40049409
+
+# 규칙 JSON 캐시 (모달리티 매핑 / suffix_map - 경로, 크기, mtime이 같으면 작업 간 공유)
+_json_cache = {}
+_json_cache_lock = threading.Lock()
+json_cache_stats = {'hits': 0, 'misses': 0}
+metrics.register_cache('rules', json_cache_stats)
 
 
 def camel2snake(name: str) -> str:
@@ -20,34 +44,75 @@ import json
 
 def bdsp_walk(target_folder: str, output_filename: str = None):
     """폴더를 스캔하여 파일 경로를 JSON으로 저장
-       단, 'bdsp'로 시작하고 '.json' 확장자인 파일은 제외"""
+       단, 'bdsp'로 시작하고 '.json' 확장자인 파일은 제외
+
+    Returns:
+        FileIndex: 저장한 파일 목록
+    """
     
     # output_filename이 None이면 target_folder 안에 기본 파일명으로 생성
     if output_filename is None:
-        output_filename = os.path.join(target_folder, "bdsp_file_list.json")
-    
-    file_paths = []
-    index = 1
+        output_filename = os.path.join(target_folder, FILE_LIST_NAME)
     
-    for root, dirs, files in os.walk(target_folder):
-        for file in files:
-            # 제외 조건: 파일명이 'bdsp'로 시작하고 .json으로 끝나는 경우
-            if file.lower().startswith("bdsp") and file.lower().endswith(".json"):
-                continue
+    index = FileIndex.scan(target_folder)
+    index.write(output_filename)
+    return index
 
-            file_path = os.path.join(root, file)
-            file_paths.append({
-                "index": index,
-                "file_path": file_path
-            })
-            index += 1
-    
-    result = {"path": file_paths}
-    
-    with open(output_filename, 'w', encoding='utf-8') as f:
-        json.dump(result, f, indent=2, ensure_ascii=False)
-    
-    return result
+
+def write_file_list(entries, output_filename: str):
+    """{"path": [{"index", "file_path"}, ...]} 형식의 bdsp_file_list.json 저장
+       entries는 FileIndex 또는 {"index", "file_path"} dict 목록"""
+    if not isinstance(entries, FileIndex):
+        entries = FileIndex.from_entries(entries)
+    entries.write(output_filename)
+
+
+# locked_file 경로별 스레드 잠금 (NFS의 flock은 프로세스 단위라 같은 프로세스의 스레드끼리는 막지 못함)
+_file_locks = {}
+_file_locks_lock = threading.Lock()
+
+
+@contextmanager
+def atomic_write(path, mode='w', encoding='utf-8'):
+    """같은 폴더의 임시 파일에 쓴 뒤 os.replace로 교체하는 파일 객체
+
+    읽는 쪽(다른 스레드 / 프로세스 / 노드)은 이전 내용이나 완성된 내용만 보며, 쓰는 중에 실패하면 임시 파일을 지운다.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode, encoding=None if 'b' in mode else encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """JSON 파일을 atomic_write로 저장 (dump_kwargs: indent / sort_keys 등)"""
+    with atomic_write(path) as f:
+        json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+
+
+@contextmanager
+def locked_file(path):
+    """여러 스레드 / 프로세스 / 노드가 읽고 고쳐 쓰는 파일의 배타 잠금 (읽기-수정-쓰기 구간을 감쌈)
+
+    같은 프로세스의 스레드 간은 경로별 threading.Lock, 프로세스 / 노드 간은 <path>.lock 파일의 flock으로 직렬화한다.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    lock_path = f"{os.path.abspath(path)}.lock"
+    with _file_locks_lock:
+        thread_lock = _file_locks.setdefault(lock_path, threading.Lock())
+    with thread_lock, open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 
 def zero_fill(num) -> str:
@@ -61,17 +126,64 @@ def zero_fill(num) -> str:
 def bdsp_path_maker(path: str) -> bool:
     """경로가 존재하는지 확인하고, 존재하지 않으면 폴더 생성"""
     if os.path.exists(path):
-        print(f"경로가 이미 존재합니다: {path}")
+        logger.debug(f"경로가 이미 존재합니다: {path}")
         return False  # 이미 존재하므로 생성하지 않음
     else:
         try:
             os.makedirs(path, exist_ok=True)
-            print(f"폴더를 생성했습니다: {path}")
+            logger.debug(f"폴더를 생성했습니다: {path}")
             return True  # 새로 생성함
         except OSError as e:
-            print(f"폴더 생성 중 오류 발생: {e}")
+            logger.error(f"폴더 생성 중 오류 발생: {e}")
             return False
-        
+
+
+def dir_file_size(path: str) -> int:
+    """디렉토리 바로 아래 파일들의 크기 합 (bytes, 디렉토리가 없으면 0)"""
+    try:
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    except OSError:
+        return 0
+
+
+def tree_file_size(path: str) -> int:
+    """디렉토리 하위 전체 파일 크기 합 (bytes, 디렉토리가 없으면 0)"""
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def load_json_cached(path: str):
+    """
+    규칙 JSON 파일 로드 (파일이 바뀌지 않았으면 이전에 파싱한 객체 재사용)
+    
+    반환 객체는 작업 간에 공유되므로 호출부에서 수정하면 안 된다.
+    
+    Raises:
+        FileNotFoundError / json.JSONDecodeError: json.load와 동일
+    """
+    st = os.stat(path)
+    key = (st.st_size, st.st_mtime_ns)
+    with _json_cache_lock:
+        cached = _json_cache.get(path)
+        if cached is not None and cached[0] == key:
+            json_cache_stats['hits'] += 1
+            return cached[1]
+        json_cache_stats['misses'] += 1
+    
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    
+    with _json_cache_lock:
+        _json_cache[path] = (key, data)
+    return data
+
+
 def remove_all_whitespace(text):
     return re.sub(r'\s+', '', text)
 
@@ -80,29 +192,21 @@ def separated_walk(separated_path, json_output_path):
     
     파일명 패턴: item_{set_id}_{index}{ext} (index는 가변 자리수)
     """
-    separated_path = Path(separated_path)
-    entries = []
+    entries = FileIndex()
     
     # item_{set_id}_{숫자}{ext} 패턴 매칭 (숫자 자리수 제한 없음)
     pattern = re.compile(r'item_.*?_(\d+)\.')
     
-    for file_path in separated_path.iterdir():
-        if file_path.is_file() and not file_path.name.endswith('.json'):
-            match = pattern.search(file_path.name)
-            if match:
-                index = int(match.group(1))  # 01 -> 1, 0001 -> 1, 123 -> 123
-                entries.append({
-                    "index": index,
-                    "file_path": str(file_path)  # 전체 경로 저장
-                })
-    
-    # index 순서로 정렬
-    entries.sort(key=lambda x: x["index"])
-    
-    # JSON 생성
-    data = {"path": entries}
-    with open(json_output_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    with os.scandir(separated_path) as it:
+        for entry in it:
+            if entry.is_file() and not entry.name.endswith('.json'):
+                match = pattern.search(entry.name)
+                if match:
+                    # 01 -> 1, 0001 -> 1, 123 -> 123 (전체 경로 저장)
+                    entries.add(entry.path, int(match.group(1)))
+    
+    # index 순서로 정렬 후 JSON 생성
+    entries.sort().write(json_output_path)
         
 def remove_special_chars(text: str) -> str:
     """
@@ -143,4 +247,173 @@ def compress_nii_gz(nii_path: str) -> str:
     # 원본 파일 삭제
     nii_file.unlink()
     
-    return str(gz_file)
\ No newline at end of file
+    return str(gz_file)
+
+def stream_compress_file(src_path: str, gz_path: str) -> str:
+    """
+    원본을 한 번만 읽으면서 gz_path에 바로 gzip 압축 기록 (임시 비압축 파일 없음)
+    
+    Args:
+        src_path (str): 입력 파일 경로 (예: .nii)
+        gz_path (str): 출력 .gz 파일 경로
+    
+    Returns:
+        str: 원본 데이터의 sha256 (hex)
+    """
+    with open(src_path, 'rb') as f_in, ParallelGzipWriter(gz_path) as f_out:
+        for chunk in iter(lambda: f_in.read(_COPY_CHUNK_SIZE), b''):
+            f_out.write(chunk)
+    return f_out.checksum
+
+
+def clone_or_copy_file(src_path: str, dst_path: str, allow_hardlink: bool = True):
+    """
+    같은 장치면 reflink(CoW) → hardlink 순으로 시도하고, 불가능하면 한 번 읽으며 복사
+    
+    Args:
+        src_path (str): 원본 파일 경로
+        dst_path (str): 대상 파일 경로 (존재하면 교체)
+        allow_hardlink (bool): False면 hardlink를 쓰지 않음 (대상 수정이 원본에 반영되면 안 되는 경우)
+    
+    Returns:
+        tuple: (method, sha256) - method는 'reflink' / 'hardlink' / 'copy',
+               sha256은 복사한 경우에만 계산 (링크는 원본과 같은 데이터이므로 None)
+    """
+    if os.path.exists(dst_path):
+        os.remove(dst_path)
+    
+    if os.stat(src_path).st_dev == os.stat(os.path.dirname(dst_path) or '.').st_dev:
+        # 1) reflink: 블록 공유 + CoW (이후 한쪽 수정이 다른 쪽에 영향 없음)
+        try:
+            with open(src_path, 'rb') as f_in, open(dst_path, 'wb') as f_out:
+                fcntl.ioctl(f_out.fileno(), _FICLONE, f_in.fileno())
+            shutil.copystat(src_path, dst_path)
+            return 'reflink', None
+        except OSError:
+            if os.path.exists(dst_path):
+                os.remove(dst_path)
+        
+        # 2) hardlink
+        if allow_hardlink:
+            try:
+                os.link(src_path, dst_path)
+                return 'hardlink', None
+            except OSError:
+                pass
+    
+    # 3) 스트리밍 복사 (읽으면서 체크섬 계산, 임시 파일 기록 후 교체)
+    hasher = hashlib.sha256()
+    with open(src_path, 'rb') as f_in, atomic_write(dst_path, 'wb') as f_out:
+        for chunk in iter(lambda: f_in.read(_COPY_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+            f_out.write(chunk)
+        f_out.flush()
+        shutil.copystat(src_path, f_out.name)
+    return 'copy', hasher.hexdigest()
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """여러 스레드로 gzip 압축하며 순차 기록하는 쓰기 전용 파일 객체
+
+    입력을 chunk_size 단위로 잘라 각 청크를 독립된 gzip member로 동시에 압축한 뒤
+    순서대로 이어 붙인다 (multi-member gzip은 gzip/zlib/nibabel 모두 읽을 수 있음).
+    임시 파일에 기록 후 close() 시점에 교체하므로 중간 실패 시 불완전한 결과가 남지 않는다.
+    압축 전 데이터의 체크섬(sha256)을 함께 계산한다.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 4 * 1024 * 1024,
+                 workers: int = None, compresslevel: int = 6):
+        super().__init__()
+        self.path = str(path)
+        self.chunk_size = chunk_size
+        self.compresslevel = compresslevel
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self._tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._file = open(self._tmp_path, 'wb')
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._hasher = hashlib.sha256()
+        self._position = 0
+        self._aborted = False
+
+    def write(self, data) -> int:
+        data = memoryview(data).cast('B')
+        self._hasher.update(data)
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.chunk_size:
+            chunk = bytes(self._buffer[:self.chunk_size])
+            del self._buffer[:self.chunk_size]
+            self._submit(chunk)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        # 순차 기록만 지원 (현재 위치로의 seek만 허용)
+        if whence != 0 or offset != self._position:
+            raise io.UnsupportedOperation("ParallelGzipWriter는 순차 쓰기만 지원합니다.")
+        return self._position
+
+    def seekable(self) -> bool:
+        return False
+
+    def writable(self) -> bool:
+        return True
+
+    @property
+    def checksum(self) -> str:
+        """압축 전 데이터의 sha256 (hex)"""
+        return self._hasher.hexdigest()
+
+    def _submit(self, chunk: bytes):
+        self._pending.append(self._executor.submit(gzip.compress, chunk, self.compresslevel, mtime=0))
+        # 메모리 사용량 제한: 대기 중인 청크가 많으면 앞쪽부터 기록
+        while len(self._pending) > self.workers * 2:
+            self._file.write(self._pending.popleft().result())
+
+    def close(self):
+        """남은 데이터를 압축/기록하고 최종 경로로 교체"""
+        if self.closed or self._aborted:
+            return
+        try:
+            if self._buffer or self._position == 0:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._file.write(self._pending.popleft().result())
+            self._file.close()
+            os.replace(self._tmp_path, self.path)
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._executor.shutdown(wait=True)
+            super().close()
+
+    def abort(self):
+        """기록 중단 및 임시 파일 삭제"""
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        self._aborted = True
+        super().close()
+
+    def __del__(self):
+        # close() 없이 버려진 경우 불완전한 결과를 남기지 않음
+        if not self.closed:
+            self.abort()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,198 @@
+#/BDSP/bids_app/src/utils/file_index.py
+"""bdsp_file_list.json 파일 목록
+
+{"path": [{"index", "file_path"}, ...]} 형식은 그대로 두고, 메모리에서는 항목마다 dict를 만들지 않고
+index / 디렉토리 번호 / 파일명을 병렬 배열로 저장한다 (디렉토리 문자열은 한 번만 저장).
+파일에는 항목을 한 줄에 하나씩 기록하므로 (json.load로 그대로 읽을 수 있음) 읽을 때 한 줄씩 바로 해석하고,
+다른 형식(예전 indent=2 파일)이면 json.load로 읽는다.
+게시(staging) 시 경로 접두사를 문자열로 치환하므로 파일은 JSON 텍스트로만 기록한다.
+"""
+import json
+import os
+import re
+from array import array
+
+FILE_LIST_NAME = "bdsp_file_list.json"
+
+# 한 줄 한 항목 형식
+_HEADER = '{"path": ['
+_FOOTER = ']}'
+_LINE_START = '{"index": '
+_LINE_SEP = ', "file_path": "'
+# JSON 문자열에서 이스케이프가 필요한 문자
+_ESCAPE_RE = re.compile(r'["\\\x00-\x1f]')
+_WRITE_BATCH = 4096
+
+
+def _is_file_list(name):
+    """목록 파일 자신은 목록에서 제외 ('bdsp'로 시작하는 .json)"""
+    lower = name.lower()
+    return lower.startswith("bdsp") and lower.endswith(".json")
+
+
+def _quote(text):
+    return json.dumps(text, ensure_ascii=False) if _ESCAPE_RE.search(text) else f'"{text}"'
+
+
+class FileIndex:
+    """(index, file_path) 목록
+
+    - add / scan으로 채우고, 반복하면 (index, file_path)를 순서대로 돌려준다
+    - sort()는 index 순으로 정렬 (이미 정렬된 상태면 아무것도 하지 않음)
+    - to_dict()는 기존 {"path": [{"index", "file_path"}, ...]} 형식 (호환용)
+    """
+
+    __slots__ = ('_dirs', '_dir_ids', '_entry_dirs', '_names', '_indexes', '_ordered')
+
+    def __init__(self):
+        self._dirs = []                 # 디렉토리 문자열
+        self._dir_ids = {}              # 디렉토리 문자열 -> 번호
+        self._entry_dirs = array('I')
+        self._names = []
+        self._indexes = array('q')
+        self._ordered = True
+
+    def _dir_id(self, directory):
+        dir_id = self._dir_ids.get(directory)
+        if dir_id is None:
+            dir_id = self._dir_ids[directory] = len(self._dirs)
+            self._dirs.append(directory)
+        return dir_id
+
+    def _append(self, dir_id, name, index):
+        if self._indexes and index < self._indexes[-1]:
+            self._ordered = False
+        self._entry_dirs.append(dir_id)
+        self._names.append(name)
+        self._indexes.append(index)
+
+    def add(self, file_path, index=None):
+        """항목 추가 (index가 없으면 1부터 순서대로)"""
+        directory, sep, name = str(file_path).rpartition(os.sep)
+        if sep and not directory:
+            directory = sep
+        self._append(self._dir_id(directory), name, len(self._names) + 1 if index is None else int(index))
+
+    # ===== 조회 ================================================================
+    def __len__(self):
+        return len(self._names)
+
+    def _path(self, i):
+        return os.path.join(self._dirs[self._entry_dirs[i]], self._names[i])
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self._names)
+        return self._indexes[i], self._path(i)
+
+    def __iter__(self):
+        for i in range(len(self._names)):
+            yield self._indexes[i], self._path(i)
+
+    def paths(self):
+        for i in range(len(self._names)):
+            yield self._path(i)
+
+    def sort(self):
+        """index 순 정렬 (같은 index는 추가한 순서 유지)"""
+        if self._ordered:
+            return self
+        order = sorted(range(len(self._names)), key=self._indexes.__getitem__)
+        self._entry_dirs = array('I', (self._entry_dirs[i] for i in order))
+        self._names = [self._names[i] for i in order]
+        self._indexes = array('q', (self._indexes[i] for i in order))
+        self._ordered = True
+        return self
+
+    def to_dict(self):
+        """기존 형식 {"path": [{"index", "file_path"}, ...]}"""
+        return {"path": [{"index": index, "file_path": file_path} for index, file_path in self]}
+
+    # ===== 생성 ================================================================
+    @classmethod
+    def from_entries(cls, entries):
+        """[{"index", "file_path"}, ...]에서 생성"""
+        index = cls()
+        for item in entries:
+            index.add(item.get("file_path", ""), item.get("index", 0))
+        return index
+
+    @classmethod
+    def scan(cls, target_folder):
+        """폴더 하위 파일 목록 (목록 파일 제외, os.walk 순서대로 index 1부터)"""
+        index = cls()
+        count = 0
+        for root, dirs, files in os.walk(target_folder):
+            dir_id = None
+            for name in files:
+                if _is_file_list(name):
+                    continue
+                if dir_id is None:
+                    dir_id = index._dir_id(root)
+                count += 1
+                index._append(dir_id, name, count)
+        return index
+
+    @classmethod
+    def load(cls, json_path):
+        """bdsp_file_list.json 로드
+
+        Raises:
+            OSError / ValueError: 파일이 없거나 형식이 잘못됨
+        """
+        index = cls()
+        for item_index, file_path in iter_file(json_path):
+            index.add(file_path, item_index)
+        return index
+
+    # ===== 저장 ================================================================
+    def write(self, output_filename):
+        """bdsp_file_list.json 저장 (한 줄에 한 항목)
+           임시 파일에 쓴 뒤 교체하므로 동시에 같은 파일을 갱신해도 내용이 섞이지 않음"""
+        # utils.common이 이 모듈을 import하므로 사용 시점에 import
+        from utils.common import atomic_write
+        quoted_dirs = {}
+        total = len(self._names)
+        with atomic_write(output_filename) as f:
+            f.write(_HEADER + "\n")
+            lines = []
+            for i in range(total):
+                dir_id = self._entry_dirs[i]
+                directory = quoted_dirs.get(dir_id)
+                if directory is None:
+                    raw = self._dirs[dir_id]
+                    directory = quoted_dirs[dir_id] = _quote(os.path.join(raw, "") if raw else "")[1:-1]
+                name = _quote(self._names[i])[1:-1]
+                lines.append(f'{{"index": {self._indexes[i]}, "file_path": "{directory}{name}"}}'
+                             + (",\n" if i < total - 1 else "\n"))
+                if len(lines) >= _WRITE_BATCH:
+                    f.write(''.join(lines))
+                    lines = []
+            f.write(''.join(lines))
+            f.write(_FOOTER + "\n")
+
+
+def iter_file(json_path):
+    """bdsp_file_list.json의 (index, file_path)를 파일 순서대로 반환
+
+    한 줄 한 항목 형식이면 한 줄씩 읽으며 반환하고, 그 밖의 형식이면 json.load로 읽는다.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        first = f.readline()
+        if first.strip() == _HEADER:
+            for line in f:
+                line = line.rstrip().rstrip(',')
+                if not line or line == _FOOTER:
+                    continue
+                head, sep, file_path = line.partition(_LINE_SEP)
+                if not sep or not head.startswith(_LINE_START) or not file_path.endswith('"}'):
+                    raise ValueError(f"파일 목록 형식 오류: {json_path}: {line[:200]}")
+                file_path = file_path[:-2]
+                if '\\' in file_path:
+                    file_path = json.loads(f'"{file_path}"')
+                yield int(head[len(_LINE_START):]), file_path
+            return
+        data = json.loads(first + f.read())
+    for item in data.get("path", []):
+        yield item.get("index", 0), item.get("file_path", "")
+
@@ -0,0 +1,304 @@
+#/BDSP/bids_app/src/utils/log.py
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils import metrics
+
+# 작업 컨텍스트 (워커 스레드 / 작업이 만든 스레드풀까지 전달)
+job_id_var = contextvars.ContextVar('job_id', default=None)
+subject_var = contextvars.ContextVar('subject', default=None)
+step_var = contextvars.ContextVar('step', default=None)
+
+# 같은 호출 위치에서 window 동안 통과시킬 최대 레코드 수 (ERROR 이상은 제한 없음)
+RATE_LIMIT_WINDOW = 10.0
+RATE_LIMITS = {
+    logging.DEBUG: 20,
+    logging.INFO: 20,
+    logging.WARNING: 50,
+}
+
+# 로그 큐 최대 길이 (가득 차면 워커를 멈추지 않고 레코드를 버림)
+QUEUE_SIZE = 10000
+
+_listener = None
+_queue_handler = None
+_rate_limiter = None
+# 단계 시작/종료 알림 (작업 상태 추적용) - listener(job_id, step, event), event: 'start' / 'end'
+_step_listeners = []
+
+
+@contextmanager
+def job_context(job_id=None, subject=None):
+    """작업 하나의 로그 컨텍스트 (종료 시 이전 값으로 복원)"""
+    tokens = [job_id_var.set(job_id), subject_var.set(subject), step_var.set(None)]
+    try:
+        yield
+    finally:
+        if _rate_limiter is not None:
+            _rate_limiter.flush(job_id)
+        for var, token in zip((step_var, subject_var, job_id_var), reversed(tokens)):
+            var.reset(token)
+
+
+def bind(**fields):
+    """현재 작업 컨텍스트에 subject 등 필드 설정 (job_context 종료 시 함께 복원됨)"""
+    if 'subject' in fields:
+        subject_var.set(fields['subject'])
+    if 'step' in fields:
+        step_var.set(fields['step'])
+
+
+def add_step_listener(listener):
+    """단계 시작/종료 알림 등록 (작업 컨텍스트 안의 단계만 알림)"""
+    _step_listeners.append(listener)
+
+
+def _notify_step(name, event):
+    job_id = job_id_var.get()
+    if job_id is None:
+        return
+    for listener in list(_step_listeners):
+        try:
+            listener(job_id, name, event)
+        except Exception:
+            logging.getLogger(__name__).exception(f"단계 알림 처리 실패: {name} ({event})")
+
+
+@contextmanager
+def step(name):
+    """파이프라인 단계 컨텍스트"""
+    token = step_var.set(name)
+    _notify_step(name, 'start')
+    try:
+        yield
+    finally:
+        _notify_step(name, 'end')
+        step_var.reset(token)
+
+
+def submit(executor, fn, *args, **kwargs):
+    """현재 로그 컨텍스트를 유지한 채 executor에 작업 제출"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class ContextFilter(logging.Filter):
+    """레코드에 job_id / subject / step 필드 추가 (로그를 만든 스레드에서 실행되어야 함)"""
+
+    def filter(self, record):
+        record.job_id = job_id_var.get()
+        record.subject = subject_var.get()
+        record.step = step_var.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """호출 위치(파일:라인)별 반복 로그 제한
+
+    작업별·호출 위치별로 window 동안 RATE_LIMITS 개수까지만 통과시키고 나머지는 건수만 센다.
+    생략된 건수는 다음 window의 첫 레코드 또는 작업 종료 시 요약 레코드로 남긴다.
+    """
+
+    def __init__(self, window=RATE_LIMIT_WINDOW, limits=None):
+        super().__init__()
+        self.window = window
+        self.limits = limits or RATE_LIMITS
+        self._lock = threading.Lock()
+        # (job_id, pathname, lineno) -> [window 시작, 통과 수, 생략 수, logger 이름, level]
+        self._state = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR or getattr(record, 'rate_limit_summary', False):
+            return True
+        limit = self.limits.get(record.levelno, self.limits[logging.WARNING])
+        key = (getattr(record, 'job_id', None), record.pathname, record.lineno)
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or record.created - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                state = self._state[key] = [record.created, 0, 0, record.name, record.levelno]
+                if suppressed:
+                    record.msg = f"{record.getMessage()} (직전 {self.window:g}초 동안 같은 위치의 로그 {suppressed}건 생략)"
+                    record.args = ()
+            state[1] += 1
+            if state[1] > limit:
+                state[2] += 1
+                return False
+        return True
+
+    def flush(self, job_id):
+        """작업 종료 시 생략된 로그 요약을 남기고 해당 작업의 상태 삭제"""
+        with self._lock:
+            keys = [key for key in self._state if key[0] == job_id]
+            pending = [(key, self._state.pop(key)) for key in keys]
+        for (job, pathname, lineno), state in pending:
+            if state[2]:
+                logging.getLogger(state[3]).log(
+                    state[4], f"{pathname}:{lineno} 반복 로그 {state[2]}건 생략",
+                    extra={'rate_limit_summary': True})
+
+
+class JsonFormatter(logging.Formatter):
+    """JSON lines 포맷"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'job_id': getattr(record, 'job_id', None),
+            'subject': getattr(record, 'subject', None),
+            'step': getattr(record, 'step', None),
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # 큐를 거친 레코드는 _DroppingQueueHandler.prepare가 traceback을 exc_text로 남김
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """콘솔용 텍스트 포맷 (작업 컨텍스트가 있으면 앞에 표시)"""
+
+    def format(self, record):
+        message = super().format(record)
+        job_id = getattr(record, 'job_id', None)
+        if job_id:
+            step_name = getattr(record, 'step', None)
+            prefix = f"[{job_id}{'/' + step_name if step_name else ''}] "
+            head, sep, tail = message.partition(f"{record.levelname} - ")
+            return f"{head}{sep}{prefix}{tail}" if sep else prefix + message
+        return message
+
+
+# exc_info → traceback 문자열 (워커 스레드에서 변환 - traceback 객체는 큐로 넘기지 않음)
+_exc_formatter = logging.Formatter()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """큐가 가득 차면 대기하지 않고 버림 (로그 때문에 워커가 멈추지 않도록)
+
+    버린 건수는 metrics.LOG_DROPPED로 노출하고, 큐에 다시 여유가 생기면 RATE_LIMIT_WINDOW마다
+    한 번씩 요약 레코드로 남긴다 (종료 시 남은 건수는 shutdown_logging에서 기록).
+    """
+
+    dropped = 0
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self._lock = threading.Lock()
+        self._unreported = 0
+        self._last_report = 0.0
+
+    def prepare(self, record):
+        """리스너 스레드로 넘길 사본 (메시지 인자는 문자열로 합치고, traceback은 message에 합치지 않고 exc_text로 유지)
+
+        기본 QueueHandler.prepare는 traceback을 msg에 합치고 exc_info를 지우므로 JsonFormatter의 exc 필드가 비게 된다.
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                _DroppingQueueHandler.dropped += 1
+                self._unreported += 1
+            metrics.LOG_DROPPED.inc()
+            return
+        if self._unreported and time.monotonic() - self._last_report >= RATE_LIMIT_WINDOW:
+            self._report()
+
+    def _report(self):
+        with self._lock:
+            count, self._unreported = self._unreported, 0
+            self._last_report = time.monotonic()
+        if not count:
+            return
+        try:
+            self.queue.put_nowait(self.prepare(_dropped_record(count)))
+        except queue.Full:
+            with self._lock:
+                self._unreported += count
+
+    def take_unreported(self):
+        with self._lock:
+            count, self._unreported = self._unreported, 0
+        return count
+
+
+def _dropped_record(count):
+    return logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                             f"로그 큐가 가득 차 {count}건 버림 (누적 {_DroppingQueueHandler.dropped}건)", None, None)
+
+
+def setup_logging(log_filename, level=logging.INFO, console=True):
+    """비동기 로그 파이프라인 설정
+
+    워커 스레드: ContextFilter → RateLimitFilter → 큐에 넣기만 함
+    리스너 스레드: 파일(JSON lines) / 콘솔(텍스트) 출력
+
+    Returns:
+        QueueListener
+    """
+    global _listener, _queue_handler, _rate_limiter
+
+    handlers = []
+    file_handler = logging.FileHandler(log_filename, encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter())
+    handlers.append(file_handler)
+    if console:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(TextFormatter('%(asctime)s - %(levelname)s - %(message)s'))
+        handlers.append(stream_handler)
+
+    log_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    queue_handler = _queue_handler = _DroppingQueueHandler(log_queue)
+    _rate_limiter = RateLimitFilter()
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(_rate_limiter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    if _listener is not None:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """큐에 남은 로그를 모두 출력하고 리스너 종료"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        # 리스너 종료 후에는 큐를 읽지 않으므로 아직 알리지 않은 버린 건수는 출력 핸들러에 직접 기록
+        dropped = _queue_handler.take_unreported() if _queue_handler is not None else 0
+        if dropped:
+            record = _dropped_record(dropped)
+            for handler in _listener.handlers:
+                handler.handle(record)
+        _listener = None
@@ -0,0 +1,315 @@
+#/BDSP/bids_app/src/utils/metrics.py
+import logging
+import os
+import socketserver
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Prometheus text exposition format 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 기본 히스토그램 버킷 (초) - 단계/작업 시간은 수 초 ~ 수십 분
+STEP_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 2400, 3600)
+DCM2NIIX_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra) if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """라벨별 값을 가진 메트릭 공통 부분"""
+    type_name = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        # 라벨 없는 counter/gauge는 첫 갱신 전에도 0으로 노출
+        if not self.labelnames and self.type_name in ('counter', 'gauge'):
+            self._values[()] = 0
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: labels {sorted(labels)} != {list(self.labelnames)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, key, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [('_total', key, None, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self):
+        with self._lock:
+            return [('', key, None, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STEP_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state['counts']):
+                    cumulative += count
+                    samples.append(('_bucket', key, [('le', _format_value(bound))], cumulative))
+                samples.append(('_sum', key, None, state['sum']))
+                samples.append(('_count', key, None, state['count']))
+        return samples
+
+
+class Registry:
+    """메트릭 목록 + scrape 시점에 값을 채우는 collector 콜백"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, func):
+        """scrape 직전에 호출할 콜백 등록 (캐시 통계처럼 다른 모듈이 가진 값을 gauge/counter로 복사)"""
+        with self._lock:
+            self._collectors.append(func)
+
+    def render(self):
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for collect in collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.warning(f"메트릭 collector 실패: {e}")
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# ===== 파이프라인 메트릭 ======================================================
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'bdsp_queue_depth', 'Jobs waiting in the scheduler or worker pool and not yet started'))
+EVENT_FILES = REGISTRY.register(Gauge(
+    'bdsp_event_dir_files', 'Event JSON files found in EVENT_DIR at the last poll'))
+WORKER_LIMIT = REGISTRY.register(Gauge(
+    'bdsp_worker_limit', 'Current maximum number of concurrently running jobs'))
+JOBS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'bdsp_jobs_in_flight', 'Jobs currently running, per worker thread', ('worker',)))
+JOBS = REGISTRY.register(Counter(
+    'bdsp_jobs', 'Finished jobs by outcome', ('outcome',)))
+JOB_DURATION = REGISTRY.register(Histogram(
+    'bdsp_job_duration_seconds', 'Wall time of process.main.main per job', ('outcome',)))
+STEP_DURATION = REGISTRY.register(Histogram(
+    'bdsp_step_duration_seconds', 'Wall time per pipeline step', ('step',)))
+STAGE_QUEUED = REGISTRY.register(Gauge(
+    'bdsp_stage_queued', 'Stage calls waiting for a worker in each stage pool', ('pool',)))
+STAGE_ACTIVE = REGISTRY.register(Gauge(
+    'bdsp_stage_active', 'Stage calls running in each stage pool', ('pool',)))
+DCM2NIIX_DURATION = REGISTRY.register(Histogram(
+    'bdsp_dcm2niix_duration_seconds', 'dcm2niix subprocess wall time', ('outcome',),
+    buckets=DCM2NIIX_BUCKETS))
+SOURCE_FIRST_SERIES = REGISTRY.register(Histogram(
+    'bdsp_source_first_series_seconds', 'Seconds from extraction start to the first DICOM series in streaming mode'))
+BYTES_INGESTED = REGISTRY.register(Counter(
+    'bdsp_ingested_bytes', 'Bytes of uploaded zip files copied into origin'))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'bdsp_cache_requests', 'Cache lookups by cache and result', ('cache', 'result')))
+CACHE_HIT_RATIO = REGISTRY.register(Gauge(
+    'bdsp_cache_hit_ratio', 'Cache hit ratio since process start', ('cache',)))
+ADMISSION_HELD = REGISTRY.register(Gauge(
+    'bdsp_admission_held_jobs', 'Queued jobs held back by disk/memory admission control'))
+ADMISSION_DEFERRALS = REGISTRY.register(Counter(
+    'bdsp_admission_deferrals', 'Jobs deferred by admission control, by resource', ('reason',)))
+ADMISSION_EXPANSION = REGISTRY.register(Gauge(
+    'bdsp_admission_expansion_factor', 'Work bytes per upload byte used to estimate job disk footprint'))
+CLUSTER_PEERS = REGISTRY.register(Gauge(
+    'bdsp_cluster_peers', 'Other ingest nodes with a live heartbeat in EVENT_DIR/.claims'))
+CLUSTER_TAKEOVERS = REGISTRY.register(Counter(
+    'bdsp_cluster_takeovers', 'Claim directories of expired nodes taken over by this node'))
+CLUSTER_FENCED = REGISTRY.register(Counter(
+    'bdsp_cluster_fenced', 'Times this node found its own claim directory taken over by another node'))
+LOG_DROPPED = REGISTRY.register(Counter(
+    'bdsp_log_dropped_records', 'Log records dropped because the async log queue was full'))
+
+# 캐시 이름 → {'hits': int, 'misses': int} (모듈이 직접 갱신하는 dict를 scrape 시점에 읽음)
+_caches = {}
+
+
+def register_cache(name, stats):
+    """hits/misses 카운트 dict를 가진 캐시를 메트릭에 등록"""
+    _caches[name] = stats
+
+
+def cache_snapshot():
+    """등록된 캐시의 현재 hits/misses ({이름: {'hits', 'misses'}})"""
+    return {name: {'hits': stats.get('hits', 0), 'misses': stats.get('misses', 0)}
+            for name, stats in list(_caches.items())}
+
+
+def _collect_caches():
+    for name, stats in list(_caches.items()):
+        hits = stats.get('hits', 0)
+        misses = stats.get('misses', 0)
+        with CACHE_REQUESTS._lock:
+            CACHE_REQUESTS._values[(name, 'hit')] = hits
+            CACHE_REQUESTS._values[(name, 'miss')] = misses
+        total = hits + misses
+        CACHE_HIT_RATIO.set(hits / total if total else 0.0, cache=name)
+
+
+REGISTRY.add_collector(_collect_caches)
+
+
+@contextmanager
+def step_timer(step):
+    """파이프라인 단계 시간 측정 (실패한 단계도 기록)"""
+    with STEP_DURATION.time(step=step):
+        yield
+
+
+# ===== 노출 서버 ==============================================================
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix 소켓은 client_address가 비어 있음
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        logger.debug("metrics %s - %s", self.address_string(), format % args)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('unix', 0)
+
+
+def start_server(port=0, host='127.0.0.1', socket_path=''):
+    """메트릭 노출 서버를 백그라운드 스레드로 시작
+
+    socket_path가 있으면 Unix 소켓, 아니면 host:port(HTTP). 둘 다 없으면(port=0) 시작하지 않음.
+
+    Returns:
+        server 객체 (시작하지 않으면 None)
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        os.makedirs(os.path.dirname(socket_path) or '.', exist_ok=True)
+        server = _UnixHTTPServer(socket_path, _MetricsHandler)
+        where = f"unix:{socket_path}"
+    elif port:
+        server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+        server.daemon_threads = True
+        where = f"http://{host}:{server.server_address[1]}/metrics"
+    else:
+        logger.info("Metrics endpoint disabled")
+        return None
+
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logger.info(f"Metrics endpoint: {where}")
+    return server
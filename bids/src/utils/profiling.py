@@ -0,0 +1,219 @@
+#/BDSP/bids_app/src/utils/profiling.py
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# 프로파일링 제어 파일 중 모든 작업에 적용되는 이름
+PROFILE_ALL = "all"
+
+# 기본 옵션 (이벤트 JSON의 profile 필드가 dict이면 덮어씀)
+DEFAULT_OPTIONS = {
+    'sample_interval_ms': 5,    # collapsed stack 샘플링 주기
+    'memory': True,             # tracemalloc 사용 여부
+    'memory_frames': 10,        # 할당 traceback 깊이
+    'top_allocations': 30,      # 보고서에 기록할 상위 할당 수
+}
+
+# tracemalloc은 프로세스 전역이므로 동시에 프로파일링 중인 작업 수로 시작/종료 관리
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def _load_event(json_file_path):
+    try:
+        with open(json_file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def profile_requested(json_file_path, profile_flag_dir):
+    """작업의 프로파일링 여부 확인
+
+    다음 중 하나면 프로파일링한다.
+      - 이벤트 JSON의 "profile" 필드가 true 또는 옵션 dict
+      - profile_flag_dir에 작업 ID(이벤트 파일명, 확장자 제외), subjectId 또는 'all' 이름의 제어 파일 존재
+        (작업 ID/subjectId 제어 파일은 1회용으로 사용 후 삭제)
+
+    Returns:
+        dict | None: 프로파일링 옵션 (하지 않으면 None)
+    """
+    event = _load_event(json_file_path)
+    field = event.get('profile')
+    if isinstance(field, dict):
+        return {**DEFAULT_OPTIONS, **field}
+    if field is True:
+        return dict(DEFAULT_OPTIONS)
+
+    if not profile_flag_dir or not os.path.isdir(profile_flag_dir):
+        return None
+
+    job_id = Path(json_file_path).stem
+    for name in (job_id, str(event.get('subjectId', '')), PROFILE_ALL):
+        if not name:
+            continue
+        control = Path(profile_flag_dir) / name
+        if control.exists():
+            if name != PROFILE_ALL:
+                control.unlink(missing_ok=True)
+            logger.info(f"프로파일링 제어 파일 감지: {control}")
+            return dict(DEFAULT_OPTIONS)
+    return None
+
+
+class StackSampler:
+    """대상 스레드(와 작업 중 생성된 스레드)의 호출 스택을 주기적으로 샘플링하여 collapsed stack 집계
+
+    cProfile은 호출 스레드만, 호출 관계만 기록하므로 flamegraph용 전체 스택은 샘플링으로 얻는다.
+    (subprocess 대기 등 wall-clock 시간도 포함)
+    """
+
+    def __init__(self, target_ident, interval):
+        self.target_ident = target_ident
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        # 단계 풀(stage-*) 스레드는 작업 시작 전부터 있어도 작업의 단계를 실행하므로 샘플링 대상
+        # (동시에 실행 중인 다른 작업의 단계도 함께 샘플링될 수 있음)
+        self._baseline = {t.ident for t in threading.enumerate()
+                          if not t.name.startswith('stage-')} - {target_ident}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (ident != self.target_ident and ident in self._baseline):
+                    continue
+                self.counts[self._collapse(frame)] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _start_tracemalloc(frames):
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def _write_allocation_report(path, snapshot, peak, top):
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+    stats = snapshot.statistics('lineno')
+    with open(path, 'w', encoding='utf-8') as f:
+        total = sum(stat.size for stat in stats)
+        f.write(f"# 작업 종료 시점 추적 중인 메모리: {total / 1024 / 1024:.1f} MiB, 최대: {peak / 1024 / 1024:.1f} MiB\n")
+        f.write(f"# 상위 {top}개 할당 위치 (lineno 기준)\n")
+        for index, stat in enumerate(stats[:top], 1):
+            frame = stat.traceback[0]
+            f.write(f"{index:3d}. {frame.filename}:{frame.lineno}  "
+                    f"{stat.size / 1024:.1f} KiB  ({stat.count} blocks)\n")
+
+        f.write("\n# 상위 5개 할당 traceback\n")
+        for stat in snapshot.statistics('traceback')[:5]:
+            f.write(f"\n{stat.size / 1024:.1f} KiB ({stat.count} blocks)\n")
+            for line in stat.traceback.format():
+                f.write(f"  {line}\n")
+
+
+def run_profiled(func, json_file_path, fallback_dir, options=None, **kwargs):
+    """func(json_file_path, **kwargs)를 프로파일링하며 실행
+
+    결과 파일은 func가 반환한 trace.json 옆(실패 시 fallback_dir)에 저장된다.
+      - <이름>_profile.pstats      : cProfile 결과 (python -m pstats / snakeviz)
+      - <이름>_profile.collapsed   : collapsed stack (flamegraph.pl / speedscope)
+      - <이름>_profile_alloc.txt   : tracemalloc 상위 할당 보고서
+
+    Returns:
+        func의 반환값 (예외는 결과 파일 저장 후 그대로 전달)
+    """
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    job_id = Path(json_file_path).stem
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident(), max(options['sample_interval_ms'], 1) / 1000.0)
+    use_memory = bool(options['memory'])
+
+    if use_memory:
+        _start_tracemalloc(int(options['memory_frames']))
+    logger.info(f"프로파일링 시작: {job_id}")
+    started = time.perf_counter()
+    sampler.start()
+    result = None
+    try:
+        result = profiler.runcall(func, json_file_path, **kwargs)
+        return result
+    finally:
+        sampler.stop()
+        elapsed = time.perf_counter() - started
+        snapshot = peak = None
+        if use_memory:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            _stop_tracemalloc()
+
+        trace_json = result.get('trace_json') if isinstance(result, dict) else None
+        if trace_json:
+            output_dir = Path(trace_json).parent
+            stem = Path(trace_json).stem
+        else:
+            output_dir = Path(fallback_dir)
+            stem = job_id
+        try:
+            output_dir.mkdir(parents=True, exist_ok=True)
+            pstats_path = output_dir / f"{stem}_profile.pstats"
+            collapsed_path = output_dir / f"{stem}_profile.collapsed"
+            profiler.dump_stats(str(pstats_path))
+            sampler.write(collapsed_path)
+            written = [pstats_path, collapsed_path]
+            if snapshot is not None:
+                alloc_path = output_dir / f"{stem}_profile_alloc.txt"
+                _write_allocation_report(alloc_path, snapshot, peak, int(options['top_allocations']))
+                written.append(alloc_path)
+            logger.info(f"프로파일링 완료: {job_id} ({elapsed:.1f}s, 샘플 {sampler.samples}개) -> "
+                        f"{', '.join(str(p) for p in written)}")
+        except Exception as e:
+            logger.error(f"프로파일링 결과 저장 실패: {job_id} ({e})")
@@ -0,0 +1,32 @@
+#/BDSP/bids_app/src/utils/progress.py
+import logging
+
+from utils import log
+
+logger = logging.getLogger(__name__)
+
+# 진행 상황 수신 - listener(job_id, counters)
+_listeners = []
+
+
+def add_listener(listener):
+    """작업 진행 상황 수신 등록 (app의 JobTracker)"""
+    _listeners.append(listener)
+
+
+def report(**counters):
+    """현재 작업의 진행 카운터 보고 (누적값, 예: files_extracted=120, files_total=800)
+
+    작업 컨텍스트(log.job_context) 밖이거나 수신자가 없으면 아무것도 하지 않는다.
+    파일 단위로 자주 호출되므로 수신자는 가볍게 처리해야 한다.
+    """
+    if not _listeners:
+        return
+    job_id = log.job_id_var.get()
+    if job_id is None:
+        return
+    for listener in list(_listeners):
+        try:
+            listener(job_id, counters)
+        except Exception as e:
+            logger.debug(f"진행 상황 보고 실패: {counters} ({e})")
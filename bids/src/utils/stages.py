@@ -0,0 +1,134 @@
+#/BDSP/bids_app/src/utils/stages.py
+import contextvars
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# 단계 종류
+IO = "io"       # 복사, 압축 해제, 이동, 디렉토리 순회 (NAS/디스크 대기)
+CPU = "cpu"     # 헤더 파싱, NIfTI 통계, 썸네일 (numpy/zlib/cv2는 GIL 해제)
+PROC = "proc"   # dcm2niix 등 외부 프로세스
+
+# 중첩 호출 시 다른 풀로 보낼 수 있는 방향 (앞 → 뒤로만 기다림)
+_ORDER = {IO: 0, CPU: 1, PROC: 2}
+
+# 풀별 기본 크기 (configure에서 변경), 대기열 길이는 풀 크기와 별도로 제한
+_DEFAULT_WORKERS = {
+    IO: 4,
+    CPU: os.cpu_count() or 1,
+    PROC: os.cpu_count() or 1,
+}
+DEFAULT_QUEUE_SIZE = 8
+
+_pools = {}
+_pools_lock = threading.Lock()
+_settings = {'workers': dict(_DEFAULT_WORKERS), 'queue_size': DEFAULT_QUEUE_SIZE}
+
+# 현재 스레드가 실행 중인 단계 종류 (풀 스레드 안에서의 중첩 호출 판단)
+_current = threading.local()
+
+
+class StagePool:
+    """단계 종류별 스레드풀 + 제한된 대기열
+
+    실행 중 + 대기 중 작업 수가 workers + queue_size에 도달하면 제출하는 쪽(작업 스레드)이 대기한다.
+    (한 종류의 단계가 밀리면 그 단계에 들어가려는 작업만 멈추고 다른 종류의 풀은 계속 동작)
+    """
+
+    def __init__(self, kind, workers, queue_size):
+        self.kind = kind
+        self.workers = max(1, int(workers))
+        self.queue_size = max(0, int(queue_size))
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"stage-{kind}")
+
+    def _execute(self, context, fn, args, kwargs):
+        _current.kind = self.kind
+        metrics.STAGE_QUEUED.dec(pool=self.kind)
+        metrics.STAGE_ACTIVE.inc(pool=self.kind)
+        try:
+            return context.run(fn, *args, **kwargs)
+        finally:
+            metrics.STAGE_ACTIVE.dec(pool=self.kind)
+            _current.kind = None
+
+    def run(self, fn, *args, **kwargs):
+        """fn을 이 풀에서 실행하고 결과 반환 (예외는 그대로 전달)"""
+        self._slots.acquire()
+        metrics.STAGE_QUEUED.inc(pool=self.kind)
+        try:
+            # 로그 컨텍스트(job/subject/step)를 풀 스레드로 전달
+            future = self._executor.submit(self._execute, contextvars.copy_context(), fn, args, kwargs)
+        except BaseException:
+            metrics.STAGE_QUEUED.dec(pool=self.kind)
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def configure(io_workers=None, cpu_workers=None, proc_workers=None, queue_size=None):
+    """풀 크기 설정 (0 또는 None이면 기본값). 이미 만들어진 풀은 실행 중인 작업을 마친 뒤 교체된다."""
+    workers = dict(_DEFAULT_WORKERS)
+    for kind, value in ((IO, io_workers), (CPU, cpu_workers), (PROC, proc_workers)):
+        if value:
+            workers[kind] = int(value)
+    with _pools_lock:
+        _settings['workers'] = workers
+        if queue_size is not None:
+            _settings['queue_size'] = int(queue_size)
+        old_pools = list(_pools.values())
+        _pools.clear()
+    for pool in old_pools:
+        pool.shutdown(wait=False)
+    logger.info(f"Stage pools - IO: {workers[IO]}, CPU: {workers[CPU]}, PROC: {workers[PROC]}, "
+                f"Queue: {_settings['queue_size']}")
+
+
+def get_pool(kind):
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            pool = _pools[kind] = StagePool(kind, _settings['workers'][kind], _settings['queue_size'])
+        return pool
+
+
+def run(kind, fn, *args, **kwargs):
+    """fn을 kind 풀에서 실행
+
+    이미 단계 풀 스레드 안이면 IO → CPU → PROC 순서로 뒤쪽 풀에만 보내고, 같거나 앞쪽 풀의 단계는
+    그 자리에서 바로 실행한다. 풀끼리 기다리는 방향이 한쪽으로만 흐르므로 교착이 생기지 않는다
+    (예: IO 단계의 오케스트레이션이 NIfTI 압축(CPU)이나 dcm2niix(PROC)를 기다리는 것은 가능, 그 반대는 바로 실행).
+    """
+    current = getattr(_current, 'kind', None)
+    if current is not None and _ORDER[kind] <= _ORDER[current]:
+        return fn(*args, **kwargs)
+    return get_pool(kind).run(fn, *args, **kwargs)
+
+
+def stage(kind):
+    """함수를 kind 단계 풀에서 실행하도록 지정하는 데코레이터"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return run(kind, fn, *args, **kwargs)
+        wrapper.stage_kind = kind
+        return wrapper
+    return decorator
+
+
+def shutdown(wait=True):
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait)